@@ -1,5 +1,9 @@
 """The cl.oquence kernel programming language."""
 import ast as _ast # http://docs.python.org/library/ast.html
+import os as _os
+import hashlib as _hashlib
+import weakref as _weakref
+import multiprocessing as _multiprocessing
 
 import cypy
 import cypy.astx as astx
@@ -8,7 +12,21 @@ import cypy.cg as cg
 version = cypy.Version("cl.oquence", (("Major", 1), ("Minor", 0)), "alpha")
 """The current :class:`version <cypy.Version>` of cl.oquence (1.0 alpha)."""
 
-def fn(decl):
+intern_max_size = 1024
+"""The number of most recently used generic and concrete functions (and their
+types) which each :func:`intern pool <cypy.intern_pool>` keeps alive. Others 
+remain interned only for as long as they are referenced elsewhere."""
+
+disk_cache = None
+"""The process-wide :class:`disk cache <diskcache.DiskCache>` to use for 
+compiled concrete functions. None (disabled) until set explicitly."""
+
+call_backend = None
+"""The :class:`Backend` whose :meth:`dispatcher <Backend.dispatcher>` 
+launches generic functions when they are called. Set to the OpenCL backend
+when :mod:`clq.backends.opencl` is imported, if not set already."""
+
+def fn(decl=None, **options):
     """Create a :class:`generic cl.oquence function <GenericFn>` from a 
     Python function declaration.
     
@@ -58,19 +76,34 @@ def fn(decl):
     information on manipulating Python syntax trees. The :mod:`cypy.astx`
     module provides several convenience functions for working with Python 
     ASTs as well.
+    
+    Options controlling how the function is compiled can be provided as 
+    keyword arguments, which are saved as the attributes of the same name of 
+    the :class:`GenericFn` (e.g. ``unroll`` and ``inline``)::
+    
+        @clq.fn(unroll=8)
+        def dot(a, b, n):
+            ...
+            
+    All three forms accept them, e.g. ``clq.fn.from_source(src, unroll=8)``.
     """
-    ast = astx.infer_ast(decl)
-    ast = astx.extract_the(ast, _ast.FunctionDef)
-    return GenericFn(ast)
-    
-def from_source(src):
-    ast = astx.infer_ast(src)
-    ast = astx.extract_the(ast, _ast.FunctionDef)
-    return GenericFn(ast)
+    if decl is None:
+        return lambda decl: GenericFn(_parse(decl), **options)
+    return GenericFn(_parse(decl), **options)
+    
+def from_source(src, **options):
+    return GenericFn(_parse(src), **options)
 fn.from_source = from_source
 
-def from_ast(ast):
-    return GenericFn(ast)
+def _parse(decl):
+    with instrument.phase("parse") as phase:
+        ast = astx.infer_ast(decl)
+        ast = astx.extract_the(ast, _ast.FunctionDef)
+        phase.fn = ast.name
+    return ast
+
+def from_ast(ast, **options):
+    return GenericFn(ast, **options)
 fn.from_ast = from_ast
 
 class GenericFn(object):
@@ -81,8 +114,25 @@ class GenericFn(object):
     
     Generic functions are immutable and intern.
     """
-    def __init__(self, ast):
+    def __init__(self, ast, unroll=None, inline=None, vectorize=None):
         self.original_ast = ast
+        self.unroll = unroll
+        self.inline = inline
+        self.vectorize = vectorize
+        
+    unroll = None
+    """Whether, and how, to unroll for loops with constant bounds in this 
+    function. See :class:`passes.UnrollLoops`."""
+    
+    inline = None
+    """Whether to inline calls to this function: always if True, never if 
+    False and depending on its size if None. See 
+    :class:`passes.InlineCalls`."""
+    
+    vectorize = None
+    """The number of consecutive elements each work-item of this function, 
+    an elementwise kernel, processes using vectors, or None to process one. 
+    See :class:`passes.VectorizeElementwise`."""
 
     ###########################################################################
     # Abstract Syntax Tree
@@ -110,7 +160,8 @@ class GenericFn(object):
         See :class:`internals.GenericFnVisitor`.
         """
         visitor = self._visitor = internals.GenericFnVisitor()
-        return visitor.visit(self.original_ast)
+        with instrument.phase("annotate", self):
+            return visitor.visit(self.original_ast)
     
     @cypy.lazy(property)
     def arg_names(self):
@@ -133,15 +184,59 @@ class GenericFn(object):
         """The function's name."""
         return self.annotated_ast.name
 
+    @cypy.lazy(property)
+    def cache_key(self):
+        """A digest of the canonical dump of the original syntax tree and the
+        options which are set."""
+        key = _ast.dump(self.original_ast)
+        options = self.options
+        if options:
+            key += repr(sorted(options.iteritems()))
+        return _hashlib.sha1(key).hexdigest()
+    
+    @property
+    def options(self):
+        """A dict of the options given to :func:`fn` which differ from their 
+        defaults."""
+        return dict((name, getattr(self, name)) for name in option_names
+                    if getattr(self, name) != getattr(GenericFn, name))
+
+    def with_options(self, **options):
+        """Returns the generic function with the same syntax tree and options
+        as this one, except for the provided ones, e.g. 
+        ``ew_add.with_options(vectorize=4)``."""
+        new_options = self.options
+        new_options.update(options)
+        return GenericFn(self.original_ast, **new_options)
+
     def compile(self, target, *arg_types):
         """Creates a :class:`concrete function <ConcreteFn>` with the provided
         argument types."""
         return ConcreteFn(self, arg_types, target)
-        
+
+    def __call__(self, *args, **kwargs):
+        """Launches this function as a kernel with argument types inferred 
+        from the provided arguments, e.g. ``ew_add(a, b, dest, 
+        get_global_id, global_size=(n,))``, using its :attr:`dispatcher`."""
+        return self.dispatcher(*args, **kwargs)
+
+    @cypy.lazy(property)
+    def dispatcher(self):
+        """The callable which launches this function when it is called, 
+        created by the :meth:`dispatcher <Backend.dispatcher>` of the 
+        :obj:`call_backend`."""
+        if call_backend is None:
+            raise Error("No backend launches generic functions when they "
+                        "are called. Set clq.call_backend.")
+        return call_backend.dispatcher(self)
+
     @cypy.lazy(property)
     def cl_type(self):
         return self.Type(self)
-cypy.intern(GenericFn)
+cypy.intern(GenericFn, intern_max_size)
+
+option_names = ("unroll", "inline", "vectorize")
+"""The names of the options which can be given to :func:`fn`."""
 
 class ConcreteFn(object):
     """A concrete function is made from a generic function by binding the 
@@ -155,7 +250,25 @@ class ConcreteFn(object):
         self.arg_types = arg_types
         self.backend = backend
         
-        self.arg_map = cypy.frozendict(zip(generic_fn.arg_names, arg_types))
+        constants = { }
+        arg_map = { }
+        for arg_name, arg_type in zip(generic_fn.arg_names, arg_types):
+            if isinstance(arg_type, ConstantType):
+                constant = constants[arg_name] = \
+                    arg_type.resolve_constant(backend)
+                arg_type = constant[0]
+            arg_map[arg_name] = arg_type
+        self.arg_map = cypy.frozendict(arg_map)
+        self.constants = cypy.frozendict(constants)
+        
+    arg_map = None
+    """A dict mapping the names of the arguments to their types. The type of
+    an argument bound to a :func:`constant <const>` is the type of its 
+    value."""
+    
+    constants = None
+    """A dict mapping the names of the arguments bound to :func:`constants 
+    <const>` to pairs containing the type of the value and the value."""
         
     @cypy.setonce(property)
     def generic_fn(self):
@@ -189,21 +302,74 @@ class ConcreteFn(object):
         """The typed abstract syntax tree for this function."""
         backend = self.backend
         visitor = self._visitor = internals.ConcreteFnVisitor(self, backend)
-        return visitor.visit(self._generic_fn.annotated_ast)
+        typed_ast = visitor.visit(self._generic_fn.annotated_ast)
+        if disk_cache is not None:
+            disk_cache.put(self, typed_ast.context)
+        return typed_ast
+    
+    @cypy.lazy(property)
+    def cache_key(self):
+        """A digest identifying this function's generic function, argument 
+        types and backend and the enabled :class:`optimization passes 
+        <passes.PassManager>`, used as the key in the :obj:`disk_cache`."""
+        key = [str(version), self._generic_fn.cache_key, self._backend.name,
+               passes.manager.cache_key]
+        key.extend(arg_type.cache_key for arg_type in self._arg_types)
+        return _hashlib.sha1("\0".join(key)).hexdigest()
+    
+    @property
+    def cache_entry(self):
+        """The :class:`entry <diskcache.Entry>` this function was restored 
+        from, or None if it was not restored. 
+        
+        The :obj:`disk_cache` is consulted the first time this is read.
+        """
+        try:
+            return self._cache_entry
+        except AttributeError:
+            entry = self._cache_entry = None
+            if disk_cache is not None:
+                entry = disk_cache.get(self)
+                if entry is not None:
+                    self.restore(entry)
+            return entry
+    
+    def restore(self, entry):
+        """Restores the products of compiling this function from the provided
+        :class:`entry <diskcache.Entry>` rather than compiling it.
+        
+        Must be called before the function is used. See :func:`compile_many`.
+        """
+        self._cache_entry = entry
+        self._backend.add_program_items(entry.program_items)
+        
+    @property
+    def is_compiled(self):
+        """Whether this function has been compiled (or restored) yet."""
+        return hasattr(self, '_visitor') or self.cache_entry is not None
     
     @cypy.lazy(property)
     def program_items(self):
         """A list of all program items needed by this concrete function."""
+        entry = self.cache_entry
+        if entry is not None:
+            return entry.program_items
         return tuple(self.typed_ast.context.program_items)
     
     @cypy.lazy(property)
     def program_item(self):
         """The program item corresponding to this function."""
+        entry = self.cache_entry
+        if entry is not None:
+            return entry.program_item
         return self.typed_ast.context.program_item
     
     @cypy.lazy(property)
     def return_type(self):
         """The return type of this function."""
+        entry = self.cache_entry
+        if entry is not None:
+            return entry.return_type
         return self.typed_ast.context.return_type
     
     @cypy.lazy(property)
@@ -214,7 +380,73 @@ class ConcreteFn(object):
     @cypy.lazy(property)
     def cl_type(self):
         return self.Type(self)
-cypy.intern(ConcreteFn)
+cypy.intern(ConcreteFn, intern_max_size)
+
+def compile_many(specs, workers=None):
+    """Compiles many concrete functions, using a pool of worker processes.
+    
+    specs is a sequence of ``(generic_fn, backend, arg_types)`` triples. 
+    Returns a list of the corresponding (interned) :class:`concrete functions 
+    <ConcreteFn>`, already compiled, so later calls to 
+    :meth:`GenericFn.compile` with the same arguments produce them directly.
+    
+    workers is the number of processes to use. Defaults to the number of CPUs.
+    Functions are compiled in this process if workers is 1 or if the platform 
+    does not support ``fork``. Functions whose return type can not be 
+    restored by name (see :meth:`Backend.type_for_name`) or which fail to 
+    compile in a worker are also compiled in this process, so errors are 
+    raised as usual.
+    """
+    concrete_fns = [generic_fn.compile(backend, *arg_types)
+                    for generic_fn, backend, arg_types in specs]
+    pending = [concrete_fn for concrete_fn in concrete_fns 
+               if not concrete_fn.is_compiled]
+    
+    if workers is None:
+        workers = _multiprocessing.cpu_count()
+    workers = min(workers, len(pending))
+    if workers > 1 and hasattr(_os, 'fork'):
+        global _compile_many_pending
+        # workers are forked, so they see this rather than having to unpickle
+        # the functions (which can't be done)
+        _compile_many_pending = pending
+        try:
+            pool = _multiprocessing.Pool(workers)
+            try:
+                records = pool.map(_compile_many_worker, xrange(len(pending)))
+            finally:
+                pool.terminate()
+        finally:
+            _compile_many_pending = None
+        
+        for concrete_fn, record in zip(pending, records):
+            if record is None: continue
+            item_records, return_type_name = record
+            return_type = concrete_fn.backend.type_for_name(return_type_name)
+            if return_type is None: continue
+            concrete_fn.restore(diskcache.Entry(
+                diskcache.program_items_from_records(item_records), return_type))
+
+    # anything left (or everything, if not done in parallel)
+    for concrete_fn in pending:
+        concrete_fn.program_item
+        
+    return concrete_fns
+
+_compile_many_pending = None
+
+def _compile_many_worker(i):
+    concrete_fn = _compile_many_pending[i]
+    try:
+        return_type = concrete_fn.return_type
+        records = diskcache.program_item_records(concrete_fn.program_items)
+    except Exception:
+        # compiled again by the parent, which raises the error normally
+        return None
+    return_type_name = return_type.name
+    if concrete_fn.backend.type_for_name(return_type_name) is not return_type:
+        return None
+    return records, return_type_name
 
 class Type(object):
     """Base class for cl.oquence types."""
@@ -227,6 +459,12 @@ class Type(object):
     def __repr__(self):
         return str(self)
     
+    @property
+    def cache_key(self):
+        """A string uniquely identifying this type across processes, used to 
+        key the :obj:`disk_cache`. Defaults to the name of the type."""
+        return self.name
+    
     def observe(self, context, node):
         """Called when this type has been assigned to an expression, given by 
         ``node``."""
@@ -302,6 +540,20 @@ class Type(object):
             "Type '%s' does not support the call operation." % 
             self.name, node.func)
         
+    def is_pure_Call(self, context, node):
+        """Returns whether calling a value of this type, as in the provided 
+        call, has no side effects and gives a result depending only on the 
+        arguments, so the :mod:`optimization passes <passes>` may evaluate 
+        it fewer times or earlier than written. False by default."""
+        return False
+    
+    def is_elementwise_Call(self, context, node):
+        """Returns whether calling a value of this type, as in the provided 
+        call, with vectors of the same type in place of each scalar argument 
+        applies it to each of their components in turn, so 
+        :class:`passes.VectorizeElementwise` may do so. False by default."""
+        return False
+        
     def validate_Return(self, context, node):
         raise TypeResolutionError(
             "Type '%s' does not support the 'return' statement." % 
@@ -383,7 +635,7 @@ class VirtualType(Type):
     """Designates a type that does not have a concrete representation (e.g. 
     singleton function types)."""
 
-def _generic_generate_Call(context, node):
+def _generic_generate_Call(context, node, name):
     arg_types = tuple(arg.unresolved_type.resolve(context)
                       for arg in node.args)
     args = tuple(context.visit(arg)
@@ -391,7 +643,8 @@ def _generic_generate_Call(context, node):
                  if not isinstance(arg_types[i], VirtualType))
     func = context.visit(node.func)
     
-    code = (func.code, "(",
+    # the function may have been passed under another name
+    code = (name, "(",
             cypy.join((arg.code for arg in args), ", "),
             ")")
     
@@ -406,6 +659,10 @@ class GenericFnType(VirtualType):
     def __init__(self, generic_fn):
         VirtualType.__init__(self, generic_fn.name)
         self.generic_fn = generic_fn
+        
+    @property
+    def cache_key(self):
+        return "GenericFn(%s)" % self.generic_fn.cache_key
          
     def resolve_Call(self, context, node):
         arg_types = tuple(arg.unresolved_type.resolve(context)
@@ -414,14 +671,14 @@ class GenericFnType(VirtualType):
         return concrete_fn.return_type
     
     def generate_Call(self, context, node):
-        r = _generic_generate_Call(context, node)
         arg_types = tuple(arg.unresolved_type.resolve(context)
                           for arg in node.args)
         concrete_fn = self.generic_fn.compile(context.backend, *arg_types)
-        cypy.extend_front(context.program_items, concrete_fn.program_items)
+        r = _generic_generate_Call(context, node, concrete_fn.name)
+        context.program_items.extend(concrete_fn.program_items)
         return r
 
-cypy.intern(GenericFnType)
+cypy.intern(GenericFnType, intern_max_size)
 GenericFn.Type = GenericFnType
 
 class ConcreteFnType(VirtualType):
@@ -430,6 +687,10 @@ class ConcreteFnType(VirtualType):
         VirtualType.__init__(self, concrete_fn.name)
         self.concrete_fn = concrete_fn
         
+    @property
+    def cache_key(self):
+        return "ConcreteFn(%s)" % self.concrete_fn.cache_key
+        
     def resolve_Call(self, context, node):
         arg_types = tuple(arg.unresolved_type.resolve(context)
                           for arg in node.args)
@@ -443,18 +704,89 @@ class ConcreteFnType(VirtualType):
         return concrete_fn.return_type
     
     def generate_Call(self, context, node):
-        r = _generic_generate_Call(context, node)
-        cypy.extend_front(context.program_items, self.concrete_fn.program_items)
+        r = _generic_generate_Call(context, node, 
+                                   self.concrete_fn.name)
+        context.program_items.extend(self.concrete_fn.program_items)
         return r
     
-cypy.intern(ConcreteFnType)
+cypy.intern(ConcreteFnType, intern_max_size)
 ConcreteFn.Type = ConcreteFnType
 
+def const(value, cl_type=None):
+    """Returns the type to give an argument to bind it to a constant value, 
+    rather than passing it each time the function is called::
+    
+        sum = reduce.compile(OpenCL, ocl.float.ptr_global, clq.const(256))
+    
+    The argument is removed from the signature of the concrete function and 
+    each reference to it is replaced by a literal of the provided type. If no 
+    type is provided, the value has the type a literal with the same value 
+    would have (see :meth:`Backend.type_of_constant`.) Operations on it can 
+    then be folded by the :mod:`optimization passes <passes>`.
+    """
+    return ConstantType(value, cl_type)
+
+class ConstantType(VirtualType):
+    """The type of an argument bound to a constant value. See :func:`const`.
+    
+    Constant types with the same value and type are equal, so functions 
+    compiled with them intern.
+    """
+    def __init__(self, value, cl_type=None):
+        if cl_type is None:
+            name = "const(%r)" % (value,)
+        else:
+            name = "const(%r, %s)" % (value, cl_type.name)
+        VirtualType.__init__(self, name)
+        self.value = value
+        self.cl_type = cl_type
+        # 1, 1.0 and True are equal but aren't the same constant
+        self._key = (type(value), value, cl_type)
+        
+    value = None
+    """The value of the argument."""
+    
+    cl_type = None
+    """The type of the value, or None to infer it."""
+    
+    def __eq__(self, other):
+        return isinstance(other, ConstantType) and self._key == other._key
+    
+    def __ne__(self, other):
+        return not self == other
+    
+    def __hash__(self):
+        return hash(self._key)
+    
+    @property
+    def cache_key(self):
+        cl_type = self.cl_type
+        return "const(%s, %r, %s)" % (type(self.value).__name__, self.value,
+            None if cl_type is None else cl_type.cache_key)
+        
+    def resolve_constant(self, backend):
+        """Returns a pair containing the type of the value and the value 
+        converted to that type."""
+        value = self.value
+        cl_type = self.cl_type
+        if cl_type is None:
+            cl_type = backend.type_of_constant(value)
+        coerce = getattr(cl_type, 'coerce', None)
+        converted = None if coerce is None else coerce(value)
+        # floats may be rounded to a narrower float type, but never 
+        # truncated to an integer
+        if converted is None or (converted != value and 
+                                 not (isinstance(value, float) and 
+                                      isinstance(converted, float))):
+            raise Error("Constant %r can not be represented as a '%s'." % 
+                        (value, cl_type.name))
+        return cl_type, converted
+
 class Backend(object):
     """Abstract base class for a backend language specification."""
     def __init__(self, name):
         self.name = name
-        self.program_items = cypy.SetList([])
+        self.program_items = cypy.IndexedSetList()
         
     def init_context(self, context):
         """Initializes a :class:`context <Context>`."""
@@ -474,6 +806,33 @@ class Backend(object):
         by compiling a concrete function to the global list of program items."""
         self.program_items.extend(items)
         
+    def link(self, module):
+        """Returns the source code of a :class:`Module`, consisting of a block
+        enabling its extensions followed by its program items."""
+        pragmas = [ ]
+        for extension in module.extensions:
+            pragma = self.extension_pragma(extension)
+            if pragma is not None:
+                pragmas.append(pragma)
+        code = [item.code for item in module.program_items]
+        if pragmas:
+            code.insert(0, "\n".join(pragmas) + "\n")
+        return "\n".join(code)
+    
+    def extension_pragma(self, extension):
+        """Returns the line of code enabling the named extension, or None if
+        none is needed."""
+        return None
+        
+    def type_for_name(self, name):
+        """Returns the type with the provided name, or None if this backend
+        does not know of one.
+        
+        Used to restore types that were stored by name (e.g. by the 
+        :obj:`disk_cache`.)
+        """
+        return None
+        
     def void_type(self, context, node):
         raise TypeResolutionError(
             "Backend does not specify a void type.", node) 
@@ -485,6 +844,63 @@ class Backend(object):
     def generate_Num(self, context, node):
         raise CodeGenerationError(
             "Backend cannot handle raw numeric literals.", node)
+    
+    def type_of_constant(self, value):
+        """Returns the type of a :func:`constant <const>` Python value bound 
+        to an argument without specifying a type."""
+        raise Error("Backend does not support constant arguments.")
+    
+    def is_global_id(self, context, node):
+        """Returns whether the provided expression gives the index of the 
+        work-item running the function in the first dimension, as assigned 
+        to a variable by elementwise kernels. False by default.
+        
+        This and the following methods are used by 
+        :class:`passes.VectorizeElementwise`, and backends without vector 
+        types needn't provide them."""
+        return False
+    
+    def dispatcher(self, generic_fn):
+        """Returns a callable launching the provided generic function on its
+        arguments when it is called. See :obj:`call_backend`."""
+        raise Error("The %s backend can't launch generic functions." % 
+                    self.name)
+    
+    def is_work_item_call(self, context, node):
+        """Returns whether the provided expression calls a function giving 
+        the dimensions of the launch or the position of the work-item in it,
+        whose values differ once the launch is split. False by default."""
+        return False
+    
+    def vector_type(self, scalar_type, width):
+        """Returns the type of vectors of ``width`` values of the provided 
+        scalar type, or None if there is none."""
+        return None
+    
+    def vector_load_fn(self, ptr_type, width):
+        """Returns a pair containing the name and type of the function 
+        loading ``width`` consecutive values through pointers of the provided
+        type, called with the offset in vectors and the pointer, or None if 
+        there is none."""
+        return None
+    
+    def vector_store_fn(self, ptr_type, width):
+        """Returns a pair containing the name and type of the function 
+        storing a vector as ``width`` consecutive values through pointers of 
+        the provided type, called with the vector, the offset in vectors and 
+        the pointer, or None if there is none."""
+        return None
+    
+    def vector_literal_fn(self, vector_type):
+        """Returns a pair containing the name and type of the function giving
+        vectors of the provided type with each component set to the scalar 
+        it is called with."""
+        raise Error("Backend does not support vector types.")
+    
+    def vector_convert_fn(self, vector_type):
+        """Returns a pair containing the name and type of the function 
+        converting vectors with as many components to the provided type."""
+        raise Error("Backend does not support vector types.")
         
     def resolve_Str(self, context, node):
         raise TypeResolutionError(
@@ -550,14 +966,58 @@ class Context(object):
         
         self.body = [ ]
         self.stmts = [ ]
-        self.program_items = cypy.SetList()
+        self.program_items = cypy.IndexedSetList()
                 
-        # used to provide base case for resolving multiple assignments
-        self._resolving_name = None
-        self._multiple_assignment_prev = { }
+        self.resolved_types = { }
+        self.local_variable_solver = None
+        self.added_variables = { }
+        self._variable_names = None
         
         backend.init_context(self)
         
+    resolved_types = None
+    """A dict mapping the unresolved types in the function being compiled to 
+    their resolved types. 
+    
+    This is only needed until the function is compiled, so it is emptied 
+    afterwards by :meth:`release_resolution_table`."""
+    
+    local_variable_solver = None
+    """The :class:`internals.LocalVariableSolver` which infers the types of 
+    local variables, created when the first one is resolved."""
+    
+    added_variables = None
+    """A dict mapping the names of the local variables added to the function 
+    by the :mod:`optimization passes <passes>`, which don't appear in its 
+    source, to their types."""
+    
+    def add_variable(self, basename, clq_type):
+        """Adds a local variable with the provided type to the 
+        :attr:`added_variables`, returning its name.
+        
+        The name is based on the provided one but differs from every other 
+        name in the function, as generated by :class:`cypy.Naming`."""
+        names = self._variable_names
+        if names is None:
+            names = self._variable_names = cypy.Naming(None)
+            generic_fn = self.generic_fn
+            used = set(generic_fn.arg_names)
+            for stmt in generic_fn.annotated_ast.body:
+                used.update(node.id for node in passes.walk(stmt)
+                            if isinstance(node, _ast.Name))
+            for name in sorted(used):
+                names.generate_unique_name(name)
+        name = names.generate_unique_name(basename)
+        self.added_variables[name] = clq_type
+        return name
+        
+    def release_resolution_table(self):
+        """Empties :attr:`resolved_types` and drops the 
+        :attr:`local_variable_solver`, which is called once the function has 
+        been compiled. Any later resolution is simply done again."""
+        self.resolved_types = { }
+        self.local_variable_solver = None
+        
     def visit(self, node):
         return self.visitor.visit(node)
     
@@ -570,15 +1030,166 @@ class Context(object):
 
 class ProgramItem(object):
     """Represents a top-level item in the generated source code."""
-    def __init__(self, name, code):
+    def __init__(self, name, code, dependencies=(), extensions=()):
         self.name = name
         self.code = code
+        self.dependencies = dependencies
+        self.extensions = extensions
         
     name = None
     """The name of the item, if it has a name, or None."""
     
     code = None
     """The source code associated with this item."""
+    
+    dependencies = ()
+    """A tuple of the program items which must precede this one."""
+    
+    extensions = ()
+    """A tuple of the names of the backend extensions this item requires."""
+    
+    @cypy.lazy(property)
+    def content_hash(self):
+        """A digest of the source code of this item."""
+        return _hashlib.sha1(self.code).hexdigest()
+    
+    def intern(self):
+        """Returns the program item with the same name and code as this one 
+        that was interned first and is still alive, interning this one if 
+        there is none.
+        
+        Program items are compared by identity, so items restored from 
+        records (see :mod:`diskcache`) are interned to share one object for 
+        each helper rather than including it once per restored function."""
+        key = (self.name, self.content_hash)
+        item = _interned_program_items.get(key, None)
+        if item is None:
+            item = _interned_program_items[key] = self
+        return item
+
+_interned_program_items = _weakref.WeakValueDictionary()
+    
+class Module(object):
+    """A single translation unit containing many concrete functions, along 
+    with all the program items they need.
+    
+    Program items needed by more than one function are included once. Items 
+    are identified by name and, to catch distinct items with the same name, 
+    the hash of their code. They are ordered so each follows its 
+    dependencies, and the extensions required by any of them are enabled 
+    once, at the top.
+    
+    Functions which aren't kernels are named after their argument types by 
+    the backend, so specializations of the same generic function can be 
+    linked together, while kernels keep the name they are launched by::
+
+        module = clq.Module(OpenCL, (scale_f, scale_d, saxpy_f))
+        program = ctx.compile(module.code)
+    """
+    def __init__(self, backend, concrete_fns=()):
+        self.backend = backend
+        self.concrete_fns = [ ]
+        self.extend(concrete_fns)
+        
+    backend = None
+    """The :class:`Backend` all of the functions were compiled for."""
+    
+    concrete_fns = None
+    """The list of :class:`concrete functions <ConcreteFn>` in this module."""
+        
+    def add(self, concrete_fn):
+        """Adds a concrete function to this module."""
+        if concrete_fn.backend is not self.backend:
+            raise LinkError(
+                "Concrete function %s was compiled for the %s backend, not %s."
+                % (concrete_fn.generic_fn.name, concrete_fn.backend.name, 
+                   self.backend.name))
+        self.concrete_fns.append(concrete_fn)
+        
+    def extend(self, concrete_fns):
+        """Adds each of the provided concrete functions to this module."""
+        for concrete_fn in concrete_fns:
+            self.add(concrete_fn)
+            
+    @property
+    def program_items(self):
+        """A tuple of the distinct program items in this module, each after 
+        its dependencies."""
+        canonical = { } # key => first item seen with that key
+        ordered = [ ]
+        done = set() # keys of items in ordered
+        
+        def key_for(item):
+            name = item.name
+            if name is None:
+                return item.content_hash
+            try:
+                existing = canonical[name]
+            except KeyError:
+                canonical[name] = item
+            else:
+                if existing is not item and \
+                   existing.content_hash != item.content_hash:
+                    raise LinkError(
+                        "Program items with the same name, '%s', but "
+                        "different code can't be linked." % name)
+            return name
+                
+        def visit(item):
+            key = key_for(item)
+            if key in done:
+                return
+            # dependencies of an item are in dependency order already, so
+            # this doesn't recurse deeply
+            for dependency in item.dependencies:
+                visit(dependency)
+            done.add(key)
+            ordered.append(item)
+        
+        for concrete_fn in self.concrete_fns:
+            for item in concrete_fn.program_items:
+                visit(item)
+        return tuple(ordered)
+    
+    @property
+    def extensions(self):
+        """A tuple of the names of the extensions required by any of the 
+        program items in this module."""
+        extensions = cypy.IndexedSetList()
+        for item in self.program_items:
+            extensions.extend(item.extensions)
+        return tuple(extensions)
+        
+    @property
+    def code(self):
+        """The source code of this module. See :meth:`Backend.link`."""
+        return self.backend.link(self)
+    
+    @property
+    def vectorized_kernels(self):
+        """A dict mapping the names of the kernels in this module with 
+        :attr:`vectorized <GenericFn.vectorize>` variants in it to pairs 
+        containing the name of the variant and the number of elements each of
+        its work-items processes."""
+        vectorized_kernels = { }
+        for concrete_fn in self.concrete_fns:
+            generic_fn = concrete_fn.generic_fn
+            width = generic_fn.vectorize
+            if width is not None:
+                scalar_fn = generic_fn.with_options(vectorize=None).compile(
+                    self.backend, *concrete_fn.arg_types)
+                vectorized_kernels[scalar_fn.name] = (concrete_fn.name, width)
+        return vectorized_kernels
+    
+    def compile(self, ctx, options=""):
+        """Compiles the code of this module in the provided context, e.g. a 
+        :class:`pyocl.Context`, in one step.
+        
+        The :attr:`vectorized_kernels` are saved as the attribute of the same 
+        name of the program, which :class:`pyocl.Kernel` uses."""
+        program = ctx.compile(self.code, options)
+        program.vectorized_kernels = self.vectorized_kernels
+        return program
 
 class Error(Exception):
     """Base class for errors in cl.oquence."""
@@ -604,5 +1215,12 @@ class CodeGenerationError(Error):
         self.message = message
         self.node = node
 
+class LinkError(Error):
+    """Raised to indicate that the functions in a :class:`Module` can not be 
+    linked together."""
+
 # placed at the end because the internals use the definitions above
-import internals 
+import internals
+import diskcache
+import instrument
+import passes
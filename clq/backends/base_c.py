@@ -1,4 +1,8 @@
 import ast as _ast
+import re as _re
+import struct as _struct
+import hashlib as _hashlib
+import operator as _operator
 
 import cypy
 import cypy.astx as astx
@@ -21,6 +25,13 @@ class Backend(clq.Backend):
     ## Generating Program Items
     ######################################################################
     def generate_program_item(self, context):
+        self._remove_unused_declarations(context)
+        if context.return_type != self.void_t and \
+           "__kernel" in context.modifiers:
+            # only functions returning void can be kernels, the others are
+            # called from them
+            context.modifiers.remove("__kernel")
+        
         g = cg.CG()
         g.append(cypy.join(cypy.cons(context.modifiers, 
                                      (context.return_type.name,)), " "))
@@ -33,6 +44,36 @@ class Backend(clq.Backend):
         g.append((context.untab, "\n}\n"))
         return clq.ProgramItem(name, g.code)
         
+    def _remove_unused_declarations(self, context):
+        # declarations are added as assignments are generated, so they can 
+        # be left behind when passes remove references to a variable and are 
+        # missing when a variable is only read after its assignments were 
+        # removed as unreachable
+        names = _names_in(context.body)
+        added_variables = context.added_variables
+        if names is None:
+            # inline code may refer to anything
+            for id in sorted(added_variables):
+                self._add_declaration(context, id, added_variables[id])
+            return
+        
+        declared = set()
+        declarations = [ ]
+        for decl in context.declarations:
+            id = decl[:-1].rsplit(" ", 1)[-1]
+            if id in names:
+                declared.add(id)
+                declarations.append(decl)
+        context.declarations = declarations
+        
+        local_variables = context.generic_fn.local_variables
+        for id in sorted(names - declared):
+            if id in local_variables:
+                self._add_declaration(context, id, 
+                                      local_variables[id].resolve(context))
+            elif id in added_variables:
+                self._add_declaration(context, id, added_variables[id])
+        
     def _yield_arg_str(self, context):
         concrete_fn = context.concrete_fn
         for arg_name, arg_type in zip(concrete_fn.generic_fn.arg_names, 
@@ -41,8 +82,29 @@ class Backend(clq.Backend):
                 yield (arg_type.name, " ", arg_name)
     
     def _generate_name(self, context):
-        # TODO: proper namespacing
-        return context.concrete_fn.generic_fn.name
+        # kernels keep their names, which the host looks them up by, while
+        # the functions they call are mangled by their argument types so 
+        # that specializations of one generic function can be linked 
+        # together, e.g. scale_float_float and scale_double_double
+        concrete_fn = context.concrete_fn
+        generic_fn = concrete_fn.generic_fn
+        if generic_fn.vectorize is not None:
+            # so it can be linked with the kernel it is a variant of
+            return "%s_x%d" % (generic_fn.name, generic_fn.vectorize)
+        if "__kernel" in context.modifiers:
+            return generic_fn.name
+        parts = [generic_fn.name]
+        virtual = [ ]
+        for arg_type in concrete_fn.arg_types:
+            if isinstance(arg_type, clq.VirtualType):
+                virtual.append(arg_type.cache_key)
+            else:
+                parts.extend(_re.findall("[A-Za-z0-9]+", 
+                    arg_type.name.replace("*", " ptr")))
+        if virtual:
+            # e.g. the functions passed to it, which have no C types
+            parts.append(_hashlib.sha1("\0".join(virtual)).hexdigest()[:8])
+        return "_".join(parts)
     
     def _add_declaration(self, context, id, type):
         decl = type.name + " " + id + ";"
@@ -68,12 +130,23 @@ class Backend(clq.Backend):
     def resolve_Num(self, context, node):
         n = node.n
         if cypy.is_int_like(n):
-            return self.int_t
+            int_type = self.int_type_for(n)
+            if int_type is None:
+                raise clq.TypeResolutionError(
+                    "Integer literal %d is out of range of %s." %
+                    (n, self.int_literal_types[-1].name), node)
+            return int_type
         else:
             return self.float_t
         
     def generate_Num(self, context, node):
-        code = str(node.n)
+        unresolved_type = node.unresolved_type
+        if isinstance(unresolved_type, clq.internals.NumURT) and \
+           unresolved_type.resolve(context) in (self.int_t, self.float_t):
+            code = str(node.n)
+        else:
+            # a literal introduced by the compiler, e.g. a folded constant
+            code = unresolved_type.resolve(context).literal_for(node.n)
         
         return astx.copy_node(node,
             code = code                  
@@ -82,6 +155,33 @@ class Backend(clq.Backend):
     int_t = None
     float_t = None
     
+    int_literal_types = ()
+    """The types given to integer literals in the source, in order of 
+    preference. A literal has the first one which can hold its value, as 
+    with decimal literals in C, which are never unsigned. If empty, all
+    literals are given :attr:`int_t`, as constant arguments without a type
+    always are."""
+    
+    def int_type_for(self, value):
+        """Returns the type of an integer literal with the provided value, or
+        None if none of the :attr:`int_literal_types` can hold it."""
+        literal_types = self.int_literal_types
+        if not literal_types:
+            return self.int_t
+        for cl_type in literal_types:
+            if cl_type.coerce(value) == value:
+                return cl_type
+        return None
+    
+    def type_of_constant(self, value):
+        if isinstance(value, bool):
+            return self.bool_t
+        elif cypy.is_int_like(value):
+            return self.int_t
+        elif cypy.is_float_like(value):
+            return self.float_t
+        raise clq.Error("Unsupported constant: %r." % (value,))
+    
     def resolve_Str(self, context, node):
         return self.string_t
     
@@ -241,6 +341,29 @@ class Backend(clq.Backend):
             code=code
         )
         
+def _names_in(stmts):
+    # the set of names referred to in a generated function body, or None if 
+    # it contains inline code
+    names = set()
+    nodes = list(stmts)
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, _ast.Name):
+            names.add(node.id)
+        elif isinstance(node, _ast.Exec):
+            return None
+        for field in cypy.cons(node._fields, _generated_fields):
+            value = getattr(node, field, None)
+            if isinstance(value, _ast.AST):
+                nodes.append(value)
+            elif isinstance(value, list):
+                nodes.extend(item for item in value 
+                             if isinstance(item, _ast.AST))
+    return names
+
+# fields added to generated for loops
+_generated_fields = ('init', 'guard', 'update_stmt')
+        
 class Type(clq.Type):
         
     min_sizeof = None
@@ -321,6 +444,28 @@ class BoolType(Type):
     def __init__(self, name='bool'):
         Type.__init__(self, name)
         
+    true_literal = "1"
+    """The code for a true literal."""
+    
+    false_literal = "0"
+    """The code for a false literal."""
+    
+    def coerce(self, value):
+        """Returns the provided Python value converted to this type."""
+        return bool(value)
+    
+    def literal_for(self, value):
+        """Returns a literal with the provided value."""
+        if value:
+            return self.true_literal
+        return self.false_literal
+    
+    def fold_UnaryOp(self, op_type, operand):
+        """Returns the value of applying the unary operator of the provided 
+        type to a constant, or None if it can not be determined."""
+        if op_type is _ast.Not:
+            return not operand
+        
     def resolve_BoolOp(self, context, node):
         right_type = node.values[1].unresolved_type.resolve(context)
         if not isinstance(right_type, BoolType):
@@ -401,9 +546,68 @@ class ScalarType(Type):
     respectively, unless the integer exceeds the bounds for 32-bit integers
     in which case it is promoted to a long.
     """
+
+    def literal_for(self, value):
+        """Returns a literal of this type with the provided value, which 
+        should have been produced by :meth:`coerce`."""
+        return self.make_literal(self._bare_literal(value))
+    
+    def _bare_literal(self, value):
+        return str(value)
+    
+    def coerce(self, value):
+        """Returns the provided Python number converted to this type as C 
+        would convert it, or None if that can not be determined at compile
+        time (e.g. because the size of this type depends on the device.)"""
+        return None
+    
+    def fold_UnaryOp(self, op_type, operand):
+        """Returns the value of this type resulting from applying the unary 
+        operator of the provided type to a constant, or None if it can not be 
+        determined at compile time."""
+        return None
+    
+    def fold_BinOp(self, op_type, left, right):
+        """Returns the value of this type resulting from applying the binary
+        operator of the provided type to two constants, or None if it can not 
+        be determined at compile time (e.g. division by zero.)
+        
+        Both operands are first converted to this type, as is done by the 
+        usual arithmetic conversions in C."""
+        return None
+    
+    def common_type(self, other, backend):
+        """Returns the type values of this type and the provided type are
+        converted to before being operated on, or None."""
+        return self._resolve_BinOp(_ast.Add, other, backend)
+    
+    def _resolve_BinOp(self, op_type, right_type, backend):
+        return None
+    
+    def fold_Compare(self, op_type, left, right):
+        """Returns the result of comparing two constants after converting 
+        them to this type, or None if it can not be determined at compile 
+        time."""
+        left = self.coerce(left)
+        right = self.coerce(right)
+        if left is None or right is None:
+            return None
+        try:
+            compare = _compare_folds[op_type]
+        except KeyError:
+            return None
+        return compare(left, right)
     
     def resolve_Compare(self, context, node):
         right_type = node.comparators[0].unresolved_type.resolve(context)
+        if isinstance(right_type, VectorType):
+            # elementwise
+            try:
+                return right_type._resolve_Compare(type(node.ops[0]), self)
+            except TypeResolutionError as e:
+                if e.node is None:
+                    e.node = node
+                raise e
         if not isinstance(right_type, ScalarType):
             raise TypeResolutionError(
                 "Cannot compare values of type '%s' and '%s'." % 
@@ -439,6 +643,85 @@ class IntegerType(ScalarType):
     unsigned_variant = None
     """If integer, this provides the unsigned variant of the type."""
     
+    def coerce(self, value):
+        sizeof = self.min_sizeof
+        if sizeof is None or sizeof != self.max_sizeof:
+            return None
+        if isinstance(value, float):
+            if value != value or value in (_inf, -_inf):
+                return None
+            value = int(value) # truncates towards zero, like C
+        bits = 8 * sizeof
+        value = long(value) & ((1 << bits) - 1)
+        if not self.unsigned and value >> (bits - 1):
+            value -= 1 << bits
+        return int(value)
+    
+    def literal_for(self, value):
+        if self.literal_suffix is not None and not self.unsigned and \
+           value == -(1 << (8 * self.min_sizeof - 1)):
+            # the literal of the minimum's negation doesn't fit in the type
+            return "(%s - 1)" % self.make_literal(str(value + 1))
+        return ScalarType.literal_for(self, value)
+    
+    def _folded(self, value):
+        # signed overflow is undefined in C, so such expressions are left for
+        # the device rather than wrapped
+        folded = self.coerce(value)
+        if not self.unsigned and folded != value:
+            return None
+        return folded
+    
+    def fold_UnaryOp(self, op_type, operand):
+        operand = self.coerce(operand)
+        if operand is None:
+            return None
+        if op_type is _ast.USub:
+            return self._folded(-operand)
+        elif op_type is _ast.UAdd:
+            return operand
+        elif op_type is _ast.Invert:
+            return self.coerce(~operand)
+        
+    def fold_BinOp(self, op_type, left, right):
+        left = self.coerce(left)
+        right = self.coerce(right)
+        if left is None or right is None:
+            return None
+        
+        if op_type is _ast.Div or op_type is _ast.Mod:
+            if right == 0:
+                return None
+            # C truncates towards zero, Python rounds towards negative 
+            # infinity
+            quotient, remainder = divmod(abs(left), abs(right))
+            if (left < 0) != (right < 0):
+                quotient = -quotient
+            quotient = self._folded(quotient)
+            if quotient is None:
+                # e.g. the minimum divided by -1
+                return None
+            if op_type is _ast.Div:
+                return quotient
+            if left < 0:
+                remainder = -remainder
+            return self.coerce(remainder)
+        elif op_type is _ast.LShift or op_type is _ast.RShift:
+            if not 0 <= right < 8 * self.min_sizeof:
+                return None
+            if op_type is _ast.LShift:
+                if left < 0:
+                    # undefined for signed types
+                    return None
+                return self._folded(left << right)
+            return self.coerce(left >> right)
+        
+        try:
+            fold = _integer_folds[op_type]
+        except KeyError:
+            return None
+        return self._folded(fold(left, right))
+    
     def resolve_UnaryOp(self, context, node):
         op = node.op
         if isinstance(op, _ast.Not):
@@ -476,16 +759,19 @@ class IntegerType(ScalarType):
     def resolve_BinOp(self, context, node):
         right_type = node.right.unresolved_type.resolve(context)
         try:
-            return self._resolve_BinOp(node.op, right_type, context.backend)
+            return self._resolve_BinOp(type(node.op), right_type, 
+                                       context.backend)
         except TypeResolutionError as e:
             if e.node is None:
                 e.node = node
             raise e
         
     @cypy.memoize
-    def _resolve_BinOp(self, op, right_type, backend):        
+    def _resolve_BinOp(self, op_type, right_type, backend):        
+        # memoized on the type of the operator, not the operator node, so 
+        # the cache is bounded by the number of types and operators
         if isinstance(right_type, FloatType):
-            return right_type._resolve_BinOp(op, self, backend)
+            return right_type._resolve_BinOp(op_type, self, backend)
         
         elif isinstance(right_type, IntegerType):
             min_sizeof = self.min_sizeof
@@ -501,7 +787,7 @@ class IntegerType(ScalarType):
                 else:
                     return backend.int_t
             elif right_type.min_sizeof < 4:
-                return right_type._resolve_BinOp(op, self, backend)
+                return right_type._resolve_BinOp(op_type, self, backend)
             else:
                 right_max = right_type.max_sizeof
                 self_max = self.max_sizeof
@@ -517,8 +803,11 @@ class IntegerType(ScalarType):
                     else:
                         return right_type
                     
+        elif isinstance(right_type, VectorType):
+            return right_type._resolve_BinOp(op_type, self, backend)
+        
         # pointer arithmetic
-        elif isinstance(right_type, PtrType) and isinstance(op, _ast.Add):
+        elif isinstance(right_type, PtrType) and issubclass(op_type, _ast.Add):
             return right_type
     
     def generate_BinOp(self, context, node):
@@ -572,7 +861,7 @@ class IntegerType(ScalarType):
     
     def validate_AugAssign(self, context, node):
         # TODO: Need to check value too right?
-        context.concrete_fn.generic_fn.local_variables[node.target.id].resolve(context)
+        node.target.unresolved_type.resolve(context)
 
     def generate_AugAssign(self, context, node):
         target = context.visit(node.target)
@@ -613,6 +902,56 @@ class FloatType(ScalarType):
     def sizeof(self):
         return self.min_sizeof
     
+    def coerce(self, value):
+        sizeof = self.sizeof
+        try:
+            value = float(value)
+        except OverflowError:
+            return None
+        if sizeof == 4:
+            try:
+                value = _struct.unpack("f", _struct.pack("f", value))[0]
+            except OverflowError:
+                return None
+        elif sizeof != 8:
+            # no Python equivalent for half
+            return None
+        if value != value or value in (_inf, -_inf):
+            return None
+        return value
+    
+    def _bare_literal(self, value):
+        # the shortest literal which gives back the same value
+        for precision in xrange(6, 18):
+            literal = "%.*g" % (precision, value)
+            if self.coerce(float(literal)) == value:
+                break
+        if "." not in literal and "e" not in literal:
+            literal += ".0"
+        return literal
+    
+    def fold_UnaryOp(self, op_type, operand):
+        operand = self.coerce(operand)
+        if operand is None:
+            return None
+        if op_type is _ast.USub:
+            return -operand
+        elif op_type is _ast.UAdd:
+            return operand
+    
+    def fold_BinOp(self, op_type, left, right):
+        left = self.coerce(left)
+        right = self.coerce(right)
+        if left is None or right is None:
+            return None
+        if op_type is _ast.Div and right == 0:
+            return None
+        try:
+            fold = _float_folds[op_type]
+        except KeyError:
+            return None
+        return self.coerce(fold(left, right))
+    
     def resolve_UnaryOp(self, context, node):
         op = node.op
         if isinstance(op, (_ast.USub, _ast.UAdd)):
@@ -641,13 +980,14 @@ class FloatType(ScalarType):
     def resolve_BinOp(self, context, node):
         right_type = node.right.unresolved_type.resolve(context)
         try:
-            return self._resolve_BinOp(node.op, right_type, context.backend)
+            return self._resolve_BinOp(type(node.op), right_type, 
+                                       context.backend)
         except TypeResolutionError as e:
             if e.node is None:
                 e.node = node
             raise e
 
-    def _resolve_BinOp(self, op, right_type, backend):
+    def _resolve_BinOp(self, op_type, right_type, backend):
         if isinstance(right_type, FloatType):
             self_sizeof = self.sizeof
             right_sizeof = right_type.sizeof
@@ -666,6 +1006,8 @@ class FloatType(ScalarType):
                 return self
             else:
                 return backend.float_t    
+        elif isinstance(right_type, VectorType):
+            return right_type._resolve_BinOp(op_type, self, backend)
         
     def generate_BinOp(self, context, node):
         left = context.visit(node.left)
@@ -709,7 +1051,7 @@ class FloatType(ScalarType):
             
     def validate_AugAssign(self, context, node):
         # TODO: Need to check value too right?
-        context.concrete_fn.generic_fn.local_variables[node.target.id].resolve(context)
+        node.target.unresolved_type.resolve(context)
     
     def generate_AugAssign(self, context, node):
         target = context.visit(node.target)
@@ -745,6 +1087,192 @@ class FloatType(ScalarType):
         # TODO: implement this
         #pass
     
+class VectorType(Type):
+    """Base class for vector types, whose values consist of a fixed number of
+    components of a scalar type which are operated on elementwise."""
+    def __init__(self, base_type, n):
+        self.base_type = base_type
+        self.n = n
+        Type.__init__(self, "%s%d" % (base_type.name, n))
+    
+    base_type = None
+    """The type of the components of values of this type."""
+    
+    n = None
+    """The number of components in values of this type."""
+    
+    compare_type = None
+    """The type resulting from comparing values of this type, or None if they
+    can't be compared."""
+    
+    @property
+    def min_sizeof(self):
+        return self.base_type.min_sizeof * self.n
+    
+    @property
+    def max_sizeof(self):
+        return self.base_type.max_sizeof * self.n
+    
+    def converts(self, scalar_type):
+        """Returns whether a value of the provided scalar type is implicitly
+        converted to this type when used as an operand along with a value of
+        this type.
+    
+        Integers convert to any vector type and floating point numbers to
+        vectors of floating point numbers at least as wide."""
+        if isinstance(scalar_type, IntegerType):
+            return True
+        elif isinstance(scalar_type, FloatType):
+            base_type = self.base_type
+            return isinstance(base_type, FloatType) and \
+                scalar_type.max_sizeof <= base_type.min_sizeof
+        return False
+    
+    def resolve_UnaryOp(self, context, node):
+        op = node.op
+        if isinstance(op, (_ast.USub, _ast.UAdd)) or (
+                isinstance(op, _ast.Invert) and
+                isinstance(self.base_type, IntegerType)):
+            # no promotions, unlike scalars
+            return self
+        else:
+            raise TypeResolutionError(
+                "The '%s' operator is not supported for values of type '%s'." %
+                (astx.all_operators[type(op)], self.name), node.operand)
+    
+    def generate_UnaryOp(self, context, node):
+        op = context.visit(node.op)
+        operand = context.visit(node.operand)
+    
+        code = ("(", op.code, "(", operand.code, "))")
+    
+        return astx.copy_node(node,
+            op=op,
+            operand=operand,
+    
+            code=code
+        )
+    
+    def resolve_BinOp(self, context, node):
+        right_type = node.right.unresolved_type.resolve(context)
+        try:
+            return self._resolve_BinOp(type(node.op), right_type,
+                                       context.backend)
+        except TypeResolutionError as e:
+            if e.node is None:
+                e.node = node
+            raise e
+    
+    @cypy.memoize
+    def _resolve_BinOp(self, op_type, other_type, backend):
+        # elementwise, so scalars on the left also end up here
+        if op_type not in astx.C_integer_binary_operators and \
+           op_type not in astx.C_non_integer_binary_operators:
+            raise TypeResolutionError(
+                "The '%s' operator is not supported for vectors." %
+                astx.all_operators[op_type], None)
+        if op_type not in astx.C_non_integer_binary_operators and \
+           not isinstance(self.base_type, IntegerType):
+            raise TypeResolutionError(
+                "The '%s' operator is not supported for values of type '%s'." %
+                (astx.all_operators[op_type], self.name), None)
+    
+        if other_type == self or (isinstance(other_type, ScalarType) and
+                                  self.converts(other_type)):
+            return self
+        raise TypeResolutionError(
+            "Cannot operate on values of types '%s' and '%s' together." %
+            (self.name, other_type.name), None)
+    
+    def generate_BinOp(self, context, node):
+        left = context.visit(node.left)
+        op = context.visit(node.op)
+        right = context.visit(node.right)
+    
+        code = ("(", left.code, " ", op.code, " ", right.code, ")")
+    
+        return astx.copy_node(node,
+            left=left,
+            op=op,
+            right=right,
+    
+            code=code
+        )
+    
+    def resolve_Compare(self, context, node):
+        right_type = node.comparators[0].unresolved_type.resolve(context)
+        try:
+            return self._resolve_Compare(type(node.ops[0]), right_type)
+        except TypeResolutionError as e:
+            if e.node is None:
+                e.node = node
+            raise e
+    
+    @cypy.memoize
+    def _resolve_Compare(self, op_type, other_type):
+        compare_type = self.compare_type
+        if op_type not in _compare_folds or compare_type is None:
+            raise TypeResolutionError(
+                "The '%s' operator is not supported for values of type '%s'." %
+                (astx.all_operators[op_type], self.name), None)
+    
+        if other_type == self or (isinstance(other_type, ScalarType) and
+                                  self.converts(other_type)):
+            return compare_type
+        raise TypeResolutionError(
+            "Cannot compare values of type '%s' and '%s'." %
+            (self.name, other_type.name), None)
+    
+    def generate_Compare(self, context, node):
+        left = context.visit(node.left)
+        right = context.visit(node.comparators[0])
+        op = context.visit(node.ops[0])
+    
+        code = (left.code, " ", op.code, " ", right.code)
+    
+        return astx.copy_node(node,
+            left=left,
+            ops=[op],
+            comparators=[right],
+    
+            code=code
+        )
+    
+    def validate_AugAssign(self, context, node):
+        value_type = node.value.unresolved_type.resolve(context)
+        try:
+            self._resolve_BinOp(type(node.op), value_type, context.backend)
+        except TypeResolutionError as e:
+            if e.node is None:
+                e.node = node
+            raise e
+    
+    def generate_AugAssign(self, context, node):
+        target = context.visit(node.target)
+        value = context.visit(node.value)
+        op = context.visit(node.op)
+    
+        # add declaration
+        id = target.id
+        local_variables = context.generic_fn.local_variables
+        if id in local_variables:
+            context.backend._add_declaration(context,
+                id, local_variables[id].resolve(context))
+    
+        # add code
+        context.stmts.append((self.generate_AugAssign_stmt(
+            target.code,
+            op.code,
+            value.code
+        ), context.end_stmt))
+    
+        # add node
+        context.body.append(astx.copy_node(node,
+            target=target,
+            value=value,
+            op=op
+        ))
+
 class PtrType(Type):
     def __init__(self, target_type):
         self.target_type = target_type
@@ -893,6 +1421,33 @@ class StructureType(Type):
             op=op
         ))
         
+_inf = float("inf")
+
+_float_folds = {
+    _ast.Add: _operator.add,
+    _ast.Sub: _operator.sub,
+    _ast.Mult: _operator.mul,
+    _ast.Div: _operator.truediv
+}
+
+_integer_folds = {
+    _ast.Add: _operator.add,
+    _ast.Sub: _operator.sub,
+    _ast.Mult: _operator.mul,
+    _ast.BitOr: _operator.or_,
+    _ast.BitXor: _operator.xor,
+    _ast.BitAnd: _operator.and_
+}
+
+_compare_folds = {
+    _ast.Eq: _operator.eq,
+    _ast.NotEq: _operator.ne,
+    _ast.Lt: _operator.lt,
+    _ast.LtE: _operator.le,
+    _ast.Gt: _operator.gt,
+    _ast.GtE: _operator.ge
+}
+
 keywords = (
     "auto",
     "break",
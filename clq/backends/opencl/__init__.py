@@ -15,10 +15,22 @@ class Type(base_c.Type):
     def sizeof_for(self, device):
         # TODO: Implement this
         return self.max_sizeof
+    
+    required_extensions = ()
+    """A tuple of the :class:`extensions <Extension>` which must be enabled 
+    to use this type."""
+    
+    def observe(self, context, node):
+        context.extensions.extend(self.required_extensions)
 
 class ScalarType(base_c.ScalarType, Type):
     ptr = None
     
+    vector_types = None
+    """A dict mapping each of the :obj:`vector_type_sizes` to the 
+    :class:`VectorType` with components of this type, or None if there are no
+    such vector types."""
+    
     @cypy.lazy(property)
     def ptr_global(self):
         return GlobalPtrType(self)
@@ -59,6 +71,9 @@ void = VoidType()
 class BoolType(base_c.BoolType, Type):
     ptr = None
     
+    true_literal = "true"
+    false_literal = "false"
+    
     @cypy.lazy(property)
     def ptr_global(self):
         return GlobalPtrType(self)
@@ -110,6 +125,12 @@ short, ushort = IntegerType._make_pair('short', 2)
 int, uint = IntegerType._make_pair('int', 4)
 long, ulong = IntegerType._make_pair('long', 8)
 
+# char and short literals are written with casts
+int.literal_suffix = ""
+uint.literal_suffix = "u"
+long.literal_suffix = "L"
+ulong.literal_suffix = "UL"
+
 machine_independent_int_types = dict(
     (name, _globals[name]) for name in 
     ('char', 'uchar', 'short', 'ushort', 'int', 'uint', 'long', 'ulong'))
@@ -187,6 +208,9 @@ float.min_sizeof = float.max_sizeof = 4
 double = FloatType("double")
 double.min_sizeof = double.max_sizeof = 8
 
+float.literal_suffix = "f"
+double.literal_suffix = ""
+
 float_types = dict((name, _globals[name]) for name in 
     ('half', 'float', 'double'))
 
@@ -212,11 +236,299 @@ scalar_types = cypy.merge_dicts(int_types,
 #===============================================================================
 vector_type_sizes = (2, 3, 4, 8, 16)
 
-class VectorType(Type):
-    pass
+class VectorType(base_c.VectorType, Type):
+    ptr = None
+    
+    @property
+    def min_sizeof(self):
+        # 3-component vectors take up as much space as 4-component vectors
+        return self.base_type.min_sizeof * _stored_components[self.n]
+    
+    @property
+    def max_sizeof(self):
+        return self.base_type.max_sizeof * _stored_components[self.n]
+    
+    @property
+    def required_extensions(self):
+        return self.base_type.required_extensions
+    
+    @cypy.lazy(property)
+    def ptr_global(self):
+        return GlobalPtrType(self)
+    
+    @cypy.lazy(property)
+    def ptr_shared(self):
+        return SharedPtrType(self)
+    
+    @cypy.lazy(property)
+    def ptr_private(self):
+        return PrivatePtrType(self)
+    
+    @cypy.lazy(property)
+    def ptr_constant(self):
+        return ConstantPtrType(self)
+    
+    @cypy.lazy(property)
+    def constructor(self):
+        """The :class:`type <VectorLiteralType>` of the constructor of 
+        literals of this type."""
+        return VectorLiteralType(self)
+    
+    def components(self, attr):
+        """Returns a tuple of the indices of the components selected by the 
+        provided attribute, or None if it is not a valid selector.
+        
+        Components can be selected by ``lo``, ``hi``, ``even`` and ``odd``, 
+        by ``s`` followed by hexadecimal indices, e.g. ``s0f``, or for vectors
+        with up to 4 components by the letters ``xyzw``, e.g. ``zyx``.
+        """
+        n = self.n
+        # for 3-component vectors, as if there were a fourth
+        half = _stored_components[n] // 2
+        if attr == "lo":
+            return tuple(xrange(half))
+        elif attr == "hi":
+            return tuple(xrange(half, 2 * half))
+        elif attr == "even":
+            return tuple(xrange(0, 2 * half, 2))
+        elif attr == "odd":
+            return tuple(xrange(1, 2 * half, 2))
+        
+        if attr[0] in "sS" and len(attr) > 1:
+            indices = tuple(_hex_digits.find(digit) 
+                            for digit in attr[1:].lower())
+        elif n <= 4:
+            indices = tuple("xyzw".find(letter) for letter in attr)
+        else:
+            return None
+        for index in indices:
+            if not 0 <= index < n:
+                return None
+        return indices
+    
+    def resolve_Attribute(self, context, node):
+        try:
+            return self._resolve_Attribute(node.attr)
+        except TypeResolutionError as e:
+            if e.node is None:
+                e.node = node
+            raise e
+    
+    @cypy.memoize
+    def _resolve_Attribute(self, attr):
+        indices = self.components(attr)
+        if indices is None:
+            raise TypeResolutionError(
+                "Type '%s' has no components '%s'." % (self.name, attr), None)
+        n = len(indices)
+        if n == 1:
+            return self.base_type
+        try:
+            return self.base_type.vector_types[n]
+        except KeyError:
+            raise TypeResolutionError(
+                "Cannot select %d components, since there is no '%s%d' type." 
+                % (n, self.base_type.name, n), None)
+    
+    def generate_Attribute(self, context, node):
+        value = context.visit(node.value)
+        
+        code = (value.code, ".", node.attr)
+        
+        return astx.copy_node(node,
+            value=value,
+            
+            code=code
+        )
+    
+    def _validate_components(self, target):
+        indices = self.components(target.attr)
+        if indices is not None and len(set(indices)) != len(indices):
+            raise TypeResolutionError(
+                "Cannot assign to the same component more than once.", 
+                target)
+        
+    def validate_AssignAttribute(self, context, node):
+        target = node.targets[0]
+        self._validate_components(target)
+        target_type = target.unresolved_type.resolve(context)
+        value_type = node.value.unresolved_type.resolve(context)
+        if target_type == value_type:
+            return
+        elif isinstance(target_type, VectorType):
+            if isinstance(value_type, ScalarType) and \
+               target_type.converts(value_type):
+                return
+        elif isinstance(value_type, ScalarType):
+            return
+        raise TypeResolutionError(
+            "Cannot assign a value of type '%s' to components of type '%s'." % 
+            (value_type.name, target_type.name), node)
+    
+    def generate_AssignAttribute(self, context, node):
+        target = context.visit(node.targets[0])
+        value = context.visit(node.value)
+        context.stmts.append((self.generate_Assign_stmt(target.code, value.code), 
+                              context.end_stmt))
+        context.body.append(astx.copy_node(node,
+            targets=[target],
+            value=value
+        ))
+    
+    def validate_AugAssignAttribute(self, context, node):
+        target = node.target
+        self._validate_components(target)
+        target_type = target.unresolved_type.resolve(context)
+        if isinstance(target_type, VectorType):
+            target_type.validate_AugAssign(context, node)
+        
+    def generate_AugAssignAttribute(self, context, node):
+        target = context.visit(node.target)
+        value = context.visit(node.value)
+        op = context.visit(node.op)
+        context.stmts.append((self.generate_AugAssign_stmt(
+            target.code,
+            op.code,
+            value.code
+        ), context.end_stmt))
+        context.body.append(astx.copy_node(node,
+            target=target,
+            value=value,
+            op=op
+        ))
+
+_stored_components = {2: 2, 3: 4, 4: 4, 8: 8, 16: 16}
+
+_hex_digits = "0123456789abcdef"
+
+class VectorLiteralType(Type, clq.VirtualType):
+    """The type of the constructor of literals of a vector type, available as
+    :attr:`VectorType.constructor`.
+    
+    Calling it with scalars or vectors with the same component type 
+    providing all of the components in order, or with a single scalar for 
+    all of the components, gives a literal, e.g. ``(float4)(x, y, v.xy)``.
+    """
+    def __init__(self, vector_type):
+        Type.__init__(self, "VectorLiteralType(%s)" % vector_type.name)
+        self.vector_type = vector_type
+        
+    vector_type = None
+    """The type of the literals."""
+    
+    def resolve_Call(self, context, node):
+        vector_type = self.vector_type
+        arg_types = tuple(arg.unresolved_type.resolve(context)
+                          for arg in node.args)
+        n = 0
+        for arg_type in arg_types:
+            if isinstance(arg_type, ScalarType) and \
+               vector_type.converts(arg_type):
+                n += 1
+            elif isinstance(arg_type, VectorType) and \
+                 arg_type.base_type == vector_type.base_type:
+                n += arg_type.n
+            else:
+                raise TypeResolutionError(
+                    "Cannot provide components of a '%s' with a value of type "
+                    "'%s'." % (vector_type.name, arg_type.name), node)
+        if n != vector_type.n and not (n == 1 and len(arg_types) == 1):
+            raise TypeResolutionError(
+                "A '%s' has %d components, but %d were provided." % 
+                (vector_type.name, vector_type.n, n), node)
+        return vector_type
+    
+    def generate_Call(self, context, node):
+        args = tuple(context.visit(arg) for arg in node.args)
+        func = context.visit(node.func)
+        
+        code = ("(", self.vector_type.name, ")(",
+                cypy.join((arg.code for arg in args), ", "),
+                ")")
+        
+        return astx.copy_node(node,
+            args=args,
+            func=func,
+            
+            code=code)
+    
+    def is_pure_Call(self, context, node):
+        return True
+cypy.intern(VectorLiteralType, clq.intern_max_size)
 
 vector_types = { }
-#base_types['bool'] = bool
+for base_type in (char, uchar, short, ushort, int, uint, long, ulong, 
+                  half, float, double):
+    base_type.vector_types = { }
+    for n in vector_type_sizes:
+        cl_type = VectorType(base_type, n)
+        base_type.vector_types[n] = vector_types[cl_type.name] = \
+            _globals[cl_type.name] = cl_type
+
+# elementwise comparisons give signed integers of the same size, -1 if true
+_compare_base_types = {1: char, 2: short, 4: int, 8: long}
+for cl_type in vector_types.itervalues():
+    compare_base_type = _compare_base_types[cl_type.base_type.min_sizeof]
+    cl_type.compare_type = compare_base_type.vector_types[cl_type.n]
+
+try:
+    import numpy
+except ImportError:
+    pass
+else:
+    for cl_type in vector_types.itervalues():
+        base_dtype = cl_type.base_type.np_dtype
+        if base_dtype is None:
+            cl_type.np_dtype = None
+            continue
+        n = cl_type.n
+        if n <= 4:
+            names = ["x", "y", "z", "w"][0:n]
+        else:
+            names = ["s" + _hex_digits[i] for i in xrange(n)]
+        cl_type.np_dtype = numpy.dtype({
+            'names': names,
+            'formats': [base_dtype] * n,
+            'offsets': [i * base_dtype.itemsize for i in xrange(n)],
+            'itemsize': cl_type.min_sizeof
+        })
+        to_cl_type[cl_type.np_dtype] = cl_type
+
+def vector_type_for_dtype(np_dtype):
+    """Returns the vector type whose values are laid out in memory like those
+    of the provided numpy dtype, or None.
+    
+    The dtype must be a structured dtype whose fields, or a subarray dtype 
+    whose elements, all have the same scalar type and follow one another. 
+    Note that values of 3-component vector types are as large as those of 
+    4-component vector types.
+    """
+    subdtype = np_dtype.subdtype
+    if subdtype is not None:
+        base_dtype, shape = subdtype
+        if len(shape) != 1:
+            return None
+        n = shape[0]
+    elif np_dtype.names:
+        fields = sorted((np_dtype.fields[name][0:2] 
+                         for name in np_dtype.names), 
+                        key=lambda field: field[1])
+        base_dtype = fields[0][0]
+        for i, (field_dtype, offset) in enumerate(fields):
+            if field_dtype != base_dtype or \
+               offset != i * base_dtype.itemsize:
+                return None
+        n = len(fields)
+    else:
+        return None
+    
+    base_type = to_cl_type.get(base_dtype, None)
+    if base_type is None or base_type.vector_types is None:
+        return None
+    cl_type = base_type.vector_types.get(n, None)
+    if cl_type is None or cl_type.min_sizeof != np_dtype.itemsize:
+        return None
+    return cl_type
 
 #===============================================================================
 # Pointers
@@ -234,6 +546,10 @@ class PtrType(base_c.PtrType, Type):
     
     ptr = None
     
+    @property
+    def required_extensions(self):
+        return self.target_type.required_extensions
+    
 class GlobalPtrType(PtrType):
     def __init__(self, target_type):
         PtrType.__init__(self, target_type, "__global")
@@ -247,8 +563,9 @@ class PrivatePtrType(PtrType):
         PtrType.__init__(self, target_type, "__private")
         
 class SharedPtrType(PtrType):
+    # pointers to memory shared by a work-group, which OpenCL calls local
     def __init__(self, target_type):
-        PtrType.__init__(self, target_type, "__shared")
+        PtrType.__init__(self, target_type, "__local")
         
 loc = None
 
@@ -271,7 +588,7 @@ address_space_qualifiers = (
     '__global', 'global',
     '__constant', 'constant', 
     '__private', 'private',
-    '__shared', 'shared'
+    '__local', 'local'
 )
                         
 function_qualifiers = ('__kernel', 'kernel') 
@@ -299,8 +616,40 @@ base_types = cypy.merge_dicts(scalar_types, vector_types)
 #===============================================================================
 # Type parser
 #===============================================================================
+_ptr_attrs = {
+    "__global": "ptr_global",
+    "__constant": "ptr_constant",
+    "__private": "ptr_private",
+    "__local": "ptr_shared",
+    "__shared": "ptr_shared" # the name it used to have
+}
+
 def t(name):
-    return None
+    """Returns the type with the provided name, or None if it is not known.
+
+        >>> t("int") is int
+        True
+        >>> t("__global float*") is float.ptr_global
+        True
+
+    """
+    name = name.strip()
+    if name.endswith("*"):
+        try:
+            address_space, target_name = name[:-1].split(None, 1)
+        except ValueError:
+            return None
+        ptr_attr = _ptr_attrs.get(address_space, None)
+        target_type = t(target_name)
+        if ptr_attr is None or target_type is None:
+            return None
+        return getattr(target_type, ptr_attr, None)
+    elif name == void.name:
+        return void
+    elif name == bool.name:
+        return bool
+    else:
+        return base_types.get(name, None)
 
 #===============================================================================
 # OpenCL Backend
@@ -312,10 +661,82 @@ class Backend(base_c.Backend):
     void_t = void
     int_t = int
     uint_t = uint
+    int_literal_types = (int, long)
     float_t = float
     bool_t = bool
     string_t = None # TODO: char.private_ptr
 
+    def type_for_name(self, name):
+        return t(name)
+    
+    def init_context(self, context):
+        base_c.Backend.init_context(self, context)
+        context.extensions = cypy.IndexedSetList()
+        
+    def generate_program_item(self, context):
+        extensions = context.extensions
+        for cl_type in cypy.cons((context.return_type,), 
+                                 context.concrete_fn.arg_types):
+            extensions.extend(getattr(cl_type, 'required_extensions', ()))
+        item = base_c.Backend.generate_program_item(self, context)
+        item.extensions = tuple(extension.name for extension in extensions)
+        return item
+    
+    def extension_pragma(self, extension):
+        return Extension(extension).pragma_str
+    
+    def is_global_id(self, context, node):
+        # get_global_id(0)
+        if not isinstance(node, _ast.Call) or len(node.args) != 1:
+            return False
+        arg = node.args[0]
+        return isinstance(arg, _ast.Num) and arg.n == 0 and \
+            node.func.unresolved_type.resolve(context) is get_global_id.cl_type
+    
+    def is_work_item_call(self, context, node):
+        if not isinstance(node, _ast.Call):
+            return False
+        fn_type = node.func.unresolved_type.resolve(context)
+        for fn in work_item_fns: # any is a builtin here
+            if fn_type is fn.cl_type:
+                return True
+        return False
+    
+    def dispatcher(self, generic_fn):
+        import clq.backends.opencl.dispatch as dispatch
+        return dispatch.Dispatcher(generic_fn)
+    
+    def vector_type(self, scalar_type, width):
+        vector_types = getattr(scalar_type, 'vector_types', None)
+        if vector_types is None:
+            return None
+        return vector_types.get(width, None)
+        
+    def _vector_access_fn(self, prefix, ptr_type, width):
+        # halfs are loaded and stored as floats, by other functions
+        if not isinstance(ptr_type, GlobalPtrType) or \
+           ptr_type.target_type is half or \
+           self.vector_type(ptr_type.target_type, width) is None:
+            return None
+        fn = builtins[prefix + str(width)]
+        return (fn.name, fn.cl_type)
+    
+    def vector_load_fn(self, ptr_type, width):
+        return self._vector_access_fn("vload", ptr_type, width)
+    
+    def vector_store_fn(self, ptr_type, width):
+        return self._vector_access_fn("vstore", ptr_type, width)
+    
+    def vector_literal_fn(self, vector_type):
+        return (vector_type.name, vector_type.constructor)
+    
+    def vector_convert_fn(self, vector_type):
+        fn = convert_fn(vector_type)
+        return (fn.name, fn.cl_type)
+
+if clq.call_backend is None:
+    clq.call_backend = Backend()
+
 #############################################################################
 ## OpenCL Extension descriptors
 #############################################################################
@@ -332,8 +753,8 @@ class Extension(object):
     @property
     def pragma_str(self):
         """Returns the pragma needed to enable this extension."""
-        return "#pragma extension %s : enable" % self.name
-cypy.intern(Extension)
+        return "#pragma OPENCL EXTENSION %s : enable" % self.name
+cypy.intern(Extension, clq.intern_max_size)
 
 cl_khr_fp64 = Extension("cl_khr_fp64")
 """Standard 64-bit floating point extension.
@@ -347,6 +768,9 @@ cl_khr_fp16 = Extension("cl_khr_fp16")
 *See section 9.10 in the spec.*
 """
 
+double.required_extensions = (cl_khr_fp64,)
+half.required_extensions = (cl_khr_fp16,)
+
 cl_khr_global_int32_base_atomics = Extension("cl_khr_global_int32_base_atomics")
 """Standard 32-bit base atomic operations for global memory.
 
@@ -438,9 +862,10 @@ APPLE_extensions = (cl_APPLE_gl_sharing,
 ##############################################################################
 class BuiltinFn(object):
     """A stub for built-in functions avaiable to OpenCL kernels."""
-    def __init__(self, name, return_type_fn):
+    def __init__(self, name, return_type_fn, pure=True):
         self.name = name
         self.return_type_fn = return_type_fn
+        self.pure = pure
         builtins[name] = self  
         
     name = None
@@ -455,6 +880,16 @@ class BuiltinFn(object):
     """If not None, returns a tuple of extensions required for arguments of 
     the specified types."""
     
+    pure = True
+    """Whether calls to the function have no side effects and give results 
+    depending only on their arguments. Functions which read or write memory 
+    through pointers are not pure."""
+    
+    elementwise = False
+    """Whether the function applies to each component of vectors in turn when
+    each of its arguments is a vector of the same type, as for the math 
+    functions. Those in :obj:`elementwise_builtins` are."""
+    
     @cypy.lazy(property)
     def cl_type(self):
         return BuiltinFnType(self)
@@ -468,11 +903,27 @@ class BuiltinFnType(Type, clq.VirtualType):
     def resolve_Call(self, context, node):
         arg_types = tuple(arg.unresolved_type.resolve(context)
                           for arg in node.args)
-        return self.builtin.return_type_fn(*arg_types)
+        try:
+            return self.builtin.return_type_fn(*arg_types)
+        except TypeResolutionError as e:
+            if e.node is None:
+                e.node = node
+            raise e
     
     def generate_Call(self, context, node):
-        return clq._generic_generate_Call(context, node)
-cypy.intern(BuiltinFnType)
+        requires_extensions = self.builtin.requires_extensions
+        if requires_extensions is not None:
+            arg_types = tuple(arg.unresolved_type.resolve(context)
+                              for arg in node.args)
+            context.extensions.extend(requires_extensions(*arg_types))
+        return clq._generic_generate_Call(context, node, self.builtin.name)
+    
+    def is_pure_Call(self, context, node):
+        return self.builtin.pure
+    
+    def is_elementwise_Call(self, context, node):
+        return self.builtin.elementwise
+cypy.intern(BuiltinFnType, clq.intern_max_size)
 
 class BuiltinConstant(object):
     """A descriptor for builtin constants available to OpenCL kernels."""
@@ -506,6 +957,10 @@ get_num_groups = BuiltinFn("get_num_groups", lambda D: size_t)
 """The ``get_num_groups`` builtin function."""
 get_group_id = BuiltinFn("get_group_id", lambda D: size_t)
 """The ``get_group_id`` builtin function."""
+work_item_fns = (get_work_dim, get_global_size, get_global_id, get_local_size,
+                 get_local_id, get_num_groups, get_group_id)
+"""The builtin functions giving the dimensions of the kernel's launch and the 
+position of the work-item in it."""
 
 # Integer Built-in Functions [6.11.3]
 abs = BuiltinFn("abs", lambda x: x.unsigned_variant)
@@ -657,9 +1112,9 @@ fmin = BuiltinFn("fmin", lambda x, y: x)
 """The ``fmin`` builtin function."""
 fmod = BuiltinFn("fmod", lambda x, y: x)
 """The ``fmod`` builtin function."""
-fract = BuiltinFn("fract", lambda x, iptr: x)
+fract = BuiltinFn("fract", lambda x, iptr: x, pure=False)
 """The ``fract`` builtin function."""
-frexp = BuiltinFn("frexp", lambda x, exp: x)
+frexp = BuiltinFn("frexp", lambda x, exp: x, pure=False)
 """The ``frexp`` builtin function."""
 hypot = BuiltinFn("hypot", lambda x, y: x)
 """The ``hypot`` builtin function."""
@@ -669,7 +1124,7 @@ ldexp = BuiltinFn("ldexp", lambda x, n: x)
 """The ``ldexp`` builtin function."""
 lgamma = BuiltinFn("lgamma", lambda x: x)
 """The ``lgamma`` builtin function."""
-lgamma_r = BuiltinFn("lgamma_r", lambda x, signp: x)
+lgamma_r = BuiltinFn("lgamma_r", lambda x, signp: x, pure=False)
 """The ``lgamma_r`` builtin function."""
 log = BuiltinFn("log", lambda x: x)
 """The ``log`` builtin function."""
@@ -695,7 +1150,7 @@ logb = BuiltinFn("logb", lambda x: x)
 """The ``logb`` builtin function."""
 mad = BuiltinFn("mad", lambda a, b, c: a)
 """The ``mad`` builtin function."""
-modf = BuiltinFn("modf", lambda x, iptr: x)
+modf = BuiltinFn("modf", lambda x, iptr: x, pure=False)
 """The ``modf`` builtin function."""
 nextafter = BuiltinFn("nextafter", lambda x, y: x)
 """The ``nextafter`` builtin function."""
@@ -715,7 +1170,7 @@ native_recip = BuiltinFn("native_recip", lambda x: x)
 """The ``native_recip`` builtin function."""
 remainder = BuiltinFn("remainder", lambda x, y: x)
 """The ``remainder`` builtin function."""
-remquo = BuiltinFn("remquo", lambda x, y, n: x)
+remquo = BuiltinFn("remquo", lambda x, y, n: x, pure=False)
 """The ``remquo`` builtin function."""
 rint = BuiltinFn("rint", lambda x: x)
 """The ``rint`` builtin function."""
@@ -735,7 +1190,7 @@ native_sin = BuiltinFn("native_sin", lambda x: x)
 """The ``native_sin`` builtin function."""
 half_sin = BuiltinFn("half_sin", lambda x: x)
 """The ``half_sin`` builtin function."""
-sincos = BuiltinFn("sincos", lambda x, cosval: x)
+sincos = BuiltinFn("sincos", lambda x, cosval: x, pure=False)
 """The ``sincos`` builtin function."""
 sinh = BuiltinFn("sinh", lambda x: x)
 """The ``sinh`` builtin function."""
@@ -762,6 +1217,26 @@ tgamma = BuiltinFn("tgamma", lambda x: x)
 trunc = BuiltinFn("trunc", lambda x: x)
 """The ``trunc`` builtin function."""
 
+elementwise_builtins = (
+    add_sat, hadd, rhadd, clz, mad_hi, mad24, mad_sat, max, min, mul_hi, 
+    mul24, rotate, sub_sat, 
+    clamp, degrees, radians, step, smoothstep, sign, 
+    acos, acosh, acospi, asin, asinh, asinpi, atan, atan2, atanh, atanpi, 
+    atan2pi, cbrt, ceil, copysign, cos, half_cos, native_cos, cosh, cospi, 
+    half_divide, native_divide, erf, exp, half_exp, native_exp, exp2, 
+    half_exp2, native_exp2, exp10, half_exp10, native_exp10, expm1, fabs, 
+    fdim, floor, fma, fmax, fmin, fmod, hypot, lgamma, log, half_log, 
+    native_log, log2, half_log2, native_log2, log10, half_log10, native_log10,
+    log1p, logb, mad, nextafter, pow, powr, half_powr, native_powr, 
+    half_recip, native_recip, remainder, rint, round, rsqrt, native_rsqrt, 
+    half_rsqrt, sin, native_sin, half_sin, sinh, sinpi, sqrt, half_sqrt, 
+    native_sqrt, tan, half_tan, native_tan, tanh, tanpi, tgamma, trunc)
+"""The builtin functions above which are :attr:`elementwise 
+<BuiltinFn.elementwise>`. Those whose arguments may differ in type, e.g. 
+``ldexp``, are not."""
+for _fn in elementwise_builtins:
+    _fn.elementwise = True
+
 # Geometric Built-in Functions [6.11.5]
 dot = BuiltinFn("dot", lambda p0, p1: p0)
 """The ``dot`` builtin function."""
@@ -817,17 +1292,18 @@ select = BuiltinFn("select", lambda a, b, c: a)
 """The ``select`` builtin function."""
 
 # Base Atomic Functions [9.5]
-atom_add = BuiltinFn("atom_add", lambda p, val: val)
+atom_add = BuiltinFn("atom_add", lambda p, val: val, pure=False)
 """The ``atom_add`` builtin function."""
-atom_sub = BuiltinFn("atom_sub", lambda p, val: val)
+atom_sub = BuiltinFn("atom_sub", lambda p, val: val, pure=False)
 """The ``atom_sub`` builtin function."""
-atom_xchg = BuiltinFn("atom_xchg", lambda p, val: val)
+atom_xchg = BuiltinFn("atom_xchg", lambda p, val: val, pure=False)
 """The ``atom_xchg`` builtin function."""
-atom_inc = BuiltinFn("atom_inc", lambda p: p.target_type)
+atom_inc = BuiltinFn("atom_inc", lambda p: p.target_type, pure=False)
 """The ``atom_inc`` builtin function."""
-atom_dec = BuiltinFn("atom_dec", lambda p: p.target_type)
+atom_dec = BuiltinFn("atom_dec", lambda p: p.target_type, pure=False)
 """The ``atom_dec`` builtin function."""
-atom_cmpxchg = BuiltinFn("atom_cmpxchg", lambda p, cmp, val: val)
+atom_cmpxchg = BuiltinFn("atom_cmpxchg", lambda p, cmp, val: val, 
+                         pure=False)
 """The ``atom_cmpxchg`` builtin function."""
 base_atomics = (atom_add, atom_sub, atom_xchg, atom_inc, atom_dec, atom_cmpxchg)
 
@@ -843,19 +1319,19 @@ for fn in base_atomics:
     fn.requires_extensions = _base_atomic_extension_inference
     
 # Extended Atomic Functions [9.5]
-atom_min = BuiltinFn("atom_min", lambda p, val: val)
+atom_min = BuiltinFn("atom_min", lambda p, val: val, pure=False)
 """The ``atom_min`` builtin function."""
-atom_max = BuiltinFn("atom_max", lambda p, val: val)
+atom_max = BuiltinFn("atom_max", lambda p, val: val, pure=False)
 """The ``atom_max`` builtin function."""
-atom_and = BuiltinFn("atom_and", lambda p, val: val)
+atom_and = BuiltinFn("atom_and", lambda p, val: val, pure=False)
 """The ``atom_and`` builtin function."""
-atom_or = BuiltinFn("atom_or", lambda p, val: val)
+atom_or = BuiltinFn("atom_or", lambda p, val: val, pure=False)
 """The ``atom_or`` builtin function."""
-atom_xor = BuiltinFn("atom_xor", lambda p, val: val)
+atom_xor = BuiltinFn("atom_xor", lambda p, val: val, pure=False)
 """The ``atom_xor`` builtin function."""
 extended_atomics = (atom_min, atom_max, atom_and, atom_or, atom_xor)
 
-def _extended_atomic_extension_inference(p):
+def _extended_atomic_extension_inference(p, *args): #@UnusedVariable
     target_type = p.target_type
     if target_type is int or target_type is uint:
         if p.address_space == "__global":
@@ -867,11 +1343,149 @@ for fn in extended_atomics:
     fn.requires_extensions = _extended_atomic_extension_inference
 
 # Vector Data Load/Store Built-in Functions [6.11.7]
-vload_half = BuiltinFn("vload_half", lambda offset, p: float)
+vload_half = BuiltinFn("vload_half", lambda offset, p: float, pure=False)
 """The ``vload_half`` builtin function."""
-vstore_half = BuiltinFn("vstore_half", lambda data, offset, p: void)
+vstore_half = BuiltinFn("vstore_half", lambda data, offset, p: void, 
+                        pure=False)
 """The ``vstore_half`` builtin function."""
 
+def _vector_type_of(n, cl_type, name):
+    vector_types = getattr(cl_type, 'vector_types', None)
+    if vector_types is None:
+        raise TypeResolutionError(
+            "'%s' does not support values of type '%s'." % 
+            (name, cl_type.name), None)
+    return vector_types[n]
+
+def _check_vector_load_store_args(name, offset, p):
+    if not isinstance(offset, IntegerType):
+        raise TypeResolutionError(
+            "The offset given to '%s' must be an integer, but saw a %s." % 
+            (name, offset.name), None)
+    if not isinstance(p, PtrType):
+        raise TypeResolutionError(
+            "'%s' requires a pointer, but saw a %s." % (name, p.name), None)
+
+def _vload_return_type_fn(n, name):
+    def return_type_fn(offset, p):
+        _check_vector_load_store_args(name, offset, p)
+        return _vector_type_of(n, p.target_type, name)
+    return return_type_fn
+
+def _vstore_return_type_fn(n, name):
+    def return_type_fn(data, offset, p):
+        _check_vector_load_store_args(name, offset, p)
+        if data != _vector_type_of(n, p.target_type, name):
+            raise TypeResolutionError(
+                "'%s' can not store a value of type '%s' to a '%s'." % 
+                (name, data.name, p.name), None)
+        return void
+    return return_type_fn
+
+def _vload_half_return_type_fn(n, name):
+    def return_type_fn(offset, p):
+        _check_vector_load_store_args(name, offset, p)
+        return float.vector_types[n]
+    return return_type_fn
+
+def _vstore_half_return_type_fn(n, name):
+    def return_type_fn(data, offset, p):
+        _check_vector_load_store_args(name, offset, p)
+        if not isinstance(data, VectorType) or data.n != n or \
+           not isinstance(data.base_type, FloatType):
+            raise TypeResolutionError(
+                "'%s' can not store a value of type '%s'." % 
+                (name, data.name), None)
+        return void
+    return return_type_fn
+
+# vloadn, vstoren, vload_halfn, vstore_halfn, vloada_halfn and vstorea_halfn
+# for each of the vector_type_sizes, e.g. vload4
+for n in vector_type_sizes:
+    for prefix, return_type_fn_for in (
+            ("vload", _vload_return_type_fn),
+            ("vstore", _vstore_return_type_fn),
+            ("vload_half", _vload_half_return_type_fn),
+            ("vstore_half", _vstore_half_return_type_fn),
+            ("vloada_half", _vload_half_return_type_fn),
+            ("vstorea_half", _vstore_half_return_type_fn)):
+        name = prefix + str(n)
+        _globals[name] = BuiltinFn(name, return_type_fn_for(n, name), 
+                                   pure=False)
+        
+# Synchronization and Explicit Memory Fence Functions [6.11.9, 6.11.10]
+barrier = BuiltinFn("barrier", lambda flags: void, pure=False)
+"""The ``barrier`` builtin function."""
+mem_fence = BuiltinFn("mem_fence", lambda flags: void, pure=False)
+"""The ``mem_fence`` builtin function."""
+read_mem_fence = BuiltinFn("read_mem_fence", lambda flags: void, pure=False)
+"""The ``read_mem_fence`` builtin function."""
+write_mem_fence = BuiltinFn("write_mem_fence", lambda flags: void, 
+                            pure=False)
+"""The ``write_mem_fence`` builtin function."""
+
+CLK_LOCAL_MEM_FENCE = clq.const(1, uint)
+"""The ``CLK_LOCAL_MEM_FENCE`` flag for :obj:`barrier` and the fence 
+functions, as a :func:`constant <clq.const>` to bind an argument to, since 
+names in generic functions are arguments."""
+CLK_GLOBAL_MEM_FENCE = clq.const(2, uint)
+"""The ``CLK_GLOBAL_MEM_FENCE`` flag. See :obj:`CLK_LOCAL_MEM_FENCE`."""
+
+# Conversions and Type Casting [6.2.3, 6.2.4]
+rounding_modes = ("rte", "rtz", "rtp", "rtn")
+"""The rounding modes which explicit conversions can use."""
+
+def convert_fn(cl_type, saturate=False, rounding=None):
+    """Returns the builtin function explicitly converting scalars or vectors 
+    with the same number of components to the provided type, e.g. 
+    ``convert_uchar4_sat_rte`` with ``saturate`` and ``rounding="rte"``.
+    
+    ``convert_`` functions without saturation and using the default rounding
+    mode are also available by name, e.g. :obj:`convert_float4`.
+    """
+    name = "convert_" + cl_type.name
+    if saturate:
+        name += "_sat"
+    if rounding is not None:
+        if rounding not in rounding_modes:
+            raise clq.Error("Invalid rounding mode: %s." % rounding)
+        name += "_" + rounding
+    fn = builtins.get(name, None)
+    if fn is None:
+        fn = BuiltinFn(name, _convert_return_type_fn(cl_type, name))
+    return fn
+
+def _convert_return_type_fn(cl_type, name):
+    def return_type_fn(x):
+        if isinstance(cl_type, VectorType):
+            valid = isinstance(x, VectorType) and x.n == cl_type.n
+        else:
+            valid = isinstance(x, ScalarType)
+        if not valid:
+            raise TypeResolutionError(
+                "'%s' can not convert a value of type '%s'." % 
+                (name, x.name), None)
+        return cl_type
+    return return_type_fn
+
+def _as_return_type_fn(cl_type, name):
+    def return_type_fn(x):
+        if not isinstance(x, (ScalarType, VectorType)) or \
+           x.min_sizeof != x.max_sizeof or x.min_sizeof != cl_type.min_sizeof:
+            raise TypeResolutionError(
+                "'%s' can not reinterpret a value of type '%s'." % 
+                (name, x.name), None)
+        return cl_type
+    return return_type_fn
+
+# convert_type and as_type for each scalar and vector type, e.g. as_uint4
+for cl_type in cypy.cons(machine_independent_int_types.values(), 
+                         float_types.values(), 
+                         vector_types.values()):
+    _globals["convert_" + cl_type.name] = convert_fn(cl_type)
+    name = "as_" + cl_type.name
+    _globals[name] = BuiltinFn(name, _as_return_type_fn(cl_type, name))
+
 sizeof = BuiltinFn("sizeof", lambda x: size_t)
 """The ``sizeof`` builtin operator."""
 
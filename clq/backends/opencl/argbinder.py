@@ -0,0 +1,119 @@
+"""Fast launches of kernels with a known signature.
+
+:meth:`pyocl.Kernel.__call__ <clq.backends.opencl.pyocl.Kernel.__call__>`
+inspects and converts its arguments anew on each call, which can take longer
+than the kernel itself when it is small and launched often. A binder is built
+once from the argument types of the concrete function the kernel was compiled
+from, and then only does what they require::
+
+    launch = kernel.binder(concrete_fn.arg_types)
+    for step in xrange(n_steps):
+        event = launch((n,), a, b, numpy.float32(dt), local_size=(64,))
+
+Buffers and local memory are only set when a different object is passed than
+in the previous launch through the same binder, and scalars and vectors are converted to the exact
+numpy type of the parameter, rather than one guessed from their value.
+Arguments of virtual types, e.g. :func:`constants <clq.const>` and
+built-in functions, are not kernel parameters and are not passed.
+
+A binder does not vectorize launches, support :meth:`Context.Out
+<clq.backends.opencl.pyocl.Context.Out>` and :meth:`Context.InOut
+<clq.backends.opencl.pyocl.Context.InOut>` or accept a queue as the first
+argument, as :meth:`Kernel.__call__` does.
+
+A binder sets arguments with the kernel's ``set_arg(index, value)``, and
+leaves enqueueing each launch to the function it was given, which
+:meth:`Kernel.binder` passes.
+"""
+import numpy
+
+import clq
+import clq.backends.opencl as ocl
+
+class ArgBinder(object):
+    """Sets the arguments of a kernel with the provided argument types, and
+    launches it."""
+    def __init__(self, kernel, arg_types, enqueue):
+        self.kernel = kernel
+        self.arg_types = tuple(arg_type for arg_type in arg_types
+                               if not isinstance(arg_type, clq.VirtualType))
+        self.enqueue = enqueue
+        self._converters = tuple(converter_for(arg_type)
+                                 for arg_type in self.arg_types)
+        self._bound = [None] * len(self.arg_types)
+
+    kernel = None
+    """The kernel whose arguments are set."""
+
+    arg_types = None
+    """The types of the parameters of the kernel, i.e. the argument types it
+    was compiled with other than virtual ones."""
+
+    enqueue = None
+    """The function launches are enqueued with, called as ``enqueue(queue,
+    kernel, global_size, local_size, global_offset, wait_for)``."""
+
+    def bind(self, args):
+        """Sets the arguments of the kernel to the provided ones, one for each
+        of the :attr:`arg_types`."""
+        if len(args) != len(self.arg_types):
+            raise clq.Error("Expected %d arguments, not %d." %
+                            (len(self.arg_types), len(args)))
+        kernel = self.kernel
+        bound = self._bound
+        if getattr(kernel, 'bound_by', None) is not self:
+            # calling the kernel or another binder of it replaced the
+            # arguments, so every memory object is set again
+            bound = self._bound = [None] * len(self.arg_types)
+            kernel.bound_by = self
+        i = 0
+        for convert, arg in zip(self._converters, args):
+            if convert is None:
+                # memory objects are set again only if replaced
+                if arg is not bound[i]:
+                    kernel.set_arg(i, arg)
+                    bound[i] = arg
+            else:
+                kernel.set_arg(i, convert(arg))
+            i += 1
+
+    def __call__(self, global_size, *args, **kwargs):
+        """Launches the kernel with the provided arguments and returns the
+        event for it.
+
+        The ``local_size``, ``global_offset``, ``wait_for`` and ``queue``
+        keyword arguments are accepted, the last defaulting to the queue of
+        the kernel.
+        """
+        self.bind(args)
+        queue = kwargs.pop('queue', None)
+        if queue is None:
+            queue = self.kernel.queue
+        local_size = kwargs.pop('local_size', None)
+        global_offset = kwargs.pop('global_offset', None)
+        wait_for = kwargs.pop('wait_for', None)
+        if kwargs:
+            raise clq.Error("Unexpected keyword arguments: %s." %
+                            ", ".join(sorted(kwargs)))
+        return self.enqueue(queue, self.kernel, global_size, local_size,
+                            global_offset, wait_for)
+
+def converter_for(cl_type):
+    """Returns a function converting arguments to the numpy type of the
+    provided parameter type, or None for memory objects, which are passed
+    as they are."""
+    if isinstance(cl_type, ocl.PtrType):
+        return None
+    np_dtype = getattr(cl_type, 'np_dtype', None)
+    if np_dtype is None:
+        raise clq.Error("Arguments of type %s can't be passed to kernels." %
+                        cl_type.name)
+    if np_dtype.names is None:
+        return np_dtype.type
+
+    # vectors
+    def convert(arg):
+        if isinstance(arg, numpy.ndarray) and arg.dtype == np_dtype:
+            return arg
+        return numpy.array(tuple(arg), np_dtype)
+    return convert
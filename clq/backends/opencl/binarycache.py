@@ -0,0 +1,180 @@
+"""A persistent cache of the device binaries of built OpenCL programs.
+
+Building a program from source can take the driver hundreds of milliseconds
+for each kernel. When this cache is enabled, :meth:`pyocl.Context.compile
+<clq.backends.opencl.pyocl.Context.compile>` saves the binaries of each
+program it builds and loads them instead of the source the next time the
+same program is built for the same devices, e.g. in a later run::
+
+    import clq.backends.opencl.pyocl as pyocl
+    import clq.backends.opencl.binarycache as binarycache
+    pyocl.binary_cache = binarycache.BinaryCache("/tmp/clq-binaries")
+
+Entries are keyed by :func:`key_for`, a hash of the source, the build options
+and the platform, name and driver version of each device, so binaries are
+never loaded by a different driver than the one which produced them. If the
+driver rejects a binary anyway, the program is built from source and the
+entry is replaced.
+
+In addition, the programs most recently built by each cache are kept in
+memory, so building the same program for the same context again returns it
+without consulting the driver or the disk at all.
+
+:meth:`BinaryCache.compile` is passed the class of the program to build, and
+calls it as ``program_type(context, source)`` on a miss and as
+``program_type(context, devices, binaries)`` on a hit.
+"""
+import os
+import hashlib
+import cPickle as pickle
+
+import cypy
+from clq.diskcache import make_dirs, write_atomically, evict
+
+default_max_size = 256 * 1024 * 1024
+"""The default maximum total size, in bytes, of the binaries in a cache."""
+
+default_max_programs = 64
+"""The default number of programs kept in memory by a cache."""
+
+suffix = ".bin"
+"""The file suffix used for cache entries."""
+
+def key_for(source, options, devices):
+    """Returns the key of the binaries of a program built from ``source`` with
+    the provided build options for the provided devices."""
+    key = [source, options]
+    for device in devices:
+        key.extend((device.platform.name, device.name,
+                    device.driver_version))
+    return hashlib.sha1("\0".join(key)).hexdigest()
+
+class BinaryCache(object):
+    """A directory of the binaries of built programs, bounded in total size by
+    evicting the least recently used entries, in front of which the most
+    recently built programs are kept in memory."""
+    def __init__(self, path, max_size=default_max_size,
+                 max_programs=default_max_programs):
+        make_dirs(path)
+        self.path = path
+        self.max_size = max_size
+        self.max_programs = max_programs
+        self._programs = cypy.OrderedDict()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.rejected = 0
+
+    path = None
+    """The directory containing the cache entries."""
+
+    max_size = None
+    """The maximum total size, in bytes, of the entries in this cache."""
+
+    max_programs = None
+    """The number of most recently built programs kept in memory."""
+
+    memory_hits = None
+    """The number of programs found in memory."""
+
+    disk_hits = None
+    """The number of programs built from saved binaries."""
+
+    misses = None
+    """The number of programs built from source."""
+
+    rejected = None
+    """The number of saved binaries the driver could not build, which are
+    included in the :attr:`misses`."""
+
+    @property
+    def stats(self):
+        """A dict containing the memory hits, disk hits, misses, rejected
+        binaries and number of programs in memory."""
+        return {'memory_hits': self.memory_hits, 'disk_hits': self.disk_hits,
+                'misses': self.misses, 'rejected': self.rejected,
+                'programs': len(self._programs)}
+
+    def filename_for(self, key):
+        """Returns the path of the entry with the provided key."""
+        return os.path.join(self.path, key + suffix)
+
+    def compile(self, context, source, options, program_type):
+        """Returns a program of the provided type built from ``source`` with
+        the provided options for the devices of ``context``, from memory,
+        from saved binaries or from source, in that order of preference."""
+        devices = context.devices
+        key = key_for(source, options, devices)
+        programs = self._programs
+        memory_key = (context, key)
+        try:
+            program = programs.pop(memory_key)
+        except KeyError:
+            pass
+        else:
+            # reinserted as the most recently used
+            programs[memory_key] = program
+            self.memory_hits += 1
+            return program
+
+        program = None
+        binaries = self.get(key, len(devices))
+        if binaries is not None:
+            try:
+                program = program_type(context, devices, binaries).build(
+                    options)
+            except Exception:
+                # drivers differ in how they report unusable binaries
+                self.rejected += 1
+            else:
+                self.disk_hits += 1
+        if program is None:
+            self.misses += 1
+            program = program_type(context, source).build(options)
+            self.put(key, program.binaries)
+
+        programs[memory_key] = program
+        while len(programs) > self.max_programs:
+            del programs[next(iter(programs))]
+        return program
+
+    def get(self, key, n_devices):
+        """Returns the list of saved binaries with the provided key, one for
+        each of the provided number of devices, or None if there is no usable
+        entry."""
+        filename = self.filename_for(key)
+        try:
+            f = open(filename, 'rb')
+            try:
+                binaries = pickle.load(f)
+            finally:
+                f.close()
+        except (IOError, OSError, EOFError, ValueError, TypeError,
+                IndexError, pickle.UnpicklingError):
+            return None
+        if not isinstance(binaries, list) or len(binaries) != n_devices:
+            return None
+
+        try:
+            # mark as recently used
+            os.utime(filename, None)
+        except OSError:
+            pass
+        return binaries
+
+    def put(self, key, binaries):
+        """Saves the provided binaries with the provided key."""
+        write_atomically(self.filename_for(key),
+                         [str(binary) for binary in binaries])
+        self.evict()
+
+    def evict(self):
+        """Removes the least recently used entries until the total size of
+        the cache is no more than :attr:`max_size`."""
+        evict(self.path, suffix, self.max_size)
+
+    def clear(self):
+        """Removes all entries from the cache and all programs from
+        memory."""
+        self._programs.clear()
+        evict(self.path, suffix, 0)
@@ -0,0 +1,152 @@
+"""A pool of device buffers, bucketed by size class.
+
+Allocating device memory is slow, and fragments it when buffers of many sizes
+are created and destroyed in turn, e.g. by a pipeline allocating its
+intermediate buffers anew for each request. When a pool is enabled for a
+:class:`pyocl.Context <clq.backends.opencl.pyocl.Context>`, its
+:meth:`alloc <clq.backends.opencl.pyocl.Context.alloc>` method, and so
+``to_device``, ``Out`` and ``InOut``, take buffers from the pool instead::
+
+    pool = ctx.enable_pool(max_bytes=64 * 1024 * 1024)
+
+Each buffer is allocated with the smallest power of two number of bytes it
+fits in, its size class, and returns to the pool when its ``release`` method
+is called or it is garbage collected. Later allocations in the same size class
+with the same flags on the same device reuse it. At most ``max_bytes`` of idle
+buffers are kept, the least recently released being freed first.
+
+New buffers are created as ``buffer_type(context, flags, size)``, where
+``buffer_type`` is the subclass of :class:`Pooled` the pool was created with.
+"""
+import cypy
+
+default_max_bytes = 256 * 1024 * 1024
+"""The default maximum number of bytes of idle buffers kept by a pool."""
+
+def size_class(size):
+    """Returns the smallest power of two no less than ``size``."""
+    capacity = 1
+    while capacity < size:
+        capacity <<= 1
+    return capacity
+
+class Pooled(object):
+    """Mixin for buffers allocated by a :class:`BufferPool`, which return to
+    it when released or garbage collected."""
+    pool = None
+    """The pool this buffer returns to, or None while it is idle in the pool
+    or once it has been freed."""
+
+    capacity = None
+    """The number of bytes allocated for this buffer, its size class."""
+
+    def release(self):
+        """Returns this buffer to its pool. It must not be used afterwards."""
+        pool = self.pool
+        if pool is not None:
+            pool.recycle(self)
+
+    def __del__(self):
+        # recycling resurrects the buffer; idle buffers hold no references
+        # back to the pool or their context, so they never form cycles
+        self.release()
+
+class BufferPool(object):
+    """A pool of the buffers of one context, bucketed by device, flags and
+    size class."""
+    def __init__(self, buffer_type, max_bytes=default_max_bytes):
+        self.buffer_type = buffer_type
+        self.max_bytes = max_bytes
+        self._idle = { } # (device, flags, capacity) => idle buffers
+        self._released = cypy.OrderedDict() # id => idle buffer, oldest first
+        self.hits = 0
+        self.misses = 0
+        self.in_use = 0
+        self.idle = 0
+        self.high_water_mark = 0
+
+    buffer_type = None
+    """The type of the buffers created by this pool."""
+
+    max_bytes = None
+    """The maximum number of bytes of idle buffers kept by this pool."""
+
+    hits = None
+    """The number of allocations which reused an idle buffer."""
+
+    misses = None
+    """The number of allocations which created a buffer."""
+
+    in_use = None
+    """The number of bytes of the buffers allocated and not yet released."""
+
+    idle = None
+    """The number of bytes of the idle buffers in the pool."""
+
+    high_water_mark = None
+    """The largest number of bytes held by the buffers of this pool, in use
+    and idle, at any one time."""
+
+    @property
+    def stats(self):
+        """A dict containing the hits, misses, bytes in use and idle, and the
+        high-water mark."""
+        return {'hits': self.hits, 'misses': self.misses,
+                'in_use': self.in_use, 'idle': self.idle,
+                'high_water_mark': self.high_water_mark}
+
+    def alloc(self, context, size, flags):
+        """Returns a buffer of at least ``size`` bytes with the provided flags
+        on the device of the provided context, reusing an idle one if
+        possible."""
+        capacity = size_class(size)
+        key = (context.device, flags, capacity)
+        buffers = self._idle.get(key)
+        if buffers:
+            buffer = buffers.pop()
+            del self._released[id(buffer)]
+            self.idle -= capacity
+            self.hits += 1
+        else:
+            buffer = self.buffer_type(context, flags, capacity)
+            buffer.capacity = capacity
+            buffer._key = key
+            self.misses += 1
+        buffer.context = context
+        buffer.pool = self
+        self.in_use += capacity
+        self.high_water_mark = max(self.high_water_mark,
+                                   self.in_use + self.idle)
+        return buffer
+
+    def recycle(self, buffer):
+        """Makes the provided buffer, allocated by this pool, idle, freeing
+        the least recently released idle buffers if there are more than
+        :attr:`max_bytes` of them. Called by :meth:`Pooled.release`."""
+        buffer.pool = None
+        buffer.context = None
+        capacity = buffer.capacity
+        self.in_use -= capacity
+        if capacity > self.max_bytes:
+            return
+        self._idle.setdefault(buffer._key, [ ]).append(buffer)
+        self._released[id(buffer)] = buffer
+        self.idle += capacity
+        self.evict(self.max_bytes)
+
+    def evict(self, max_bytes):
+        """Frees the least recently released idle buffers until there are no
+        more than ``max_bytes`` of them."""
+        released = self._released
+        while self.idle > max_bytes:
+            buffer = released.pop(next(iter(released)))
+            buffers = self._idle[buffer._key]
+            for i, idle in enumerate(buffers):
+                if idle is buffer:
+                    del buffers[i]
+                    break
+            self.idle -= buffer.capacity
+
+    def clear(self):
+        """Frees all idle buffers."""
+        self.evict(0)
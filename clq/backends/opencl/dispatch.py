@@ -0,0 +1,180 @@
+"""Launching generic functions directly on their arguments.
+
+Calling a :class:`generic function <clq.GenericFn>` launches it as a kernel
+on the OpenCL backend, with argument types inferred from the arguments::
+
+    @clq.fn
+    def ew_add(a, b, dest, get_global_id):
+        gid = get_global_id(0)
+        dest[gid] = a[gid] + b[gid]
+
+    ew_add(a_buf, b_buf, dest_buf, get_global_id, global_size=(n,)).wait()
+
+The type of each argument is found as follows:
+
+- :class:`types <clq.Type>`, e.g. :func:`constants <clq.const>`, are used
+  as they are, and nothing is passed to the kernel for them;
+- numpy scalars and vectors have the type of their dtype;
+- Python ints are ints, or longs if out of range, and Python floats are
+  floats, or doubles if out of range;
+- anything else must have a ``cl_type`` attribute, as buffers, local memory,
+  built-in functions and generic functions do.
+
+The first call with each combination of argument types compiles the function
+and builds a program in the context given by the ``ctx`` keyword argument,
+the context of the first argument which has one, or the default context
+:obj:`pyocl.ctx <clq.backends.opencl.pyocl.ctx>`, in that order. Each
+:class:`Dispatcher` keeps its kernels in a :class:`KernelCache
+<clq.backends.opencl.kernelcache.KernelCache>`, and an :class:`ArgBinder
+<clq.backends.opencl.argbinder.ArgBinder>` for each of them in a dict, so
+later calls with the same types only look the binder up by the context and
+the tuple of types, which compare by identity other than constants, which
+compare by value, and launch through it.
+
+The ``global_size`` defaults to the shape of the first buffer argument,
+and the ``local_size``, ``global_offset``, ``wait_for`` and ``queue``
+keyword arguments are passed on to the binder. Launches with other keyword
+arguments, e.g. ``block``, with :meth:`Context.Out
+<clq.backends.opencl.pyocl.Context.Out>` or :meth:`Context.InOut
+<clq.backends.opencl.pyocl.Context.InOut>` arguments or of kernels with a
+:attr:`vectorized variant <clq.backends.opencl.pyocl.Kernel.vector_kernel>`
+go through :meth:`pyocl.Kernel.__call__
+<clq.backends.opencl.pyocl.Kernel.__call__>` instead.
+"""
+import numpy
+
+import clq
+import clq.backends.opencl as ocl
+import clq.backends.opencl.kernelcache as kernelcache
+
+backend = ocl.Backend()
+"""The backend generic functions are compiled for when called."""
+
+_int32_info = numpy.iinfo(numpy.int32)
+_int64_info = numpy.iinfo(numpy.int64)
+_float32_info = numpy.finfo(numpy.float32)
+
+_binder_kwargs = frozenset(('local_size', 'global_offset', 'wait_for',
+                            'queue'))
+
+class Dispatcher(object):
+    """Launches a generic function on its arguments, caching a kernel for
+    each context and combination of argument types."""
+    def __init__(self, generic_fn):
+        self.generic_fn = generic_fn
+        self.kernels = kernelcache.KernelCache() # argument types => kernel
+        self._binders = { } # (context, argument types) => binder
+        self._hits = 0
+
+    generic_fn = None
+    """The generic function launched."""
+
+    kernels = None
+    """The :class:`KernelCache <clq.backends.opencl.kernelcache.KernelCache>`
+    of the kernels compiled so far."""
+
+    @property
+    def stats(self):
+        """A dict containing the hits, misses and number of kernels."""
+        stats = self.kernels.stats
+        stats['hits'] += self._hits
+        return stats
+
+    def __call__(self, *args, **kwargs):
+        """Launches the function on the provided arguments and returns the
+        event for the kernel."""
+        arg_types = [ ]
+        kernel_args = [ ]
+        ctx = kwargs.pop('ctx', None)
+        hooked = False
+        for arg in args:
+            arg_type, arg = type_and_value(arg)
+            arg_types.append(arg_type)
+            if not isinstance(arg_type, clq.VirtualType):
+                kernel_args.append(arg)
+                if ctx is None:
+                    ctx = getattr(arg, 'context', None)
+                if getattr(arg, 'post_kernel_hook', None) is not None:
+                    hooked = True
+        if ctx is None:
+            import clq.backends.opencl.pyocl as pyocl
+            ctx = pyocl.ctx
+            if ctx is None:
+                raise clq.Error("No context to launch %s in: none of its "
+                                "arguments has one and pyocl.ctx is not set."
+                                % self.generic_fn.name)
+
+        key = (ctx, tuple(arg_types))
+        binder = self._binders.get(key, None)
+        if binder is None:
+            binder = self.binder_for(*key)
+        else:
+            self._hits += 1
+
+        global_size = kwargs.pop('global_size', None)
+        if global_size is None:
+            for arg in kernel_args:
+                # numpy scalars have empty shapes
+                global_size = getattr(arg, 'shape', None)
+                if global_size:
+                    break
+            else:
+                raise clq.Error("No global size for %s: none of its "
+                                "arguments has a shape." %
+                                self.generic_fn.name)
+        kernel = binder.kernel
+        if hooked or getattr(kernel, 'vector_kernel', None) is not None or \
+           not _binder_kwargs.issuperset(kwargs):
+            return kernel(global_size, *kernel_args, **kwargs)
+        return binder(global_size, *kernel_args, **kwargs)
+
+    def binder_for(self, ctx, arg_types):
+        """Returns the :class:`ArgBinder
+        <clq.backends.opencl.argbinder.ArgBinder>` of the kernel for the
+        provided argument types in the provided context, compiling it if it
+        hasn't been already."""
+        binders = self._binders
+        if len(binders) >= self.kernels.max_size:
+            # the kernels cache drops those used least recently
+            binders.clear()
+        kernel = self.kernels.kernel(ctx, arg_types,
+                                     lambda: self.kernel_for(ctx, arg_types))
+        binder = binders[ctx, arg_types] = kernel.binder(arg_types)
+        return binder
+
+    def kernel_for(self, ctx, arg_types):
+        """Returns the kernel of the function compiled with the provided
+        argument types, in a program built in the provided context."""
+        return kernelcache.build(ctx, backend,
+                                 [self.generic_fn.compile(backend, *arg_types)])
+
+    def clear(self):
+        """Forgets the kernels compiled so far."""
+        self._binders.clear()
+        self.kernels.clear()
+
+def type_and_value(arg):
+    """Returns the type of the provided argument and the value to pass to a
+    kernel for it, e.g. a numpy scalar for a Python number."""
+    if isinstance(arg, clq.Type):
+        return arg, None
+    if isinstance(arg, numpy.generic):
+        try:
+            return ocl.to_cl_type[arg.dtype], arg
+        except KeyError:
+            raise clq.Error("No type corresponds to the dtype %s." %
+                            arg.dtype)
+    if isinstance(arg, (int, long)) and not isinstance(arg, bool):
+        if _int32_info.min <= arg <= _int32_info.max:
+            return ocl.int, numpy.int32(arg)
+        elif _int64_info.min <= arg <= _int64_info.max:
+            return ocl.long, numpy.int64(arg)
+        raise clq.Error("Integer %d is out of range of long." % arg)
+    if isinstance(arg, float):
+        if _float32_info.min <= arg <= _float32_info.max:
+            return ocl.float, numpy.float32(arg)
+        return ocl.double, numpy.float64(arg)
+    try:
+        return arg.cl_type, arg
+    except AttributeError:
+        raise clq.Error("Can not infer the type of argument %r." % (arg,))
@@ -0,0 +1,76 @@
+"""A bounded in-memory cache of the kernels built for each context.
+
+The host-side drivers of :mod:`clq.stdlib` and :mod:`lazy
+<clq.backends.opencl.lazy>`, and the :class:`Dispatcher
+<clq.backends.opencl.dispatch.Dispatcher>` of each generic function, compile
+their kernels the first time they are launched in a context and look them up
+afterwards::
+
+    _kernels = kernelcache.KernelCache()
+
+    def _kernel(ctx, generic_fn, arg_types):
+        return _kernels.kernel(ctx, (generic_fn, arg_types), lambda:
+            kernelcache.build(ctx, backend,
+                              [generic_fn.compile(backend, *arg_types)]))
+
+A kernel holds its program and the context it was built in, so a cache only
+keeps the ``max_size`` most recently used kernels, rather than every context
+and program for the life of the process.
+"""
+import cypy
+import clq
+
+default_max_size = 128
+"""The default number of kernels kept by a cache."""
+
+class KernelCache(object):
+    """The most recently used kernels, each built in a context for a key."""
+    def __init__(self, max_size=default_max_size):
+        self.max_size = max_size
+        self._kernels = cypy.OrderedDict() # (context, key) => kernel
+        self.hits = 0
+        self.misses = 0
+
+    max_size = None
+    """The number of most recently used kernels kept."""
+
+    hits = None
+    """The number of kernels found in this cache."""
+
+    misses = None
+    """The number of kernels built for this cache."""
+
+    @property
+    def stats(self):
+        """A dict containing the hits, misses and number of kernels."""
+        return {'hits': self.hits, 'misses': self.misses,
+                'kernels': len(self._kernels)}
+
+    def kernel(self, ctx, key, make_kernel):
+        """Returns the kernel for the provided key in the provided context,
+        calling ``make_kernel()`` to build it if it isn't cached."""
+        kernels = self._kernels
+        ctx_key = (ctx, key)
+        try:
+            kernel = kernels.pop(ctx_key)
+        except KeyError:
+            kernel = make_kernel()
+            self.misses += 1
+        else:
+            self.hits += 1
+        # inserted as the most recently used
+        kernels[ctx_key] = kernel
+        while len(kernels) > self.max_size:
+            del kernels[next(iter(kernels))]
+        return kernel
+
+    def clear(self):
+        """Forgets the kernels cached so far."""
+        self._kernels.clear()
+
+def build(ctx, backend, concrete_fns):
+    """Returns the kernel of the first of the provided concrete functions,
+    built in the provided context in a program along with the others (see
+    :meth:`clq.Module.compile`)."""
+    program = clq.Module(backend, concrete_fns).compile(ctx)
+    return getattr(program, concrete_fns[0].name)
@@ -0,0 +1,371 @@
+"""Lazy elementwise expressions over :class:`pyocl.Buffer
+<clq.backends.opencl.pyocl.Buffer>` objects.
+
+Applying generic functions to buffers with :func:`apply` builds an expression
+instead of launching a kernel. Once its result is needed, by
+:meth:`Expr.wait` or :meth:`Expr.from_device`, all of the stages which
+haven't been evaluated yet are fused into a single kernel, which computes each
+element of the result from the corresponding elements of the buffers without
+storing intermediate values in global memory::
+
+    from clq.backends.opencl import lazy
+    from clq.stdlib import plus, mul
+
+    c = lazy.apply(plus, a, b)
+    d = lazy.apply(mul, c, e) # or c * e, or lazy.mul(c, e)
+    result = d.from_device() # launches one kernel
+
+The functions, e.g. those in :mod:`clq.stdlib`, are applied to the elements
+of the buffers and to Python numbers, and are inlined into the kernel.
+Expressions used more than once are computed once per element.
+"""
+import clq
+import clq.backends.opencl as ocl
+import clq.backends.opencl.kernelcache as kernelcache
+import clq.stdlib as stdlib
+
+backend = ocl.Backend()
+"""The backend fused kernels are compiled for."""
+
+vector_width = 4
+"""The width of the :attr:`vectorized <clq.GenericFn.vectorize>` variant of
+each fused kernel to compile along with it, where it can be, or None to
+compile none."""
+
+def apply(generic_fn, *args):
+    """Returns the lazy application of the provided generic function to each
+    element of the arguments, which may be buffers, expressions or
+    scalars."""
+    return Apply(generic_fn, tuple(as_expr(arg) for arg in args))
+
+def lift(generic_fn):
+    """Returns a function :func:`applying <apply>` the provided generic
+    function lazily."""
+    return lambda *args: apply(generic_fn, *args)
+
+plus = lift(stdlib.plus)
+"""Lazily applies :func:`clq.stdlib.plus`. See :func:`lift`."""
+
+minus = lift(stdlib.minus)
+"""Lazily applies :func:`clq.stdlib.minus`. See :func:`lift`."""
+
+mul = lift(stdlib.mul)
+"""Lazily applies :func:`clq.stdlib.mul`. See :func:`lift`."""
+
+div = lift(stdlib.div)
+"""Lazily applies :func:`clq.stdlib.div`. See :func:`lift`."""
+
+def as_expr(value):
+    """Returns the provided value if it is an :class:`Expr` or an
+    :class:`Input` holding it otherwise."""
+    if isinstance(value, Expr):
+        return value
+    return Input(value)
+
+class Expr(object):
+    """Base class for lazy expressions.
+
+    The arithmetic operators apply :obj:`plus`, :obj:`minus`, :obj:`mul` and
+    :obj:`div`.
+    """
+    buffer = None
+    """The buffer holding the result once it has been evaluated, or None."""
+
+    event = None
+    """The event for the kernel computing the :attr:`buffer`, if any."""
+
+    def evaluate(self):
+        """Launches the kernel computing this expression, unless it has been
+        already, and returns the :attr:`buffer`."""
+        raise NotImplementedError()
+
+    def wait(self):
+        """Evaluates this expression and waits for the kernel computing it to
+        finish, returning the :attr:`buffer`."""
+        buffer = self.evaluate()
+        if self.event is not None:
+            self.event.wait()
+        return buffer
+
+    def from_device(self):
+        """Evaluates this expression and copies the result to a new array."""
+        return self.wait().from_device()
+
+    def __add__(self, other):
+        return plus(self, other)
+
+    def __radd__(self, other):
+        return plus(other, self)
+
+    def __sub__(self, other):
+        return minus(self, other)
+
+    def __rsub__(self, other):
+        return minus(other, self)
+
+    def __mul__(self, other):
+        return mul(self, other)
+
+    def __rmul__(self, other):
+        return mul(other, self)
+
+    def __div__(self, other):
+        return div(self, other)
+
+    def __rdiv__(self, other):
+        return div(other, self)
+
+    __truediv__ = __div__
+    __rtruediv__ = __rdiv__
+
+class Input(Expr):
+    """A buffer or a scalar used in expressions."""
+    def __init__(self, value):
+        self.value = value
+        if self.is_scalar:
+            self.cl_type = self.element_type = backend.type_of_constant(value)
+        else:
+            self.buffer = value
+            self.cl_type = value.cl_type
+            self.element_type = value.cl_dtype
+
+    value = None
+    """The buffer or scalar."""
+
+    cl_type = None
+    """The type of the argument passing the value to kernels."""
+
+    element_type = None
+    """The type of the elements of the buffer, or of the scalar."""
+
+    @property
+    def is_scalar(self):
+        """Whether the value is a scalar rather than a buffer."""
+        return not hasattr(self.value, 'cl_type')
+
+    def evaluate(self):
+        return self.buffer
+
+class Apply(Expr):
+    """The lazy application of a generic function to the elements of other
+    expressions. See :func:`apply`."""
+    def __init__(self, generic_fn, args):
+        self.generic_fn = generic_fn
+        self.args = args
+
+    generic_fn = None
+    """The generic function applied."""
+
+    args = None
+    """A tuple of the expressions it is applied to."""
+
+    def evaluate(self):
+        if self.buffer is None:
+            Fusion(self).launch()
+        return self.buffer
+
+class Fusion(object):
+    """The kernel evaluating the stages of an :class:`Apply` expression which
+    haven't been evaluated in one step.
+
+    It is made from two generated generic functions, e.g. for
+    ``mul(plus(a, b), 2)``::
+
+        def fused_plus_mul_value(x0, x1, x2, f0, f1):
+            return f1(f0(x0, x1), x2)
+
+        def fused_plus_mul(x0, x1, x2, dest, value, f0, f1, get_global_id):
+            gid = get_global_id(0)
+            dest[gid] = value(x0[gid], x1[gid], x2, f0, f1)
+
+    The functions applied are passed as arguments, and the :attr:`value_fn`
+    is always inlined.
+    """
+    def __init__(self, expr):
+        self.expr = expr
+        self.inputs = [ ]
+        self.fns = [ ]
+        self._input_ids = { }
+        self._fn_ids = { }
+        self._uses = { }
+        self._count_uses(expr)
+        self._names = { }
+        self._stmts = [ ]
+        value = self._visit(expr)
+
+        xs = ["x%d" % i for i in xrange(len(self.inputs))]
+        fs = ["f%d" % i for i in xrange(len(self.fns))]
+        name = "fused_" + "_".join(fn.name for fn in self.fns)
+        elements = [x if _is_scalar(input) else x + "[gid]"
+                    for x, input in zip(xs, self.inputs)]
+        self.value_src = "def %s_value(%s):\n%s    return %s\n" % (
+            name, ", ".join(xs + fs),
+            "".join("    %s\n" % stmt for stmt in self._stmts), value)
+        self.kernel_src = (
+            "def %s(%s, dest, value, %s, get_global_id):\n"
+            "    gid = get_global_id(0)\n"
+            "    dest[gid] = value(%s)\n" % (
+                name, ", ".join(xs), ", ".join(fs), ", ".join(elements + fs)))
+        try:
+            self.value_fn, self.kernel_fn = _generic_fns[self.kernel_src,
+                                                         self.value_src]
+        except KeyError:
+            self.value_fn = clq.fn.from_source(self.value_src, inline=True)
+            self.kernel_fn = clq.fn.from_source(self.kernel_src)
+            _generic_fns[self.kernel_src, self.value_src] = \
+                (self.value_fn, self.kernel_fn)
+
+    expr = None
+    """The expression evaluated."""
+
+    inputs = None
+    """A list of the buffers and scalars, as :class:`Input` expressions, and
+    of the expressions which have already been evaluated, which the kernel
+    reads."""
+
+    fns = None
+    """A list of the distinct generic functions applied."""
+
+    value_src = None
+    """The source code of the :attr:`value_fn`."""
+
+    kernel_src = None
+    """The source code of the :attr:`kernel_fn`."""
+
+    value_fn = None
+    """The generic function computing an element of the result."""
+
+    kernel_fn = None
+    """The generic function of the kernel."""
+
+    def _count_uses(self, expr):
+        # counts the uses of each expression to evaluate, visiting each once
+        for arg in expr.args:
+            if isinstance(arg, Apply) and arg.buffer is None:
+                uses = self._uses.get(arg, 0)
+                self._uses[arg] = uses + 1
+                if not uses:
+                    self._count_uses(arg)
+
+    def _visit(self, expr):
+        # returns the code computing an element of expr
+        if not isinstance(expr, Apply) or expr.buffer is not None:
+            # buffers are only read once, but scalars aren't merged
+            key = expr.buffer
+            if key is None:
+                key = expr
+            try:
+                id = self._input_ids[key]
+            except KeyError:
+                id = self._input_ids[key] = len(self.inputs)
+                self.inputs.append(expr)
+            return "x%d" % id
+        try:
+            return self._names[expr]
+        except KeyError:
+            pass
+        args = [self._visit(arg) for arg in expr.args]
+        fn = expr.generic_fn
+        try:
+            fn_id = self._fn_ids[fn]
+        except KeyError:
+            fn_id = self._fn_ids[fn] = len(self.fns)
+            self.fns.append(fn)
+        code = "f%d(%s)" % (fn_id, ", ".join(args))
+        if self._uses.get(expr, 0) > 1:
+            name = self._names[expr] = "t%d" % len(self._stmts)
+            self._stmts.append("%s = %s" % (name, code))
+            return name
+        return code
+
+    @property
+    def element_types(self):
+        """A tuple of the types of the elements of the :attr:`inputs`."""
+        return tuple(_element_type(input) for input in self.inputs)
+
+    @property
+    def result_type(self):
+        """The type of the elements of the result."""
+        fn_types = tuple(fn.cl_type for fn in self.fns)
+        return self.value_fn.compile(
+            backend, *(self.element_types + fn_types)).return_type
+
+    @property
+    def arg_types(self):
+        """A tuple of the types of the arguments of the :attr:`kernel_fn`."""
+        return (tuple(_arg_type(input) for input in self.inputs) +
+                (self.result_type.ptr_global, self.value_fn.cl_type) +
+                tuple(fn.cl_type for fn in self.fns) +
+                (ocl.get_global_id.cl_type,))
+
+    def kernel(self, ctx):
+        """Returns the kernel, as compiled in the provided
+        :class:`pyocl.Context <clq.backends.opencl.pyocl.Context>` once."""
+        arg_types = self.arg_types
+        return _kernels.kernel(ctx, (self.kernel_fn, arg_types),
+                               lambda: self.build(ctx, arg_types))
+
+    def build(self, ctx, arg_types):
+        """Returns the kernel compiled for the provided argument types, along
+        with its vectorized variant where it can be, in the provided
+        context."""
+        concrete_fn = self.kernel_fn.compile(backend, *arg_types)
+        concrete_fns = [concrete_fn]
+        if vector_width is not None:
+            vector_fn = self.kernel_fn.with_options(
+                vectorize=vector_width).compile(backend, *arg_types)
+            try:
+                vector_fn.program_item
+            except clq.InvalidOperationError:
+                pass
+            else:
+                concrete_fns.append(vector_fn)
+        return kernelcache.build(ctx, backend, concrete_fns)
+
+    def launch(self):
+        """Launches the kernel, saving the buffer it stores the result in and
+        the event for it as the attributes of the :attr:`expr`."""
+        expr = self.expr
+        buffers = [input.buffer for input in self.inputs
+                   if input.buffer is not None]
+        if not buffers:
+            raise clq.Error("Expressions must read at least one buffer.")
+        size = len(buffers[0])
+        for buffer in buffers:
+            if len(buffer) != size:
+                raise clq.Error("Buffers of lengths %d and %d can't be "
+                                "combined elementwise." % (size, len(buffer)))
+        ctx = buffers[0].context
+        kernel = self.kernel(ctx)
+        dest = ctx.alloc(buffers[0].shape, self.result_type)
+        args = [_arg_value(input) for input in self.inputs]
+        args.append(dest)
+        wait_for = [input.event for input in self.inputs
+                    if input.event is not None]
+        kwargs = { }
+        if wait_for:
+            kwargs['wait_for'] = wait_for
+        expr.event = kernel((size,), *args, **kwargs)
+        expr.buffer = dest
+
+def _is_scalar(input):
+    return isinstance(input, Input) and input.is_scalar
+
+def _element_type(input):
+    if isinstance(input, Input):
+        return input.element_type
+    return input.buffer.cl_dtype
+
+def _arg_type(input):
+    if isinstance(input, Input):
+        return input.cl_type
+    return input.buffer.cl_type
+
+def _arg_value(input):
+    if _is_scalar(input):
+        return input.cl_type.np_dtype.type(input.value)
+    return input.buffer
+
+_generic_fns = { } # (kernel source, value source) => generic functions
+# (kernel generic function, argument types) => kernel
+_kernels = kernelcache.KernelCache()
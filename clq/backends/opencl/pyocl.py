@@ -6,6 +6,8 @@ import numpy as _numpy
 import pyopencl as _cl
 from pyopencl import * #@UnusedWildImport
 import clq.backends.opencl as clqcl
+import clq.backends.opencl.bufferpool as _bufferpool
+import clq.backends.opencl.argbinder as _argbinder
 
 class Error(Error): 
     """Base class for errors in ``cl.oquence.pyopencl``. 
@@ -193,6 +195,11 @@ class Context(Context):
     devices = None
     properties = None
     dev_type = None
+    
+    pool = None
+    """The :class:`BufferPool <clq.backends.opencl.bufferpool.BufferPool>` 
+    buffers are allocated from, or None if pooling is not enabled. See 
+    :meth:`enable_pool`."""
         
     @classmethod
     def get_somehow(cls, interactive=True, platform=None):
@@ -252,6 +259,8 @@ class Context(Context):
         ``flags``
             One or more :class:`mem_flags`. Defaults to 
             ``mem_flags.READ_WRITE``.            
+            
+        If a :attr:`pool` is enabled, the buffer is taken from it.
         """
         if cypy.is_int_like(shape):
             shape = (shape,)
@@ -272,6 +281,29 @@ class Context(Context):
 
         return Buffer.shaped(self, shape, cl_dtype, order, flags)
 
+    def enable_pool(self, max_bytes=_bufferpool.default_max_bytes):
+        """Enables pooling of the buffers allocated in this context, keeping 
+        at most ``max_bytes`` of idle buffers, and returns the 
+        :attr:`pool`.
+        
+        See :mod:`clq.backends.opencl.bufferpool`.
+        """
+        if self.pool is None:
+            self.pool = _bufferpool.BufferPool(PooledBuffer, max_bytes)
+        else:
+            self.pool.max_bytes = max_bytes
+            self.pool.evict(max_bytes)
+        return self.pool
+    
+    def disable_pool(self):
+        """Frees the idle buffers in the :attr:`pool` and stops pooling. 
+        Buffers still in use are freed when garbage collected."""
+        pool = self.pool
+        if pool is not None:
+            pool.max_bytes = 0
+            pool.clear()
+            self.pool = None
+    
     def copy(self, src, dest, block=True, wait_for=None, queue=None):
         """Copies the ``src`` buffer/array to the ``dest`` buffer/array.
 
@@ -282,8 +314,8 @@ class Context(Context):
             If True, does not return until the transfer is complete.
             
         ``wait_for``
-            A list of :class:`Event` instances to block on before copying, or
-            None.
+            A list of :class:`Event` or :class:`EventGroup` instances to block 
+            on before copying, or None.
 
         ``queue``
             The :class:`CommandQueue` to issue the copy command over. If not
@@ -293,11 +325,15 @@ class Context(Context):
         """
         if queue is None:
             queue = self.queue
+        if wait_for is not None:
+            wait_for = events_in(wait_for)
             
         if isinstance(dest, Buffer):
             if isinstance(src, Buffer):
-                # device to device
+                # device to device, pooled buffers may be larger than their
+                # contents
                 event = enqueue_copy_buffer(queue, src, dest, 
+                                            min(src.size, dest.size),
                                             wait_for=wait_for,
                                             is_blocking=block)
             else:
@@ -375,7 +411,11 @@ class Context(Context):
     def Out(self, dest):
         """Allocates an empty device buffer on the device for writing only, and 
         copies the result into the provided host buffer ``dest`` after each 
-        kernel call to which it is passed."""
+        kernel call to which it is passed.
+        
+        The copy is enqueued without blocking, to wait for the kernel. The 
+        :class:`EventGroup` returned by the kernel call completes once it 
+        has (see :meth:`Kernel.__call__`)."""
         return _Out(self, dest)
 
     def InOut(self, src):
@@ -387,15 +427,24 @@ class Context(Context):
         
         The compiler options can be provided as a single string or a sequence 
         of strings.
+
+        If a :obj:`binary_cache` is set, the program is looked up in it first.
         """
         if cypy.is_iterable(options):
             options = " ".join(options)
+        if binary_cache is not None:
+            return binary_cache.compile(self, source, options, Program)
         return Program(self, source).build(options)
 _cl.Context = Context
 
 ctx = None
 """The process-wide default context to use. None until set explicitly."""
 
+binary_cache = None
+"""The :class:`BinaryCache <clq.backends.opencl.binarycache.BinaryCache>`
+used by :meth:`Context.compile`, or None to always build programs from
+source. None until set explicitly."""
+
 def _Out(ctx, dest):
     buffer = ctx.alloc(flags=mem_flags.WRITE_ONLY, like=dest)
     buffer.post_kernel_hook = _Out_post_kernel_hook
@@ -409,8 +458,7 @@ def _InOut(ctx, src):
     return buffer
 
 def _Out_post_kernel_hook(context, buffer, event):
-    event.wait()
-    context.copy(buffer, buffer._dest, block=True)
+    return context.copy(buffer, buffer._dest, block=False, wait_for=[event])
 
 #############################################################################
 ## Memory Objects
@@ -439,6 +487,8 @@ class Buffer(Buffer):
         - If mem_flags.USE_HOST_PTR is not included and a ``hostbuf`` is 
           specified, it will be added automatically.
         - Metadata will be inferred from ``hostbuf`` if not explicitly provided.
+        - If no ``hostbuf`` is provided and the context has a 
+          :attr:`pool <Context.pool>`, the buffer is taken from it.
     
         ``shape``
             If an int is provided, converted to a one-dimensional tuple. 
@@ -465,7 +515,11 @@ class Buffer(Buffer):
         if size <= 0:
             raise Error("Invalid buffer size %s." % str(size))
         assert size > 0
-        buffer = cls(ctx, flags, size, hostbuf)
+        if hostbuf is None and ctx.pool is not None:
+            buffer = ctx.pool.alloc(ctx, size, flags)
+            buffer.size = size
+        else:
+            buffer = cls(ctx, flags, size, hostbuf)
         buffer.shape = shape
         buffer.cl_dtype = cl_dtype
         buffer.order = order
@@ -550,7 +604,10 @@ class Buffer(Buffer):
         """Attempts to infer a cl_dtype for the source buffer.
     
         If a ``cl_dtype`` attribute is defined, uses that. If not, but a 
-        ``dtype`` is defined, uses :obj:`to_cl_type` to look it up.
+        ``dtype`` is defined, uses :obj:`to_cl_type` to look it up. Structured
+        dtypes laid out like vectors, e.g. with four consecutive float32 
+        fields, give the corresponding vector type (see 
+        :func:`clq.backends.opencl.vector_type_for_dtype`.)
     
         Raises an :class:`Error` if not able to infer a cl_dtype.
         """
@@ -558,9 +615,16 @@ class Buffer(Buffer):
             return src.cl_dtype
         except AttributeError:
             try:
-                return clqcl.to_cl_type[src.dtype]
-            except (KeyError, AttributeError):
+                dtype = src.dtype
+            except AttributeError:
                 raise Error("No cl_dtype can be inferred from src.")
+            try:
+                return clqcl.to_cl_type[dtype]
+            except KeyError:
+                cl_dtype = clqcl.vector_type_for_dtype(dtype)
+                if cl_dtype is None:
+                    raise Error("No cl_dtype can be inferred from src.")
+                return cl_dtype
     
     @classmethod
     def infer_dtype(cls, src):
@@ -618,6 +682,7 @@ class LocalMemory(LocalMemory):
         local_mem.shape = shape
         local_mem.cl_dtype = cl_dtype
         local_mem.order = order
+        return local_mem
     
     shape = None
     """A tuple specifying the dimensions of the memory object.
@@ -635,7 +700,7 @@ class LocalMemory(LocalMemory):
     @cypy.lazy(property)
     def cl_type(self):
         """Returns a :class:`LocalPtrType` descriptor for this object."""
-        return self.cl_dtype.local_ptr    
+        return self.cl_dtype.ptr_shared
         
     order = "C"
     """The order of the dimensions of the array in memory.
@@ -655,6 +720,29 @@ class LocalMemory(LocalMemory):
     """
 _cl.LocalMemory = LocalMemory
 
+class PooledBuffer(_bufferpool.Pooled, Buffer):
+    """A :class:`Buffer` allocated from the :attr:`pool <Context.pool>` of 
+    its context, which is reused with new metadata once it is released.
+    
+    Its :attr:`size` is that requested and its :attr:`capacity` the size 
+    class it was allocated with.
+    """
+    @property
+    def cl_type(self):
+        """A :class:`GlobalPtrType` descriptor for this Buffer."""
+        if self.constant:
+            return self.cl_dtype.ptr_constant
+        else:
+            return self.cl_dtype.ptr_global
+        
+    def release(self):
+        """Returns this buffer to the pool of its context. It must not be 
+        used afterwards."""
+        # forget what Context.Out and Context.InOut attached to it
+        self.post_kernel_hook = None
+        self._dest = None
+        _bufferpool.Pooled.release(self)
+
 #############################################################################
 ## Program
 #############################################################################
@@ -664,6 +752,11 @@ class Program(Program):
     def __init__(self, context, *args, **kwargs):
         _orig__init_Program(self, context, *args, **kwargs)
         self.context = context
+        
+    vectorized_kernels = { }
+    """A dict mapping the names of kernels in this program to pairs containing
+    the name of their vectorized variant and its width. Set by 
+    :meth:`clq.Module.compile`."""
 _cl.Program = Program
 
 #############################################################################
@@ -682,6 +775,22 @@ class Kernel(Kernel):
         self.context = program.context
         self.queue = program.context.queue
         self.name = name
+        vectorized = program.vectorized_kernels.get(name, None)
+        if vectorized is not None:
+            vector_name, self.vector_width = vectorized
+            self.vector_kernel = Kernel(program, vector_name)
+            
+    vector_kernel = None
+    """The :attr:`vectorized <clq.GenericFn.vectorize>` variant of this 
+    kernel in the same program, or None if it has none."""
+    
+    vector_width = None
+    """The number of elements each work-item of the :attr:`vector_kernel` 
+    processes."""
+
+    bound_by = None
+    """The :meth:`binder` which set the arguments of this kernel last, or 
+    None if they have been set by calling it since."""
 
     def __call__(self, *args, **kwargs):
         """
@@ -690,13 +799,27 @@ class Kernel(Kernel):
         argument as the ``global_size`` if not explicitly specified.
 
         Also provides support for :meth:`Context.Out` and :meth:`Context.InOut`.
+        Their results are copied back to the host without blocking once the 
+        kernel completes, and an :class:`EventGroup` of the kernel and the 
+        copies is returned instead of the kernel's event. Passing 
+        ``block=True`` waits for the kernel and any copies before returning.
+        ``wait_for`` may contain event groups as well as events.
         
         Python ints and floats are converted to numpy ints and floats 
         automatically. The default floating point data type is ``float``, not
         ``double``, which is only used if the number cannot fit into the range
         of the float. The default integer data type is ``int``, with ``long``
         being used if the number is out of range of ``int``.
+        
+        If the kernel has a :attr:`vector_kernel`, it is launched instead 
+        with the global size divided by its width, followed by this kernel 
+        for the elements left over. This is done automatically for 
+        one-dimensional global sizes of at least the width when neither a
+        ``local_size`` nor a ``global_offset`` is provided, and can be 
+        chosen for each call with the ``vectorize`` keyword argument.
         """
+        # any binder of this kernel must set its arguments again
+        self.bound_by = None
         queue = args[0]
         if not isinstance(queue, CommandQueue):
             queue = kwargs.pop('queue', None)
@@ -717,19 +840,73 @@ class Kernel(Kernel):
             args = args[1:]
 
         args = tuple(self._process_args(args))
-
-        event = _orig__call_Kernel(self, queue, global_size, *args, **kwargs)
         
+        block = kwargs.pop('block', False)
+        wait_for = kwargs.get('wait_for', None)
+        if wait_for is not None:
+            kwargs['wait_for'] = events_in(wait_for)
+
+        vectorize = kwargs.pop('vectorize', None)
+        if vectorize is None:
+            vectorize = self.vector_kernel is not None and \
+                len(global_size) == 1 and \
+                global_size[0] >= self.vector_width and \
+                'local_size' not in kwargs and 'global_offset' not in kwargs
+        if vectorize:
+            event = self._call_vectorized(queue, global_size, args, kwargs)
+        else:
+            event = _orig__call_Kernel(self, queue, global_size, *args, 
+                                       **kwargs)
+        
+        copies = [ ]
         for arg in args:
             hook = getattr(arg, 'post_kernel_hook', None)
             if hook is not None:
-                hook(self.program.context, arg, event)
-
+                copies.append(hook(self.program.context, arg, event))
+        if copies:
+            event = EventGroup([event] + copies)
+            
+        if block:
+            event.wait()
+        return event
+    
+    def binder(self, arg_types):
+        """Returns an :class:`ArgBinder 
+        <clq.backends.opencl.argbinder.ArgBinder>` launching this kernel, 
+        which must have been compiled from a concrete function with the 
+        provided argument types, faster than calling it.
+        
+        See :mod:`clq.backends.opencl.argbinder`.
+        """
+        return _argbinder.ArgBinder(self, arg_types, _enqueue_kernel)
+    
+    def _call_vectorized(self, queue, global_size, args, kwargs):
+        if self.vector_kernel is None:
+            raise Error("Kernel '%s' has no vectorized variant." % self.name)
+        if len(global_size) != 1 or 'local_size' in kwargs or \
+           'global_offset' in kwargs:
+            raise Error("Vectorized kernels are launched with a "
+                        "one-dimensional global size only.")
+        size = global_size[0]
+        n_vectors, n_left = divmod(size, self.vector_width)
+        if n_vectors == 0:
+            return _orig__call_Kernel(self, queue, global_size, *args, 
+                                      **kwargs)
+        self.vector_kernel.bound_by = None
+        event = _orig__call_Kernel(self.vector_kernel, queue, (n_vectors,), 
+                                   *args, **kwargs)
+        if n_left:
+            # waiting for the vectors too, so the event returned covers both
+            kwargs = dict(kwargs, global_offset=(size - n_left,), 
+                          wait_for=[event])
+            event = _orig__call_Kernel(self, queue, (n_left,), *args, 
+                                       **kwargs)
         return event
     
     def _process_args(self, args):
         for arg in args:
-            if isinstance(arg, (_numpy.number, MemoryObject)):
+            if isinstance(arg, (_numpy.number, MemoryObject, 
+                                _cl.LocalMemory)):
                 yield arg
             else:
                 yield self.convert_arg(arg)
@@ -737,21 +914,69 @@ class Kernel(Kernel):
     @classmethod
     def convert_arg(cls, arg):
         if cypy.is_int_like(arg):
-            if cl_int.min <= arg <= cl_int.max:
-                yield _numpy.int32(arg)
-            elif cl_long.min <= arg <= cl_long.max:
-                yield _numpy.int64(arg)
+            if _int32_info.min <= arg <= _int32_info.max:
+                return _numpy.int32(arg)
+            elif _int64_info.min <= arg <= _int64_info.max:
+                return _numpy.int64(arg)
             else:
                 raise Error("Integer-like number is out of range of long: %s" %
                             str(arg))
         elif cypy.is_float_like(arg):
-            if cl_float.min <= arg <= cl_float.max:
-                yield _numpy.float32(arg)
-            elif cl_float.min <= arg <= cl_float.max:
-                yield _numpy.float64(arg)
+            if _float32_info.min <= arg <= _float32_info.max:
+                return _numpy.float32(arg)
+            elif _float64_info.min <= arg <= _float64_info.max:
+                return _numpy.float64(arg)
             else:
                 raise Error("Float-like number is out of range of double: %s" %
                             str(arg))
         else:
             raise Error("Invalid argument: %s" % str(arg))
 _cl.Kernel = Kernel
+
+_int32_info = _numpy.iinfo(_numpy.int32)
+_int64_info = _numpy.iinfo(_numpy.int64)
+_float32_info = _numpy.finfo(_numpy.float32)
+_float64_info = _numpy.finfo(_numpy.float64)
+
+def _enqueue_kernel(queue, kernel, global_size, local_size, global_offset,
+                    wait_for):
+    if wait_for is not None:
+        wait_for = events_in(wait_for)
+    return enqueue_nd_range_kernel(queue, kernel, global_size, local_size,
+                                   global_offset, wait_for)
+
+#############################################################################
+## Events
+#############################################################################
+class EventGroup(object):
+    """A group of events which completes once all of them have, e.g. a kernel
+    and the copies of its results to the host."""
+    def __init__(self, events):
+        self.events = events
+        
+    events = None
+    """The list of events in this group."""
+    
+    @property
+    def done(self):
+        """Whether every event in this group has completed."""
+        for event in self.events:
+            if event.command_execution_status != \
+               command_execution_status.COMPLETE:
+                return False
+        return True
+    
+    def wait(self):
+        """Blocks until every event in this group has completed."""
+        wait_for_events(self.events)
+        
+def events_in(events):
+    """Returns a list of the provided events, with :class:`EventGroup` 
+    instances replaced by the events in them."""
+    flat = [ ]
+    for event in events:
+        if isinstance(event, EventGroup):
+            flat.extend(events_in(event.events))
+        else:
+            flat.append(event)
+    return flat
@@ -0,0 +1,215 @@
+"""An on-disk cache of compiled concrete functions.
+
+Compiling a concrete function involves annotating, resolving and generating
+code for its entire call graph. When the same functions are compiled
+repeatedly, e.g. across runs of a program, this cache can be enabled to skip
+that work::
+
+    import clq
+    import clq.diskcache
+    clq.disk_cache = clq.diskcache.DiskCache("/tmp/clq-cache")
+
+Entries are keyed by :attr:`ConcreteFn.cache_key <clq.ConcreteFn.cache_key>`,
+which is derived from the dump of the generic function's syntax tree, the
+argument types and the backend. Functions whose return type cannot be
+restored by name using :meth:`clq.Backend.type_for_name` are not cached.
+
+Several processes may safely share a cache directory: entries are written to
+a temporary file and atomically renamed into place, and a missing or
+unreadable entry is simply treated as a miss.
+"""
+import os
+import errno
+import tempfile
+import cPickle as pickle
+
+import clq
+
+default_max_size = 64 * 1024 * 1024
+"""The default maximum total size, in bytes, of the entries in a cache."""
+
+suffix = ".clq"
+"""The file suffix used for cache entries."""
+
+def program_item_records(program_items):
+    """Returns picklable records of the provided :class:`program items 
+    <clq.ProgramItem>`, which must each be preceded by their dependencies."""
+    index = dict((item, i) for i, item in enumerate(program_items))
+    return [(item.name, item.code, 
+             tuple(index[dependency] for dependency in item.dependencies),
+             tuple(item.extensions))
+            for item in program_items]
+
+def program_items_from_records(records):
+    """Returns a tuple of the program items described by records produced by
+    :func:`program_item_records`, :meth:`interned <clq.ProgramItem.intern>`
+    so items shared by several functions are restored once."""
+    items = [ ]
+    for name, code, dependencies, extensions in records:
+        items.append(clq.ProgramItem(name, code, 
+            tuple(items[i] for i in dependencies), extensions).intern())
+    return tuple(items)
+
+def make_dirs(path):
+    """Creates the provided directory and its parents, unless it exists."""
+    if not os.path.isdir(path):
+        try:
+            os.makedirs(path)
+        except OSError, e:
+            # another process may have created it in the meantime
+            if e.errno != errno.EEXIST:
+                raise
+
+def write_atomically(filename, obj):
+    """Pickles the provided object to a temporary file in the same directory
+    as ``filename``, then renames it into place, so other processes never 
+    see a partially written file."""
+    fd, tmp_filename = tempfile.mkstemp(suffix=".tmp", 
+                                        dir=os.path.dirname(filename))
+    try:
+        f = os.fdopen(fd, 'wb')
+        try:
+            pickle.dump(obj, f, pickle.HIGHEST_PROTOCOL)
+        finally:
+            f.close()
+        os.rename(tmp_filename, filename)
+    except:
+        try:
+            os.unlink(tmp_filename)
+        except OSError:
+            pass
+        raise
+
+def evict(path, suffix, max_size):
+    """Removes the least recently modified files ending with ``suffix`` from
+    the provided directory until their total size is no more than 
+    ``max_size`` bytes."""
+    entries = [ ]
+    total_size = 0
+    for name in os.listdir(path):
+        if not name.endswith(suffix):
+            continue
+        filename = os.path.join(path, name)
+        try:
+            st = os.stat(filename)
+        except OSError:
+            # removed by another process
+            continue
+        entries.append((st.st_mtime, st.st_size, filename))
+        total_size += st.st_size
+
+    entries.sort()
+    for _, size, filename in entries:
+        if total_size <= max_size:
+            break
+        try:
+            os.unlink(filename)
+        except OSError, e:
+            if e.errno != errno.ENOENT:
+                raise
+        total_size -= size
+
+class Entry(object):
+    """The cached products of compiling a concrete function."""
+    def __init__(self, program_items, return_type):
+        self.program_items = program_items
+        self.return_type = return_type
+
+    program_items = None
+    """A tuple of the :class:`program items <clq.ProgramItem>` needed by the
+    function, ending with its own."""
+
+    return_type = None
+    """The return type of the function."""
+
+    @property
+    def program_item(self):
+        """The program item corresponding to the function."""
+        return self.program_items[-1]
+
+class DiskCache(object):
+    """A directory of cached concrete functions, bounded in total size by
+    evicting the least recently used entries."""
+    def __init__(self, path, max_size=default_max_size):
+        make_dirs(path)
+        self.path = path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+    path = None
+    """The directory containing the cache entries."""
+
+    max_size = None
+    """The maximum total size, in bytes, of the entries in this cache."""
+
+    hits = None
+    """The number of lookups which found a usable entry."""
+
+    misses = None
+    """The number of lookups which did not find a usable entry."""
+
+    def filename_for(self, concrete_fn):
+        """Returns the path of the entry for the provided concrete function."""
+        return os.path.join(self.path, concrete_fn.cache_key + suffix)
+
+    def get(self, concrete_fn):
+        """Returns the :class:`Entry` for the provided concrete function, or
+        None if there is no usable entry."""
+        filename = self.filename_for(concrete_fn)
+        try:
+            f = open(filename, 'rb')
+            try:
+                records, return_type_name = pickle.load(f)
+            finally:
+                f.close()
+            program_items = program_items_from_records(records)
+        except (IOError, OSError, EOFError, ValueError, TypeError, 
+                IndexError, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+
+        return_type = concrete_fn.backend.type_for_name(return_type_name)
+        if return_type is None:
+            self.misses += 1
+            return None
+
+        try:
+            # mark as recently used
+            os.utime(filename, None)
+        except OSError:
+            pass
+
+        self.hits += 1
+        return Entry(program_items, return_type)
+
+    def put(self, concrete_fn, context):
+        """Stores the results of compiling the provided concrete function, as
+        found in the provided :class:`context <clq.Context>`.
+
+        Returns False if the return type cannot be restored by name.
+        """
+        return_type = context.return_type
+        backend = concrete_fn.backend
+        if backend.type_for_name(return_type.name) is not return_type:
+            return False
+
+        records = program_item_records(context.program_items)
+        write_atomically(self.filename_for(concrete_fn), 
+                         (records, return_type.name))
+        self.evict()
+        return True
+
+    def evict(self):
+        """Removes the least recently used entries until the total size of
+        the cache is no more than :attr:`max_size`."""
+        evict(self.path, suffix, self.max_size)
+
+    def clear(self):
+        """Removes all entries from the cache."""
+        max_size = self.max_size
+        self.max_size = 0
+        try:
+            self.evict()
+        finally:
+            self.max_size = max_size
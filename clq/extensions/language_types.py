@@ -12,6 +12,10 @@ class ConstrainedString(clq.Type):
         self._regex = regex
         self.name = self._backend.string_t.name
     
+    @property
+    def cache_key(self):
+        return "ConstrainedString(%r)" % self._regex
+    
     @classmethod
     def regex_to_name(cls, name):
         ret_val = ""
@@ -0,0 +1,222 @@
+"""Instrumentation of the phases of the cl.oquence compiler.
+
+The compiler reports each of the following phases, per function, to the
+active :obj:`listeners`:
+
+- ``parse``: parsing the source of a generic function (``fn``,
+  ``fn.from_source``)
+- ``annotate``: annotating a generic function's syntax tree with unresolved
+  types (:attr:`GenericFn.annotated_ast <clq.GenericFn.annotated_ast>`)
+- ``resolve``: resolving unresolved types in the context of a concrete
+  function
+- ``optimize``: running the :mod:`optimization passes <clq.passes>` over the
+  body of a concrete function
+- ``generate``: generating code for the statements of a concrete function
+- ``assemble``: assembling a concrete function's program item
+
+Phases nest (e.g. types are resolved while generating code, and callees are
+compiled while resolving calls to them). A phase which re-enters itself for
+the same function is counted once.
+
+The simplest way to listen is to record into a :class:`Recorder`::
+
+    with clq.instrument.recording() as recorder:
+        fn.compile(OpenCL, ocl.int).program_item
+    print recorder.to_json(indent=2)
+"""
+import time as _time
+import json as _json
+import resource as _resource
+import contextlib as _contextlib
+
+phases = ("parse", "annotate", "resolve", "optimize", "generate", "assemble")
+"""The names of the phases which are reported."""
+
+listeners = [ ]
+"""The objects which phases are reported to.
+
+Each must have a ``record(phase, fn, time, self_time, memory)`` method. See
+:meth:`Recorder.record` for the meaning of the arguments. Phases are only
+measured if there is at least one listener.
+"""
+
+def phase(name, fn=None):
+    """Returns a context manager which measures the enclosed code as a phase
+    with the provided name, on behalf of the provided function (a
+    :class:`GenericFn <clq.GenericFn>`, :class:`ConcreteFn <clq.ConcreteFn>`
+    or a name.)
+
+    The context manager provides the :class:`Phase`, which can be used to set
+    the function once it is known.
+    """
+    if not listeners:
+        return _null_phase
+    if _stack:
+        top = _stack[-1]
+        if top.name == name and top.fn is fn:
+            return _null_phase
+    return Phase(name, fn)
+
+@_contextlib.contextmanager
+def recording(recorder=None):
+    """A context manager which adds a :class:`Recorder` (a new one by default)
+    to the :obj:`listeners` for the duration of the enclosed code, and
+    provides it."""
+    if recorder is None:
+        recorder = Recorder()
+    listeners.append(recorder)
+    try:
+        yield recorder
+    finally:
+        listeners.remove(recorder)
+
+def label(fn):
+    """Returns the name used to report the provided function."""
+    if fn is None or isinstance(fn, basestring):
+        return fn
+    arg_types = getattr(fn, 'arg_types', None)
+    if arg_types is None:
+        return fn.__name__
+    return "%s(%s)" % (fn.generic_fn.__name__,
+                       ", ".join(str(getattr(arg_type, 'name', arg_type))
+                                 for arg_type in arg_types))
+
+def _maxrss():
+    return _resource.getrusage(_resource.RUSAGE_SELF).ru_maxrss
+
+_stack = [ ]
+# the phases being measured, innermost last
+
+class Phase(object):
+    """A phase being measured."""
+    def __init__(self, name, fn):
+        self.name = name
+        self.fn = fn
+
+    name = None
+    """The name of the phase."""
+
+    fn = None
+    """The function the phase is on behalf of."""
+
+    def __enter__(self):
+        self._children_time = 0.0
+        _stack.append(self)
+        self._maxrss = _maxrss()
+        self._start = _time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = _time.time() - self._start
+        memory = _maxrss() - self._maxrss
+        _stack.pop()
+        if _stack:
+            _stack[-1]._children_time += elapsed
+
+        fn = label(self.fn)
+        self_time = elapsed - self._children_time
+        for listener in listeners:
+            listener.record(self.name, fn, elapsed, self_time, memory)
+
+class _NullPhase(object):
+    """Stands in for a phase when nothing is being measured."""
+    fn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+_null_phase = _NullPhase()
+
+class Stats(object):
+    """Accumulated statistics for a phase."""
+    def __init__(self):
+        self.calls = 0
+        self.time = 0.0
+        self.self_time = 0.0
+        self.memory = 0
+
+    calls = None
+    """The number of times the phase was entered."""
+
+    time = None
+    """The total wall time spent in the phase, in seconds."""
+
+    self_time = None
+    """The wall time spent in the phase but not in a phase nested within it,
+    in seconds."""
+
+    memory = None
+    """The total growth in peak resident set size during the phase, in the
+    units of ``resource.getrusage`` (kilobytes on Linux).
+
+    Python 2 can not trace allocations directly, so this is only an
+    indication of where memory is allocated."""
+
+    def add(self, time, self_time, memory):
+        self.calls += 1
+        self.time += time
+        self.self_time += self_time
+        self.memory += memory
+
+    def as_dict(self):
+        return {"calls": self.calls, "time": self.time,
+                "self_time": self.self_time, "memory": self.memory}
+
+class Recorder(object):
+    """A listener which accumulates :class:`Stats` per phase and per
+    function."""
+    def __init__(self):
+        self.phases = { }
+        self.functions = { }
+
+    phases = None
+    """A dict mapping phase names to :class:`Stats` over all functions."""
+
+    functions = None
+    """A dict mapping function names (see :func:`label`) to dicts mapping
+    phase names to :class:`Stats`."""
+
+    def record(self, phase, fn, time, self_time, memory):
+        """Called when a phase has finished.
+
+        fn is the name of the function, time and self_time are the wall times
+        in seconds with and without nested phases and memory is the growth in
+        peak resident set size."""
+        try:
+            stats = self.phases[phase]
+        except KeyError:
+            stats = self.phases[phase] = Stats()
+        stats.add(time, self_time, memory)
+
+        fn_phases = self.functions.setdefault(fn, { })
+        try:
+            stats = fn_phases[phase]
+        except KeyError:
+            stats = fn_phases[phase] = Stats()
+        stats.add(time, self_time, memory)
+
+    def as_dict(self):
+        """Returns the recorded statistics as nested dicts."""
+        return {
+            "phases": dict((phase, stats.as_dict())
+                           for phase, stats in self.phases.iteritems()),
+            "functions": dict(
+                (str(fn), dict((phase, stats.as_dict())
+                               for phase, stats in fn_phases.iteritems()))
+                for fn, fn_phases in self.functions.iteritems())
+        }
+
+    def to_json(self, **kwargs):
+        """Returns the recorded statistics as a JSON string. Keyword arguments
+        are passed to :func:`json.dumps`."""
+        return _json.dumps(self.as_dict(), **kwargs)
+
+    def save(self, filename, **kwargs):
+        """Writes the recorded statistics to the provided file as JSON."""
+        f = open(filename, 'w')
+        try:
+            f.write(self.to_json(**kwargs))
+        finally:
+            f.close()
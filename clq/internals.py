@@ -1,8 +1,12 @@
 import ast as _ast # http://docs.python.org/library/ast.html
+import functools as _functools
 
 import cypy
 import cypy.astx as astx
 
+import clq.instrument as instrument
+import clq.passes as passes
+
 from clq import (InvalidOperationError, TypeResolutionError, Context)
 
 class GenericFnVisitor(_ast.NodeVisitor):
@@ -277,7 +281,7 @@ class GenericFnVisitor(_ast.NodeVisitor):
     visit_BitXor = _visit_op
     visit_BitAnd = _visit_op
     visit_FloorDiv = _visit_op
-    visit_BitAnd = _visit_op
+    visit_Mod = _visit_op
     visit_Invert = _visit_op
     visit_Not = _visit_op
     visit_UAdd = _visit_op
@@ -473,18 +477,18 @@ class GenericFnVisitor(_ast.NodeVisitor):
                     unresolved_type
                 
         elif ctx_t is _ast.Store:
-            try:
-                current_type = self.all_variables[id]
-            except KeyError:
+            if id not in self.all_variables:
                 # new local variable
                 self.all_variables[id] = self.local_variables[id] = \
                     self.cur_assignment_type                     
                 
             else:
                 if id in self.local_variables:
-                    # multiple assignment of a local variable
+                    # multiple assignment of a local variable, chained onto
+                    # the previous ones
                     self.local_variables[id] = MultipleAssignmentURT(
-                        current_type, self.cur_assignment_type, name)
+                        self.local_variables[id], self.cur_assignment_type, 
+                        name)
                 elif id in self.free_variables:
                     raise InvalidOperationError(
                         "Free variables cannot be assigned to.", node)
@@ -513,6 +517,23 @@ class GenericFnVisitor(_ast.NodeVisitor):
 ##############################################################################
 ## Unresolved Types
 ##############################################################################
+def resolves_in_context(resolve):
+    """Caches the result of the provided resolve method in the 
+    :attr:`resolution table <clq.Context.resolved_types>` of the context.
+    
+    Unlike :func:`cypy.memoize`, the cache goes away with the context, rather 
+    than growing with every concrete function ever compiled."""
+    def decorated(self, context):
+        resolved_types = context.resolved_types
+        try:
+            return resolved_types[self]
+        except KeyError:
+            with instrument.phase("resolve", context.concrete_fn):
+                resolved_type = resolved_types[self] = resolve(self, context)
+            return resolved_type
+    _functools.update_wrapper(decorated, resolve)
+    return decorated
+
 class UnresolvedType(object):
     """Abstract base class for unresolved types."""
     def __init__(self, node):
@@ -526,7 +547,7 @@ class VoidURT(UnresolvedType):
     def __repr__(self):
         return "Void()"
     
-    @cypy.memoize
+    @resolves_in_context
     def resolve(self, context):
         return context.backend.void_type(context, self.node)
 
@@ -538,7 +559,7 @@ class NumURT(UnresolvedType):
     def __repr__(self):
         return "Num(%s)" % str(self.node.n)
     
-    @cypy.memoize
+    @resolves_in_context
     def resolve(self, context):
         return context.backend.resolve_Num(context, self.node)
     
@@ -550,7 +571,7 @@ class StrURT(UnresolvedType):
     def __repr__(self):
         return "Str('''%s''')" % self.node.s
     
-    @cypy.memoize
+    @resolves_in_context
     def resolve(self, context):
         return context.backend.resolve_Str(context, self.node)
     
@@ -565,7 +586,7 @@ class AttributeURT(UnresolvedType):
         return "Attribute(%s, %s)" % (repr(node.value.unresolved_type),
                                       node.attr)
     
-    @cypy.memoize
+    @resolves_in_context
     def resolve(self, context):
         node = self.node
         value_type = node.value.unresolved_type.resolve(context)            
@@ -583,7 +604,7 @@ class SubscriptURT(UnresolvedType):
         return "Subscript(%s, %s)" % (repr(node.value.unresolved_type),
                                       repr(node.slice.unresolved_type))
         
-    @cypy.memoize
+    @resolves_in_context
     def resolve(self, context):
         node = self.node
         value_type = node.value.unresolved_type.resolve(context)
@@ -601,7 +622,7 @@ class UnaryOpURT(UnresolvedType):
         return "UnaryOp(%s, %s)" % (type(node.op).__name__,
                                       repr(node.operand.unresolved_type))
         
-    @cypy.memoize
+    @resolves_in_context
     def resolve(self, context):
         node = self.node
         operand_type = node.operand.unresolved_type.resolve(context)
@@ -621,7 +642,7 @@ class BinOpURT(UnresolvedType):
                                         type(node.op).__name__,
                                         repr(node.right.unresolved_type))
         
-    @cypy.memoize
+    @resolves_in_context
     def resolve(self, context):
         node = self.node
         left_type = node.left.unresolved_type.resolve(context)
@@ -641,7 +662,7 @@ class CompareURT(UnresolvedType):
                                         type(node.op).__name__,
                                         repr(node.comparators[0].unresolved_type))
             
-    @cypy.memoize
+    @resolves_in_context
     def resolve(self, context):
         node = self.node
         left_type = node.left.unresolved_type.resolve(context)
@@ -661,7 +682,7 @@ class BoolOpURT(UnresolvedType):
                                    ", ".join(repr(value.unresolved_type)
                                              for value in node.values))
             
-    @cypy.memoize
+    @resolves_in_context
     def resolve(self, context):
         node = self.node
         left_type = node.values[0].unresolved_type.resolve(context)
@@ -675,7 +696,7 @@ class NameURT(UnresolvedType):
     def __repr__(self):
         return "Name('%s')" % self.node.id
     
-    @cypy.memoize
+    @resolves_in_context
     def resolve(self, context):
         node = self.node
         id = node.id
@@ -685,41 +706,15 @@ class NameURT(UnresolvedType):
             return context.concrete_fn.arg_map[id]
         except KeyError:
             # no? then it must be a local variable
+            if id not in context.generic_fn.local_variables:
+                raise TypeResolutionError(
+                    "Definition for name could not be found: %s." % id, node)
             
-            try:
-                return context._multiple_assignment_prev[id]
-            except KeyError:
-                # we have to assign it a type
-                try:
-                    var = context.generic_fn.local_variables[id]
-                except KeyError:
-                    raise TypeResolutionError(
-                        "Definition for name could not be found: %s." % id, node)
-                
-                #
-                # Have to keep a stack for multiple assignments to be handled
-                # correctly when they are recursive, e.g.
-                #
-                #    i = 0
-                #    i = i + 1.0
-                #
-                # Here, i has unresolved type:
-                #    
-                #    i: 0 <=> `i + 1.0
-                #
-                # If we didn't keep track of what name we're currently 
-                # working on, multiple assignment resolution would loop 
-                # forever when it saw the nested `i term.
-                #
-                 
-                prev_resolving_name = context._resolving_name
-                context._resolving_name = id
-
-                resolved_type = var.resolve(context)
-                
-                context._resolving_name = prev_resolving_name
-            
-                return resolved_type
+            solver = context.local_variable_solver
+            if solver is None:
+                solver = context.local_variable_solver = \
+                    LocalVariableSolver(context)
+            return solver.resolve(id, node)
         
 class MultipleAssignmentURT(UnresolvedType):
     """The unresolved type of variables that have been assigned to multiple 
@@ -739,21 +734,42 @@ class MultipleAssignmentURT(UnresolvedType):
         return "MultipleAssignment(%s, %s)" % (repr(self.prev.unresolved_type),
                                                repr(self.new.unresolved_type))
         
-    @cypy.memoize
+    @resolves_in_context
     def resolve(self, context):
-        prev, new, node = self.prev, self.new, self.node
-        prev_type = prev.resolve(context)
-        
-        _resolving_name = context._resolving_name
-        if _resolving_name:
-            context._multiple_assignment_prev[_resolving_name] = prev_type
-            
-        resolved_type = prev_type.resolve_MultipleAssignment(context, prev, new, node)
-        
-        if _resolving_name:
-            del context._multiple_assignment_prev[_resolving_name]
-            
+        # resolved iteratively rather than recursively, since chains can be
+        # as long as the number of assignments or return statements
+        resolved_types = context.resolved_types
+        chain = [ ]
+        prev = self.prev
+        while isinstance(prev, MultipleAssignmentURT) and \
+              prev not in resolved_types:
+            chain.append(prev)
+            prev = prev.prev
+        chain.reverse()
+        chain.append(self)
+        
+        resolved_type = prev.resolve(context)
+        for multiple_assignment in chain:
+            resolved_type = resolved_type.resolve_MultipleAssignment(context,
+                multiple_assignment.prev, multiple_assignment.new, 
+                multiple_assignment.node)
+            if multiple_assignment is not self:
+                resolved_types[multiple_assignment] = resolved_type
         return resolved_type
+    
+    def chain(self):
+        """Returns a list of the unresolved types of each of the assignments 
+        in this chain of multiple assignments, in order, paired with the 
+        multiple assignment joining each one to the ones before it (or None 
+        for the first)."""
+        chain = [ ]
+        unresolved_type = self
+        while isinstance(unresolved_type, MultipleAssignmentURT):
+            chain.append((unresolved_type.new, unresolved_type))
+            unresolved_type = unresolved_type.prev
+        chain.append((unresolved_type, None))
+        chain.reverse()
+        return chain
         
 class CallURT(UnresolvedType):
     """The unresolved type of call expressions."""
@@ -769,12 +785,187 @@ class CallURT(UnresolvedType):
                                  ", ".join(repr(arg.unresolved_type)
                                            for arg in node.args))
         
-    @cypy.memoize
+    @resolves_in_context
     def resolve(self, context):
         node = self.node
         func_type = node.func.unresolved_type.resolve(context)
         return func_type.resolve_Call(context, node)
 
+##############################################################################
+## Local Variable Type Inference
+##############################################################################
+class ResolvedURT(UnresolvedType):
+    """An unresolved type that is already known to resolve to a given type."""
+    def __init__(self, node, resolved_type):
+        UnresolvedType.__init__(self, node)
+        self.resolved_type = resolved_type
+        
+    def __str__(self):
+        return "<%s>" % self.resolved_type.name
+    
+    def __repr__(self):
+        return "Resolved(%s)" % self.resolved_type.name
+    
+    def resolve(self, context):
+        return self.resolved_type
+
+class LocalVariableSolver(object):
+    """Infers the types of the local variables of a concrete function.
+    
+    The type of a local variable is the join, as defined by 
+    ``resolve_MultipleAssignment``, of the types of all the values assigned 
+    to it. Since those values may refer to local variables (including the one 
+    being assigned to, e.g. ``i = i + 1``), this is solved as a fixpoint:
+    
+    1. The local variables each value refers to are collected once, giving 
+       the variables which must be revisited when a variable's type changes.
+    2. Every local variable is put on a worklist. While it is not empty, a 
+       variable is taken off it and its assignments are resolved using the 
+       current estimates of the types of the variables they refer to. If the 
+       estimate changes, the variables depending on it are put back on it.
+       
+    The first time a variable is resolved, its own estimate is not yet known, 
+    so references to it in its later assignments use the join of its earlier 
+    assignments. Types only ever become more general and there are finitely 
+    many of them, so this finishes after a number of steps proportional to 
+    the number of assignments.
+    """
+    def __init__(self, context):
+        self.context = context
+        self.local_variables = context.generic_fn.local_variables
+        
+        self.types = { }
+        """local variable name => current estimate of its type"""
+        
+        self._partial = { }
+        # local variable name => join of the assignments resolved so far, 
+        # while it is being resolved
+        
+        self.chains = { }
+        """local variable name => (unresolved type, multiple assignment) 
+        pairs for each of its assignments, see MultipleAssignmentURT.chain"""
+        
+        self.dependents = { }
+        """local variable name => set of names of local variables whose 
+        assigned values refer to it"""
+        
+        self._collect()
+        self.solved = False
+        self._solving = False
+        
+    def _collect(self):
+        local_variables = self.local_variables
+        dependents = self.dependents
+        for name in local_variables:
+            dependents[name] = set()
+            
+        for name, unresolved_type in local_variables.iteritems():
+            if isinstance(unresolved_type, MultipleAssignmentURT):
+                chain = unresolved_type.chain()
+            else:
+                chain = [(unresolved_type, None)]
+            self.chains[name] = chain
+            
+            for value_type, _ in chain:
+                node = value_type.node
+                if node is None: continue
+                for child in _ast.walk(node):
+                    if isinstance(child, _ast.Name) and \
+                       isinstance(child.ctx, _ast.Load) and \
+                       child.id in local_variables:
+                        dependents[child.id].add(name)
+                        
+    def resolve(self, name, node):
+        """Returns the type of the named local variable."""
+        types = self.types
+        if self.solved:
+            return types[name]
+        
+        if self._solving:
+            # called while resolving an assignment
+            try:
+                return types[name]
+            except KeyError:
+                pass
+            
+            partial = self._partial
+            if name in partial:
+                resolved_type = partial[name]
+                if resolved_type is None:
+                    raise TypeResolutionError(
+                        "Local variable '%s' is used before it is assigned." % 
+                        name, node)
+                return resolved_type
+            
+            resolved_type = types[name] = self._resolve_assignments(name)
+            return resolved_type
+        
+        self.solve()
+        return types[name]
+    
+    def solve(self):
+        """Infers the types of all the local variables."""
+        types = self.types
+        dependents = self.dependents
+        self._solving = True
+        try:
+            worklist = sorted(self.local_variables)
+            worklist.reverse()
+            on_worklist = set(worklist)
+            while worklist:
+                name = worklist.pop()
+                on_worklist.discard(name)
+                
+                resolved_type = self._resolve_assignments(name)
+                try:
+                    prev_type = types[name]
+                except KeyError:
+                    pass
+                else:
+                    if resolved_type == prev_type:
+                        continue
+                    resolved_type = self._join(prev_type, resolved_type, 
+                                               self.chains[name][-1][0])
+                    if resolved_type == prev_type:
+                        continue
+                        
+                types[name] = resolved_type
+                for dependent in dependents[name]:
+                    if dependent not in on_worklist:
+                        on_worklist.add(dependent)
+                        worklist.append(dependent)
+        finally:
+            self._solving = False
+        self.solved = True
+        
+    def _join(self, prev_type, new_type, value_type):
+        node = value_type.node
+        return prev_type.resolve_MultipleAssignment(self.context,
+            ResolvedURT(node, prev_type), ResolvedURT(node, new_type), node)
+        
+    def _resolve_assignments(self, name):
+        context = self.context
+        partial = self._partial
+        chain = self.chains[name]
+        
+        # the estimates of other variables may change, so nothing resolved 
+        # here can be kept
+        resolved_types = context.resolved_types
+        context.resolved_types = { }
+        partial[name] = None
+        try:
+            value_type, _ = chain[0]
+            resolved_type = value_type.resolve(context)
+            for value_type, multiple_assignment in chain[1:]:
+                partial[name] = resolved_type
+                resolved_type = resolved_type.resolve_MultipleAssignment(
+                    context, multiple_assignment.prev, value_type, 
+                    multiple_assignment.node)
+        finally:
+            del partial[name]
+            context.resolved_types = resolved_types
+        return resolved_type
+        
 ##############################################################################
 ## Concrete Function Visitor
 ##############################################################################
@@ -796,18 +987,28 @@ class ConcreteFnVisitor(_ast.NodeVisitor):
         # resolve return type
         context.return_type = node.return_type.resolve(context)
         
-        # visit arguments
-        args = self.visit(node.args)
+        # optimize body
+        with instrument.phase("optimize", self.concrete_fn):
+            body = passes.run(context, node.body)
         
-        # visit body
-        for stmt in node.body:
-            self.visit(stmt)
+        with instrument.phase("generate", self.concrete_fn):
+            # visit arguments
+            args = self.visit(node.args)
+            
+            # visit body
+            for stmt in body:
+                self.visit(stmt)
             
         # generate program item
-        program_item = context.backend.generate_program_item(context)
+        with instrument.phase("assemble", self.concrete_fn):
+            program_item = context.backend.generate_program_item(context)
+        program_item.dependencies = tuple(context.program_items)
+        # shared with any restored copy of it
+        program_item = program_item.intern()
         context.program_item = program_item
         context.program_items.append(program_item)
         context.backend.add_program_items(context.program_items)
+        context.release_resolution_table()
         
         # return final AST
         return astx.copy_node(node,
@@ -921,7 +1122,7 @@ class ConcreteFnVisitor(_ast.NodeVisitor):
     visit_BitXor = _visit_op
     visit_BitAnd = _visit_op
     visit_FloorDiv = _visit_op
-    visit_BitAnd = _visit_op
+    visit_Mod = _visit_op
     visit_Invert = _visit_op
     visit_Not = _visit_op
     visit_UAdd = _visit_op
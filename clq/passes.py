@@ -0,0 +1,1480 @@
+"""Optimization passes over the syntax trees of concrete functions.
+
+Passes run once the types in a concrete function can be resolved, before code
+is generated for its body. Each is applied to the annotated statements of the
+function (see :attr:`GenericFn.annotated_ast <clq.GenericFn.annotated_ast>`)
+and returns the statements that code is generated for instead.
+
+The annotated syntax tree is shared by all of the concrete functions of a
+generic function, so passes never modify it. Nodes which change are copied
+and new expressions are given an :class:`internals.ResolvedURT
+<clq.internals.ResolvedURT>` holding their type.
+"""
+import ast as _ast
+import collections as _collections
+
+import time as _time
+
+import cypy.astx as astx
+
+import clq
+
+def run(context, body):
+    """Runs the passes of the :obj:`manager` over the provided statements of 
+    the concrete function being compiled in the provided context, returning 
+    the new statements."""
+    return manager.run(context, body)
+
+class Pass(object):
+    """Base class for passes.
+
+    Like an :class:`ast.NodeVisitor`, a pass dispatches each node to its
+    ``visit_<NodeType>`` method, if it has one, or to :meth:`generic_visit`.
+    These return the node to use in place of the one provided, which must
+    not be modified. Visitors for statements may also return a list of
+    statements, which may be empty, to replace it with.
+    """
+    def __init__(self, context):
+        self.context = context
+
+    name = None
+    """The name of the pass."""
+
+    context = None
+    """The :class:`context <clq.Context>` of the concrete function."""
+
+    def run(self, body):
+        """Returns the transformed statements."""
+        return self.visit_body(body)
+
+    def type_of(self, node):
+        """Returns the resolved type of an expression."""
+        return node.unresolved_type.resolve(self.context)
+
+    def visit(self, node):
+        method = getattr(self, 'visit_' + node.__class__.__name__, None)
+        if method is None:
+            return self.generic_visit(node)
+        return method(node)
+
+    def visit_body(self, stmts):
+        """Visits a list of statements, returning the new list."""
+        new_stmts = [ ]
+        for stmt in stmts:
+            new = self.visit(stmt)
+            if isinstance(new, list):
+                new_stmts.extend(new)
+            else:
+                new_stmts.append(new)
+        return new_stmts
+
+    def generic_visit(self, node):
+        """Visits the children of a node, returning a copy of it with the
+        new children if any changed or the node itself otherwise."""
+        changes = { }
+        for field in _fields.get(type(node), node._fields):
+            value = getattr(node, field, None)
+            if isinstance(value, _ast.AST):
+                new_value = self.visit(value)
+                if new_value is not value:
+                    changes[field] = new_value
+            elif isinstance(value, list):
+                if value and isinstance(value[0], _ast.stmt):
+                    new_value = self.visit_body(value)
+                else:
+                    new_value = [self.visit(item) for item in value]
+                if len(new_value) != len(value) or any(
+                        new is not old for new, old in zip(new_value, value)):
+                    changes[field] = new_value
+        if changes:
+            return astx.copy_node(node, **changes)
+        return node
+
+    def constant(self, node):
+        """Returns the value of an expression if it is a constant, or None."""
+        if isinstance(node, _ast.Num):
+            coerce = getattr(self.type_of(node), 'coerce', None)
+            if coerce is None:
+                return None
+            value = coerce(node.n)
+            if value is None or value != node.n:
+                return None
+            return value
+        elif isinstance(node, _ast.UnaryOp):
+            # e.g. a negative literal
+            operand = self.constant(node.operand)
+            if operand is None:
+                return None
+            fold = getattr(self.type_of(node), 'fold_UnaryOp', None)
+            if fold is None:
+                return None
+            return fold(type(node.op), operand)
+        return None
+
+    def make_constant(self, node, clq_type, value):
+        """Returns a literal of the provided type and value to replace the
+        provided expression, if any, with."""
+        new = _ast.Num(n=value)
+        if node is not None:
+            _ast.copy_location(new, node)
+        new.unresolved_type = clq.internals.ResolvedURT(new, clq_type)
+        return new
+    
+    def make_name(self, id, clq_type, node=None, ctx=None):
+        """Returns a reference to the variable with the provided name and 
+        type, which loads it unless another context is provided."""
+        new = _ast.Name(id=id, ctx=_ast.Load() if ctx is None else ctx)
+        if node is not None:
+            _ast.copy_location(new, node)
+        new.unresolved_type = clq.internals.ResolvedURT(new, clq_type)
+        return new
+    
+    def make_assign(self, id, clq_type, value):
+        """Returns a statement assigning the provided expression to the 
+        variable with the provided name and type."""
+        target = self.make_name(id, clq_type, value, _ast.Store())
+        return _ast.copy_location(_ast.Assign(targets=[target], value=value), 
+                                  value)
+
+# The fields of annotated nodes to visit, where they differ from _fields. The
+# iter of a for loop is replaced by the init, guard and update_stmt fields.
+_fields = {
+    _ast.For: ('target', 'init', 'guard', 'update_stmt', 'body'),
+}
+
+def walk(node):
+    """Yields the provided annotated node and all of its descendants."""
+    nodes = [node]
+    while nodes:
+        node = nodes.pop()
+        yield node
+        for field in _fields.get(type(node), node._fields):
+            value = getattr(node, field, None)
+            if isinstance(value, _ast.AST):
+                nodes.append(value)
+            elif isinstance(value, list):
+                nodes.extend(item for item in value 
+                             if isinstance(item, _ast.AST))
+
+class SubstituteNames(Pass):
+    """Replaces each reference to the variables named in a dict with the 
+    corresponding expression, which must have been annotated with its type.
+    
+    The variables must not be assigned to."""
+    def __init__(self, context, replacements):
+        Pass.__init__(self, context)
+        self.replacements = replacements
+        
+    replacements = None
+    """A dict mapping variable names to the expressions replacing them."""
+    
+    def run(self, body):
+        if not self.replacements:
+            return body
+        return Pass.run(self, body)
+    
+    def visit_Name(self, node):
+        try:
+            replacement = self.replacements[node.id]
+        except KeyError:
+            return node
+        if not isinstance(node.ctx, _ast.Load):
+            raise clq.TypeResolutionError(
+                "Cannot assign to '%s' here." % node.id, node)
+        return replacement
+
+class SubstituteConstants(SubstituteNames):
+    """Replaces each reference to an argument bound to a :func:`constant 
+    <clq.const>` with a literal."""
+    name = "substitute_constants"
+    
+    def __init__(self, context):
+        SubstituteNames.__init__(self, context, dict(
+            (name, self.make_constant(None, clq_type, value))
+            for name, (clq_type, value) 
+            in context.concrete_fn.constants.iteritems()))
+        
+    def visit_Name(self, node):
+        if node.id in self.replacements and \
+           not isinstance(node.ctx, _ast.Load):
+            raise clq.TypeResolutionError(
+                "Cannot assign to argument '%s', which is bound to a "
+                "constant." % node.id, node)
+        return SubstituteNames.visit_Name(self, node)
+
+class FoldConstants(Pass):
+    """Folds operations on constants into literals and removes the branches
+    of ``if`` statements, ``if`` expressions and ``while`` loops which are
+    never taken.
+
+    Constants are numeric literals, and the results of folding them, which
+    are exactly representable in their type. Operations are evaluated as the
+    ``fold_*`` methods of their types define, e.g. integers wrap around and
+    division truncates towards zero, and are left alone when their result
+    can not be determined at compile time.
+    """
+    name = "fold_constants"
+
+    def is_literal(self, node):
+        """Returns whether an expression is a literal in the source."""
+        return isinstance(node, _ast.Num) and not isinstance(
+            node.unresolved_type, clq.internals.ResolvedURT)
+
+    def fold(self, node, value):
+        if value is None:
+            return node
+        return self.make_constant(node, self.type_of(node), value)
+
+    def visit_UnaryOp(self, node):
+        node = self.generic_visit(node)
+        if self.is_literal(node.operand):
+            # e.g. -1, which is already as simple as it gets
+            return node
+        return self.fold(node, self.constant(node))
+
+    def visit_BinOp(self, node):
+        node = self.generic_visit(node)
+        left = self.constant(node.left)
+        right = self.constant(node.right)
+        if left is None or right is None:
+            return node
+        fold = getattr(self.type_of(node), 'fold_BinOp', None)
+        if fold is None:
+            return node
+        return self.fold(node, fold(type(node.op), left, right))
+
+    def visit_Compare(self, node):
+        node = self.generic_visit(node)
+        left = self.constant(node.left)
+        right = self.constant(node.comparators[0])
+        if left is None or right is None:
+            return node
+        common_type = getattr(self.type_of(node.left), 'common_type', None)
+        if common_type is None:
+            return node
+        common_type = common_type(self.type_of(node.comparators[0]),
+                                  self.context.backend)
+        if common_type is None:
+            return node
+        return self.fold(node, common_type.fold_Compare(type(node.ops[0]),
+                                                        left, right))
+
+    def visit_BoolOp(self, node):
+        node = self.generic_visit(node)
+        values = node.values
+        short_circuit = isinstance(node.op, _ast.Or)
+        first = self.constant(values[0])
+        if first is None:
+            return node
+        if bool(first) == short_circuit:
+            return self.fold(node, short_circuit)
+        if len(values) == 2:
+            # the result is the second value
+            second = self.constant(values[1])
+            if second is None:
+                return values[1]
+            return self.fold(node, bool(second))
+        return node
+
+    def visit_IfExp(self, node):
+        node = self.generic_visit(node)
+        test = self.constant(node.test)
+        if test is None:
+            return node
+        taken = node.body if test else node.orelse
+        clq_type = self.type_of(node)
+        if self.type_of(taken) is clq_type:
+            return taken
+        value = self.constant(taken)
+        if value is None:
+            # the conversion to the type of the whole expression is implicit
+            return node
+        return self.fold(node, clq_type.coerce(value))
+
+    def visit_If(self, node):
+        node = self.generic_visit(node)
+        test = self.constant(node.test)
+        if test is None:
+            return node
+        if test:
+            return node.body
+        return node.orelse
+
+    def visit_While(self, node):
+        node = self.generic_visit(node)
+        test = self.constant(node.test)
+        if test is not None and not test:
+            return [ ]
+        return node
+
+unroll_threshold = 32
+"""The greatest number of iterations of a loop which :class:`UnrollLoops` 
+unrolls completely."""
+
+class UnrollLoops(Pass):
+    """Unrolls ``for`` loops with constant bounds in functions with the 
+    ``unroll`` option (see :func:`clq.fn`).
+    
+    Loops with no more than :obj:`unroll_threshold` iterations are replaced by 
+    a copy of their body for each iteration, in which the loop variable is 
+    replaced by its value in that iteration. If ``unroll`` is an integer 
+    greater than one, longer loops are unrolled that many times: each 
+    iteration runs that many copies of the body, with the loop variable 
+    offset in each, and the remaining iterations are unrolled completely 
+    after the loop.
+    
+    Loops which contain ``break`` or ``continue`` statements or assign to 
+    their variable are left alone. The unrolled statements are folded again 
+    (see :class:`FoldConstants`), since the values of the loop variable can 
+    often be folded into them.
+    """
+    name = "unroll_loops"
+    
+    def run(self, body):
+        unroll = self.context.generic_fn.unroll
+        if not unroll:
+            return body
+        self.factor = 1 if unroll is True else int(unroll)
+        self.uses = _count_names(body)
+        return Pass.run(self, body)
+    
+    def visit_For(self, node):
+        name = node.target.id
+        # whether the value of the variable after the loop is needed
+        used_after = self.uses[name] > _count_names([node])[name]
+        
+        node = self.generic_visit(node)
+        bounds = self.bounds(node)
+        if bounds is None or not self.can_unroll(node.body, name):
+            return node
+        start, stop, step = bounds
+        n_iterations = max(0, (stop - start + step - 1) // step)
+        var_type = self.type_of(node.init.targets[0])
+        values = [start + i * step for i in xrange(n_iterations + 1)]
+        if any(var_type.coerce(value) != value for value in values):
+            return node
+        
+        if n_iterations <= unroll_threshold:
+            stmts = self.unroll(node, var_type, values[:-1])
+        elif self.factor > 1:
+            stmts = self.unroll_partially(node, var_type, values)
+            if stmts is None:
+                return node
+        else:
+            return node
+        
+        if used_after and stmts[-1:] != [node]:
+            stmts.append(astx.copy_node(node.init, value=self.make_constant(
+                node.init.value, var_type, values[-1])))
+        return FoldConstants(self.context).visit_body(stmts)
+    
+    def bounds(self, node):
+        """Returns the start, stop and step of a loop if they are integer
+        constants and the step is positive, or None."""
+        guard = node.guard
+        if not isinstance(guard.ops[0], _ast.Lt) or \
+           not isinstance(guard.left, _ast.Name) or \
+           guard.left.id != node.target.id:
+            return None
+        bounds = (self.constant(node.init.value), 
+                  self.constant(guard.comparators[0]),
+                  self.constant(node.update_stmt.value))
+        for bound in bounds:
+            if not isinstance(bound, (int, long)) or isinstance(bound, bool):
+                return None
+        if bounds[2] <= 0:
+            return None
+        return bounds
+    
+    def can_unroll(self, body, name):
+        """Returns whether a loop with the provided body and variable can be 
+        unrolled."""
+        nodes = list(body)
+        while nodes:
+            node = nodes.pop()
+            if isinstance(node, (_ast.Break, _ast.Continue, _ast.Exec)):
+                return False
+            if isinstance(node, _ast.Name) and node.id == name and \
+               not isinstance(node.ctx, _ast.Load):
+                return False
+            if isinstance(node, (_ast.For, _ast.While)):
+                # their break and continue statements are their own
+                nodes.extend(child for child in walk(node) 
+                             if isinstance(child, _ast.Name))
+                continue
+            for field in _fields.get(type(node), node._fields):
+                value = getattr(node, field, None)
+                if isinstance(value, _ast.AST):
+                    nodes.append(value)
+                elif isinstance(value, list):
+                    nodes.extend(value)
+        return True
+    
+    def unroll(self, node, var_type, values):
+        """Returns a copy of the body of a loop for each of the provided 
+        values of its variable."""
+        stmts = [ ]
+        name = node.target.id
+        for value in values:
+            replacements = {name: self.make_constant(node.target, var_type, 
+                                                     value)}
+            stmts.extend(SubstituteNames(self.context, replacements).run(
+                node.body))
+        return stmts
+    
+    def unroll_partially(self, node, var_type, values):
+        """Returns statements running the loop :attr:`factor` iterations at a 
+        time followed by the remaining iterations, or None if it can't be 
+        done."""
+        factor = self.factor
+        step = values[1] - values[0]
+        n_iterations = len(values) - 1
+        n_unrolled = n_iterations // factor * factor
+        
+        guard = node.guard
+        stop = guard.comparators[0]
+        stop_type = self.type_of(stop)
+        update_value = node.update_stmt.value
+        update_type = self.type_of(update_value)
+        new_stop = values[n_unrolled]
+        new_step = step * factor
+        if stop_type.coerce(new_stop) != new_stop or \
+           update_type.coerce(new_step) != new_step:
+            return None
+        
+        name = node.target.id
+        body = list(node.body)
+        for i in xrange(1, factor):
+            var = self.make_name(name, var_type, node.target)
+            offset = self.make_constant(node.target, var_type, i * step)
+            replacement = _ast.copy_location(
+                _ast.BinOp(left=var, op=_ast.Add(), right=offset), 
+                node.target)
+            replacement.unresolved_type = clq.internals.ResolvedURT(
+                replacement, var_type)
+            body.extend(SubstituteNames(self.context, {name: replacement}).run(
+                node.body))
+        
+        loop = astx.copy_node(node,
+            guard=astx.copy_node(guard, comparators=[
+                self.make_constant(stop, stop_type, new_stop)]),
+            update_stmt=astx.copy_node(node.update_stmt, value=
+                self.make_constant(update_value, update_type, new_step)),
+            body=body
+        )
+        return [loop] + self.unroll(node, var_type, values[n_unrolled:-1])
+
+def _count_names(stmts):
+    # maps each variable name to the number of times it appears
+    counts = _collections.defaultdict(int)
+    for stmt in stmts:
+        for node in walk(stmt):
+            if isinstance(node, _ast.Name):
+                counts[node.id] += 1
+    return counts
+
+inline_threshold = 32
+"""The greatest size, in statements and expressions, of a function which 
+:class:`InlineCalls` inlines when its ``inline`` option is not set."""
+
+class InlineCalls(Pass):
+    """Replaces calls to generic and concrete functions with the statements of 
+    their bodies, so no program item or call is generated for them.
+    
+    A function is inlined if its ``inline`` option (see :func:`clq.fn`) is 
+    True or, if it is not set, if its body is no larger than 
+    :obj:`inline_threshold` after its own passes have run. It is never inlined 
+    if its option is False.
+    
+    Only functions whose only ``return`` statement is the last statement of 
+    their body, and which contain no inline code, can be inlined. The 
+    statements before it are inserted before the statement containing the 
+    call and the call is replaced by the returned expression, so functions 
+    with more than one statement are only inlined where that is evaluated 
+    exactly once: not in the conditions of loops, nor in the branches of 
+    ``and``, ``or`` and ``if`` expressions.
+    
+    The local variables of the inlined function are renamed where they would
+    clash with the names in the caller and declared as :meth:`added variables 
+    <clq.Context.add_variable>`. 
+    References to an argument are replaced by the expression passed for it 
+    if it is a variable or a literal, or by a new variable assigned to it 
+    otherwise.
+    """
+    name = "inline_calls"
+    
+    def run(self, body):
+        self.callees = { }
+        self.prelude = None
+        return Pass.run(self, body)
+    
+    prelude = None
+    """The statements to insert before the statement being visited, or None 
+    if statements can't be inserted where it is."""
+    
+    def visit_body(self, stmts):
+        outer_prelude = self.prelude
+        new_stmts = [ ]
+        for stmt in stmts:
+            prelude = self.prelude = [ ]
+            new = self.visit(stmt)
+            new_stmts.extend(prelude)
+            if isinstance(new, list):
+                new_stmts.extend(new)
+            else:
+                new_stmts.append(new)
+        self.prelude = outer_prelude
+        return new_stmts
+    
+    def visit_For(self, node):
+        self.prelude = None
+        return self.generic_visit(node)
+    visit_While = visit_For
+    
+    def visit_BoolOp(self, node):
+        values = [self.visit(node.values[0])]
+        prelude = self.prelude
+        self.prelude = None
+        values.extend(self.visit(value) for value in node.values[1:])
+        self.prelude = prelude
+        if any(new is not old for new, old in zip(values, node.values)):
+            return astx.copy_node(node, values=values)
+        return node
+    
+    def visit_IfExp(self, node):
+        test = self.visit(node.test)
+        prelude = self.prelude
+        self.prelude = None
+        body = self.visit(node.body)
+        orelse = self.visit(node.orelse)
+        self.prelude = prelude
+        if test is not node.test or body is not node.body or \
+           orelse is not node.orelse:
+            return astx.copy_node(node, test=test, body=body, orelse=orelse)
+        return node
+    
+    def visit_Expr(self, node):
+        value = node.value
+        if isinstance(value, _ast.Call):
+            call = self.generic_visit(value)
+            stmts = self.inline(call)
+            if stmts is not None:
+                value = stmts.pop()
+                if value is not None and not isinstance(
+                        value, (_ast.Name, _ast.Num)):
+                    stmts.append(astx.copy_node(node, value=value))
+                return stmts
+            if call is not value:
+                return astx.copy_node(node, value=call)
+            return node
+        return self.generic_visit(node)
+    
+    def visit_Call(self, node):
+        node = self.generic_visit(node)
+        stmts = self.inline(node)
+        if stmts is None or stmts[-1] is None:
+            return node
+        value = stmts.pop()
+        if stmts:
+            self.prelude.extend(stmts)
+        return value
+    
+    def inline(self, node):
+        """Returns the statements to insert in place of the provided call 
+        followed by the expression to replace its value with, which is None 
+        for functions returning nothing, or None if it is not inlined."""
+        func_type = self.type_of(node.func)
+        if isinstance(func_type, clq.GenericFnType):
+            arg_types = tuple(self.type_of(arg) for arg in node.args)
+            concrete_fn = func_type.generic_fn.compile(self.context.backend,
+                                                       *arg_types)
+        elif isinstance(func_type, clq.ConcreteFnType):
+            concrete_fn = func_type.concrete_fn
+        else:
+            return None
+        
+        callee = self.callee(concrete_fn)
+        if callee is None:
+            return None
+        body, value, callee_context = callee
+        if body and self.prelude is None:
+            return None
+        
+        # arguments
+        replacements = { }
+        renames = { }
+        stmts = [ ]
+        stored = _stored_names(body)
+        if not body and value is not None and not any(
+                isinstance(child, (_ast.BoolOp, _ast.IfExp)) 
+                for child in walk(value)):
+            # arguments used once can be evaluated where they are used
+            uses = _count_names([value])
+        else:
+            uses = { }
+        for arg_name, arg in zip(concrete_fn.generic_fn.arg_names, node.args):
+            if arg_name not in stored and (uses.get(arg_name) == 1 or 
+                    isinstance(arg, (_ast.Name, _ast.Num))):
+                replacements[arg_name] = arg
+                continue
+            arg_type = self.type_of(arg)
+            if self.prelude is None or isinstance(arg_type, clq.VirtualType):
+                return None
+            new_name = renames[arg_name] = self.context.add_variable(
+                arg_name, arg_type)
+            stmts.append(self.make_assign(new_name, arg_type, arg))
+        
+        # local variables, including those added by inlining into the callee
+        local_variables = concrete_fn.generic_fn.local_variables
+        added_variables = callee_context.added_variables
+        for name in _count_names(body + [value] if value else body):
+            if name in local_variables:
+                renames[name] = self.context.add_variable(name,
+                    local_variables[name].resolve(callee_context))
+            elif name in added_variables:
+                renames[name] = self.context.add_variable(name,
+                    added_variables[name])
+        
+        exporter = _Exporter(callee_context, replacements, renames)
+        stmts.extend(exporter.export(stmt) for stmt in body)
+        if value is None:
+            stmts.append(None)
+        else:
+            stmts.append(exporter.export(value))
+        return stmts
+    
+    def callee(self, concrete_fn):
+        """Returns the statements before the return statement, the returned 
+        expression and the context of the provided concrete function if it 
+        can be inlined, or None."""
+        try:
+            return self.callees[concrete_fn]
+        except KeyError:
+            pass
+        callee = self.callees[concrete_fn] = None
+        
+        generic_fn = concrete_fn.generic_fn
+        inlining = getattr(self.context, 'inlining', ())
+        if generic_fn.inline is False or concrete_fn in inlining or \
+           concrete_fn is self.context.concrete_fn:
+            return None
+        
+        callee_context = clq.Context(
+            clq.internals.ConcreteFnVisitor(concrete_fn, self.context.backend), 
+            concrete_fn, self.context.backend)
+        callee_context.inlining = inlining + (self.context.concrete_fn,)
+        annotated_ast = generic_fn.annotated_ast
+        body = run(callee_context, annotated_ast.body)
+        
+        if generic_fn.inline is None and \
+           sum(isinstance(node, (_ast.stmt, _ast.expr)) 
+               for stmt in body for node in walk(stmt)) > inline_threshold:
+            return None
+        
+        value = None
+        if body and isinstance(body[-1], _ast.Return):
+            value = body[-1].value
+            body = body[:-1]
+        for stmt in body:
+            for node in walk(stmt):
+                if isinstance(node, (_ast.Return, _ast.Exec)):
+                    return None
+        if value is not None:
+            return_type = annotated_ast.return_type.resolve(callee_context)
+            if value.unresolved_type.resolve(callee_context) != return_type:
+                return None
+        
+        callee = self.callees[concrete_fn] = (body, value, callee_context)
+        return callee
+
+class _Exporter(object):
+    # copies the statements of a function being inlined, resolving their 
+    # types in its context and renaming its variables
+    def __init__(self, context, replacements, renames):
+        self.context = context
+        self.replacements = replacements
+        self.renames = renames
+        
+    def export(self, node):
+        if isinstance(node, _ast.Name):
+            if isinstance(node.ctx, _ast.Load) and \
+               node.id in self.replacements:
+                return self.replacements[node.id]
+            new = astx.copy_node(node, id=self.renames.get(node.id, node.id))
+        else:
+            changes = { }
+            for field in _all_fields(node):
+                value = getattr(node, field, None)
+                if isinstance(value, _ast.AST):
+                    changes[field] = self.export(value)
+                elif isinstance(value, list):
+                    changes[field] = [self.export(item) 
+                                      if isinstance(item, _ast.AST) else item 
+                                      for item in value]
+            new = astx.copy_node(node, **changes)
+        
+        unresolved_type = getattr(node, 'unresolved_type', None)
+        if unresolved_type is not None and not isinstance(unresolved_type, (
+                clq.internals.NumURT, clq.internals.StrURT, 
+                clq.internals.ResolvedURT)):
+            new.unresolved_type = clq.internals.ResolvedURT(
+                new, unresolved_type.resolve(self.context))
+        return new
+
+def _all_fields(node):
+    fields = node._fields
+    extra = _fields.get(type(node))
+    if extra:
+        fields = fields + tuple(field for field in extra 
+                                if field not in fields)
+    return fields
+
+def _stored_names(stmts):
+    # the names of the variables assigned to in the provided statements, 
+    # including those with components assigned to, e.g. v in v.x = 1
+    names = set()
+    for stmt in stmts:
+        for node in walk(stmt):
+            if isinstance(node, _ast.Name):
+                if not isinstance(node.ctx, _ast.Load):
+                    names.add(node.id)
+                continue
+            for target in _targets(node):
+                while isinstance(target, _ast.Attribute):
+                    target = target.value
+                if isinstance(target, _ast.Name):
+                    names.add(target.id)
+    return names
+
+class _Expressions(Pass):
+    # base class for passes which compare expressions
+    
+    def key(self, node, child_keys, versions):
+        # a hashable key identifying the value of an expression whose 
+        # children have the provided keys, or None if it can't be identified;
+        # versions returns the number of times the variable with the provided
+        # name, or memory if None, has been assigned to, or None if memory 
+        # can't be read
+        if isinstance(node, _ast.Name):
+            return ('Name', node.id, versions(node.id))
+        elif isinstance(node, _ast.Num):
+            return ('Num', node.n, self.type_of(node))
+        if None in child_keys:
+            return None
+        if isinstance(node, _ast.BinOp):
+            return ('BinOp', type(node.op)) + child_keys
+        elif isinstance(node, _ast.UnaryOp):
+            return ('UnaryOp', type(node.op)) + child_keys
+        elif isinstance(node, _ast.Compare):
+            return ('Compare', tuple(type(op) for op in node.ops)) + child_keys
+        elif isinstance(node, _ast.Call):
+            if not self.type_of(node.func).is_pure_Call(self.context, node):
+                return None
+            return ('Call',) + child_keys
+        elif isinstance(node, _ast.Subscript):
+            version = versions(None)
+            if version is None or not isinstance(node.ctx, _ast.Load) or \
+               not isinstance(node.slice, _ast.Index):
+                return None
+            return ('Subscript', version) + child_keys
+        elif isinstance(node, _ast.Attribute):
+            # e.g. vector components
+            if not isinstance(node.ctx, _ast.Load):
+                return None
+            return ('Attribute', node.attr) + child_keys
+        return None
+    
+    def children(self, node):
+        # the subexpressions of an expression, as used by key
+        if isinstance(node, (_ast.BinOp)):
+            return (node.left, node.right)
+        elif isinstance(node, _ast.UnaryOp):
+            return (node.operand,)
+        elif isinstance(node, _ast.Compare):
+            return (node.left,) + tuple(node.comparators)
+        elif isinstance(node, _ast.Call):
+            return (node.func,) + tuple(node.args)
+        elif isinstance(node, _ast.Subscript):
+            return (node.value, getattr(node.slice, 'value', node.slice))
+        elif isinstance(node, _ast.Attribute):
+            return (node.value,)
+        return ()
+    
+    def is_worthwhile(self, node):
+        """Returns whether an expression is worth storing in a variable."""
+        if isinstance(node, (_ast.Name, _ast.Num)):
+            return False
+        if isinstance(node, _ast.UnaryOp) and \
+           isinstance(node.operand, _ast.Num):
+            # a negative literal
+            return False
+        if isinstance(node, _ast.Attribute) and \
+           isinstance(node.value, _ast.Name):
+            # e.g. a vector component
+            return False
+        return not isinstance(self.type_of(node), clq.VirtualType)
+    
+    def replace(self, stmts, replacements):
+        """Returns the provided statements with each expression which is a key
+        in the provided dict (by identity) replaced by its value."""
+        return _Replace(self.context, replacements).visit_body(stmts)
+
+class _Replace(Pass):
+    # replaces expressions by identity
+    def __init__(self, context, replacements):
+        Pass.__init__(self, context)
+        self.replacements = replacements
+    
+    def visit(self, node):
+        try:
+            return self.replacements[id(node)]
+        except KeyError:
+            return Pass.visit(self, node)
+
+class HoistLoopInvariants(_Expressions):
+    """Moves expressions which have the same value in every iteration of a 
+    ``for`` or ``while`` loop out of it, storing them in :meth:`added 
+    variables <clq.Context.add_variable>` assigned before the loop.
+    
+    Expressions are loop-invariant if they only refer to variables which are 
+    not assigned to in the loop, and only call :meth:`pure functions 
+    <clq.Type.is_pure_Call>`. The loop may not run at all, so expressions 
+    which can fail, i.e. reading memory and dividing by anything but a 
+    non-zero constant, are never moved. Nor is anything moved out of a loop 
+    containing inline code.
+    """
+    name = "hoist_loop_invariants"
+    
+    def visit_For(self, node):
+        return self.hoist(node, [node.guard, node.update_stmt.value])
+    
+    def visit_While(self, node):
+        return self.hoist(node, [node.test])
+    
+    def hoist(self, node, exprs):
+        nodes = list(walk(node))
+        if any(isinstance(child, _ast.Exec) for child in nodes):
+            return node
+        assigned = _stored_names([node])
+        keys = { }
+        for child in reversed(nodes):
+            # children come before their parents
+            if isinstance(child, _ast.expr):
+                keys[id(child)] = self.invariant_key(child, keys, assigned)
+        
+        # the outermost loop-invariant expressions
+        found = [ ]
+        todo = exprs + list(reversed(node.body))
+        while todo:
+            child = todo.pop()
+            if keys.get(id(child)) is not None and self.is_worthwhile(child):
+                found.append(child)
+                continue
+            children = [ ]
+            for field in _fields.get(type(child), child._fields):
+                value = getattr(child, field, None)
+                if isinstance(value, _ast.AST):
+                    children.append(value)
+                elif isinstance(value, list):
+                    children.extend(value)
+            todo.extend(reversed(children))
+        if not found:
+            return self.generic_visit(node)
+        
+        stmts = [ ]
+        variables = { }
+        replacements = { }
+        for child in found:
+            key = keys[id(child)]
+            try:
+                replacement = variables[key]
+            except KeyError:
+                clq_type = self.type_of(child)
+                name = self.context.add_variable("invariant", clq_type)
+                stmts.append(self.make_assign(name, clq_type, child))
+                replacement = variables[key] = self.make_name(name, clq_type, 
+                                                              child)
+            replacements[id(child)] = replacement
+            
+        replace = _Replace(self.context, replacements)
+        if isinstance(node, _ast.For):
+            loop = astx.copy_node(node, 
+                guard=replace.visit(node.guard),
+                update_stmt=replace.visit(node.update_stmt),
+                body=replace.visit_body(node.body))
+        else:
+            loop = astx.copy_node(node, 
+                test=replace.visit(node.test),
+                body=replace.visit_body(node.body))
+        # then loops nested within it
+        stmts.append(self.generic_visit(loop))
+        return stmts
+    
+    def invariant_key(self, node, keys, assigned):
+        # the key of an expression if it is loop-invariant, or None
+        if isinstance(node, _ast.Name):
+            if node.id in assigned or not isinstance(node.ctx, _ast.Load):
+                return None
+        elif isinstance(node, _ast.Subscript):
+            return None
+        elif isinstance(node, _ast.BinOp) and \
+             isinstance(node.op, (_ast.Div, _ast.FloorDiv, _ast.Mod)) and \
+             self.constant(node.right) in (None, 0):
+            return None
+        child_keys = tuple(keys.get(id(child)) 
+                           for child in self.children(node))
+        return self.key(node, child_keys, _no_versions)
+
+def _no_versions(name):
+    return 0
+
+class EliminateCommonSubexpressions(_Expressions):
+    """Evaluates expressions which are computed more than once in a sequence 
+    of statements once, storing them in :meth:`added variables 
+    <clq.Context.add_variable>`.
+    
+    The sequences are the runs of assignments, expression statements and 
+    ``return`` statements between other statements. Two expressions are the 
+    same if they have the same form and types, and none of the variables they
+    refer to are assigned to between them, nor any memory if they read from 
+    it. Only calls to :meth:`pure functions <clq.Type.is_pure_Call>` are 
+    considered, and memory is not read ahead of a statement which calls 
+    anything else. Expressions which are only evaluated conditionally, in 
+    the branches of ``and``, ``or`` and ``if`` expressions, are left alone.
+    
+    The largest expressions are chosen first. Each is assigned just before 
+    the statement where it first appears, unless that statement assigns it to
+    a variable which can be used instead.
+    """
+    name = "eliminate_common_subexpressions"
+    
+    def visit_body(self, stmts):
+        new_stmts = [ ]
+        run = [ ]
+        for stmt in stmts:
+            if isinstance(stmt, _straight_stmts):
+                run.append(stmt)
+                continue
+            new_stmts.extend(self.eliminate(run))
+            run = [ ]
+            new = self.visit(stmt)
+            if isinstance(new, list):
+                new_stmts.extend(new)
+            else:
+                new_stmts.append(new)
+        new_stmts.extend(self.eliminate(run))
+        return new_stmts
+    
+    def eliminate(self, stmts):
+        """Returns the provided run of statements with their common 
+        subexpressions eliminated."""
+        if not stmts:
+            return stmts
+        
+        counts = _collections.defaultdict(int)
+        self.occurrences = _collections.defaultdict(list)
+        self.order = 0
+        self.sizes = { }
+        for index, stmt in enumerate(stmts):
+            calls_impure = any(
+                isinstance(node, _ast.Call) and 
+                not self.type_of(node.func).is_pure_Call(self.context, node)
+                for node in walk(stmt))
+            def versions(name, calls_impure=calls_impure):
+                if name is None and calls_impure:
+                    # memory may change part way through the statement
+                    return None
+                return counts[name]
+            self.index = index
+            self.versions = versions
+            
+            for expr in _evaluated_exprs(stmt):
+                self.collect(expr)
+            
+            for name in _stored_names([stmt]):
+                counts[name] += 1
+            if calls_impure or not isinstance(stmt, _ast.Return) and any(
+                    not isinstance(target, _ast.Name) 
+                    for target in _targets(stmt)):
+                counts[None] += 1
+        
+        # the largest first, then in the order they appear
+        occurrences = self.occurrences
+        keys = sorted(occurrences, 
+                      key=lambda key: (-self.sizes[key], occurrences[key][0]))
+        covered = set()
+        chosen = [ ]
+        for key in keys:
+            found = [occurrence for occurrence in occurrences[key]
+                     if id(occurrence[2]) not in covered]
+            if len(found) < 2:
+                continue
+            chosen.append(found)
+            for _, _, node in found[1:]:
+                covered.update(id(child) for child in walk(node))
+        if not chosen:
+            return stmts
+        
+        replacements = { }
+        reused = set()
+        for found in chosen:
+            index, _, first = found[0]
+            clq_type = self.type_of(first)
+            name = self.reusable_variable(stmts, found)
+            if name is None:
+                name = self.context.add_variable("common", clq_type)
+            else:
+                reused.add(id(first))
+            replacement = self.make_name(name, clq_type, first)
+            for _, _, node in found:
+                replacements[id(node)] = replacement
+            if id(first) in reused:
+                del replacements[id(first)]
+        
+        # inner expressions are assigned first
+        chosen.sort(key=lambda found: found[0][:2])
+        replace = _Replace(self.context, replacements)
+        assignments = _collections.defaultdict(list)
+        for found in chosen:
+            index, _, first = found[0]
+            if id(first) in reused:
+                continue
+            value = Pass.generic_visit(replace, first)
+            name = replacements[id(first)].id
+            assignments[index].append(self.make_assign(
+                name, self.type_of(first), value))
+        
+        new_stmts = [ ]
+        for index, stmt in enumerate(replace.visit_body(stmts)):
+            new_stmts.extend(assignments[index])
+            new_stmts.append(stmt)
+        return new_stmts
+    
+    def reusable_variable(self, stmts, found):
+        """Returns the name of the variable which the first of the provided 
+        occurrences of an expression is assigned to, if it still holds it 
+        where the others appear, or None."""
+        first_index, _, first = found[0]
+        stmt = stmts[first_index]
+        if not isinstance(stmt, _ast.Assign) or stmt.value is not first:
+            return None
+        target = stmt.targets[0]
+        if not isinstance(target, _ast.Name) or \
+           self.type_of(target) != self.type_of(first):
+            return None
+        last_index = found[-1][0]
+        for later in stmts[first_index + 1:last_index]:
+            if target.id in _stored_names([later]):
+                return None
+        return target.id
+    
+    def collect(self, node):
+        # records the occurrences of an expression and those within it,
+        # returning its key
+        if isinstance(node, _ast.BoolOp):
+            self.collect(node.values[0])
+            return None
+        elif isinstance(node, _ast.IfExp):
+            self.collect(node.test)
+            return None
+        
+        child_keys = tuple(self.collect(child) 
+                           for child in self.children(node))
+        key = self.key(node, child_keys, self.versions)
+        if key is not None and self.is_worthwhile(node):
+            self.order += 1
+            self.occurrences[key].append((self.index, self.order, node))
+            self.sizes[key] = sum(1 for _ in walk(node))
+        return key
+
+# statements which don't affect control flow
+_straight_stmts = (_ast.Assign, _ast.AugAssign, _ast.Expr, _ast.Return, 
+                   _ast.Pass)
+
+def _targets(stmt):
+    # the targets assigned to by a statement
+    if isinstance(stmt, _ast.Assign):
+        return stmt.targets
+    elif isinstance(stmt, _ast.AugAssign):
+        return [stmt.target]
+    return [ ]
+
+def _evaluated_exprs(stmt):
+    # the expressions evaluated by a statement, in order
+    exprs = [ ]
+    value = getattr(stmt, 'value', None)
+    for target in _targets(stmt):
+        if isinstance(target, _ast.Subscript):
+            exprs.append(target.value)
+            exprs.append(getattr(target.slice, 'value', target.slice))
+        elif isinstance(target, _ast.Attribute):
+            exprs.append(target.value)
+    if value is not None:
+        exprs.append(value)
+    return exprs
+
+class VectorizeElementwise(Pass):
+    """Makes each work-item of an elementwise kernel process 
+    :attr:`vectorize <clq.GenericFn.vectorize>` consecutive elements rather 
+    than one, using vector types.
+    
+    An elementwise kernel assigns the index of its work-item to a variable 
+    and then only uses it to index arrays in global memory, in a sequence of 
+    assignments::
+    
+        gid = get_global_id(0)
+        t = a[gid] * s
+        dest[gid] = t + b[gid]
+        
+    Those elements are loaded and stored as vectors instead, variables 
+    assigned values computed from them become vectors and scalars used along 
+    with them are broadcast, so with a width of 4 this becomes::
+    
+        gid = get_global_id(0)
+        t_ = vload4(gid, a) * s
+        vstore4(t_ + vload4(gid, b), gid, dest)
+        
+    The kernel is then launched with a quarter of the global size, and the 
+    elements left over are processed by the kernel it is a variant of (see 
+    :class:`pyocl.Kernel <clq.backends.opencl.pyocl.Kernel>`).
+    
+    Each vector operation must have the vector type corresponding to the type
+    of the scalar operation, so that the results are the same, e.g. adding 
+    ``char`` values, which are promoted to ``int``, is not vectorized. Such 
+    kernels, and those which do anything else, e.g. compare loaded values, 
+    raise an :class:`InvalidOperationError <clq.InvalidOperationError>`. So 
+    do kernels calling any other work-item function, e.g. 
+    ``get_global_size``, whose values differ in the two launches.
+    """
+    name = "vectorize"
+    
+    width = None
+    """The number of elements each work-item processes."""
+    
+    index = None
+    """The name of the variable holding the index of the work-item."""
+    
+    def run(self, body):
+        width = self.context.generic_fn.vectorize
+        if width is None:
+            return body
+        self.width = width
+        self.backend = self.context.backend
+        for i, stmt in enumerate(body):
+            if isinstance(stmt, _ast.Assign) and \
+               isinstance(stmt.targets[0], _ast.Name) and \
+               self.backend.is_global_id(self.context, stmt.value):
+                break
+        else:
+            self.fail("It does not assign the index of its work-item to a "
+                      "variable.", None)
+        self.index = stmt.targets[0].id
+        for other in body:
+            for node in walk(other):
+                if node is not stmt.value and \
+                   self.backend.is_work_item_call(self.context, node):
+                    self.fail("It calls a work-item function other than to "
+                              "assign the index of its work-item, which "
+                              "would give a different value once the launch "
+                              "is split.", node)
+        prefix, rest = body[:i + 1], body[i + 1:]
+        self.assigned = _stored_names(rest)
+        for id in self.assigned & _stored_names(prefix):
+            self.fail("'%s' is assigned to before the index of its work-item "
+                      "is, and after." % id, None)
+        self.vectors = { } # variable name => (vector variable name, type)
+        self.scalars = set() # names of variables which stay scalars
+        return prefix + [self.vectorize_stmt(stmt) for stmt in rest]
+    
+    def fail(self, reason, node):
+        raise clq.InvalidOperationError("Cannot vectorize '%s'. %s" % 
+                                        (self.context.generic_fn.name, 
+                                         reason), node)
+    
+    def vectorize_stmt(self, stmt):
+        if isinstance(stmt, _ast.Pass):
+            return stmt
+        elif isinstance(stmt, _ast.Assign) and len(stmt.targets) == 1:
+            target = stmt.targets[0]
+            value, is_vector = self.vectorize(stmt.value)
+            if isinstance(target, _ast.Name):
+                return self.assign(stmt, target, value, is_vector)
+            elif self.is_element(target):
+                return self.store(stmt, target, value, is_vector)
+        elif isinstance(stmt, _ast.AugAssign):
+            target = stmt.target
+            value, is_vector = self.vectorize(stmt.value)
+            if isinstance(target, _ast.Name):
+                return self.aug_assign(stmt, target, value, is_vector)
+            elif self.is_element(target):
+                combined = _ast.BinOp(left=self.load(target), op=stmt.op, 
+                                      right=value)
+                _ast.copy_location(combined, stmt)
+                combined.unresolved_type = clq.internals.BinOpURT(combined)
+                return self.store(stmt, target, combined, True)
+        self.fail("It may only assign to variables and to the elements of "
+                  "arrays at the index of its work-item.", stmt)
+        
+    def assign(self, stmt, target, value, is_vector):
+        id = target.id
+        if id in self.vectors:
+            new_id, vector_type = self.vectors[id]
+            value = self.as_vector(value, is_vector, vector_type, stmt)
+        elif is_vector:
+            if id in self.scalars:
+                self.fail("'%s' is assigned both scalars and vectors." % id, 
+                          stmt)
+            vector_type = self.vector_type(self.type_of(target), stmt)
+            value = self.as_vector(value, True, vector_type, stmt)
+            new_id = self.context.add_variable(id, vector_type)
+            self.vectors[id] = (new_id, vector_type)
+        else:
+            self.scalars.add(id)
+            return stmt
+        new_target = self.make_name(new_id, vector_type, target, _ast.Store())
+        return _ast.copy_location(
+            _ast.Assign(targets=[new_target], value=value), stmt)
+    
+    def aug_assign(self, stmt, target, value, is_vector):
+        id = target.id
+        if id in self.vectors:
+            new_id, vector_type = self.vectors[id]
+            combined = _ast.BinOp(left=self.make_name(new_id, vector_type, 
+                                                      target),
+                                  op=stmt.op, right=value)
+            _ast.copy_location(combined, stmt)
+            combined.unresolved_type = clq.internals.BinOpURT(combined)
+            self.checked(combined, vector_type, stmt)
+            new_target = self.make_name(new_id, vector_type, target, 
+                                        _ast.Store())
+            return astx.copy_node(stmt, target=new_target, value=value)
+        elif id not in self.scalars:
+            self.fail("'%s' is used before it is assigned to." % id, stmt)
+        elif is_vector:
+            self.fail("'%s' is assigned both scalars and vectors." % id, stmt)
+        return stmt
+    
+    def store(self, stmt, target, value, is_vector):
+        vector_type = self.vector_type(self.type_of(target), stmt)
+        value = self.as_vector(value, is_vector, vector_type, stmt)
+        ptr = target.value
+        call = self.make_call(
+            self.backend.vector_store_fn(self.type_of(ptr), self.width), 
+            [value, target.slice.value, ptr], stmt)
+        self.type_of(call)
+        return _ast.copy_location(_ast.Expr(value=call), stmt)
+    
+    def load(self, node):
+        ptr = node.value
+        call = self.make_call(
+            self.backend.vector_load_fn(self.type_of(ptr), self.width), 
+            [node.slice.value, ptr], node)
+        return self.checked(call, self.vector_type(self.type_of(node), node),
+                            node)
+    
+    def is_element(self, node):
+        # whether node is an element of an array at the index of the 
+        # work-item, which can be loaded and stored as a vector
+        if not isinstance(node, _ast.Subscript) or \
+           not isinstance(node.slice, _ast.Index):
+            return False
+        index = node.slice.value
+        if not isinstance(index, _ast.Name) or index.id != self.index:
+            return False
+        ptr_type = self.type_of(node.value)
+        if self.uses_vectors(node.value) or \
+           self.backend.vector_load_fn(ptr_type, self.width) is None:
+            self.fail("The elements of '%s' values can't be loaded and "
+                      "stored as vectors." % ptr_type.name, node)
+        return True
+    
+    def vectorize(self, node):
+        # returns the expression to replace node with and whether it is a 
+        # vector; scalar expressions are returned unchanged
+        if isinstance(node, _ast.Name):
+            id = node.id
+            if id in self.vectors:
+                new_id, vector_type = self.vectors[id]
+                return self.make_name(new_id, vector_type, node), True
+            elif id == self.index:
+                self.fail("The index of its work-item, '%s', is used other "
+                          "than as the index of arrays." % id, node)
+            elif id in self.assigned and id not in self.scalars:
+                self.fail("'%s' is used before it is assigned to." % id, node)
+            return node, False
+        elif isinstance(node, _ast.Subscript) and self.is_element(node):
+            return self.load(node), True
+        elif isinstance(node, _ast.UnaryOp):
+            operand, is_vector = self.vectorize(node.operand)
+            if not is_vector:
+                return node, False
+            new = astx.copy_node(node, operand=operand)
+            new.unresolved_type = clq.internals.UnaryOpURT(new)
+        elif isinstance(node, _ast.BinOp):
+            left, left_is_vector = self.vectorize(node.left)
+            right, right_is_vector = self.vectorize(node.right)
+            if not (left_is_vector or right_is_vector):
+                return node, False
+            new = astx.copy_node(node, left=left, right=right)
+            new.unresolved_type = clq.internals.BinOpURT(new)
+        elif isinstance(node, _ast.Call):
+            args = [self.vectorize(arg) for arg in node.args]
+            if not any(is_vector for _, is_vector in args):
+                return node, False
+            if not self.type_of(node.func).is_elementwise_Call(self.context, 
+                                                               node):
+                self.fail("The function called can't be applied to vectors.",
+                          node)
+            # each argument has the type of the result, as for scalars
+            vector_type = self.vector_type(self.type_of(node), node)
+            new = astx.copy_node(node, args=[
+                self.as_vector(arg, is_vector, vector_type, node) 
+                for arg, is_vector in args])
+            new.unresolved_type = clq.internals.CallURT(new)
+        else:
+            if self.uses_vectors(node):
+                self.fail("%s expressions can't be vectorized." % 
+                          type(node).__name__, node)
+            return node, False
+        return self.checked(new, self.vector_type(self.type_of(node), node), 
+                            node), True
+    
+    def uses_vectors(self, node):
+        # whether the value of a scalar expression would vary between the 
+        # elements processed by a work-item
+        for child in walk(node):
+            if isinstance(child, _ast.Name) and self.vectorize(child)[1]:
+                return True
+            elif isinstance(child, _ast.Subscript) and self.is_element(child):
+                return True
+        return False
+    
+    def as_vector(self, value, is_vector, vector_type, node):
+        # converts or broadcasts value to the provided vector type
+        if is_vector:
+            if self.type_of(value) == vector_type:
+                return value
+            fn = self.backend.vector_convert_fn(vector_type)
+        else:
+            fn = self.backend.vector_literal_fn(vector_type)
+        return self.checked(self.make_call(fn, [value], node), vector_type, 
+                            node)
+    
+    def vector_type(self, scalar_type, node):
+        vector_type = self.backend.vector_type(scalar_type, self.width)
+        if vector_type is None:
+            self.fail("There are no vectors of %d '%s' values." % 
+                      (self.width, scalar_type.name), node)
+        return vector_type
+    
+    def checked(self, new, vector_type, node):
+        # returns the new vector expression replacing node once its type is 
+        # known to be the provided one
+        try:
+            new_type = self.type_of(new)
+        except clq.TypeResolutionError as e:
+            self.fail(e.message, node)
+        if new_type != vector_type:
+            self.fail("The result would have type '%s' rather than '%s'." % 
+                      (new_type.name, vector_type.name), node)
+        return new
+    
+    def make_call(self, fn, args, node):
+        name, fn_type = fn
+        new = _ast.Call(func=self.make_name(name, fn_type, node), args=args, 
+                        keywords=[], starargs=None, kwargs=None)
+        _ast.copy_location(new, node)
+        new.unresolved_type = clq.internals.CallURT(new)
+        return new
+
+required_passes = [SubstituteConstants]
+"""The types of the passes which code generation relies on, in order."""
+
+default_passes = [InlineCalls, FoldConstants, UnrollLoops, 
+                  EliminateCommonSubexpressions, HoistLoopInvariants]
+"""The types of the optimization passes which are run, in order, unless they 
+are disabled."""
+
+final_passes = [VectorizeElementwise]
+"""The types of the passes which run after the optimization passes, in order.
+They can't be disabled, as they carry out the options of generic functions 
+which change what their kernels do."""
+
+class PassManager(object):
+    """Runs the :obj:`required_passes` followed by a sequence of optimization 
+    passes, any of which can be disabled by name, and the :obj:`final_passes`,
+    and measures the time spent in each.
+    
+    Concrete functions are compiled by the passes of the :obj:`manager`, e.g. 
+    to compare the code generated with and without a pass::
+    
+        clq.passes.manager.disable("eliminate_common_subexpressions")
+    
+    Functions which have already been compiled are not affected. The enabled 
+    passes are part of :attr:`ConcreteFn.cache_key 
+    <clq.ConcreteFn.cache_key>`, so cached functions are not either.
+    """
+    def __init__(self, passes=None):
+        if passes is None:
+            passes = default_passes
+        self.passes = list(passes)
+        self.disabled = set()
+        self.stats = { }
+        
+    passes = None
+    """The types of the optimization passes, in the order they run."""
+    
+    disabled = None
+    """The set of the names of the passes which are disabled."""
+    
+    stats = None
+    """A dict mapping the names of the passes which have run to 
+    :class:`instrument.Stats <clq.instrument.Stats>` for them. Their time 
+    includes the time spent compiling functions which are inlined."""
+    
+    def _check_name(self, name):
+        if not any(pass_type.name == name for pass_type in self.passes):
+            raise clq.Error("There is no optimization pass named '%s'." % name)
+        
+    def enable(self, name):
+        """Enables the pass with the provided name."""
+        self._check_name(name)
+        self.disabled.discard(name)
+        
+    def disable(self, name):
+        """Disables the pass with the provided name."""
+        self._check_name(name)
+        self.disabled.add(name)
+        
+    @property
+    def enabled_passes(self):
+        """The types of the passes which are enabled, in order."""
+        disabled = self.disabled
+        return [pass_type for pass_type in self.passes 
+                if pass_type.name not in disabled]
+        
+    @property
+    def cache_key(self):
+        """A string identifying the enabled passes."""
+        return ",".join(pass_type.name for pass_type in self.enabled_passes)
+    
+    def run(self, context, body):
+        """Runs the passes over the provided statements of the concrete 
+        function being compiled in the provided context, returning the new 
+        statements."""
+        for pass_type in required_passes:
+            body = pass_type(context).run(body)
+        stats = self.stats
+        for pass_type in self.enabled_passes + final_passes:
+            start = _time.time()
+            body = pass_type(context).run(body)
+            elapsed = _time.time() - start
+            try:
+                pass_stats = stats[pass_type.name]
+            except KeyError:
+                pass_stats = stats[pass_type.name] = clq.instrument.Stats()
+            pass_stats.add(elapsed, elapsed, 0)
+        return body
+
+manager = PassManager()
+"""The :class:`PassManager` used to compile concrete functions."""
@@ -58,3 +58,73 @@ def randn(state, randf=simple_randf):
         return 6.0
     else:
         return r
+
+@clq.fn
+def philox4x32(seed, gid, counter, mul_hi, uint4):
+    #"""The Philox-4x32-10 counter-based random number generator.
+    #
+    #Returns four random uints determined by the seed, the index of the
+    #work-item and a counter, which the work-item increments to draw more.
+    #Nothing is stored between calls. The key is (seed, 0) and the counter
+    #block is (counter, gid, 0, 0), so the results match the reference
+    #implementation in Random123 for those inputs."""
+    x = uint4(counter, gid, 0, 0)
+    # the multipliers and the Weyl sequence constants, as uints, since
+    # literals this large are longs
+    m = uint4(0xD2511F53, 0xCD9E8D57, 0x9E3779B9, 0xBB67AE85)
+    k = uint4(seed, 0, 0, 0)
+    for r in (0, 10):
+        x = uint4(mul_hi(m.y, x.z) ^ x.y ^ k.x, m.y * x.z,
+                  mul_hi(m.x, x.x) ^ x.w ^ k.y, m.x * x.x)
+        k = k + m.zwzw
+    return x
+
+@clq.fn
+def threefry4x32(seed, gid, counter, rotate, uint4, uint8, uint16):
+    #"""The Threefry-4x32-20 counter-based random number generator.
+    #
+    #Takes the same inputs as philox4x32, with the key (seed, 0, 0, 0). Uses
+    #only additions, rotations and xors, which may be faster than Philox's
+    #multiplications on some devices."""
+    # the key schedule, rotated after each injection
+    k = uint8(seed, 0, 0, 0, seed ^ 0x1BD11BDA, 0, 0, 0)
+    # the rotations for the first and second four rounds, swapped after each
+    r = uint16(10, 26, 11, 21, 13, 27, 23, 5, 6, 20, 17, 11, 25, 10, 18, 20)
+    x = uint4(counter, gid, 0, 0) + k.s0123
+    for s in (1, 6):
+        x = uint4(x.x + x.y, rotate(x.y, r.s0) ^ (x.x + x.y),
+                  x.z + x.w, rotate(x.w, r.s1) ^ (x.z + x.w))
+        x = uint4(x.x + x.w, rotate(x.y, r.s3) ^ (x.z + x.y),
+                  x.z + x.y, rotate(x.w, r.s2) ^ (x.x + x.w))
+        x = uint4(x.x + x.y, rotate(x.y, r.s4) ^ (x.x + x.y),
+                  x.z + x.w, rotate(x.w, r.s5) ^ (x.z + x.w))
+        x = uint4(x.x + x.w, rotate(x.y, r.s7) ^ (x.z + x.y),
+                  x.z + x.y, rotate(x.w, r.s6) ^ (x.x + x.w))
+        k = k.s12340567
+        r = r.s89ABCDEF01234567
+        x = x + k.s0123
+        x.w = x.w + s
+    return x
+
+@clq.fn
+def randf4(bits, convert_float4, float4):
+    #"""Converts four random uints, e.g. from philox4x32, to four uniform
+    #random floats in (0, 1)."""
+    return (convert_float4(bits >> 8) + float4(0.5)) * float4(5.9604644775390625e-08)
+
+@clq.fn
+def randexp4(bits, randf, log, convert_float4, float4):
+    #"""Converts four random uints to four exponential random floats, like
+    #randexp but without state."""
+    return -log(randf(bits, convert_float4, float4))
+
+@clq.fn
+def randn4(bits, randf, log, sqrt, sinpi, cospi, convert_float4, float4):
+    #"""Converts four random uints to four normal random floats with the
+    #Box-Muller transform. Since the uniform floats are at least 2 ** -25,
+    #the results are always within 5.9 of 0, so unlike randn they need no
+    #clamp at 6.0."""
+    u = randf(bits, convert_float4, float4)
+    r = sqrt(-2 * log(u.xy))
+    t = 2 * u.zw
+    return float4(r * cospi(t), r * sinpi(t))
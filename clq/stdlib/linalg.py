@@ -0,0 +1,283 @@
+"""Dense linear algebra for the OpenCL backend.
+
+:func:`gemm` multiplies matrices held in buffers with a tiled kernel, and
+:func:`dot` multiplies arrays, copying them to and from the device::
+
+    from clq.stdlib import linalg
+
+    c = linalg.dot(ctx, a, b) # like numpy.dot(a, b)
+
+Each work-group computes a square tile of the result, reading the tiles of
+the operands it needs through local memory, and each work-item accumulates a
+row of several elements of the tile in a vector (register blocking). The
+size of the tiles, the number of elements each work-item computes and the
+width of the loads from global memory are given by a :class:`Config`, and
+are bound to :func:`constants <clq.const>` when the kernel is compiled.
+
+The best configuration depends on the device. :func:`autotune` tries each of
+the candidates and records the fastest, which is used by default from then
+on. The recorded configurations can be saved with :func:`save_configs` and
+loaded in later runs with :func:`load_configs`.
+"""
+import json
+import time
+
+import clq
+import clq.backends.opencl as ocl
+import clq.backends.opencl.kernelcache as kernelcache
+
+backend = ocl.Backend()
+"""The backend the kernels are compiled for."""
+
+class Config(object):
+    """The parameters of a matrix multiplication kernel."""
+    def __init__(self, tile_size, work_per_item, width):
+        self.tile_size = tile_size
+        self.work_per_item = work_per_item
+        self.width = width
+        if work_per_item not in ocl.vector_type_sizes or \
+           width not in ocl.vector_type_sizes or \
+           work_per_item % width or tile_size % work_per_item:
+            raise clq.Error("Invalid configuration: %r." % (self,))
+
+    tile_size = None
+    """The number of rows and columns in the tile of the result computed by
+    each work-group. The number of rows, columns and inner dimension of the
+    matrices must be multiples of it."""
+
+    work_per_item = None
+    """The number of consecutive elements of a row of the tile computed by
+    each work-item, held in a vector. Must be a vector size and divide the
+    :attr:`tile_size`."""
+
+    width = None
+    """The number of elements in each load of the operands from global
+    memory, as a vector. Must be a vector size and divide the
+    :attr:`work_per_item`."""
+
+    @property
+    def local_size(self):
+        """The dimensions of each work-group."""
+        return (self.tile_size // self.work_per_item, self.tile_size)
+
+    def fits(self, device, cl_dtype=ocl.float):
+        """Returns whether kernels with this configuration can run on the
+        provided device."""
+        n_items = self.tile_size * self.tile_size // self.work_per_item
+        local_mem = 2 * self.tile_size ** 2 * cl_dtype.sizeof_for(device)
+        return (n_items <= device.max_work_group_size and
+                local_mem <= device.local_mem_size)
+
+    def _key(self):
+        return (self.tile_size, self.work_per_item, self.width)
+
+    def __eq__(self, other):
+        return isinstance(other, Config) and self._key() == other._key()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __repr__(self):
+        return "Config(%d, %d, %d)" % self._key()
+
+default_config = Config(16, 4, 4)
+"""The configuration used for devices without a recorded one."""
+
+candidate_configs = [Config(tile_size, work_per_item, width)
+                     for tile_size in (16, 32, 64)
+                     for work_per_item in (2, 4, 8)
+                     for width in (2, 4, 8)
+                     if width <= work_per_item]
+"""The configurations tried by :func:`autotune` by default."""
+
+configs = { }
+"""A dict mapping the key of each device (see :func:`device_key`) to the
+configuration recorded for it by :func:`autotune`."""
+
+def device_key(device):
+    """Returns a string identifying the provided device and its driver."""
+    return "%s/%s/%s" % (device.vendor.strip(), device.name.strip(),
+                         device.driver_version.strip())
+
+def config_for(device):
+    """Returns the configuration recorded for the provided device, or the
+    :obj:`default_config`."""
+    return configs.get(device_key(device), default_config)
+
+################################################################################
+# Kernels
+################################################################################
+@clq.fn(unroll=4)
+def gemm_tiled(a, b, c, n, k, a_tile, b_tile, tile_size, work_per_item, width,
+               vector, vload, vstore, vload_acc, vstore_acc, get_local_id,
+               get_group_id, barrier, CLK_LOCAL_MEM_FENCE):
+    #"""Stores the product of the row-major matrices a and b in c, each
+    #work-item computing work_per_item elements of a row of a tile of it."""
+    lc = get_local_id(0)
+    lr = get_local_id(1)
+    col = get_group_id(0) * tile_size + lc * work_per_item
+    row = get_group_id(1) * tile_size + lr
+    tile_offset = lr * tile_size + lc * work_per_item
+    acc = vector(0)
+    for t in (0, k, tile_size):
+        # each work-item loads the part of the tiles it computes with
+        for w in (0, work_per_item, width):
+            vstore(vload((row * k + t + lc * work_per_item + w) / width, a),
+                   (tile_offset + w) / width, a_tile)
+            vstore(vload(((t + lr) * n + col + w) / width, b),
+                   (tile_offset + w) / width, b_tile)
+        barrier(CLK_LOCAL_MEM_FENCE)
+        for j in (0, tile_size):
+            acc = acc + a_tile[lr * tile_size + j] * vload_acc(
+                (j * tile_size + lc * work_per_item) / work_per_item, b_tile)
+        barrier(CLK_LOCAL_MEM_FENCE)
+    vstore_acc(acc, (row * n + col) / work_per_item, c)
+
+def gemm_arg_types(config, cl_dtype=ocl.float):
+    """Returns the types to compile :func:`gemm_tiled` with for the provided
+    configuration and type of the elements of the matrices."""
+    builtins = ocl.builtins
+    vector_type = cl_dtype.vector_types[config.work_per_item]
+    return (cl_dtype.ptr_global, cl_dtype.ptr_global, cl_dtype.ptr_global,
+            ocl.uint, ocl.uint, cl_dtype.ptr_shared, cl_dtype.ptr_shared,
+            clq.const(config.tile_size), clq.const(config.work_per_item),
+            clq.const(config.width), vector_type.constructor,
+            builtins["vload%d" % config.width].cl_type,
+            builtins["vstore%d" % config.width].cl_type,
+            builtins["vload%d" % config.work_per_item].cl_type,
+            builtins["vstore%d" % config.work_per_item].cl_type,
+            ocl.get_local_id.cl_type, ocl.get_group_id.cl_type,
+            ocl.barrier.cl_type, ocl.CLK_LOCAL_MEM_FENCE)
+
+################################################################################
+# Host Functions
+################################################################################
+def gemm(a, b, c=None, config=None, wait_for=None):
+    """Stores the product of the matrices in the provided buffers, which must
+    be row-major, in ``c``, or a new buffer if it is not provided, and
+    returns it along with the event for the kernel computing it.
+
+    The dimensions of the matrices must be multiples of the
+    :attr:`tile_size <Config.tile_size>` of the configuration, which is
+    the one for the device (see :func:`config_for`) if none is provided.
+    """
+    ctx = a.context
+    if config is None:
+        config = config_for(ctx.device)
+    (m, k), (k_b, n) = a.shape, b.shape
+    if k != k_b:
+        raise clq.Error("Matrices of shapes %s and %s can't be multiplied." %
+                        (a.shape, b.shape))
+    tile_size = config.tile_size
+    if m % tile_size or n % tile_size or k % tile_size:
+        raise clq.Error(
+            "The dimensions of matrices of shapes %s and %s aren't multiples "
+            "of %d." % (a.shape, b.shape, tile_size))
+    cl_dtype = a.cl_dtype
+    if c is None:
+        c = ctx.alloc((m, n), cl_dtype)
+    tile = _local_memory(ctx, tile_size * tile_size, cl_dtype)
+    kwargs = { }
+    if wait_for:
+        kwargs['wait_for'] = wait_for
+    event = _kernel(ctx, config, cl_dtype)(
+        (n // config.work_per_item, m), a, b, c, ocl.uint.np_dtype.type(n),
+        ocl.uint.np_dtype.type(k), tile, tile,
+        local_size=config.local_size, **kwargs)
+    return c, event
+
+def dot(ctx, a, b, config=None):
+    """Returns the product of the provided arrays, computed on the device of
+    the provided :class:`pyocl.Context <clq.backends.opencl.pyocl.Context>`.
+
+    The arrays are converted to single precision and padded with zeros to
+    multiples of the :attr:`tile_size <Config.tile_size>` before being
+    copied to the device.
+    """
+    import numpy
+    if config is None:
+        config = config_for(ctx.device)
+    (m, k), (k_b, n) = a.shape, b.shape
+    if k != k_b:
+        raise clq.Error("Matrices of shapes %s and %s can't be multiplied." %
+                        (a.shape, b.shape))
+    padded_a = _padded(numpy, a, config.tile_size)
+    padded_b = _padded(numpy, b, config.tile_size)
+    c, event = gemm(ctx.to_device(padded_a), ctx.to_device(padded_b),
+                    config=config)
+    return c.from_device(wait_for=[event])[:m, :n]
+
+def autotune(ctx, size=1024, candidates=None, n_repeats=3):
+    """Times the multiplication of square matrices of the provided size with
+    each candidate configuration which fits the device of the provided
+    context, :obj:`candidate_configs` by default, and records the fastest
+    for the device.
+
+    Returns a list of pairs of configurations and their times, in seconds,
+    fastest first. The size must be a multiple of the tile size of each
+    candidate.
+    """
+    import numpy
+    device = ctx.device
+    if candidates is None:
+        candidates = candidate_configs
+    a = ctx.to_device(numpy.random.rand(size, size).astype(numpy.float32))
+    b = ctx.to_device(numpy.random.rand(size, size).astype(numpy.float32))
+    c = ctx.alloc((size, size), ocl.float)
+    times = [ ]
+    for config in candidates:
+        if not config.fits(device):
+            continue
+        # the first run compiles the kernel
+        gemm(a, b, c, config)[1].wait()
+        start = time.time()
+        for i in xrange(n_repeats):
+            event = gemm(a, b, c, config)[1]
+        event.wait()
+        times.append((config, (time.time() - start) / n_repeats))
+    if not times:
+        raise clq.Error("No configuration fits %s." % device.name)
+    times.sort(key=lambda (config, elapsed): elapsed)
+    configs[device_key(device)] = times[0][0]
+    return times
+
+def save_configs(path):
+    """Saves the recorded :obj:`configs` to a JSON file."""
+    with open(path, "w") as f:
+        json.dump(dict((key, config._key())
+                       for key, config in configs.iteritems()), f, indent=1)
+
+def load_configs(path):
+    """Records the configurations saved to a JSON file by
+    :func:`save_configs`."""
+    with open(path) as f:
+        for key, params in json.load(f).iteritems():
+            configs[key] = Config(*params)
+
+################################################################################
+# Internals
+################################################################################
+_kernels = kernelcache.KernelCache() # (configuration, element type)
+
+def _kernel(ctx, config, cl_dtype):
+    return _kernels.kernel(ctx, (config, cl_dtype), lambda:
+        kernelcache.build(ctx, backend, [gemm_tiled.compile(
+            backend, *gemm_arg_types(config, cl_dtype))]))
+
+def _local_memory(ctx, n, cl_dtype):
+    import clq.backends.opencl.pyocl as pyocl
+    return pyocl.LocalMemory.shaped(ctx, (n,), cl_dtype)
+
+def _padded(numpy, a, multiple):
+    # a copy of the matrix with zeros appended to each dimension up to a
+    # multiple of the provided number, or the matrix itself if none are
+    shape = tuple(-(-d // multiple) * multiple for d in a.shape)
+    a = numpy.ascontiguousarray(a, dtype=numpy.float32)
+    if shape == a.shape:
+        return a
+    padded = numpy.zeros(shape, dtype=numpy.float32)
+    padded[:a.shape[0], :a.shape[1]] = a
+    return padded
@@ -0,0 +1,442 @@
+"""Parallel primitives for the OpenCL backend: reduction, scan, stream
+compaction, segmented reduction and radix sort.
+
+Each is made of generic functions, which are compiled for the element type of
+the buffers they are applied to, and a host driver launching them on the
+context of those buffers, e.g.::
+
+    from clq.stdlib import plus
+    from clq.stdlib import parallel
+
+    total = parallel.reduce(plus, buffer)
+    prefix_sums = parallel.scan(plus, buffer, 0)
+
+The operators are binary generic functions passed to the kernels (see
+:attr:`clq.GenericFn.cl_type`), which must be associative. They are applied
+in order, so they needn't be commutative. The number of work-items in each
+work-group can be given to each driver and must be a power of two.
+"""
+import clq
+import clq.backends.opencl as ocl
+import clq.backends.opencl.kernelcache as kernelcache
+import clq.stdlib as stdlib
+
+backend = ocl.Backend()
+"""The backend the kernels are compiled for."""
+
+local_size = 128
+"""The default number of work-items in each work-group."""
+
+################################################################################
+# Kernels
+################################################################################
+@clq.fn
+def reduce_groups(src, n, dest, scratch, op, get_local_id, get_local_size,
+                  get_group_id, barrier, CLK_LOCAL_MEM_FENCE):
+    #"""Reduces the up to two consecutive elements of src per work-item read
+    #by each work-group into the element of dest for the group."""
+    lid = get_local_id(0)
+    size = get_local_size(0)
+    group = get_group_id(0)
+    i = group * size * 2 + lid * 2
+    if i < n:
+        x = src[i]
+        if i + 1 < n:
+            x = op(x, src[i + 1])
+        scratch[lid] = x
+    barrier(CLK_LOCAL_MEM_FENCE)
+    # only the first valid elements of scratch hold values, and each step
+    # combines neighbouring ranges, keeping them in order
+    valid = (n - group * size * 2 + 1) / 2
+    if valid > size:
+        valid = size
+    s = 1
+    while s < size:
+        j = 2 * s * lid
+        if j + s < valid:
+            scratch[j] = op(scratch[j], scratch[j + s])
+        barrier(CLK_LOCAL_MEM_FENCE)
+        s = s * 2
+    if lid == 0:
+        dest[group] = scratch[0]
+
+@clq.fn
+def scan_groups(src, n, dest, sums, identity, inclusive, scratch, op,
+                get_local_id, get_local_size, get_group_id, barrier,
+                CLK_LOCAL_MEM_FENCE):
+    #"""Scans the two elements of src per work-item read by each work-group
+    #into dest, saving the reduction of them in the element of sums for the
+    #group (Blelloch's algorithm)."""
+    lid = get_local_id(0)
+    size = get_local_size(0)
+    group = get_group_id(0)
+    n_group = size * 2
+    base = group * n_group
+    for j in (lid, n_group, size):
+        if base + j < n:
+            scratch[j] = src[base + j]
+        else:
+            scratch[j] = identity
+    # up-sweep
+    offset = 1
+    d = size
+    while d > 0:
+        barrier(CLK_LOCAL_MEM_FENCE)
+        if lid < d:
+            ai = offset * (2 * lid + 1) - 1
+            bi = offset * (2 * lid + 2) - 1
+            scratch[bi] = op(scratch[ai], scratch[bi])
+        offset = offset * 2
+        d = d / 2
+    barrier(CLK_LOCAL_MEM_FENCE)
+    if lid == 0:
+        sums[group] = scratch[n_group - 1]
+        scratch[n_group - 1] = identity
+    # down-sweep
+    d = 1
+    while d < n_group:
+        offset = offset / 2
+        barrier(CLK_LOCAL_MEM_FENCE)
+        if lid < d:
+            ai = offset * (2 * lid + 1) - 1
+            bi = offset * (2 * lid + 2) - 1
+            t = scratch[ai]
+            scratch[ai] = scratch[bi]
+            scratch[bi] = op(scratch[bi], t)
+        d = d * 2
+    barrier(CLK_LOCAL_MEM_FENCE)
+    for j in (lid, n_group, size):
+        if base + j < n:
+            if inclusive:
+                dest[base + j] = op(scratch[j], src[base + j])
+            else:
+                dest[base + j] = scratch[j]
+
+@clq.fn
+def add_offsets(dest, n, offsets, op, get_local_id, get_local_size,
+                get_group_id):
+    #"""Combines the offset for each group of elements scanned by
+    #scan_groups with each of them."""
+    size = get_local_size(0)
+    group = get_group_id(0)
+    offset = offsets[group]
+    i = group * size * 2 + get_local_id(0)
+    if i < n:
+        dest[i] = op(offset, dest[i])
+    i = i + size
+    if i < n:
+        dest[i] = op(offset, dest[i])
+
+@clq.fn
+def flag_elements(src, n, flags, predicate, get_global_id):
+    #"""Sets each element of flags to 1 if predicate holds for the element
+    #of src, or 0."""
+    i = get_global_id(0)
+    if i < n:
+        if predicate(src[i]):
+            flags[i] = 1
+        else:
+            flags[i] = 0
+
+@clq.fn
+def scatter_flagged(src, n, flags, positions, dest, get_global_id):
+    #"""Stores each element of src which is flagged at its position in
+    #dest."""
+    i = get_global_id(0)
+    if i < n:
+        if flags[i]:
+            dest[positions[i]] = src[i]
+
+@clq.fn
+def reduce_segment_groups(src, offsets, dest, identity, scratch, op,
+                          get_local_id, get_local_size, get_group_id, barrier,
+                          CLK_LOCAL_MEM_FENCE):
+    #"""Reduces the elements of src from offsets[segment] up to
+    #offsets[segment + 1] into dest[segment], with a work-group per
+    #segment."""
+    lid = get_local_id(0)
+    size = get_local_size(0)
+    segment = get_group_id(0)
+    start = offsets[segment]
+    end = offsets[segment + 1]
+    # each work-item reduces a contiguous chunk of the segment
+    chunk = (end - start + size - 1) / size
+    i = start + lid * chunk
+    stop = i + chunk
+    if stop > end:
+        stop = end
+    if i < stop:
+        x = src[i]
+        i = i + 1
+        while i < stop:
+            x = op(x, src[i])
+            i = i + 1
+        scratch[lid] = x
+    barrier(CLK_LOCAL_MEM_FENCE)
+    valid = 0
+    if chunk > 0:
+        valid = (end - start + chunk - 1) / chunk
+    s = 1
+    while s < size:
+        j = 2 * s * lid
+        if j + s < valid:
+            scratch[j] = op(scratch[j], scratch[j + s])
+        barrier(CLK_LOCAL_MEM_FENCE)
+        s = s * 2
+    if lid == 0:
+        if end > start:
+            dest[segment] = scratch[0]
+        else:
+            dest[segment] = identity
+
+@clq.fn
+def flag_zero_bits(keys, n, bit, flags, get_global_id):
+    #"""Sets each element of flags to 1 if the bit of the key is 0, or 0."""
+    i = get_global_id(0)
+    if i < n:
+        flags[i] = 1 - ((keys[i] >> bit) & 1)
+
+@clq.fn
+def split_by_bit(keys, values, n, flags, positions, dest_keys, dest_values,
+                 has_values, get_global_id):
+    #"""Moves the keys whose bit is 0 before those whose bit is 1, keeping
+    #their order otherwise, along with their values."""
+    i = get_global_id(0)
+    if i < n:
+        n_zeros = positions[n - 1] + flags[n - 1]
+        if flags[i]:
+            j = positions[i]
+        else:
+            j = n_zeros + i - positions[i]
+        dest_keys[j] = keys[i]
+        if has_values:
+            dest_values[j] = values[i]
+
+################################################################################
+# Drivers
+################################################################################
+def reduce(op, src, local_size=None):
+    """Returns the reduction of the elements of the provided buffer with the
+    provided operator, e.g. their sum with :func:`plus <clq.stdlib.plus>`.
+
+    Each pass reduces the elements read by each work-group, two consecutive
+    ones per work-item, with a tree in local memory, until one is left.
+    """
+    local_size = _local_size(local_size)
+    n = len(src)
+    if n == 0:
+        raise clq.Error("Can't reduce an empty buffer.")
+    ctx = src.context
+    cl_dtype = src.cl_dtype
+    kernel = _kernel(ctx, reduce_groups, cl_dtype.ptr_global, ocl.uint,
+                     cl_dtype.ptr_global, cl_dtype.ptr_shared, op.cl_type,
+                     *_builtins("get_local_id", "get_local_size",
+                                "get_group_id", "barrier",
+                                "CLK_LOCAL_MEM_FENCE"))
+    scratch = _local_memory(ctx, local_size, cl_dtype)
+    while n > 1:
+        n_groups = _ceil_div(n, 2 * local_size)
+        dest = ctx.alloc(n_groups, cl_dtype)
+        kernel((n_groups * local_size,), src, _uint(n), dest, scratch,
+               local_size=(local_size,))
+        src, n = dest, n_groups
+    return src.from_device()[0]
+
+def scan(op, src, identity, inclusive=False, local_size=None):
+    """Returns a new buffer holding the exclusive scan of the provided one
+    with the provided operator and its identity, or the inclusive scan if
+    ``inclusive`` is True, e.g. the prefix sums with :func:`plus
+    <clq.stdlib.plus>` and 0.
+
+    Each work-group scans two elements per work-item, and the reductions of
+    those blocks are scanned in turn and combined with them.
+    """
+    dest = src.context.alloc(like=src)
+    _scan(op, src, len(src), dest, identity, inclusive,
+          _local_size(local_size))
+    return dest
+
+def _scan(op, src, n, dest, identity, inclusive, local_size):
+    ctx = src.context
+    cl_dtype = src.cl_dtype
+    kernel = _kernel(ctx, scan_groups, cl_dtype.ptr_global, ocl.uint,
+                     cl_dtype.ptr_global, cl_dtype.ptr_global, cl_dtype,
+                     clq.const(bool(inclusive)), cl_dtype.ptr_shared,
+                     op.cl_type,
+                     *_builtins("get_local_id", "get_local_size",
+                                "get_group_id", "barrier",
+                                "CLK_LOCAL_MEM_FENCE"))
+    n_groups = _ceil_div(n, 2 * local_size)
+    sums = ctx.alloc(n_groups, cl_dtype)
+    scratch = _local_memory(ctx, 2 * local_size, cl_dtype)
+    kernel((n_groups * local_size,), src, _uint(n), dest, sums,
+           _scalar(cl_dtype, identity), scratch, local_size=(local_size,))
+    if n_groups > 1:
+        offsets = ctx.alloc(n_groups, cl_dtype)
+        _scan(op, sums, n_groups, offsets, identity, False, local_size)
+        kernel = _kernel(ctx, add_offsets, cl_dtype.ptr_global, ocl.uint,
+                         cl_dtype.ptr_global, op.cl_type,
+                         *_builtins("get_local_id", "get_local_size",
+                                    "get_group_id"))
+        kernel((n_groups * local_size,), dest, _uint(n), offsets,
+               local_size=(local_size,))
+
+def compact(predicate, src, local_size=None):
+    """Returns a new buffer holding the elements of the provided one for
+    which the provided unary generic function holds, in order, and their
+    number.
+
+    The elements are flagged, the flags scanned to find their positions and
+    the flagged elements scattered to them.
+    """
+    local_size = _local_size(local_size)
+    ctx = src.context
+    cl_dtype = src.cl_dtype
+    n = len(src)
+    flags, positions = _flags(ctx, n), _flags(ctx, n)
+    _kernel(ctx, flag_elements, cl_dtype.ptr_global, ocl.uint,
+            ocl.uint.ptr_global, predicate.cl_type,
+            *_builtins("get_global_id"))(
+        (_round_up(n, local_size),), src, _uint(n), flags,
+        local_size=(local_size,))
+    _scan(stdlib.plus, flags, n, positions, 0, False, local_size)
+    count = _count(flags, positions)
+    dest = ctx.alloc(max(count, 1), cl_dtype)
+    _kernel(ctx, scatter_flagged, cl_dtype.ptr_global, ocl.uint,
+            ocl.uint.ptr_global, ocl.uint.ptr_global, cl_dtype.ptr_global,
+            *_builtins("get_global_id"))(
+        (_round_up(n, local_size),), src, _uint(n), flags, positions, dest,
+        local_size=(local_size,))
+    return dest, count
+
+def reduce_segments(op, src, offsets, identity, local_size=None):
+    """Returns a new buffer holding the reduction of each segment of the
+    provided buffer, from ``offsets[i]`` up to ``offsets[i + 1]``, with the
+    provided operator, or ``identity`` for empty segments.
+
+    ``offsets`` is a buffer of ``uint`` values with one more element than
+    there are segments. Each segment is reduced by a work-group, each
+    work-item of which reduces a contiguous chunk of it.
+    """
+    local_size = _local_size(local_size)
+    ctx = src.context
+    cl_dtype = src.cl_dtype
+    n_segments = len(offsets) - 1
+    dest = ctx.alloc(n_segments, cl_dtype)
+    kernel = _kernel(ctx, reduce_segment_groups, cl_dtype.ptr_global,
+                     offsets.cl_type, cl_dtype.ptr_global, cl_dtype,
+                     cl_dtype.ptr_shared, op.cl_type,
+                     *_builtins("get_local_id", "get_local_size",
+                                "get_group_id", "barrier",
+                                "CLK_LOCAL_MEM_FENCE"))
+    kernel((n_segments * local_size,), src, offsets, dest,
+           _scalar(cl_dtype, identity),
+           _local_memory(ctx, local_size, cl_dtype),
+           local_size=(local_size,))
+    return dest
+
+def radix_sort(keys, values=None, local_size=None):
+    """Returns a new buffer holding the provided unsigned integer keys in
+    ascending order, and one holding the provided values in the same order
+    if any are provided.
+
+    This is a least significant digit radix sort with a digit per bit, each
+    pass splitting the keys stably by the bit using a scan.
+    """
+    local_size = _local_size(local_size)
+    ctx = keys.context
+    key_type = keys.cl_dtype
+    if key_type not in (ocl.uchar, ocl.ushort, ocl.uint, ocl.ulong):
+        raise clq.Error("Radix sort needs unsigned integer keys, not %s." %
+                        key_type.name)
+    n = len(keys)
+    global_size = (_round_up(n, local_size),)
+    has_values = values is not None
+    if not has_values:
+        # never read or written
+        values = keys
+    value_type = values.cl_dtype
+    flags, positions = _flags(ctx, n), _flags(ctx, n)
+    flag_kernel = _kernel(ctx, flag_zero_bits, key_type.ptr_global, ocl.uint,
+                          ocl.uint, ocl.uint.ptr_global,
+                          *_builtins("get_global_id"))
+    split_kernel = _kernel(ctx, split_by_bit, key_type.ptr_global,
+                           value_type.ptr_global, ocl.uint,
+                           ocl.uint.ptr_global, ocl.uint.ptr_global,
+                           key_type.ptr_global, value_type.ptr_global,
+                           clq.const(has_values),
+                           *_builtins("get_global_id"))
+    # the keys and values are split into each pair of buffers in turn
+    key_buffers = (ctx.alloc(like=keys), ctx.alloc(like=keys))
+    if has_values:
+        value_buffers = (ctx.alloc(like=values), ctx.alloc(like=values))
+    else:
+        value_buffers = key_buffers
+    src_keys, src_values = keys, values
+    for bit in xrange(key_type.min_sizeof * 8):
+        dest_keys, dest_values = key_buffers[bit % 2], value_buffers[bit % 2]
+        flag_kernel(global_size, src_keys, _uint(n), _uint(bit), flags,
+                    local_size=(local_size,))
+        _scan(stdlib.plus, flags, n, positions, 0, False, local_size)
+        split_kernel(global_size, src_keys, src_values, _uint(n), flags,
+                     positions, dest_keys, dest_values,
+                     local_size=(local_size,))
+        src_keys, src_values = dest_keys, dest_values
+    if has_values:
+        return src_keys, src_values
+    return src_keys
+
+################################################################################
+# Internals
+################################################################################
+_kernels = kernelcache.KernelCache() # (generic function, argument types)
+
+def _kernel(ctx, generic_fn, *arg_types):
+    # compiles the generic function for the provided argument types in the
+    # provided context once
+    return _kernels.kernel(ctx, (generic_fn, arg_types), lambda:
+        kernelcache.build(ctx, backend,
+                          [generic_fn.compile(backend, *arg_types)]))
+
+def _builtins(*names):
+    # the types of the arguments the named builtins are passed as
+    types = [ ]
+    for name in names:
+        value = getattr(ocl, name)
+        if isinstance(value, clq.ConstantType):
+            types.append(value)
+        else:
+            types.append(value.cl_type)
+    return types
+
+def _local_memory(ctx, n, cl_dtype):
+    import clq.backends.opencl.pyocl as pyocl
+    return pyocl.LocalMemory.shaped(ctx, (n,), cl_dtype)
+
+def _local_size(local_size):
+    if local_size is None:
+        local_size = globals()['local_size']
+    if local_size < 1 or local_size & (local_size - 1):
+        raise clq.Error("The work-group size must be a power of two, not %d."
+                        % local_size)
+    return local_size
+
+def _flags(ctx, n):
+    return ctx.alloc(n, ocl.uint)
+
+def _count(flags, positions):
+    # the number of flagged elements, from the last flag and position
+    n = len(flags)
+    return int(flags.from_device()[n - 1] + positions.from_device()[n - 1])
+
+def _scalar(cl_dtype, value):
+    return cl_dtype.np_dtype.type(value)
+
+def _uint(value):
+    return _scalar(ocl.uint, value)
+
+def _ceil_div(n, d):
+    return (n + d - 1) // d
+
+def _round_up(n, d):
+    return _ceil_div(n, d) * d
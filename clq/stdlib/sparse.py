@@ -0,0 +1,500 @@
+"""Sparse matrix-vector products for the OpenCL backend.
+
+A :class:`cypy.np.DirectedAdjacencyMatrix` is converted to one of the
+representations below, using the layout given by its ``packed`` property,
+and uploaded once to a device with :class:`DeviceMatrix`, which then
+multiplies vectors by it, e.g. once per timestep of a simulation::
+
+    from clq.stdlib import sparse
+
+    matrix = sparse.DeviceMatrix(ctx, sparse.CSR.from_adjacency(cm))
+    y, event = matrix.multiply(x)
+
+The matrix has a one for each edge unless the values of the edges are
+provided. Row ``r`` lists the targets of the edges leaving ``r``, so to sum
+the inputs arriving at each neuron, e.g. to propagate spikes, the rows must
+list the sources of the incoming edges instead, as given by
+:meth:`CSR.transposed`::
+
+    incoming = sparse.DeviceMatrix(ctx, sparse.CSR.from_adjacency(cm,
+        weights).transposed())
+    event = incoming.propagate(spikes, inputs)
+
+The representations are:
+
+:class:`CSR`
+    The columns of each row are stored consecutively. Rows can be computed by
+    a work-item each (``"scalar"``) or by several, which read the columns
+    together (``"vector"``), which is faster for long rows.
+:class:`ELL`
+    Each row is padded to the length of the longest and the columns are
+    stored column-major, so that the reads of neighbouring work-items are
+    coalesced.
+:class:`SlicedELL`
+    As :class:`ELL`, but the rows are padded to the longest in each slice of
+    consecutive rows, which wastes less space when their lengths vary.
+"""
+import clq
+import clq.backends.opencl as ocl
+import clq.backends.opencl.kernelcache as kernelcache
+
+backend = ocl.Backend()
+"""The backend the kernels are compiled for."""
+
+local_size = 128
+"""The default number of work-items in each work-group."""
+
+lanes = 8
+"""The default number of work-items computing each row of the ``"vector"``
+variant of the CSR kernel. Must be a power of two dividing the work-group
+size."""
+
+slice_size = 32
+"""The default number of rows in each slice of a :class:`SlicedELL`
+matrix."""
+
+################################################################################
+# Representations
+################################################################################
+class CSR(object):
+    """A matrix in compressed sparse row format."""
+    def __init__(self, row_offsets, columns, values=None):
+        self.row_offsets = row_offsets
+        self.columns = columns
+        self.values = values
+
+    row_offsets = None
+    """An array of the offsets of the columns of each row in :attr:`columns`,
+    followed by the number of edges."""
+
+    columns = None
+    """An array of the columns of the edges of each row, in turn."""
+
+    values = None
+    """An array of the values of the edges, in the same order, or None if
+    they are all one."""
+
+    @property
+    def n_rows(self):
+        """The number of rows."""
+        return len(self.row_offsets) - 1
+
+    @property
+    def n_edges(self):
+        """The number of edges."""
+        return len(self.columns)
+
+    @property
+    def lengths(self):
+        """An array of the number of edges in each row."""
+        import numpy
+        return numpy.diff(self.row_offsets)
+
+    @classmethod
+    def from_packed(cls, packed, values=None):
+        """Returns the matrix in the layout produced by
+        :attr:`DirectedAdjacencyMatrix.packed
+        <cypy.np.DirectedAdjacencyMatrix.packed>`, with the provided values
+        for its edges, if any, in the same order."""
+        import numpy
+        n_rows = int(packed[0]) if len(packed) else 0
+        heads = packed[:n_rows].astype(numpy.intp)
+        lengths = packed[heads]
+        row_offsets = numpy.zeros(n_rows + 1, numpy.uint32)
+        numpy.cumsum(lengths, out=row_offsets[1:])
+        is_column = numpy.ones(len(packed), bool)
+        is_column[:n_rows] = False
+        is_column[heads] = False
+        columns = packed[is_column].astype(numpy.uint32)
+        return cls(row_offsets, columns, _values(values, len(columns)))
+
+    @classmethod
+    def from_adjacency(cls, matrix, values=None):
+        """Returns the :class:`cypy.np.DirectedAdjacencyMatrix`, with the
+        provided values for its edges, if any, in the order of its rows."""
+        return cls.from_packed(matrix.packed, values)
+
+    def transposed(self, n_columns=None):
+        """Returns the transpose of this matrix, whose rows list the rows of
+        this one with an edge to each column. ``n_columns`` defaults to the
+        number of rows, as in square matrices."""
+        import numpy
+        if n_columns is None:
+            n_columns = self.n_rows
+        rows = numpy.repeat(numpy.arange(self.n_rows, dtype=numpy.uint32),
+                            self.lengths)
+        # stable, so the rows stay in order within each column
+        order = numpy.argsort(self.columns, kind="mergesort")
+        counts = numpy.bincount(self.columns, minlength=n_columns)
+        row_offsets = numpy.zeros(n_columns + 1, numpy.uint32)
+        numpy.cumsum(counts, out=row_offsets[1:])
+        values = self.values
+        if values is not None:
+            values = values[order]
+        return CSR(row_offsets, rows[order], values)
+
+class ELL(object):
+    """A matrix in ELLPACK format."""
+    def __init__(self, columns, lengths, width, values=None):
+        self.columns = columns
+        self.lengths = lengths
+        self.width = width
+        self.values = values
+
+    columns = None
+    """An array of the ``j``-th column of row ``r`` at ``j * n_rows + r``,
+    for each row and each ``j`` up to the :attr:`width`."""
+
+    lengths = None
+    """An array of the number of edges in each row."""
+
+    width = None
+    """The number of edges in the longest row."""
+
+    values = None
+    """An array of the values of the edges, in the same layout as the
+    :attr:`columns`, or None if they are all one."""
+
+    @property
+    def n_rows(self):
+        """The number of rows."""
+        return len(self.lengths)
+
+    @classmethod
+    def from_csr(cls, csr):
+        """Returns the :class:`CSR` matrix in this format."""
+        import numpy
+        lengths = csr.lengths.astype(numpy.uint32)
+        width = int(lengths.max()) if len(lengths) else 0
+        rows, js = _positions(csr)
+        positions = js * csr.n_rows + rows
+        size = max(width * csr.n_rows, 1)
+        return cls(_scattered(numpy, csr.columns, positions, size), lengths,
+                   width, _scattered(numpy, csr.values, positions, size))
+
+class SlicedELL(object):
+    """A matrix in sliced ELLPACK format."""
+    def __init__(self, slice_offsets, columns, lengths, slice_size,
+                 values=None):
+        self.slice_offsets = slice_offsets
+        self.columns = columns
+        self.lengths = lengths
+        self.slice_size = slice_size
+        self.values = values
+
+    slice_offsets = None
+    """An array of the offsets of the columns of each slice in
+    :attr:`columns`."""
+
+    columns = None
+    """An array of the ``j``-th column of row ``r`` at
+    ``slice_offsets[r / slice_size] + j * slice_size + r % slice_size``,
+    for each row and each ``j`` up to the length of the longest row in its
+    slice."""
+
+    lengths = None
+    """An array of the number of edges in each row."""
+
+    slice_size = None
+    """The number of rows in each slice."""
+
+    values = None
+    """An array of the values of the edges, in the same layout as the
+    :attr:`columns`, or None if they are all one."""
+
+    @property
+    def n_rows(self):
+        """The number of rows."""
+        return len(self.lengths)
+
+    @classmethod
+    def from_csr(cls, csr, slice_size=None):
+        """Returns the :class:`CSR` matrix in this format, with slices of
+        :obj:`slice_size <clq.stdlib.sparse.slice_size>` rows by default."""
+        import numpy
+        if slice_size is None:
+            slice_size = globals()['slice_size']
+        n_rows = csr.n_rows
+        lengths = csr.lengths.astype(numpy.uint32)
+        n_slices = -(-n_rows // slice_size)
+        padded = numpy.zeros(n_slices * slice_size, numpy.uint32)
+        padded[:n_rows] = lengths
+        widths = padded.reshape(n_slices, slice_size).max(axis=1)
+        slice_offsets = numpy.zeros(n_slices + 1, numpy.uint32)
+        numpy.cumsum(widths * slice_size, out=slice_offsets[1:])
+        rows, js = _positions(csr)
+        positions = (slice_offsets[rows // slice_size] + js * slice_size +
+                     rows % slice_size)
+        size = max(int(slice_offsets[-1]), 1)
+        return cls(slice_offsets, _scattered(numpy, csr.columns, positions,
+                                             size),
+                   lengths, slice_size,
+                   _scattered(numpy, csr.values, positions, size))
+
+################################################################################
+# Kernels
+################################################################################
+@clq.fn
+def csr_scalar(row_offsets, columns, values, x, y, n_rows, has_values,
+               accumulate, get_global_id):
+    #"""Multiplies x by the CSR matrix, a work-item per row."""
+    row = get_global_id(0)
+    if row < n_rows:
+        total = 0
+        for i in (row_offsets[row], row_offsets[row + 1]):
+            if has_values:
+                total = total + values[i] * x[columns[i]]
+            else:
+                total = total + x[columns[i]]
+        if accumulate:
+            y[row] = y[row] + total
+        else:
+            y[row] = total
+
+@clq.fn
+def csr_vector(row_offsets, columns, values, x, y, n_rows, has_values,
+               accumulate, lanes, scratch, get_local_id, get_local_size,
+               get_group_id, barrier, CLK_LOCAL_MEM_FENCE):
+    #"""Multiplies x by the CSR matrix, lanes work-items per row, whose
+    #partial sums are reduced in local memory."""
+    lid = get_local_id(0)
+    lane = lid % lanes
+    row = (get_group_id(0) * get_local_size(0) + lid) / lanes
+    total = 0
+    if row < n_rows:
+        for i in (row_offsets[row] + lane, row_offsets[row + 1], lanes):
+            if has_values:
+                total = total + values[i] * x[columns[i]]
+            else:
+                total = total + x[columns[i]]
+    scratch[lid] = total
+    barrier(CLK_LOCAL_MEM_FENCE)
+    s = lanes / 2
+    while s > 0:
+        if lane < s:
+            scratch[lid] = scratch[lid] + scratch[lid + s]
+        barrier(CLK_LOCAL_MEM_FENCE)
+        s = s / 2
+    if lane == 0 and row < n_rows:
+        if accumulate:
+            y[row] = y[row] + scratch[lid]
+        else:
+            y[row] = scratch[lid]
+
+@clq.fn
+def ell_scalar(columns, values, lengths, x, y, n_rows, has_values,
+               accumulate, get_global_id):
+    #"""Multiplies x by the ELL matrix, a work-item per row."""
+    row = get_global_id(0)
+    if row < n_rows:
+        total = 0
+        for j in (0, lengths[row]):
+            i = j * n_rows + row
+            if has_values:
+                total = total + values[i] * x[columns[i]]
+            else:
+                total = total + x[columns[i]]
+        if accumulate:
+            y[row] = y[row] + total
+        else:
+            y[row] = total
+
+@clq.fn
+def sliced_ell_scalar(slice_offsets, columns, values, lengths, x, y, n_rows,
+                      has_values, accumulate, slice_size, get_global_id):
+    #"""Multiplies x by the sliced ELL matrix, a work-item per row."""
+    row = get_global_id(0)
+    if row < n_rows:
+        base = slice_offsets[row / slice_size] + row % slice_size
+        total = 0
+        for j in (0, lengths[row]):
+            i = base + j * slice_size
+            if has_values:
+                total = total + values[i] * x[columns[i]]
+            else:
+                total = total + x[columns[i]]
+        if accumulate:
+            y[row] = y[row] + total
+        else:
+            y[row] = total
+
+################################################################################
+# Host Helper
+################################################################################
+class DeviceMatrix(object):
+    """A sparse matrix copied to a device once, which vectors on the device
+    can then be multiplied by any number of times.
+
+    ``matrix`` is a :class:`CSR`, :class:`ELL` or :class:`SlicedELL` matrix,
+    or a :class:`cypy.np.DirectedAdjacencyMatrix`, which is converted to a
+    :class:`CSR` one. ``variant`` is ``"scalar"`` or, for :class:`CSR`
+    matrices, ``"vector"`` (see :mod:`clq.stdlib.sparse`).
+    """
+    def __init__(self, ctx, matrix, variant="scalar", lanes=None,
+                 local_size=None):
+        if not isinstance(matrix, (CSR, ELL, SlicedELL)):
+            matrix = CSR.from_adjacency(matrix)
+        if variant not in ("scalar", "vector"):
+            raise clq.Error("Unknown variant: %r." % (variant,))
+        if variant == "vector" and not isinstance(matrix, CSR):
+            raise clq.Error("Only CSR matrices have a vector variant.")
+        if local_size is None:
+            local_size = globals()['local_size']
+        if lanes is None:
+            lanes = globals()['lanes']
+        if variant == "vector" and (lanes & (lanes - 1) or local_size % lanes):
+            raise clq.Error("The number of lanes must be a power of two "
+                            "dividing the work-group size, not %d." % lanes)
+        self.ctx = ctx
+        self.matrix = matrix
+        self.variant = variant
+        self.lanes = lanes
+        self.local_size = local_size
+        self.n_rows = matrix.n_rows
+
+        if isinstance(matrix, CSR):
+            arrays = (matrix.row_offsets, matrix.columns)
+        elif isinstance(matrix, ELL):
+            arrays = (matrix.columns,)
+        else:
+            arrays = (matrix.slice_offsets, matrix.columns)
+        self.buffers = [ctx.to_device(array) for array in arrays]
+        if matrix.values is None:
+            self.values = None
+        else:
+            self.values = ctx.to_device(matrix.values)
+        if not isinstance(matrix, CSR):
+            self.lengths = ctx.to_device(matrix.lengths)
+
+    ctx = None
+    """The :class:`pyocl.Context <clq.backends.opencl.pyocl.Context>` the
+    matrix was copied to."""
+
+    matrix = None
+    """The matrix on the host."""
+
+    variant = None
+    """Whether each row is computed by a work-item (``"scalar"``) or several
+    (``"vector"``)."""
+
+    buffers = None
+    """A list of the buffers holding the structure of the matrix: its
+    :attr:`row offsets <CSR.row_offsets>` or :attr:`slice offsets
+    <SlicedELL.slice_offsets>`, if it has any, and its columns."""
+
+    values = None
+    """The buffer holding the values of the edges, or None."""
+
+    lengths = None
+    """The buffer holding the lengths of the rows of ELL and sliced ELL
+    matrices."""
+
+    def multiply(self, x, y=None, accumulate=False, wait_for=None):
+        """Stores the product of the matrix and the vector in the buffer
+        ``x`` in ``y``, or a new buffer of floats if it isn't provided, or
+        adds it to ``y`` if ``accumulate`` is True. Returns ``y`` and the
+        event for the kernel."""
+        if y is None:
+            y = self.ctx.alloc(self.n_rows, ocl.float)
+        has_values = self.values is not None
+        # never read when there are no values
+        values = self.values if has_values else x
+        kernel = self._kernel(x, y, values, has_values, accumulate)
+        matrix = self.matrix
+        n_rows = ocl.uint.np_dtype.type(self.n_rows)
+        if isinstance(matrix, CSR):
+            args = self.buffers + [values, x, y, n_rows]
+        else:
+            args = self.buffers + [values, self.lengths, x, y, n_rows]
+        kwargs = { }
+        if wait_for:
+            kwargs['wait_for'] = wait_for
+        local_size = self.local_size
+        if self.variant == "vector":
+            import clq.backends.opencl.pyocl as pyocl
+            args.append(pyocl.LocalMemory.shaped(self.ctx, (local_size,),
+                                                 y.cl_dtype))
+            global_size = _round_up(self.n_rows * self.lanes, local_size)
+        else:
+            global_size = _round_up(self.n_rows, local_size)
+        event = kernel((global_size,), *args, local_size=(local_size,),
+                       **kwargs)
+        return y, event
+
+    def propagate(self, spikes, inputs, wait_for=None):
+        """Adds the product of the matrix and the buffer of spikes, e.g. a
+        flag or a weight for each neuron which fired, to the buffer of
+        inputs. Returns the event for the kernel."""
+        return self.multiply(spikes, inputs, True, wait_for)[1]
+
+    def _kernel(self, x, y, values, has_values, accumulate):
+        matrix = self.matrix
+        flags = (clq.const(has_values), clq.const(accumulate))
+        vectors = (values.cl_type, x.cl_type, y.cl_type)
+        structure = tuple(buffer.cl_type for buffer in self.buffers)
+        if isinstance(matrix, CSR):
+            if self.variant == "scalar":
+                generic_fn = csr_scalar
+                arg_types = (structure + vectors + (ocl.uint,) + flags +
+                             (ocl.get_global_id.cl_type,))
+            else:
+                generic_fn = csr_vector
+                arg_types = (structure + vectors + (ocl.uint,) + flags +
+                             (clq.const(self.lanes), y.cl_dtype.ptr_shared,
+                              ocl.get_local_id.cl_type,
+                              ocl.get_local_size.cl_type,
+                              ocl.get_group_id.cl_type, ocl.barrier.cl_type,
+                              ocl.CLK_LOCAL_MEM_FENCE))
+        elif isinstance(matrix, ELL):
+            generic_fn = ell_scalar
+            arg_types = (structure + (values.cl_type, self.lengths.cl_type,
+                                      x.cl_type, y.cl_type, ocl.uint) +
+                         flags + (ocl.get_global_id.cl_type,))
+        else:
+            generic_fn = sliced_ell_scalar
+            arg_types = (structure + (values.cl_type, self.lengths.cl_type,
+                                      x.cl_type, y.cl_type, ocl.uint) +
+                         flags + (clq.const(matrix.slice_size),
+                                  ocl.get_global_id.cl_type))
+        return _kernel(self.ctx, generic_fn, arg_types)
+
+################################################################################
+# Internals
+################################################################################
+_kernels = kernelcache.KernelCache() # (generic function, argument types)
+
+def _kernel(ctx, generic_fn, arg_types):
+    return _kernels.kernel(ctx, (generic_fn, arg_types), lambda:
+        kernelcache.build(ctx, backend,
+                          [generic_fn.compile(backend, *arg_types)]))
+
+def _values(values, n_edges):
+    if values is None:
+        return None
+    import numpy
+    values = numpy.asarray(values, dtype=numpy.float32)
+    if len(values) != n_edges:
+        raise clq.Error("Expected %d values, not %d." % (n_edges,
+                                                          len(values)))
+    return values
+
+def _positions(csr):
+    # the row of each edge and its index within the row
+    import numpy
+    lengths = csr.lengths
+    rows = numpy.repeat(numpy.arange(csr.n_rows, dtype=numpy.int64), lengths)
+    js = (numpy.arange(csr.n_edges, dtype=numpy.int64) -
+          numpy.repeat(csr.row_offsets[:-1].astype(numpy.int64), lengths))
+    return rows, js
+
+def _scattered(numpy, values, positions, size):
+    # an array of the provided size with the values at the positions and
+    # zeros elsewhere
+    if values is None:
+        return None
+    scattered = numpy.zeros(size, values.dtype)
+    scattered[positions] = values
+    return scattered
+
+def _round_up(n, d):
+    return -(-n // d) * d
@@ -11,6 +11,7 @@ import inspect as _inspect
 import functools as _functools
 import math as _math
 import re as _re
+import weakref as _weakref
 
 ##############################################################################
 ## Error Handling
@@ -555,9 +556,18 @@ def prepend(list, item):
     list.insert(0, item)
     
 def extend_front(list, items):
-    """Adds the provided items to the front of the list."""
-    for item in reversed(items):
-        prepend(list, item)
+    """Adds the provided items to the front of the list.
+    
+    Uses the list's own extend_front method if it has one (see 
+    :class:`IndexedSetList`.)
+    """
+    try:
+        extend_front = list.extend_front
+    except AttributeError:
+        for item in reversed(items):
+            prepend(list, item)
+    else:
+        extend_front(items)
         
 ##############################################################################
 ## Numbers
@@ -1421,11 +1431,136 @@ def is_senior_subclass(obj, cls, testcls):
             if issubclass(base, testcls):
                 return False
             
+class InternPool(object):
+    """The pool of instances of an :func:`interned <intern>` class.
+    
+    Every instance is held weakly, so it stays in the pool (and interning 
+    continues to produce it) for exactly as long as it is alive. In addition,
+    the ``max_size`` most recently used instances are held strongly, so they 
+    survive even if not referenced elsewhere. If ``max_size`` is None, every 
+    instance is held strongly, so the pool grows without bound.
+    
+    Instances which do not support weak references are always held strongly.
+    
+        >>> pool = InternPool(max_size=1)
+        >>> class Obj(object): pass
+        >>> a, b = Obj(), Obj()
+        >>> pool.add(1, a); pool.add(2, b)
+        >>> del a, b
+        >>> pool.get(1)
+        Traceback (most recent call last):
+          ...
+        KeyError: 1
+        >>> pool.get(2) # doctest: +ELLIPSIS
+        <...Obj object at ...>
+        >>> sorted(pool.stats.items())
+        [('hits', 1), ('live', 1), ('misses', 1), ('retained', 1)]
+    
+    """
+    def __init__(self, max_size=None):
+        self._objects = _weakref.WeakValueDictionary()
+        self._strong = { }
+        self._recent = OrderedDict()
+        self._max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        
+    hits = None
+    """The number of look-ups which found a live instance."""
+    
+    misses = None
+    """The number of look-ups which did not find a live instance."""
+    
+    @property
+    def max_size(self):
+        """The number of recently used instances held strongly, or None if 
+        every instance is held strongly. 
+        
+        Setting this releases the least recently used instances as needed.
+        """
+        return self._max_size
+    
+    @max_size.setter
+    def max_size(self, value): #@DuplicatedSignature
+        self._max_size = value
+        self._trim()
+    
+    @property
+    def live(self):
+        """The number of live instances in the pool."""
+        return len(self._objects) + len(self._strong)
+    
+    @property
+    def retained(self):
+        """The number of instances held strongly by the pool."""
+        if self._max_size is None:
+            return self.live
+        return len(self._recent) + len(self._strong)
+    
+    @property
+    def stats(self):
+        """A dict containing the hits, misses, live and retained counts."""
+        return {'hits': self.hits, 'misses': self.misses, 
+                'live': self.live, 'retained': self.retained}
+    
+    def get(self, key):
+        """Returns the live instance with the provided key, or raises 
+        KeyError."""
+        try:
+            obj = self._objects[key]
+        except KeyError:
+            try:
+                obj = self._strong[key]
+            except KeyError:
+                self.misses += 1
+                raise
+        else:
+            self._touch(key, obj)
+        self.hits += 1
+        return obj
+    
+    def add(self, key, obj):
+        """Adds an instance with the provided key to the pool."""
+        try:
+            self._objects[key] = obj
+        except TypeError:
+            # doesn't support weak references
+            self._strong[key] = obj
+        else:
+            self._touch(key, obj)
+            
+    def clear(self):
+        """Removes every instance from the pool. 
+        
+        Instances which are still alive will no longer be produced by 
+        interning, so use this with care."""
+        self._objects.clear()
+        self._strong.clear()
+        self._recent.clear()
+            
+    def _touch(self, key, obj):
+        if self._max_size is None:
+            self._recent[key] = obj
+        elif self._max_size > 0:
+            recent = self._recent
+            try:
+                del recent[key]
+            except KeyError: pass
+            recent[key] = obj
+            self._trim()
+        
+    def _trim(self):
+        max_size = self._max_size
+        if max_size is None: return
+        recent = self._recent
+        while len(recent) > max_size:
+            del recent[next(iter(recent))]
+
 class intern(object):  
     # a class just so the name mangling mechanisms are invoked, deleted below
     
     @staticmethod
-    def intern(cls_):
+    def intern(cls_=None, max_size=None):
         """Transforms the provided class into an interned class.
         
         That is, initializing the class multiple times with the same arguments 
@@ -1471,6 +1606,33 @@ class intern(object):
                   to automate adding metadata as above, though you should 
                   probably just do that with a function.
 
+        Instances are kept in an :class:`InternPool`, available via 
+        :func:`intern_pool`. By default, the pool keeps every instance alive 
+        forever. Provide max_size to keep only that many of the most recently 
+        used instances alive; the others remain interned only as long as they 
+        are referenced elsewhere. Either way, interning produces the same 
+        object for as long as that object is alive.
+        
+            >>> class M(object):
+            ...     def __init__(self, m):
+            ...         self.m = m
+            >>> M = intern(M, max_size=0)
+            >>> intern_pool(M).live
+            0
+            >>> m = M(1)
+            >>> M(1) is m
+            True
+            >>> intern_pool(M).live
+            1
+            >>> del m
+            >>> intern_pool(M).live
+            0
+            
+        With only keyword arguments, a decorator is returned:
+        
+            >>> @intern(max_size=16)
+            ... class Bounded(object): pass
+        
         .. Note:: You can override the hash function used by providing a value
                   for __init__._intern__hash_function. This should take None
                   as the first argument (substituting for self) and then *args
@@ -1482,7 +1644,9 @@ class intern(object):
                   doesn't work.
         
         """
-        cls_.__pool = { }
+        if cls_ is None:
+            return lambda cls_: intern(cls_, max_size)
+        cls_.__pool = InternPool(max_size)
         
         __init__ = cls_.__init__
         try:
@@ -1511,7 +1675,7 @@ class intern(object):
             try:
                 # look-up object
                 hash = hash_function(None, *args, **kwargs)  # none because self is not created yet
-                obj = cls_.__pool[hash]
+                obj = cls_.__pool.get(hash)
             except (TypeError, KeyError) as e:
                 # if arguments not hashable or object not found, need to 
                 # make a new object
@@ -1521,15 +1685,16 @@ class intern(object):
                 if orig_new is _NotDefined: del cls_.__new__
                 else: cls_.__new__ = orig_new
                 
-                # create new object
-                obj = cls(*args, **kwargs)
+                try:
+                    # create new object
+                    obj = cls(*args, **kwargs)
+                finally:
+                    # re-override __new__, even if __init__ raised
+                    cls_.__new__ = __static_new__
                 
                 # put it in ze pool
                 if isinstance(e, KeyError):
-                    cls_.__pool[hash] = obj
-                
-                # re-override __new__
-                cls_.__new__ = __static_new__
+                    cls_.__pool.add(hash, obj)
                                 
             # Return the instance but don't call __init__ since it was done 
             # when it was created the first time, see below for how this is 
@@ -1552,6 +1717,12 @@ class intern(object):
         cls_.__static_new__ = __static_new__
         cls_.__new__ = __static_new__
         return cls_
+    
+    @staticmethod
+    def intern_pool(cls):
+        """Returns the :class:`InternPool` of the provided interned class."""
+        return cls.__pool
+intern_pool = intern.intern_pool
 intern = intern.intern
 def _dummy_init(self, *args, **kwargs): #@UnusedVariable
     """Prevents __init__ from being called if returning a obj copy."""
@@ -1827,6 +1998,145 @@ class SetList(list):
         if x not in self:
             super(SetList, self).insert(i, x)
         
+class IndexedSetList(object):
+    """Like :class:`SetList`, a sequence where each element appears only once,
+    in the position it was originally inserted, but with a hash index so 
+    membership tests, appends and extensions at the front take constant time
+    per element. Elements must be hashable.
+    
+        >>> s = IndexedSetList([2, 3])
+        >>> s.append(3)
+        >>> s.extend_front([1, 2, 0])
+        >>> s.append(4)
+        >>> s
+        IndexedSetList([1, 0, 2, 3, 4])
+        >>> 0 in s, s[1], s[-1], len(s)
+        (True, 0, 4, 5)
+    
+    Insertion anywhere other than either end, and deletion, rebuild the 
+    sequence, so take linear time.
+    """
+    def __init__(self, iterable=()):
+        # the front is stored reversed, so both ends can be appended to
+        self._front = [ ]
+        self._back = [ ]
+        self._index = set()
+        self.extend(iterable)
+        
+    def __len__(self):
+        return len(self._index)
+    
+    def __contains__(self, x):
+        return x in self._index
+    
+    def __iter__(self):
+        for item in reversed(self._front):
+            yield item
+        for item in self._back:
+            yield item
+            
+    def __reversed__(self):
+        for item in reversed(self._back):
+            yield item
+        for item in self._front:
+            yield item
+            
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return list(self)[i]
+        front = self._front
+        n_front = len(front)
+        if i < 0:
+            i += len(self)
+            if i < 0:
+                raise IndexError("IndexedSetList index out of range")
+        if i < n_front:
+            return front[n_front - 1 - i]
+        return self._back[i - n_front]
+    
+    def __delitem__(self, i):
+        items = list(self)
+        del items[i]
+        self._rebuild(items)
+        
+    def __eq__(self, other):
+        if isinstance(other, IndexedSetList):
+            return list(self) == list(other)
+        elif isinstance(other, list):
+            return list(self) == other
+        return NotImplemented
+    
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        if eq is NotImplemented:
+            return eq
+        return not eq
+    
+    __hash__ = None
+    
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, list(self))
+        
+    def _rebuild(self, items):
+        self._front = [ ]
+        self._back = items
+        self._index = set(items)
+    
+    def append(self, x):
+        index = self._index
+        if x not in index:
+            index.add(x)
+            self._back.append(x)
+        
+    def extend(self, L):
+        index = self._index
+        back = self._back
+        for x in L:
+            if x not in index:
+                index.add(x)
+                back.append(x)
+                
+    def prepend(self, x):
+        """Inserts x at the front, if it is not already present."""
+        index = self._index
+        if x not in index:
+            index.add(x)
+            self._front.append(x)
+    
+    def extend_front(self, L):
+        """Inserts the elements of L which are not already present at the 
+        front, in order. Equivalent to :func:`extend_front` on a SetList."""
+        index = self._index
+        front = self._front
+        for x in reversed(L):
+            if x not in index:
+                index.add(x)
+                front.append(x)
+            
+    def insert(self, i, x):
+        if x in self._index:
+            return
+        if i == 0:
+            self.prepend(x)
+        elif i >= len(self):
+            self.append(x)
+        else:
+            items = list(self)
+            items.insert(i, x)
+            self._rebuild(items)
+            
+    def remove(self, x):
+        if x not in self._index:
+            raise ValueError("IndexedSetList.remove(x): x not in list")
+        self._rebuild([item for item in self if item != x])
+        
+    def index(self, x):
+        if x in self._index:
+            for i, item in enumerate(self):
+                if item == x:
+                    return i
+        raise ValueError("%r is not in list" % (x,))
+    
 class stack_lookup(object):
     """Looks up keys from a stack of dictionaries.
     
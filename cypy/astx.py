@@ -120,6 +120,7 @@ integer_binary_operators = cypy.make_symmetric({
     _ast.LShift: '<<',
     _ast.RShift: '>>',
     _ast.BitOr: '|',
+    _ast.BitAnd: '&',
     _ast.BitXor: '^',
     _ast.Mod: '%'
 })
@@ -108,5 +108,5 @@ if __name__ == "__main__":
     cm.connect_randomly(pei, rangee, rangei)
     cm.connect_randomly(pie, rangei, rangee)
     cm.connect_randomly(pii, rangei, rangei)
-    packed_cm = cm.packed()
+    packed_cm = cm.packed
     print packed_cm
@@ -0,0 +1,67 @@
+'''Measures memory use across many repeated compilations of the same generic
+function.
+
+Each iteration produces a new concrete function (the intern pools are set to
+retain nothing), so any state that outlives a compilation shows up as a
+steadily growing object count. Both the object count and the peak resident
+set size should stay flat.
+
+Usage: python bench_compile_memory.py [n_compiles]
+'''
+import gc
+import sys
+import time
+import resource
+
+import cypy
+import clq
+import clq.backends.opencl as ocl
+
+OpenCL = ocl.Backend()
+
+@clq.fn
+def saxpy(a, x, y, dest, get_global_id):
+    gid = get_global_id(0)
+    s = 0.0
+    for i in (0, 4):
+        s = s + x[gid] * a
+    if gid > 2:
+        s = s - 1
+    dest[gid] = s + y[gid]
+    return s
+
+arg_types = (ocl.float, ocl.float.ptr_global, ocl.float.ptr_global,
+             ocl.float.ptr_global, ocl.get_global_id.cl_type)
+
+def maxrss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def main(n_compiles=10000, report_every=1000):
+    for cls in (clq.ConcreteFn, clq.ConcreteFnType):
+        cypy.intern_pool(cls).max_size = 0
+
+    print "%8s %10s %12s %10s" % ("compiles", "objects", "maxrss (kB)",
+                                  "time (s)")
+    start = time.time()
+    for i in xrange(1, n_compiles + 1):
+        concrete_fn = saxpy.compile(OpenCL, *arg_types)
+        concrete_fn.program_item
+        del concrete_fn
+
+        # the backend accumulates every program item it is given, since they
+        # make up the program being built; that is not what is measured here
+        del OpenCL.program_items[:]
+
+        # compiled functions refer to themselves through their typed syntax
+        # tree, so they are only released by the cycle collector
+        gc.collect()
+
+        if i % report_every == 0:
+            print "%8d %10d %12d %10.2f" % (i, len(gc.get_objects()),
+                                            maxrss_kb(), time.time() - start)
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
@@ -0,0 +1,59 @@
+'''Measures the host overhead of launching a small kernel by calling it, with
+an argument binder and by calling the generic function it was compiled from.
+
+The kernel scales a buffer of 64 floats, so its launches take far less time
+on the device than on the host. Each method launches it a number of times
+without waiting, and the time per launch is reported, then the launches are
+waited for before the next method.
+
+Usage: python bench_launch.py [n_launches]
+'''
+import sys
+import time
+
+import numpy
+
+import clq
+import clq.backends.opencl as ocl
+import clq.backends.opencl.pyocl as pyocl
+
+OpenCL = ocl.Backend()
+
+@clq.fn
+def scale(a, n, x, get_global_id):
+    gid = get_global_id(0)
+    if gid < n:
+        a[gid] = a[gid] * x
+
+arg_types = (ocl.float.ptr_global, ocl.uint, ocl.float,
+             ocl.get_global_id.cl_type)
+
+def main(n_launches=100000):
+    ctx = pyocl.Context.get_somehow()
+    concrete_fn = scale.compile(OpenCL, *arg_types)
+    program = clq.Module(OpenCL, [concrete_fn]).compile(ctx)
+    kernel = getattr(program, concrete_fn.name)
+    a = ctx.to_device(numpy.ones(64, numpy.float32))
+    n, x = numpy.uint32(64), numpy.float32(1.0)
+
+    launch = kernel.binder(concrete_fn.arg_types)
+    methods = [
+        ("__call__, python scalars", lambda: kernel((64,), a, 64, 1.0)),
+        ("__call__, numpy scalars", lambda: kernel((64,), a, n, x)),
+        ("binder, python scalars", lambda: launch((64,), a, 64, 1.0)),
+        ("binder, numpy scalars", lambda: launch((64,), a, n, x)),
+        ("generic function", lambda: scale(a, n, x, ocl.get_global_id)),
+    ]
+    print "%26s %14s %16s" % ("method", "us/launch", "launches/s")
+    for name, method in methods:
+        method().wait()
+        start = time.time()
+        for i in xrange(n_launches):
+            event = method()
+        elapsed = time.time() - start
+        event.wait()
+        print "%26s %14.2f %16.0f" % (name, elapsed / n_launches * 1e6,
+                                      n_launches / elapsed)
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
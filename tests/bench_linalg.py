@@ -0,0 +1,64 @@
+'''Measures the tiled matrix multiplication in clq.stdlib.linalg against
+numpy.dot.
+
+The configurations which fit the device are first tried with
+linalg.autotune, and the fastest is then used to multiply square matrices of
+a few sizes. Each product is checked against numpy.dot before being timed.
+The times don't include copying the matrices to and from the device.
+
+Usage: python bench_linalg.py [n_repeats]
+'''
+import sys
+import time
+
+import numpy
+
+import clq
+import clq.backends.opencl as ocl
+import clq.backends.opencl.pyocl as pyocl
+from clq.stdlib import linalg
+
+sizes = (256, 512, 1024, 2048)
+
+def gflops(n, elapsed):
+    return 2.0 * n ** 3 / elapsed / 1e9
+
+def main(n_repeats=5):
+    ctx = pyocl.Context.get_somehow()
+    print "%-20s %12s %10s" % ("configuration", "time (ms)", "GFLOPS")
+    for config, elapsed in linalg.autotune(ctx):
+        print "%-20r %12.3f %10.2f" % (config, elapsed * 1000,
+                                       gflops(1024, elapsed))
+    config = linalg.config_for(ctx.device)
+    print
+    print "%6s %12s %12s %10s %10s" % ("size", "device (ms)", "numpy (ms)",
+                                       "GFLOPS", "speedup")
+    for n in sizes:
+        a = numpy.random.rand(n, n).astype(numpy.float32)
+        b = numpy.random.rand(n, n).astype(numpy.float32)
+        expected = numpy.dot(a, b)
+        if not numpy.allclose(linalg.dot(ctx, a, b, config), expected,
+                              rtol=1e-4, atol=1e-3 * n):
+            raise clq.Error("The product of size %d is incorrect." % n)
+
+        a_buffer, b_buffer = ctx.to_device(a), ctx.to_device(b)
+        c = ctx.alloc((n, n), ocl.float)
+        start = time.time()
+        for i in xrange(n_repeats):
+            event = linalg.gemm(a_buffer, b_buffer, c, config)[1]
+        event.wait()
+        device_time = (time.time() - start) / n_repeats
+
+        start = time.time()
+        for i in xrange(n_repeats):
+            numpy.dot(a, b)
+        numpy_time = (time.time() - start) / n_repeats
+        print "%6d %12.3f %12.3f %10.2f %10.2f" % (
+            n, device_time * 1000, numpy_time * 1000,
+            gflops(n, device_time), numpy_time / device_time)
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
@@ -0,0 +1,57 @@
+'''Measures how the time to compile scales with the number of assignments to
+the same variables and the number of return statements.
+
+Both produce chains of multiple assignments, so the time per assignment
+should stay roughly constant as the functions get longer, and long functions
+must not exceed the recursion limit.
+
+Usage: python bench_multiple_assignment.py [max_n_assignments]
+'''
+import sys
+import time
+
+import clq
+import clq.backends.opencl as ocl
+
+OpenCL = ocl.Backend()
+
+def reassignments_src(n):
+    lines = ["def reassign(x, n):", "    s = 0", "    t = 0"]
+    for i in xrange(n):
+        lines.append("    if n > %d:" % i)
+        lines.append("        s = s + t * x")
+        lines.append("        t = s - %d" % i)
+    lines.append("    return s")
+    return "\n".join(lines)
+
+def returns_src(n):
+    lines = ["def returns(x, n):"]
+    for i in xrange(n):
+        lines.append("    if n == %d:" % i)
+        lines.append("        return x + %d" % i)
+    lines.append("    return x")
+    return "\n".join(lines)
+
+def compile_time(src, *arg_types):
+    generic_fn = clq.fn.from_source(src)
+    start = time.time()
+    generic_fn.compile(OpenCL, *arg_types).program_item
+    return time.time() - start
+
+def main(max_n=4000):
+    print "%8s %14s %14s %14s %14s" % ("n", "reassign (s)", "per n (us)",
+                                       "returns (s)", "per n (us)")
+    n = 250
+    while n <= max_n:
+        t_reassign = compile_time(reassignments_src(n), ocl.float, ocl.int)
+        t_returns = compile_time(returns_src(n), ocl.float, ocl.int)
+        print "%8d %14.3f %14.1f %14.3f %14.1f" % (
+            n, t_reassign, 1e6 * t_reassign / n,
+            t_returns, 1e6 * t_returns / n)
+        n *= 2
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
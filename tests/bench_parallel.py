@@ -0,0 +1,96 @@
+'''Measures the parallel primitives in clq.stdlib.parallel against their numpy
+equivalents.
+
+Each primitive is applied to buffers of random values of a few sizes and
+checked against numpy before being timed. The times include waiting for the
+results to be read back, but not copying the inputs to the device or
+compiling the kernels, which happens in the checking run.
+
+Usage: python bench_parallel.py [n_repeats]
+'''
+import sys
+import time
+
+import numpy
+
+import clq
+import clq.stdlib as stdlib
+import clq.backends.opencl.pyocl as pyocl
+from clq.stdlib import parallel
+
+positive = clq.fn.from_source('''
+def positive(x):
+    return x > 0
+''')
+
+sizes = (1 << 10, 1 << 16, 1 << 20, 1 << 22)
+
+def primitives(ctx, n):
+    # (name, device function, numpy function, check) for inputs of size n
+    values = numpy.random.uniform(-1, 1, n).astype(numpy.float32)
+    ints = numpy.random.randint(0, 100, n).astype(numpy.int32)
+    keys = numpy.random.randint(0, 1 << 31, n).astype(numpy.uint32)
+    n_segments = max(n // 1000, 1)
+    offsets = numpy.sort(numpy.random.randint(0, n, n_segments + 1))
+    offsets[0], offsets[-1] = 0, n
+    offsets = offsets.astype(numpy.uint32)
+
+    values_buffer = ctx.to_device(values)
+    ints_buffer = ctx.to_device(ints)
+    keys_buffer = ctx.to_device(keys)
+    offsets_buffer = ctx.to_device(offsets)
+    return [
+        ("sum", lambda: parallel.reduce(stdlib.plus, ints_buffer),
+         lambda: ints.sum(),
+         lambda result, expected: result == expected),
+        ("cumsum", lambda: parallel.scan(stdlib.plus, ints_buffer, 0,
+                                         True).from_device(),
+         lambda: numpy.cumsum(ints),
+         numpy.array_equal),
+        ("compact", lambda: _compacted(parallel.compact(positive,
+                                                        values_buffer)),
+         lambda: values[values > 0],
+         numpy.array_equal),
+        ("reduceat", lambda: parallel.reduce_segments(
+            stdlib.plus, ints_buffer, offsets_buffer, 0).from_device(),
+         lambda: _reduceat(ints, offsets),
+         numpy.array_equal),
+        ("sort", lambda: parallel.radix_sort(keys_buffer).from_device(),
+         lambda: numpy.sort(keys),
+         numpy.array_equal),
+    ]
+
+def _compacted((buffer, count)):
+    return buffer.from_device()[:count]
+
+def _reduceat(values, offsets):
+    # numpy.add.reduceat gives the element at the offset for empty segments
+    sums = numpy.add.reduceat(values, offsets[:-1])
+    sums[offsets[:-1] == offsets[1:]] = 0
+    return sums
+
+def timed(fn, n_repeats):
+    start = time.time()
+    for i in xrange(n_repeats):
+        fn()
+    return (time.time() - start) / n_repeats
+
+def main(n_repeats=10):
+    ctx = pyocl.Context.get_somehow()
+    print "%10s %10s %12s %12s %8s" % ("primitive", "size", "device (ms)",
+                                       "numpy (ms)", "speedup")
+    for n in sizes:
+        for name, device_fn, numpy_fn, check in primitives(ctx, n):
+            if not check(device_fn(), numpy_fn()):
+                raise clq.Error("%s of %d elements is incorrect." % (name, n))
+            device_time = timed(device_fn, n_repeats)
+            numpy_time = timed(numpy_fn, n_repeats)
+            print "%10s %10d %12.3f %12.3f %8.2f" % (
+                name, n, device_time * 1000, numpy_time * 1000,
+                numpy_time / device_time)
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
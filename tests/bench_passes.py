@@ -0,0 +1,99 @@
+'''Measures the effect of each optimization pass on compile time and on the
+size of the generated code.
+
+A few kernels are compiled with all of the default passes enabled, with each
+one disabled in turn and with none of them. New generic functions are parsed
+for each compilation, so nothing is reused from an earlier one. The size of
+the code is given as the number of operators and calls in it, which is what
+the passes try to reduce, and the number of statements.
+
+No device is needed, so the effect on run time is not measured.
+
+Usage: python bench_passes.py [n_compiles]
+'''
+import re
+import sys
+import time
+
+import clq
+import clq.passes
+import clq.stdlib
+import clq.backends.opencl as ocl
+
+OpenCL = ocl.Backend()
+
+gid_t = ocl.get_global_id.cl_type
+
+kernels = [
+    ('''
+def saxpy(a, x, y, dest, get_global_id):
+    gid = get_global_id(0)
+    s = 0.0
+    for i in (0, 4):
+        s = s + x[gid] * a
+    dest[gid] = s + y[gid]
+''', (ocl.float, ocl.float.ptr_global, ocl.float.ptr_global,
+      ocl.float.ptr_global, gid_t)),
+    ('''
+def rows(a, out, n, get_global_id, plus, mul):
+    s = 0.0
+    for i in (0, n):
+        x = a[get_global_id(0) * n + i]
+        s = plus(s, mul(x, a[get_global_id(0) * n + i]))
+    out[get_global_id(0)] = s
+''', (ocl.float.ptr_global, ocl.float.ptr_global, ocl.int, gid_t,
+      clq.stdlib.plus.cl_type, clq.stdlib.mul.cl_type)),
+    ('''
+def noise(a, state, randf, get_global_id):
+    gid = get_global_id(0)
+    a[gid] = a[gid] * a[gid] + randf(state, get_global_id)
+''', (ocl.float.ptr_global, ocl.int.ptr_global,
+      clq.stdlib.simple_randf.cl_type, gid_t)),
+]
+
+_operations = re.compile(r"[-+*/%<>]|\w+\(")
+
+def compile_all(n_compiles):
+    operations = statements = 0
+    start = time.time()
+    for _ in xrange(n_compiles):
+        for src, arg_types in kernels:
+            concrete_fn = clq.fn.from_source(src).compile(OpenCL, *arg_types)
+            for item in concrete_fn.program_items:
+                body = item.code.split("{", 1)[1]
+                operations += len(_operations.findall(body))
+                statements += body.count(";")
+            del OpenCL.program_items[:]
+    return (time.time() - start, operations / n_compiles, 
+            statements / n_compiles)
+
+def main(n_compiles=200):
+    manager = clq.passes.manager
+    names = [pass_type.name for pass_type in manager.passes]
+    configurations = [("all", set())]
+    configurations.extend(("-" + name, set([name])) for name in names)
+    configurations.append(("none", set(names)))
+
+    print "%-34s %10s %10s %10s" % ("passes", "time (s)", "operations",
+                                    "statements")
+    for label, disabled in configurations:
+        manager.disabled = disabled
+        try:
+            elapsed, operations, statements = compile_all(n_compiles)
+        finally:
+            manager.disabled = set()
+        print "%-34s %10.3f %10d %10d" % (label, elapsed, operations, 
+                                          statements)
+
+    print
+    print "%-34s %10s %10s" % ("pass", "runs", "time (s)")
+    for name in names:
+        stats = manager.stats.get(name)
+        if stats is not None:
+            print "%-34s %10d %10.3f" % (name, stats.calls, stats.time)
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
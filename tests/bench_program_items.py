@@ -0,0 +1,56 @@
+'''Compares cypy.SetList and cypy.IndexedSetList for collecting the program
+items of a graph of helper functions.
+
+Each of the helpers calls the previous one and up to two other earlier ones,
+so the last helper needs all of the others. Its program items are
+collected as when compiling it: its callees' program items are added to the
+front, then its own item is appended. Both collections must produce the same
+order.
+
+Usage: python bench_program_items.py [n_helpers]
+'''
+import sys
+import time
+import random
+
+import cypy
+import clq
+
+def helper_graph(n_helpers, max_other_callees=2, seed=0):
+    rng = random.Random(seed)
+    graph = [[]]
+    for i in xrange(1, n_helpers):
+        n_others = min(i - 1, rng.randint(0, max_other_callees))
+        graph.append([i - 1] + rng.sample(xrange(i - 1), n_others))
+    return graph
+
+def collect(collection_type, graph):
+    items = [clq.ProgramItem("helper%d" % i, "") for i in xrange(len(graph))]
+    program_items = [ ]
+    for i, callees in enumerate(graph):
+        collected = collection_type()
+        for callee in callees:
+            cypy.extend_front(collected, program_items[callee])
+        collected.append(items[i])
+        program_items.append(tuple(collected))
+    return program_items
+
+def main(n_helpers=1000):
+    graph = helper_graph(n_helpers)
+    results = { }
+    for collection_type in (cypy.SetList, cypy.IndexedSetList):
+        start = time.time()
+        results[collection_type] = collect(collection_type, graph)
+        elapsed = time.time() - start
+        print "%16s: %8.3f s" % (collection_type.__name__, elapsed)
+
+    set_list, indexed = results[cypy.SetList], results[cypy.IndexedSetList]
+    assert [[item.name for item in items] for items in set_list] == \
+           [[item.name for item in items] for items in indexed]
+    print "largest program: %d items" % max(len(items) for items in indexed)
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
@@ -0,0 +1,97 @@
+'''Measures the throughput of the counter-based random number generators in
+clq.stdlib against simple_randf.
+
+Each kernel fills a buffer with uniform random floats, each work-item drawing
+a number of them in turn. simple_randf reads and writes its state in global
+memory for each number, while philox4x32 and threefry4x32 keep nothing
+between calls and give four numbers each. The mean of the numbers is checked
+before timing.
+
+Usage: python bench_random.py [n_work_items] [n_repeats]
+'''
+import sys
+import time
+
+import numpy
+
+import clq
+import clq.stdlib as stdlib
+import clq.backends.opencl as ocl
+import clq.backends.opencl.pyocl as pyocl
+
+OpenCL = ocl.Backend()
+
+draws = 16
+"""The number of times each work-item draws from the generator."""
+
+@clq.fn
+def fill_simple(state, dest, draws, randf, get_global_id):
+    gid = get_global_id(0)
+    for i in (0, draws):
+        dest[gid * draws + i] = randf(state, get_global_id)
+
+@clq.fn
+def fill_philox(seed, dest, draws, rng, mul_hi, uint4, randf, convert_float4,
+                float4, get_global_id, vstore4):
+    gid = get_global_id(0)
+    for i in (0, draws):
+        vstore4(randf(rng(seed, gid, i, mul_hi, uint4), convert_float4,
+                      float4), gid * draws + i, dest)
+
+@clq.fn
+def fill_threefry(seed, dest, draws, rng, rotate, uint4, uint8, uint16, randf,
+                  convert_float4, float4, get_global_id, vstore4):
+    gid = get_global_id(0)
+    for i in (0, draws):
+        vstore4(randf(rng(seed, gid, i, rotate, uint4, uint8, uint16),
+                      convert_float4, float4), gid * draws + i, dest)
+
+def generators(ctx, n_work_items):
+    # (name, kernel, arguments, numbers per draw)
+    n = n_work_items * draws
+    state = ctx.to_device(stdlib.simple_randf.initializer(n_work_items))
+    gid_t = ocl.get_global_id.cl_type
+    randf = (stdlib.randf4.cl_type, ocl.convert_float4.cl_type,
+             ocl.float4.constructor, gid_t, ocl.vstore4.cl_type)
+    seed = numpy.uint32(42)
+    return [
+        ("simple_randf", fill_simple.compile(
+            OpenCL, ocl.int.ptr_global, ocl.float.ptr_global,
+            clq.const(draws), stdlib.simple_randf.cl_type, gid_t),
+         (state, ctx.alloc(n, ocl.float)), 1),
+        ("philox4x32", fill_philox.compile(
+            OpenCL, ocl.uint, ocl.float.ptr_global, clq.const(draws),
+            stdlib.philox4x32.cl_type, ocl.mul_hi.cl_type,
+            ocl.uint4.constructor, *randf),
+         (seed, ctx.alloc(4 * n, ocl.float)), 4),
+        ("threefry4x32", fill_threefry.compile(
+            OpenCL, ocl.uint, ocl.float.ptr_global, clq.const(draws),
+            stdlib.threefry4x32.cl_type, ocl.rotate.cl_type,
+            ocl.uint4.constructor, ocl.uint8.constructor,
+            ocl.uint16.constructor, *randf),
+         (seed, ctx.alloc(4 * n, ocl.float)), 4),
+    ]
+
+def main(n_work_items=1 << 16, n_repeats=20):
+    ctx = pyocl.Context.get_somehow()
+    print "%14s %10s %12s %16s" % ("generator", "numbers", "time (ms)",
+                                   "numbers/s")
+    for name, concrete_fn, args, per_draw in generators(ctx, n_work_items):
+        program = clq.Module(OpenCL, [concrete_fn]).compile(ctx)
+        kernel = getattr(program, concrete_fn.name)
+        kernel((n_work_items,), *args).wait()
+        mean = args[-1].from_device().mean()
+        if abs(mean - 0.5) > 0.01:
+            raise clq.Error("The mean of %s is %f." % (name, mean))
+
+        start = time.time()
+        for i in xrange(n_repeats):
+            event = kernel((n_work_items,), *args)
+        event.wait()
+        elapsed = (time.time() - start) / n_repeats
+        n = n_work_items * draws * per_draw
+        print "%14s %10d %12.3f %16.3g" % (name, n, elapsed * 1000,
+                                           n / elapsed)
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,77 @@
+'''Measures spike propagation through the network of the example in cypy.np
+with each sparse matrix representation in clq.stdlib.sparse.
+
+The network of excitatory and inhibitory neurons is connected randomly and
+its transpose is copied to the device once in each representation. Each
+timestep, a random tenth of the neurons spike and the weights of their
+outgoing edges are added to the inputs of their targets. The inputs are
+checked against numpy before timing.
+
+Usage: python bench_sparse.py [n_neurons] [n_steps]
+'''
+import sys
+import time
+
+import numpy
+
+import clq
+import clq.backends.opencl as ocl
+import clq.backends.opencl.pyocl as pyocl
+from clq.stdlib import sparse
+from cypy.np import DirectedAdjacencyMatrix
+
+def network(n):
+    # as in the example in cypy.np
+    n_exc = n * 4 // 5
+    exc, inh = (0, n_exc), (n_exc, n)
+    cm = DirectedAdjacencyMatrix(n)
+    cm.connect_randomly(0.15, exc, exc)
+    cm.connect_randomly(0.4, exc, inh)
+    cm.connect_randomly(0.4, inh, exc)
+    cm.connect_randomly(0.4, inh, inh)
+    return cm
+
+def representations(csr):
+    # (name, matrix, variant)
+    return [
+        ("csr scalar", csr, "scalar"),
+        ("csr vector", csr, "vector"),
+        ("ell", sparse.ELL.from_csr(csr), "scalar"),
+        ("sliced ell", sparse.SlicedELL.from_csr(csr), "scalar"),
+    ]
+
+def main(n_neurons=4000, n_steps=100):
+    ctx = pyocl.Context.get_somehow()
+    cm = network(n_neurons)
+    weights = numpy.random.rand(cm.n_edges).astype(numpy.float32)
+    incoming = sparse.CSR.from_adjacency(cm, weights).transposed()
+    spikes = [ctx.to_device((numpy.random.rand(n_neurons) < 0.1).astype(
+        numpy.float32)) for i in xrange(n_steps)]
+
+    # the inputs for the first step, on the host
+    fired = spikes[0].from_device()
+    rows = numpy.repeat(numpy.arange(n_neurons), incoming.lengths)
+    expected = numpy.bincount(rows, incoming.values *
+                              fired[incoming.columns], minlength=n_neurons)
+
+    print "%12s %10s %12s %16s" % ("format", "edges", "time (ms)",
+                                   "edges/s")
+    for name, matrix, variant in representations(incoming):
+        device_matrix = sparse.DeviceMatrix(ctx, matrix, variant)
+        inputs = ctx.to_device(numpy.zeros(n_neurons, numpy.float32))
+        event = device_matrix.propagate(spikes[0], inputs)
+        if not numpy.allclose(inputs.from_device(wait_for=[event]), expected,
+                              rtol=1e-4):
+            raise clq.Error("The inputs computed with %s are wrong." % name)
+
+        start = time.time()
+        for step in xrange(n_steps):
+            event = device_matrix.propagate(spikes[step], inputs)
+        event.wait()
+        elapsed = (time.time() - start) / n_steps
+        print "%12s %10d %12.3f %16.3g" % (name, incoming.n_edges,
+                                           elapsed * 1000,
+                                           incoming.n_edges / elapsed)
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
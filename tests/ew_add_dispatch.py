@@ -0,0 +1,27 @@
+import numpy
+import numpy.linalg as la
+import clq
+import clq.backends.opencl.pyocl as cl
+from clq.backends.opencl import get_global_id
+
+a = numpy.random.rand(50000).astype(numpy.float32)
+b = numpy.random.rand(50000).astype(numpy.float32)
+
+@clq.fn
+def ew_add(a, b, dest, get_global_id):
+    gid = get_global_id(0)
+    dest[gid] = a[gid] + b[gid]
+
+ctx = cl.ctx = cl.Context.for_device(0, 0)
+a_buf = ctx.to_device(a)
+b_buf = ctx.to_device(b)
+dest_buf = ctx.alloc(like=a)
+
+# the first call compiles ew_add for these types, the second reuses it
+for i in xrange(2):
+    ew_add(a_buf, b_buf, dest_buf, get_global_id, local_size=(1,)).wait()
+
+c = ctx.from_device(dest_buf)
+
+print la.norm(c - (a + b))
+print ew_add.dispatcher.stats
@@ -0,0 +1,114 @@
+'''Unit tests for the argument binder.
+
+The binder only sets arguments and enqueues launches through the function it
+is given, so these tests use a stand-in for pyocl's Kernel and run without an
+OpenCL runtime.
+'''
+import unittest
+
+import numpy
+
+import clq
+import clq.backends.opencl as ocl
+from clq.backends.opencl.argbinder import ArgBinder
+
+class Kernel(object):
+    queue = "queue"
+    bound_by = None
+
+    def __init__(self):
+        self.args = { }
+        self.n_set = 0
+
+    def set_arg(self, i, value):
+        self.args[i] = value
+        self.n_set += 1
+
+def enqueue(*args):
+    return args
+
+src = '''
+def scale(a, b, n, x, offset, scratch, unroll, get_global_id):
+    gid = get_global_id(0)
+    if gid < n:
+        b[gid] = a[gid] * x + offset.x
+'''
+
+arg_types = (ocl.float.ptr_global, ocl.float.ptr_global, ocl.ulong,
+             ocl.double, ocl.float4, ocl.float.ptr_shared, clq.const(4),
+             ocl.get_global_id.cl_type)
+
+class ArgBinderTest(unittest.TestCase):
+    def runTest(self):
+        kernel = Kernel()
+        binder = ArgBinder(kernel, arg_types, enqueue)
+        # the virtual arguments aren't parameters
+        self.assertEqual(binder.arg_types, arg_types[:6])
+
+        a, b, scratch = object(), object(), object()
+        event = binder((64,), a, b, 3, 0.5, (1, 2, 3, 4), scratch,
+                       local_size=(16,))
+        self.assertEqual(event, ("queue", kernel, (64,), (16,), None, None))
+        self.assertEqual(kernel.n_set, 6)
+        args = kernel.args
+        self.assertTrue(args[0] is a and args[1] is b and args[5] is scratch)
+        # the exact types of the parameters
+        self.assertTrue(type(args[2]) is numpy.uint64)
+        self.assertTrue(type(args[3]) is numpy.float64)
+        self.assertEqual(args[4].dtype, ocl.float4.np_dtype)
+        self.assertEqual(tuple(args[4][()]), (1, 2, 3, 4))
+
+        # unchanged memory objects aren't set again, scalars always are
+        binder.bind((a, b, 4, 0.5, args[4], scratch))
+        self.assertEqual(kernel.n_set, 9)
+        self.assertEqual(args[2], 4)
+        binder((64,), b, a, 4, 0.5, args[4], scratch, queue="other",
+               wait_for=["event"])
+        self.assertEqual(kernel.n_set, 14)
+        self.assertTrue(args[0] is b and args[1] is a)
+
+        self.assertRaises(clq.Error, binder.bind, (a, b))
+        self.assertRaises(clq.Error, binder, (64,), a, b, 3, 0.5,
+                          (1, 2, 3, 4), scratch, vectorize=True)
+
+class SharedKernelTest(unittest.TestCase):
+    def runTest(self):
+        kernel = Kernel()
+        binder = ArgBinder(kernel, arg_types, enqueue)
+        other = ArgBinder(kernel, arg_types, enqueue)
+        a, b, scratch = object(), object(), object()
+        args = (a, b, 3, 0.5, (1, 2, 3, 4), scratch)
+        binder.bind(args)
+        self.assertTrue(kernel.bound_by is binder)
+
+        # another binder set the memory objects, so they are set again
+        other.bind((b, a) + args[2:])
+        kernel.n_set = 0
+        binder.bind(args)
+        self.assertEqual(kernel.n_set, 6)
+        self.assertTrue(kernel.args[0] is a and kernel.args[1] is b)
+        binder.bind(args)
+        self.assertEqual(kernel.n_set, 9)
+
+        # as does calling the kernel, which resets bound_by
+        kernel.bound_by = None
+        kernel.n_set = 0
+        binder.bind(args)
+        self.assertEqual(kernel.n_set, 6)
+
+class CodeTest(unittest.TestCase):
+    def runTest(self):
+        # the parameters of the kernel are those the binder sets
+        code = clq.fn.from_source(src).compile(
+            ocl.Backend(), *arg_types).program_item.code
+        self.assertTrue("(__global float* a, __global float* b, ulong n, "
+                        "double x, float4 offset, __local float* scratch)"
+                        in code)
+
+class UnsupportedTest(unittest.TestCase):
+    def runTest(self):
+        self.assertRaises(clq.Error, ArgBinder, Kernel(), (ocl.half,),
+                          enqueue)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,169 @@
+'''Unit tests for the persistent cache of program binaries.
+
+The cache only constructs and builds programs, so these tests use stand-ins
+for pyopencl's Program, Context and Device, and run without an OpenCL
+runtime.
+'''
+import os
+import shutil
+import tempfile
+import unittest
+
+import clq.backends.opencl.binarycache as binarycache
+
+class Platform(object):
+    name = "Platform"
+
+class Device(object):
+    platform = Platform()
+    name = "Device"
+    driver_version = "1.0"
+
+class Context(object):
+    def __init__(self, devices=(Device(),)):
+        self.devices = devices
+
+class BuildError(Exception):
+    pass
+
+class Program(object):
+    # builds binaries which are the source prefixed by "binary:", and
+    # rejects any other binaries, as a driver would
+    built_from_source = 0
+    built_from_binaries = 0
+
+    def __init__(self, context, *args):
+        self.context = context
+        if len(args) == 1:
+            self.source, self.binaries = args[0], None
+        else:
+            devices, self.binaries = args
+            self.source = None
+
+    def build(self, options):
+        if self.source is not None:
+            Program.built_from_source += 1
+            self.binaries = ["binary:" + self.source + options]
+        else:
+            for binary in self.binaries:
+                if not binary.startswith("binary:"):
+                    raise BuildError("Invalid binary.")
+            Program.built_from_binaries += 1
+        self.options = options
+        return self
+
+class BinaryCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        Program.built_from_source = Program.built_from_binaries = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def builds(self):
+        return Program.built_from_source, Program.built_from_binaries
+
+    def runTest(self):
+        cache = binarycache.BinaryCache(self.path)
+        ctx = Context()
+        program = cache.compile(ctx, "src", "-O", Program)
+        self.assertEqual(program.binaries, ["binary:src-O"])
+        self.assertEqual(self.builds(), (1, 0))
+
+        # the same program for the same context comes from memory
+        self.assertTrue(cache.compile(ctx, "src", "-O", Program) is program)
+        self.assertEqual(self.builds(), (1, 0))
+
+        # a new context, or a new cache as in a later run, loads the binaries
+        other = binarycache.BinaryCache(self.path)
+        program = other.compile(Context(), "src", "-O", Program)
+        self.assertEqual(program.source, None)
+        self.assertEqual(program.binaries, ["binary:src-O"])
+        self.assertEqual(self.builds(), (1, 1))
+
+        # different options make a different program
+        cache.compile(ctx, "src", "", Program)
+        self.assertEqual(self.builds(), (2, 1))
+        self.assertEqual(cache.stats, {'memory_hits': 1, 'disk_hits': 0,
+                                       'misses': 2, 'rejected': 0,
+                                       'programs': 2})
+        self.assertEqual(other.stats['disk_hits'], 1)
+
+class KeyTest(unittest.TestCase):
+    def runTest(self):
+        devices = (Device(),)
+        key = binarycache.key_for("src", "", devices)
+        self.assertEqual(key, binarycache.key_for("src", "", (Device(),)))
+        self.assertNotEqual(key, binarycache.key_for("src ", "", devices))
+        self.assertNotEqual(key, binarycache.key_for("src", "-O", devices))
+
+        # another driver version, device or platform
+        device = Device()
+        device.driver_version = "1.1"
+        self.assertNotEqual(key, binarycache.key_for("src", "", (device,)))
+        device = Device()
+        device.name = "Other"
+        self.assertNotEqual(key, binarycache.key_for("src", "", (device,)))
+        device = Device()
+        device.platform = Platform()
+        device.platform.name = "Other"
+        self.assertNotEqual(key, binarycache.key_for("src", "", (device,)))
+        self.assertNotEqual(key, binarycache.key_for("src", "",
+                                                     devices + devices))
+
+class RejectedTest(unittest.TestCase):
+    def runTest(self):
+        path = tempfile.mkdtemp()
+        try:
+            cache = binarycache.BinaryCache(path)
+            ctx = Context()
+            key = binarycache.key_for("src", "", ctx.devices)
+            cache.put(key, ["corrupt"])
+            program = cache.compile(ctx, "src", "", Program)
+            self.assertEqual(program.source, "src")
+            self.assertEqual((cache.rejected, cache.misses), (1, 1))
+            # replaced by the binaries built from source
+            self.assertEqual(cache.get(key, 1), ["binary:src"])
+
+            # unreadable entries and ones for other numbers of devices are
+            # misses too
+            f = open(cache.filename_for(key), "wb")
+            f.write("garbage")
+            f.close()
+            self.assertEqual(cache.get(key, 1), None)
+            cache.put(key, ["binary:src"])
+            self.assertEqual(cache.get(key, 2), None)
+        finally:
+            shutil.rmtree(path)
+
+class EvictionTest(unittest.TestCase):
+    def runTest(self):
+        path = tempfile.mkdtemp()
+        try:
+            cache = binarycache.BinaryCache(path, max_programs=2)
+            ctx = Context()
+            programs = [cache.compile(ctx, source, "", Program)
+                        for source in ("a", "b")]
+            cache.compile(ctx, "a", "", Program) # now more recent than b
+            cache.compile(ctx, "c", "", Program)
+            self.assertEqual(cache.stats['programs'], 2)
+            self.assertTrue(cache.compile(ctx, "a", "", Program)
+                            is programs[0])
+            self.assertFalse(cache.compile(ctx, "b", "", Program)
+                             is programs[1])
+            self.assertEqual(cache.disk_hits, 1)
+
+            self.assertEqual(len(os.listdir(path)), 3)
+            cache.max_size = 0
+            cache.evict()
+            self.assertEqual(os.listdir(path), [ ])
+
+            cache.compile(ctx, "d", "", Program)
+            cache.clear()
+            self.assertEqual(cache.stats['programs'], 0)
+            self.assertEqual(os.listdir(path), [ ])
+        finally:
+            shutil.rmtree(path)
+
+if __name__ == "__main__":
+    unittest.main()
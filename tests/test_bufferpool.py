@@ -0,0 +1,107 @@
+'''Unit tests for the size-class buffer pool.
+
+The pool only creates buffers and tracks them, so these tests use stand-ins
+for pyocl's Buffer and Context, and run without an OpenCL runtime.
+'''
+import gc
+import unittest
+
+import clq.backends.opencl.bufferpool as bufferpool
+
+class Buffer(bufferpool.Pooled):
+    created = 0
+
+    def __init__(self, context, flags, size):
+        Buffer.created += 1
+        self.flags = flags
+        self.size = size
+
+class Context(object):
+    def __init__(self, device="device"):
+        self.device = device
+
+class SizeClassTest(unittest.TestCase):
+    def runTest(self):
+        self.assertEqual([bufferpool.size_class(size)
+                          for size in (1, 2, 3, 4, 1000, 1024, 1025)],
+                         [1, 2, 4, 4, 1024, 1024, 2048])
+
+class BufferPoolTest(unittest.TestCase):
+    def setUp(self):
+        Buffer.created = 0
+
+    def runTest(self):
+        pool = bufferpool.BufferPool(Buffer)
+        ctx = Context()
+        a = pool.alloc(ctx, 1000, 1)
+        self.assertEqual((a.size, a.capacity), (1024, 1024))
+        self.assertTrue(a.context is ctx and a.pool is pool)
+        self.assertEqual(pool.stats, {'hits': 0, 'misses': 1,
+                                      'in_use': 1024, 'idle': 0,
+                                      'high_water_mark': 1024})
+
+        # released explicitly, then reused by the same size class
+        a.release()
+        self.assertTrue(a.context is None and a.pool is None)
+        self.assertEqual((pool.in_use, pool.idle), (0, 1024))
+        a.release() # no effect
+        self.assertEqual((pool.in_use, pool.idle), (0, 1024))
+        b = pool.alloc(ctx, 600, 1)
+        self.assertTrue(b is a)
+        self.assertEqual((pool.hits, Buffer.created), (1, 1))
+
+        # not by other size classes, flags or devices
+        c = pool.alloc(ctx, 400, 1)
+        d = pool.alloc(ctx, 600, 2)
+        e = pool.alloc(Context("other"), 600, 1)
+        self.assertEqual((pool.hits, Buffer.created), (1, 4))
+
+        # garbage collected buffers are recycled too
+        del a, b, c, d, e
+        self.assertEqual((pool.in_use, pool.idle), (0, 3 * 1024 + 512))
+        self.assertEqual(pool.high_water_mark, 3 * 1024 + 512)
+        pool.alloc(Context("other"), 1024, 1)
+        self.assertEqual((pool.hits, Buffer.created), (2, 4))
+
+class EvictionTest(unittest.TestCase):
+    def setUp(self):
+        Buffer.created = 0
+
+    def runTest(self):
+        pool = bufferpool.BufferPool(Buffer, max_bytes=2048)
+        ctx = Context()
+        buffers = [pool.alloc(ctx, 1024, 1) for i in xrange(3)]
+        ids = [id(buffer) for buffer in buffers]
+        for buffer in buffers:
+            buffer.release()
+        del buffer, buffers[:]
+        # the least recently released is freed
+        self.assertEqual(pool.idle, 2048)
+        again = [pool.alloc(ctx, 1024, 1) for i in xrange(2)]
+        self.assertEqual(sorted(id(buffer) for buffer in again),
+                         sorted(ids[1:]))
+        self.assertEqual((pool.hits, Buffer.created), (2, 3))
+
+        # buffers larger than the limit are never kept
+        pool.alloc(ctx, 4096, 1).release()
+        self.assertEqual(pool.idle, 0)
+
+        del again
+        pool.clear()
+        self.assertEqual(pool.stats, {'hits': 2, 'misses': 4,
+                                      'in_use': 0, 'idle': 0,
+                                      'high_water_mark': 2 * 1024 + 4096})
+
+class CollectionTest(unittest.TestCase):
+    def runTest(self):
+        # contexts refer to their pools, so idle buffers must not refer to
+        # their contexts or they would form uncollectable cycles
+        ctx = Context()
+        ctx.pool = bufferpool.BufferPool(Buffer)
+        ctx.pool.alloc(ctx, 100, 1)
+        del ctx
+        gc.collect()
+        self.assertEqual(gc.garbage, [ ])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+'''Unit tests for compiling many concrete functions in parallel.'''
+import unittest
+
+import clq
+import clq.backends.opencl as ocl
+
+OpenCL = ocl.Backend()
+
+src = '''
+def mix(a, b):
+    c = a * b
+    return c + a
+'''
+
+types = (ocl.char, ocl.ushort, ocl.int, ocl.ulong, ocl.float)
+
+class CompileManyTest(unittest.TestCase):
+    def compile_all(self, workers):
+        mix = clq.fn.from_source(src)
+        specs = [(mix, OpenCL, (a, b)) for a in types for b in types]
+        return mix, specs, clq.compile_many(specs, workers=workers)
+
+    def runTest(self):
+        _, _, expected = self.compile_all(1)
+        mix, specs, concrete_fns = self.compile_all(2)
+        self.assertEqual(len(concrete_fns), len(expected))
+        for concrete_fn, expected_fn in zip(concrete_fns, expected):
+            self.assertTrue(concrete_fn.is_compiled)
+            self.assertFalse(hasattr(concrete_fn, '_visitor'))
+            self.assertTrue(concrete_fn.return_type is expected_fn.return_type)
+            self.assertEqual(concrete_fn.program_item.code,
+                             expected_fn.program_item.code)
+            self.assertEqual([item.code for item in concrete_fn.program_items],
+                             [item.code for item in expected_fn.program_items])
+
+        # merged back into the intern pool
+        for (_, backend, arg_types), concrete_fn in zip(specs, concrete_fns):
+            self.assertTrue(mix.compile(backend, *arg_types) is concrete_fn)
+
+plus = clq.fn.from_source('''
+def plus(a, b):
+    return a + b
+''', inline=False)
+
+f = clq.fn.from_source('''
+def f(x, plus):
+    return plus(x, x) * 2
+''', inline=False)
+
+g = clq.fn.from_source('''
+def g(x, plus):
+    return plus(x, 1) * 3
+''', inline=False)
+
+h = clq.fn.from_source('''
+def h(a, f, g, plus):
+    a[0] = f(a[0], plus) + g(a[1], plus)
+''')
+
+class SharedItemsTest(unittest.TestCase):
+    def runTest(self):
+        arg_types = (ocl.int, plus.cl_type)
+        clq.compile_many([(f, OpenCL, arg_types), (g, OpenCL, arg_types)],
+                         workers=2)
+        concrete_fn = h.compile(OpenCL, ocl.int.ptr_global, f.cl_type,
+                                g.cl_type, plus.cl_type)
+        items = concrete_fn.program_items
+        # the helper restored with each function is shared
+        self.assertEqual([item.name for item in items],
+                         ["plus_int_int", f.compile(OpenCL, *arg_types).name,
+                          g.compile(OpenCL, *arg_types).name, "h"])
+        for i, item in enumerate(items):
+            for dependency in item.dependencies:
+                self.assertTrue(items.index(dependency) < i)
+
+class CompileManyErrorTest(unittest.TestCase):
+    def runTest(self):
+        bad = clq.fn.from_source('def bad(a):\n    return undefined\n')
+        self.assertRaises(clq.TypeResolutionError, clq.compile_many,
+                          [(bad, OpenCL, (ocl.int,)), (bad, OpenCL, (ocl.float,))],
+                          workers=2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+'''Unit tests for binding arguments to constant values.'''
+import unittest
+
+import clq
+import clq.backends.opencl as ocl
+
+OpenCL = ocl.Backend()
+
+scale = clq.fn.from_source('''
+def scale(a, n, s, get_global_id):
+    gid = get_global_id(0)
+    if n > 128:
+        a[gid] = a[gid] * s * (n / 2)
+    else:
+        a[gid] = 0
+''')
+
+gid_t = ocl.get_global_id.cl_type
+
+class ConstTest(unittest.TestCase):
+    def runTest(self):
+        concrete_fn = scale.compile(OpenCL, ocl.float.ptr_global,
+                                    clq.const(256), clq.const(2.5), gid_t)
+        code = concrete_fn.program_item.code
+        self.assertTrue("void scale(__global float* a)" in code)
+        self.assertTrue("a[gid] = ((a[gid] * 2.5f) * 128);" in code)
+        self.assertFalse("if" in code)
+        self.assertTrue(concrete_fn.arg_map["n"] is ocl.int)
+        self.assertEqual(concrete_fn.constants["s"], (ocl.float, 2.5))
+
+        # the value's type can be given explicitly
+        code = scale.compile(OpenCL, ocl.float.ptr_global,
+                             clq.const(64, ocl.uint), clq.const(2.5),
+                             gid_t).program_item.code
+        self.assertTrue("a[gid] = 0;" in code)
+        self.assertFalse("if" in code)
+
+class ConstInternTest(unittest.TestCase):
+    def runTest(self):
+        self.assertEqual(clq.const(256), clq.const(256))
+        self.assertNotEqual(clq.const(1), clq.const(True))
+        self.assertNotEqual(clq.const(1), clq.const(1.0))
+        self.assertNotEqual(clq.const(1), clq.const(1, ocl.uint))
+
+        first = scale.compile(OpenCL, ocl.float.ptr_global, clq.const(256),
+                              clq.const(2.5), gid_t)
+        self.assertTrue(first is scale.compile(OpenCL, ocl.float.ptr_global,
+                                               clq.const(256), clq.const(2.5),
+                                               gid_t))
+        other = scale.compile(OpenCL, ocl.float.ptr_global, clq.const(256.0),
+                              clq.const(2.5), gid_t)
+        self.assertFalse(first is other)
+        self.assertNotEqual(first.cache_key, other.cache_key)
+
+class ConstErrorTest(unittest.TestCase):
+    def runTest(self):
+        self.assertRaises(clq.Error, scale.compile, OpenCL,
+                          ocl.float.ptr_global, clq.const(2 ** 40),
+                          clq.const(2.5), gid_t)
+        # a float isn't truncated to an integer type
+        self.assertRaises(clq.Error, scale.compile, OpenCL,
+                          ocl.float.ptr_global, clq.const(2.7, ocl.int),
+                          clq.const(2.5), gid_t)
+        # but can be rounded to a narrower float type
+        concrete_fn = scale.compile(OpenCL, ocl.float.ptr_global,
+                                    clq.const(256), clq.const(2.7), gid_t)
+        self.assertEqual(concrete_fn.constants["s"], (ocl.float,
+                                                      ocl.float.coerce(2.7)))
+
+        assign = clq.fn.from_source('''
+def assign(n):
+    n = n + 1
+    return n
+''')
+        concrete_fn = assign.compile(OpenCL, clq.const(1))
+        self.assertRaises(clq.TypeResolutionError,
+                          lambda: concrete_fn.program_item)
+
+if __name__ == "__main__":
+    unittest.main()
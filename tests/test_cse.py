@@ -0,0 +1,115 @@
+'''Unit tests for common subexpression elimination, loop-invariant code motion
+and the pass manager.'''
+import unittest
+
+import clq
+import clq.passes
+import clq.backends.opencl as ocl
+
+OpenCL = ocl.Backend()
+
+gid_t = ocl.get_global_id.cl_type
+
+def code_for(src, *arg_types):
+    return clq.fn.from_source(src).compile(OpenCL, *arg_types).program_item.code
+
+class CommonSubexpressionTest(unittest.TestCase):
+    def runTest(self):
+        code = code_for('''
+def f(a, b, get_global_id):
+    gid = get_global_id(0)
+    x = a[gid] * a[gid] + b[get_global_id(0)]
+    a[gid] = x
+    y = a[gid] + (x + 1)
+    x = 0
+    b[gid] = y + (x + 1)
+''', ocl.float.ptr_global, ocl.float.ptr_global, gid_t)
+        # the variable already holding it is used
+        self.assertEqual(code.count("get_global_id(0)"), 1)
+        self.assertTrue("common = a[gid];\n"
+                        "    x = ((common * common) + b[gid]);" in code)
+        # memory and x have changed in between
+        self.assertTrue("y = (a[gid] + (x + 1));" in code)
+        self.assertTrue("b[gid] = (y + (x + 1));" in code)
+
+class NotEliminatedTest(unittest.TestCase):
+    def runTest(self):
+        code = code_for('''
+def f(a, i, n, atom_add):
+    x = i < n and a[i] > 0
+    y = a[i] + atom_add(a, 1) + a[i]
+    if a[i] > 0:
+        a[0] = a[i]
+''', ocl.int.ptr_global, ocl.int, ocl.int, ocl.atom_add.cl_type)
+        self.assertFalse("common" in code)
+
+        # other work-items may write to memory before a barrier returns
+        for fence in (ocl.barrier, ocl.mem_fence, ocl.read_mem_fence,
+                      ocl.write_mem_fence):
+            self.assertFalse(fence.pure)
+            code = code_for('''
+def f(a, b, fence, flags):
+    x = a[0] + 1
+    fence(flags)
+    b[0] = x + (a[0] + 1)
+''', ocl.int.ptr_global, ocl.int.ptr_global, fence.cl_type,
+                ocl.CLK_GLOBAL_MEM_FENCE.cl_type)
+            self.assertFalse("common" in code)
+
+            code = code_for('''
+def f(a, n, fence, flags):
+    for i in (0, n):
+        fence(flags)
+        a[i] = a[0] * 2
+''', ocl.int.ptr_global, ocl.int, fence.cl_type,
+                ocl.CLK_GLOBAL_MEM_FENCE.cl_type)
+            self.assertFalse("invariant" in code)
+
+class HoistTest(unittest.TestCase):
+    def runTest(self):
+        code = code_for('''
+def f(a, n, d, get_global_id):
+    for i in (0, n):
+        a[get_global_id(0) * n + i] = a[0] / d + i * 2 + n / 2
+''', ocl.int.ptr_global, ocl.int, ocl.int, gid_t)
+        self.assertTrue("invariant = (get_global_id(0) * n);\n"
+                        "    invariant_1 = (n / 2);\n"
+                        "    for (i = 0; i < n; i += 1) {\n"
+                        "        a[(invariant + i)] = (((a[0] / d) + (i * 2))"
+                        " + invariant_1);" in code)
+        
+        code = code_for('''
+def f(a, n):
+    while n > 0:
+        a[0] = a[0] + n * 2
+        n = n - 1
+''', ocl.int.ptr_global, ocl.int)
+        self.assertFalse("invariant" in code)
+        
+class PassManagerTest(unittest.TestCase):
+    def runTest(self):
+        src = '''
+def f(a, b):
+    return a[0] * b + a[0]
+'''
+        manager = clq.passes.manager
+        concrete_fn = clq.fn.from_source(src).compile(
+            OpenCL, ocl.int.ptr_global, ocl.int)
+        self.assertTrue("common" in concrete_fn.program_item.code)
+        self.assertTrue(
+            manager.stats["eliminate_common_subexpressions"].calls >= 1)
+        
+        cache_key = concrete_fn.cache_key
+        manager.disable("eliminate_common_subexpressions")
+        try:
+            other = clq.fn.from_source(src).compile(
+                OpenCL, ocl.int.ptr_global, ocl.int)
+            self.assertFalse("common" in other.program_item.code)
+            self.assertNotEqual(cache_key, other.cache_key)
+        finally:
+            manager.enable("eliminate_common_subexpressions")
+        
+        self.assertRaises(clq.Error, manager.disable, "no_such_pass")
+
+if __name__ == "__main__":
+    unittest.main()
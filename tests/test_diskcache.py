@@ -0,0 +1,94 @@
+'''Unit tests for the on-disk cache of compiled concrete functions.'''
+import unittest
+import shutil
+import tempfile
+
+import clq
+import clq.diskcache
+import clq.backends.opencl as ocl
+
+OpenCL = ocl.Backend()
+
+src = '''
+def scale(a, x, get_global_id):
+    gid = get_global_id(0)
+    a[gid] = a[gid] * x
+    return x + 1
+'''
+
+class DiskCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.prev_disk_cache = clq.disk_cache
+        self.cache = clq.disk_cache = clq.diskcache.DiskCache(self.path)
+
+    def tearDown(self):
+        clq.disk_cache = self.prev_disk_cache
+        shutil.rmtree(self.path)
+
+    def compile(self, arg_type=ocl.float):
+        # a new generic function each time, so nothing is shared in memory
+        return clq.fn.from_source(src).compile(OpenCL,
+            arg_type.ptr_global, arg_type, ocl.get_global_id.cl_type)
+
+    def runTest(self):
+        first = self.compile()
+        code = first.program_item.code
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 1))
+
+        second = self.compile()
+        self.assertEqual(second.program_item.code, code)
+        self.assertTrue(second.return_type is ocl.float)
+        self.assertEqual([item.code for item in second.program_items],
+                         [item.code for item in first.program_items])
+        self.assertFalse(hasattr(second, '_visitor')) # not compiled
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+        # different argument types must not collide
+        third = self.compile(ocl.int)
+        self.assertTrue(third.return_type is ocl.int)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 2))
+
+shared_srcs = ('''
+def plus(a, b):
+    return a + b
+''', '''
+def f(x, plus):
+    return plus(x, x) * 2
+''', '''
+def g(x, plus):
+    return plus(x, 1) * 3
+''')
+
+class SharedItemsTest(DiskCacheTest):
+    def compile_shared(self):
+        plus, f, g = [clq.fn.from_source(src, inline=False) 
+                      for src in shared_srcs]
+        return [fn.compile(OpenCL, ocl.int, plus.cl_type) for fn in (f, g)]
+
+    def runTest(self):
+        for concrete_fn in self.compile_shared():
+            concrete_fn.program_item
+        f, g = self.compile_shared()
+        # restored separately, but sharing the item of the helper
+        self.assertTrue(f.program_items[0] is g.program_items[0])
+        self.assertEqual(self.cache.hits, 2)
+        
+        module = clq.Module(OpenCL, (f, g))
+        self.assertEqual([item.name for item in module.program_items],
+                         ["plus_int_int", f.name, g.name])
+
+class DiskCacheEvictionTest(unittest.TestCase):
+    def runTest(self):
+        path = tempfile.mkdtemp()
+        try:
+            cache = clq.diskcache.DiskCache(path, max_size=0)
+            fn = clq.fn.from_source(src).compile(OpenCL, ocl.float.ptr_global,
+                ocl.float, ocl.get_global_id.cl_type)
+            self.assertTrue(cache.put(fn, fn.typed_ast.context))
+            self.assertTrue(cache.get(fn) is None)
+        finally:
+            shutil.rmtree(path)
+
+if __name__ == "__main__":
+    unittest.main()
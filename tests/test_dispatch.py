@@ -0,0 +1,210 @@
+'''Unit tests for launching generic functions directly on their arguments.
+
+Dispatching only compiles programs in the context of the arguments and calls
+their kernels, so these tests use stand-ins for pyocl's Context, Program,
+Kernel and Buffer, and run without an OpenCL runtime.
+'''
+import unittest
+
+import numpy
+
+import clq
+import clq.backends.opencl as ocl
+from clq.backends.opencl.argbinder import ArgBinder
+from clq.backends.opencl.dispatch import Dispatcher, type_and_value
+
+class Kernel(object):
+    queue = "queue"
+    vector_kernel = None
+
+    def __init__(self, name):
+        self.name = name
+        self.args = { }
+        self.launches = [ ]
+        self.calls = [ ]
+
+    def set_arg(self, i, value):
+        self.args[i] = value
+
+    def binder(self, arg_types):
+        return ArgBinder(self, arg_types, enqueue)
+
+    def __call__(self, *args, **kwargs):
+        self.calls.append((args, kwargs))
+        return "called"
+
+def enqueue(queue, kernel, global_size, local_size, global_offset, wait_for):
+    kernel.launches.append((global_size, local_size, global_offset, wait_for,
+                            dict(kernel.args)))
+    return "event"
+
+class Program(object):
+    def __init__(self, code):
+        self.code = code
+        self.kernels = { }
+
+    def __getattr__(self, name):
+        try:
+            return self.kernels[name]
+        except KeyError:
+            kernel = self.kernels[name] = Kernel(name)
+            return kernel
+
+class Context(object):
+    def __init__(self):
+        self.programs = [ ]
+
+    def compile(self, code, options=""):
+        program = Program(code)
+        self.programs.append(program)
+        return program
+
+class Buffer(object):
+    def __init__(self, context, shape, cl_dtype):
+        self.context = context
+        self.shape = shape
+        self.cl_type = cl_dtype.ptr_global
+
+src = '''
+def ew_scale(a, dest, x, get_global_id):
+    gid = get_global_id(0)
+    dest[gid] = a[gid] * x
+'''
+
+class TypeTest(unittest.TestCase):
+    def runTest(self):
+        self.assertEqual(type_and_value(3), (ocl.int, 3))
+        self.assertTrue(type(type_and_value(3)[1]) is numpy.int32)
+        self.assertEqual(type_and_value(2 ** 40)[0], ocl.long)
+        self.assertEqual(type_and_value(0.5)[0], ocl.float)
+        self.assertEqual(type_and_value(1e300)[0], ocl.double)
+        self.assertEqual(type_and_value(numpy.uint8(3))[0], ocl.uchar)
+        self.assertEqual(type_and_value(numpy.float64(3))[0], ocl.double)
+        const = clq.const(4)
+        self.assertEqual(type_and_value(const), (const, None))
+        self.assertEqual(type_and_value(ocl.get_global_id)[0],
+                         ocl.get_global_id.cl_type)
+        self.assertRaises(clq.Error, type_and_value, "a")
+        self.assertRaises(clq.Error, type_and_value, True)
+        self.assertRaises(clq.Error, type_and_value, 2 ** 70)
+
+class DispatchTest(unittest.TestCase):
+    def runTest(self):
+        ew_scale = clq.fn.from_source(src)
+        ctx = Context()
+        a = Buffer(ctx, (16,), ocl.float)
+        dest = Buffer(ctx, (16,), ocl.float)
+        event = ew_scale(a, dest, 2.0, ocl.get_global_id, local_size=(4,))
+        self.assertEqual(event, "event")
+        self.assertEqual(len(ctx.programs), 1)
+        program = ctx.programs[0]
+        self.assertTrue("__kernel void ew_scale(__global float* a, "
+                        "__global float* dest, float x)" in program.code)
+        kernel = program.ew_scale
+        # launched through a binder, the global size being the shape of the
+        # first buffer, and nothing is passed for the built-in function
+        global_size, local_size, global_offset, wait_for, args = \
+            kernel.launches[0]
+        self.assertEqual((global_size, local_size), ((16,), (4,)))
+        self.assertEqual((args[0], args[1]), (a, dest))
+        self.assertTrue(type(args[2]) is numpy.float32)
+        self.assertEqual(len(args), 3)
+
+        # the same types reuse the kernel and binder, others compile another
+        ew_scale(dest, a, 3.0, ocl.get_global_id, global_size=(8,),
+                 wait_for=["before"])
+        self.assertEqual(kernel.launches[1][:4], ((8,), None, None,
+                                                  ["before"]))
+        self.assertEqual(kernel.launches[1][4][0], dest)
+        self.assertEqual(kernel.calls, [ ])
+        self.assertEqual(len(ctx.programs), 1)
+        ew_scale(a, dest, numpy.float64(3), ocl.get_global_id)
+        self.assertEqual(len(ctx.programs), 2)
+        self.assertTrue("double x" in ctx.programs[1].code)
+        # and so do other contexts
+        other = Context()
+        ew_scale(Buffer(other, (16,), ocl.float), dest, 2.0,
+                 ocl.get_global_id)
+        self.assertEqual(len(other.programs), 1)
+        self.assertEqual(ew_scale.dispatcher.stats,
+                         {'hits': 1, 'misses': 3, 'kernels': 3})
+
+        # constants are equal by value
+        const_src = src.replace("* x", "* x * scale").replace(
+            "x, get", "x, scale, get")
+        ew_scale = clq.fn.from_source(const_src)
+        for i in xrange(2):
+            ew_scale(a, dest, 2.0, clq.const(4), ocl.get_global_id)
+        self.assertEqual(ew_scale.dispatcher.stats,
+                         {'hits': 1, 'misses': 1, 'kernels': 1})
+        ew_scale.dispatcher.clear()
+        self.assertEqual(ew_scale.dispatcher.stats['kernels'], 0)
+
+class Out(Buffer):
+    def post_kernel_hook(self, context, buffer, event):
+        pass
+
+class KernelCallTest(unittest.TestCase):
+    def runTest(self):
+        # the binder doesn't support these, the kernel does
+        ew_scale = clq.fn.from_source(src)
+        ctx = Context()
+        a = Buffer(ctx, (16,), ocl.float)
+        self.assertEqual(ew_scale(a, a, 2.0, ocl.get_global_id, block=True),
+                         "called")
+        kernel = ctx.programs[0].ew_scale
+        self.assertEqual(kernel.calls[0], (((16,), a, a, 2.0),
+                                           {'block': True}))
+        out = Out(ctx, (16,), ocl.float)
+        self.assertEqual(ew_scale(a, out, 2.0, ocl.get_global_id), "called")
+        kernel.vector_kernel = Kernel("ew_scale_x4")
+        self.assertEqual(ew_scale(a, a, 2.0, ocl.get_global_id), "called")
+        self.assertEqual(len(kernel.calls), 3)
+        self.assertEqual(kernel.launches, [ ])
+        self.assertEqual(ew_scale.dispatcher.stats,
+                         {'hits': 2, 'misses': 1, 'kernels': 1})
+
+class BinderBoundTest(unittest.TestCase):
+    def runTest(self):
+        ew_scale = clq.fn.from_source(src)
+        dispatcher = ew_scale.dispatcher
+        dispatcher.kernels.max_size = 2
+        ctx = Context()
+        a = Buffer(ctx, (16,), ocl.float)
+        for x in (2.0, numpy.float64(2), numpy.int32(2), 2.0):
+            ew_scale(a, a, x, ocl.get_global_id)
+        # the binders are dropped with the kernels, and the kernels for the
+        # first types compiled again
+        self.assertTrue(len(dispatcher._binders) <= 2)
+        self.assertEqual(dispatcher.stats,
+                         {'hits': 0, 'misses': 4, 'kernels': 2})
+
+class BackendTest(unittest.TestCase):
+    def setUp(self):
+        self.call_backend = clq.call_backend
+
+    def tearDown(self):
+        clq.call_backend = self.call_backend
+
+    def runTest(self):
+        # importing the OpenCL backend sets it
+        self.assertTrue(isinstance(clq.call_backend, ocl.Backend))
+        self.assertTrue(isinstance(clq.fn.from_source(src).dispatcher,
+                                   Dispatcher))
+
+        clq.call_backend = None
+        self.assertRaises(clq.Error, clq.fn.from_source(src.replace(
+            "ew_scale", "ew_scale_none")), None)
+        clq.call_backend = clq.Backend("Other")
+        self.assertRaises(clq.Error, clq.fn.from_source(src.replace(
+            "ew_scale", "ew_scale_other")), None)
+
+class NoGlobalSizeTest(unittest.TestCase):
+    def runTest(self):
+        ew_scale = clq.fn.from_source(src)
+        a = Buffer(Context(), (16,), ocl.float)
+        del a.shape
+        self.assertRaises(clq.Error, ew_scale, a, a, 2.0, ocl.get_global_id)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+'''Unit tests for copying Out and InOut results back without blocking.
+
+Kernel.__call__ and the hooks of the buffers only enqueue copies and group
+events, so these tests use stand-ins for pyocl's Kernel, Context and events,
+and record what is enqueued, without an OpenCL runtime.
+'''
+import unittest
+
+import numpy
+
+import clq.backends.opencl.pyocl as pyocl
+
+class Event(object):
+    waited = [ ]
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return self.name
+
+    def wait(self):
+        Event.waited.append(self)
+
+class Context(object):
+    def __init__(self):
+        self.copies = [ ]
+
+    def copy(self, src, dest, **kwargs):
+        self.copies.append((src, dest, kwargs))
+        return "copy %d" % len(self.copies)
+
+class Program(object):
+    def __init__(self):
+        self.context = Context()
+
+class Kernel(object):
+    __call__ = pyocl.Kernel.__call__.im_func
+    _process_args = pyocl.Kernel._process_args.im_func
+    convert_arg = pyocl.Kernel.__dict__['convert_arg']
+
+    queue = "queue"
+    vector_kernel = None
+
+    def __init__(self):
+        self.program = Program()
+
+class Buffer(pyocl.MemoryObject):
+    # an Out buffer, without device memory
+    def __init__(self, dest):
+        self.post_kernel_hook = pyocl._Out_post_kernel_hook
+        self._dest = dest
+
+class EventsTest(unittest.TestCase):
+    def setUp(self):
+        self.launches = [ ]
+        self.waited = Event.waited = [ ]
+        self.kernel_event = Event("kernel")
+        def launch(kernel, queue, global_size, *args, **kwargs):
+            self.launches.append(kwargs)
+            return self.kernel_event
+        self._orig__call_Kernel = pyocl._orig__call_Kernel
+        self._orig_wait_for_events = pyocl.wait_for_events
+        pyocl._orig__call_Kernel = launch
+        pyocl.wait_for_events = self.waited.append
+
+    def tearDown(self):
+        pyocl._orig__call_Kernel = self._orig__call_Kernel
+        pyocl.wait_for_events = self._orig_wait_for_events
+
+class CopyTest(EventsTest):
+    def runTest(self):
+        kernel = Kernel()
+        event = self.kernel_event
+        # the kernel's own event without copies
+        self.assertTrue(kernel((4,), 2.0) is event)
+
+        dest = numpy.empty(4)
+        out = Buffer(dest)
+        group = kernel((4,), out, 2.0)
+        self.assertTrue(isinstance(group, pyocl.EventGroup))
+        self.assertEqual(group.events, [event, "copy 1"])
+        # enqueued without blocking, after the kernel
+        self.assertEqual(kernel.program.context.copies,
+                         [(out, dest, {'block': False,
+                                       'wait_for': [event]})])
+        self.assertEqual(self.waited, [ ])
+
+class BlockTest(EventsTest):
+    def runTest(self):
+        kernel = Kernel()
+        event = self.kernel_event
+        kernel((4,), 2.0, block=True)
+        self.assertEqual(self.waited, [event])
+
+        # for the kernel and the copies
+        del self.waited[:]
+        group = kernel((4,), Buffer(numpy.empty(4)), block=True)
+        self.assertEqual(self.waited, [[event, "copy 1"]])
+        self.assertFalse('block' in self.launches[-1])
+        group.wait()
+        self.assertEqual(len(self.waited), 2)
+
+class WaitForTest(EventsTest):
+    def runTest(self):
+        inner = pyocl.EventGroup(["a", "b"])
+        outer = pyocl.EventGroup([inner, "c"])
+        self.assertEqual(pyocl.events_in([outer, "d"]), ["a", "b", "c", "d"])
+        self.assertEqual(pyocl.events_in([]), [])
+
+        Kernel()((4,), 2.0, wait_for=[outer, "d"])
+        self.assertEqual(self.launches[-1],
+                         {'wait_for': ["a", "b", "c", "d"]})
+
+if __name__ == "__main__":
+    unittest.main()
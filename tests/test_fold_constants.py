@@ -0,0 +1,98 @@
+'''Unit tests for constant folding and the removal of unreachable code.'''
+import unittest
+
+import clq
+import clq.backends.opencl as ocl
+
+OpenCL = ocl.Backend()
+
+def code_for(src, *arg_types):
+    return clq.fn.from_source(src).compile(OpenCL, *arg_types).program_item.code
+
+class FoldArithmeticTest(unittest.TestCase):
+    def runTest(self):
+        code = code_for('''
+def f(x):
+    return x + 2 * 3 - (0 - 7) / 2
+''', ocl.int)
+        # C division truncates towards zero
+        self.assertTrue("return ((x + 6) - -3);" in code)
+
+        code = code_for('''
+def f(x):
+    return x * (0.5 + 0.25)
+''', ocl.float)
+        self.assertTrue("return (x * 0.75f);" in code)
+
+class FoldOverflowTest(unittest.TestCase):
+    def runTest(self):
+        # signed overflow is undefined, so it's left for the device
+        code = code_for('''
+def f(x):
+    return (2147483647 + 1) + (0 - 2147483647 - 1) / -1 + -(-2147483647 - 1)
+''', ocl.int)
+        self.assertTrue("(2147483647 + 1)" in code)
+        self.assertTrue("/ -1)" in code)
+        self.assertTrue("(-((-2147483647 - 1)))" in code)
+
+        # unsigned arithmetic wraps
+        code = code_for('''
+def f(x, n):
+    return (n + 1) + x
+''', ocl.uint, clq.const(4294967295, ocl.uint))
+        self.assertTrue("return (0u + x);" in code)
+
+class NotFoldedTest(unittest.TestCase):
+    def runTest(self):
+        code = code_for('''
+def f(x):
+    return x + 1 / 0 + (1 << 40) + -1
+''', ocl.long)
+        self.assertTrue("(1 / 0)" in code)
+        self.assertTrue("(1 << 40)" in code)
+        self.assertTrue("+ -1)" in code)
+
+class PruneIfTest(unittest.TestCase):
+    def runTest(self):
+        code = code_for('''
+def f(x):
+    if 1 > 2:
+        y = 1
+        z = 2
+    else:
+        y = x
+    if 1 < 2 and x > 0:
+        y = y + 1
+    while 1 == 0:
+        y = 0
+    return y
+''', ocl.int)
+        self.assertTrue("if (x > 0) {" in code)
+        self.assertEqual(code.count("if"), 1)
+        self.assertFalse("while" in code)
+        self.assertFalse("z" in code)
+        self.assertTrue("y = x;" in code)
+        self.assertFalse("y = 1;" in code)
+
+class DeclarationsTest(unittest.TestCase):
+    def runTest(self):
+        # only ever assigned in unreachable code, but still read
+        code = code_for('''
+def f(x):
+    if 0:
+        z = 5
+    return z + x
+''', ocl.int)
+        self.assertTrue("int z;" in code)
+        self.assertFalse("z = 5" in code)
+
+class FoldCompareTest(unittest.TestCase):
+    def runTest(self):
+        code = code_for('''
+def f(x):
+    return 1 < 2
+''', ocl.int)
+        self.assertTrue("return true;" in code)
+
+if __name__ == "__main__":
+    unittest.main()
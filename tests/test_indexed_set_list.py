@@ -0,0 +1,60 @@
+'''Unit tests for the hash-indexed ordered set used to collect program items.'''
+import unittest
+
+from cypy import IndexedSetList
+
+class OrderTest(unittest.TestCase):
+    def runTest(self):
+        s = IndexedSetList([3, 1, 2])
+        s.append(0)
+        s.extend([5, 4])
+        self.assertEqual(list(s), [3, 1, 2, 0, 5, 4])
+        self.assertEqual(list(reversed(s)), [4, 5, 0, 2, 1, 3])
+        self.assertEqual((s[0], s[3], s[-1], s[1:3]), (3, 0, 4, [1, 2]))
+        self.assertEqual(len(s), 6)
+        self.assertEqual(s.index(0), 3)
+        self.assertRaises(IndexError, lambda: s[-7])
+
+class DedupTest(unittest.TestCase):
+    def runTest(self):
+        s = IndexedSetList([1, 2, 1])
+        s.append(2)
+        s.extend([3, 1, 3])
+        s.prepend(3)
+        s.insert(1, 2)
+        self.assertEqual(s, [1, 2, 3])
+        self.assertEqual(len(s), 3)
+
+class ExtendFrontTest(unittest.TestCase):
+    def runTest(self):
+        s = IndexedSetList([2, 3])
+        # in order, skipping elements already present
+        s.extend_front([0, 2, 1])
+        self.assertEqual(s, [0, 1, 2, 3])
+        s.extend_front([5, 4])
+        s.append(6)
+        s.prepend(7)
+        self.assertEqual(list(s), [7, 5, 4, 0, 1, 2, 3, 6])
+        self.assertEqual((s[0], s[3], s[4], s[-1]), (7, 0, 1, 6))
+        s.insert(2, 8)
+        self.assertEqual(list(s), [7, 5, 8, 4, 0, 1, 2, 3, 6])
+
+class RemoveTest(unittest.TestCase):
+    def runTest(self):
+        s = IndexedSetList([1, 2])
+        s.extend_front([3, 4])
+        s.remove(1)
+        self.assertFalse(1 in s)
+        self.assertTrue(3 in s and 2 in s)
+        del s[0]
+        self.assertFalse(3 in s)
+        self.assertEqual(s, [4, 2])
+        self.assertRaises(ValueError, s.remove, 1)
+        self.assertRaises(ValueError, s.index, 3)
+        # removed elements can be added again
+        s.append(1)
+        s.extend_front([3])
+        self.assertEqual(s, [3, 4, 2, 1])
+
+if __name__ == "__main__":
+    unittest.main()
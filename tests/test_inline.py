@@ -0,0 +1,146 @@
+'''Unit tests for inlining calls to generic functions.'''
+import unittest
+
+import clq
+import clq.backends.opencl as ocl
+from clq.stdlib import plus, mul, simple_randf
+
+OpenCL = ocl.Backend()
+
+gid_t = ocl.get_global_id.cl_type
+
+def names(concrete_fn):
+    return [item.name for item in concrete_fn.program_items]
+
+class InlineExpressionTest(unittest.TestCase):
+    def runTest(self):
+        axpy = clq.fn.from_source('''
+def axpy(a, x, y, plus, mul, get_global_id):
+    gid = get_global_id(0)
+    y[gid] = plus(mul(a, x[gid]), y[gid])
+''')
+        concrete_fn = axpy.compile(OpenCL, ocl.float, ocl.float.ptr_global,
+                                   ocl.float.ptr_global, plus.cl_type,
+                                   mul.cl_type, gid_t)
+        self.assertEqual(names(concrete_fn), ["axpy"])
+        self.assertTrue("y[gid] = ((a * x[gid]) + y[gid]);" 
+                        in concrete_fn.program_item.code)
+
+class InlineStatementsTest(unittest.TestCase):
+    def runTest(self):
+        noise = clq.fn.from_source('''
+def noise(a, state, randf, get_global_id):
+    gid = get_global_id(0)
+    x = a[gid]
+    a[gid] = x + randf(state, get_global_id)
+''')
+        concrete_fn = noise.compile(OpenCL, ocl.float.ptr_global,
+                                    ocl.int.ptr_global, simple_randf.cl_type,
+                                    gid_t)
+        self.assertEqual(names(concrete_fn), ["noise"])
+        code = concrete_fn.program_item.code
+        # the locals of simple_randf are renamed where they clash
+        self.assertTrue("size_t gid_1;" in code)
+        self.assertTrue("int x_1;" in code)
+        self.assertTrue("gid_1 = gid;\n"
+                        "    x_1 = ((state[gid_1] * 16598013) + 12820163);\n"
+                        "    state[gid_1] = x_1;\n"
+                        "    a[gid] = (x + (((x_1 * 4.65662e-10)" in code)
+
+helper = clq.fn.from_source('''
+def helper(x):
+    y = x * 2
+    return y + y
+''')
+
+class ArgumentTest(unittest.TestCase):
+    def runTest(self):
+        f = clq.fn.from_source('''
+def f(a, helper):
+    return helper(a[0] + 1)
+''')
+        code = f.compile(OpenCL, ocl.int.ptr_global,
+                         helper.cl_type).program_item.code
+        # evaluated once
+        self.assertTrue("x = (a[0] + 1);\n    y = (x * 2);\n"
+                        "    return (y + y);" in code)
+
+class NestedTest(unittest.TestCase):
+    def runTest(self):
+        f = clq.fn.from_source('''
+def f(x):
+    t = x * 2
+    return t + t
+''', inline=True)
+        g = clq.fn.from_source('''
+def g(x, f):
+    u = f(x) + 1
+    return u * 3
+''', inline=True)
+        h = clq.fn.from_source('''
+def h(a, g, f):
+    t = 5
+    a[0] = g(a[1], f) + t
+''')
+        concrete_fn = h.compile(OpenCL, ocl.int.ptr_global, g.cl_type,
+                                f.cl_type)
+        self.assertEqual(names(concrete_fn), ["h"])
+        code = concrete_fn.program_item.code
+        # the locals g picked up from f are renamed and declared too
+        self.assertTrue("int t_1;" in code)
+        self.assertTrue("t = 5;\n    x = a[1];\n    t_1 = (x * 2);\n"
+                        "    u = ((t_1 + t_1) + 1);\n"
+                        "    a[0] = ((u * 3) + t);" in code)
+
+class NotInlinedTest(unittest.TestCase):
+    def runTest(self):
+        # must be evaluated each iteration
+        loop = clq.fn.from_source('''
+def loop(a, helper):
+    while helper(a[0]) < 10:
+        a[0] = a[0] + 1
+''')
+        concrete_fn = loop.compile(OpenCL, ocl.int.ptr_global, helper.cl_type)
+        self.assertEqual(names(concrete_fn), ["helper_int", "loop"])
+        
+        branches = clq.fn.from_source('''
+def branches(x):
+    if x > 0:
+        return x
+    return 0
+''')
+        f = clq.fn.from_source('''
+def f(x, branches):
+    return branches(x) + 1
+''')
+        concrete_fn = f.compile(OpenCL, ocl.int, branches.cl_type)
+        self.assertEqual(names(concrete_fn),
+                         ["branches_int", concrete_fn.name])
+
+class OptionTest(unittest.TestCase):
+    def runTest(self):
+        src = '''
+def large(x):
+    y = x
+    y = y * 2 + y * 3 + y * 4 + y * 5 + y * 6 + y * 7
+    y = y * 2 + y * 3 + y * 4 + y * 5 + y * 6 + y * 7
+    return y
+'''
+        f = clq.fn.from_source('''
+def f(x, g):
+    return g(x)
+''')
+        for options, inlined in (({}, False), ({"inline": True}, True)):
+            large = clq.fn.from_source(src, **options)
+            concrete_fn = f.compile(OpenCL, ocl.int, large.cl_type)
+            self.assertEqual("large_int" in names(concrete_fn), not inlined)
+        
+        small = clq.fn.from_source('''
+def small(x):
+    return x + 1
+''', inline=False)
+        concrete_fn = f.compile(OpenCL, ocl.int, small.cl_type)
+        self.assertEqual(names(concrete_fn), ["small_int", concrete_fn.name])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,34 @@
+'''Unit tests for the instrumentation of compiler phases.'''
+import json
+import unittest
+
+import clq
+import clq.instrument
+import clq.backends.opencl as ocl
+
+OpenCL = ocl.Backend()
+
+class InstrumentTest(unittest.TestCase):
+    def runTest(self):
+        with clq.instrument.recording() as recorder:
+            plus = clq.fn.from_source('def plus(a, b):\n    return a + b\n')
+            plus.compile(OpenCL, ocl.int, ocl.float).program_item
+        self.assertEqual(clq.instrument.listeners, [])
+
+        report = json.loads(recorder.to_json())
+        self.assertEqual(sorted(report["phases"]),
+                         sorted(clq.instrument.phases))
+        self.assertEqual(sorted(report["functions"]["plus"]),
+                         ["annotate", "parse"])
+        phases = report["functions"]["plus(int, float)"]
+        self.assertEqual(sorted(phases), ["assemble", "generate", "optimize", "resolve"])
+        for stats in phases.itervalues():
+            self.assertTrue(stats["calls"] >= 1)
+            self.assertTrue(0 <= stats["self_time"] <= stats["time"])
+
+        # nothing is recorded without a listener
+        plus.compile(OpenCL, ocl.float, ocl.float).program_item
+        self.assertFalse("plus(float, float)" in recorder.functions)
+
+if __name__ == "__main__":
+    unittest.main()
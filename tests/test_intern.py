@@ -0,0 +1,44 @@
+'''Unit tests for the bounded intern pools used by cl.oquence.'''
+import gc
+import unittest
+
+import cypy
+import clq
+import clq.backends.opencl as ocl
+
+OpenCL = ocl.Backend()
+
+@clq.fn
+def plus(a, b):
+    return a + b
+
+class InternPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.pool = cypy.intern_pool(clq.ConcreteFn)
+        self.prev_max_size = self.pool.max_size
+        self.pool.max_size = 2
+
+    def tearDown(self):
+        self.pool.max_size = self.prev_max_size
+
+    def runTest(self):
+        pool = self.pool
+        live = [plus.compile(OpenCL, t, t)
+                for t in (ocl.int, ocl.float, ocl.short, ocl.long)]
+        # newer functions evict older ones from the bounded part of the pool,
+        # but identity holds for everything still alive
+        for fn, t in zip(live, (ocl.int, ocl.float, ocl.short, ocl.long)):
+            self.assertTrue(plus.compile(OpenCL, t, t) is fn)
+        self.assertEqual(pool.retained, 2)
+
+        n_live = pool.live
+        del live, fn
+        gc.collect()
+        self.assertEqual(pool.live, n_live - 2)
+
+        misses = pool.misses
+        plus.compile(OpenCL, ocl.int, ocl.int)
+        self.assertEqual(pool.misses, misses + 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+'''Unit tests for splitting kernel launches between a vectorized kernel and
+the kernel it is a variant of.
+
+Kernel.__call__ only chooses the global sizes and offsets of the launches, so
+these tests use a stand-in for pyocl's Kernel which borrows its methods, and
+record the launches rather than enqueueing them, without an OpenCL runtime.
+'''
+import unittest
+
+import numpy
+
+import clq.backends.opencl.pyocl as pyocl
+
+class Kernel(object):
+    __call__ = pyocl.Kernel.__call__.im_func
+    _call_vectorized = pyocl.Kernel._call_vectorized.im_func
+    _process_args = pyocl.Kernel._process_args.im_func
+    convert_arg = pyocl.Kernel.__dict__['convert_arg']
+
+    queue = "queue"
+    vector_kernel = None
+    vector_width = None
+
+    def __init__(self, name, vector_width=None):
+        self.name = name
+        if vector_width is not None:
+            self.vector_kernel = Kernel(name + "_x%d" % vector_width)
+            self.vector_width = vector_width
+
+class LaunchTest(unittest.TestCase):
+    def setUp(self):
+        self.launches = [ ]
+        def launch(kernel, queue, global_size, *args, **kwargs):
+            self.launches.append((kernel.name, global_size, kwargs))
+            self.assertEqual(queue, "queue")
+            self.assertTrue(type(args[0]) is numpy.float32)
+            return "event %d" % len(self.launches)
+        self._orig__call_Kernel = pyocl._orig__call_Kernel
+        pyocl._orig__call_Kernel = launch
+
+    def tearDown(self):
+        pyocl._orig__call_Kernel = self._orig__call_Kernel
+
+class SplitTest(LaunchTest):
+    def runTest(self):
+        kernel = Kernel("scale", 4)
+        kernel.bound_by = kernel.vector_kernel.bound_by = "binder"
+        # the vectors, then the elements left over once they have been
+        event = kernel((10,), 2.0)
+        self.assertEqual(self.launches, [
+            ("scale_x4", (2,), { }),
+            ("scale", (2,), {'global_offset': (8,),
+                             'wait_for': ["event 1"]})])
+        self.assertEqual(event, "event 2")
+        # binders must set the arguments of both again
+        self.assertTrue(kernel.bound_by is None)
+        self.assertTrue(kernel.vector_kernel.bound_by is None)
+
+        # nothing left over
+        del self.launches[:]
+        self.assertEqual(kernel((8,), 2.0), "event 1")
+        self.assertEqual(self.launches, [("scale_x4", (2,), { })])
+
+        # fewer elements than the width
+        del self.launches[:]
+        kernel((3,), 2.0, vectorize=True)
+        self.assertEqual(self.launches, [("scale", (3,), { })])
+
+        # events to wait for are passed to the first launch
+        del self.launches[:]
+        kernel((9,), 2.0, wait_for=["before"])
+        self.assertEqual(self.launches[0],
+                         ("scale_x4", (2,), {'wait_for': ["before"]}))
+        self.assertEqual(self.launches[1][2]['wait_for'], ["event 1"])
+
+class ChoiceTest(LaunchTest):
+    def runTest(self):
+        kernel = Kernel("scale", 4)
+        for global_size, kwargs in (((3,), { }),
+                                    ((16,), {'local_size': (4,)}),
+                                    ((16,), {'global_offset': (4,)}),
+                                    ((16, 16), { }),
+                                    ((16,), {'vectorize': False})):
+            del self.launches[:]
+            kernel(global_size, 2.0, **kwargs)
+            kwargs.pop('vectorize', None)
+            self.assertEqual(self.launches, [("scale", global_size, kwargs)])
+
+        # without a vectorized variant
+        del self.launches[:]
+        Kernel("scale")((16,), 2.0)
+        self.assertEqual(self.launches, [("scale", (16,), { })])
+        self.assertRaises(pyocl.Error, Kernel("scale"), (16,), 2.0,
+                          vectorize=True)
+        self.assertRaises(pyocl.Error, kernel, (16,), 2.0, vectorize=True,
+                          local_size=(4,))
+        self.assertRaises(pyocl.Error, kernel, (16, 16), 2.0, vectorize=True)
+
+class ProcessArgsTest(unittest.TestCase):
+    def runTest(self):
+        kernel = Kernel("scale")
+        local = pyocl.LocalMemory(16)
+        x = numpy.float64(0.5)
+        args = list(kernel._process_args((local, x, 3, 0.5)))
+        # local memory and numpy numbers are passed as they are
+        self.assertTrue(args[0] is local and args[1] is x)
+        self.assertTrue(type(args[2]) is numpy.int32)
+        self.assertTrue(type(args[3]) is numpy.float32)
+        self.assertRaises(pyocl.Error, list,
+                          kernel._process_args((object(),)))
+
+if __name__ == "__main__":
+    unittest.main()
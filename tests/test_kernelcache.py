@@ -0,0 +1,84 @@
+'''Unit tests for the in-memory cache of the kernels built for each context.
+
+The cache only calls the function it is given to build each kernel, and
+build only compiles a module in the context, so these tests use stand-ins for
+pyocl's Context and Program, and run without an OpenCL runtime.
+'''
+import gc
+import weakref
+import unittest
+
+import clq
+import clq.backends.opencl as ocl
+import clq.backends.opencl.kernelcache as kernelcache
+
+OpenCL = ocl.Backend()
+
+class Program(object):
+    def __init__(self, context, code):
+        self.context = context
+        self.code = code
+
+    def __getattr__(self, name):
+        return (self, name)
+
+class Context(object):
+    def compile(self, code, options=""):
+        return Program(self, code)
+
+class KernelCacheTest(unittest.TestCase):
+    def runTest(self):
+        cache = kernelcache.KernelCache(max_size=2)
+        built = [ ]
+        def make_kernel(name):
+            def make():
+                built.append(name)
+                return name
+            return make
+        a, b = Context(), Context()
+        self.assertEqual(cache.kernel(a, "f", make_kernel("a.f")), "a.f")
+        self.assertEqual(cache.kernel(a, "f", make_kernel("other")), "a.f")
+        # each context has its own
+        self.assertEqual(cache.kernel(b, "f", make_kernel("b.f")), "b.f")
+        self.assertEqual(cache.stats, {'hits': 1, 'misses': 2, 'kernels': 2})
+
+        # the least recently used is dropped
+        cache.kernel(a, "f", make_kernel("other"))
+        cache.kernel(a, "g", make_kernel("a.g"))
+        self.assertEqual(cache.kernel(a, "f", make_kernel("other")), "a.f")
+        self.assertEqual(cache.kernel(b, "f", make_kernel("b.f 2")), "b.f 2")
+        self.assertEqual(built, ["a.f", "b.f", "a.g", "b.f 2"])
+        self.assertEqual(cache.stats['kernels'], 2)
+
+        cache.clear()
+        self.assertEqual(cache.stats['kernels'], 0)
+
+class ReleaseTest(unittest.TestCase):
+    def runTest(self):
+        # kernels hold their context, which is freed once they are dropped
+        cache = kernelcache.KernelCache(max_size=1)
+        ctx = Context()
+        ref = weakref.ref(ctx)
+        cache.kernel(ctx, "f", lambda program=Program(ctx, ""): program)
+        del ctx
+        cache.kernel(Context(), "f", lambda: "kernel")
+        gc.collect()
+        self.assertTrue(ref() is None)
+
+class BuildTest(unittest.TestCase):
+    def runTest(self):
+        scale = clq.fn.from_source('''
+def scale(a, x, get_global_id):
+    gid = get_global_id(0)
+    a[gid] = a[gid] * x
+''')
+        concrete_fn = scale.compile(OpenCL, ocl.float.ptr_global, ocl.float,
+                                    ocl.get_global_id.cl_type)
+        ctx = Context()
+        program, name = kernelcache.build(ctx, OpenCL, [concrete_fn])
+        self.assertEqual(name, "scale")
+        self.assertTrue(program.context is ctx)
+        self.assertTrue("__kernel void scale(" in program.code)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+'''Unit tests for the fusion of lazy elementwise expressions.'''
+import unittest
+
+import clq
+import clq.backends.opencl as ocl
+import clq.stdlib as stdlib
+from clq.backends.opencl import lazy
+
+class Array(object):
+    # the metadata of a pyocl.Buffer that expressions are compiled for
+    def __init__(self, cl_dtype):
+        self.cl_dtype = cl_dtype
+        self.cl_type = cl_dtype.ptr_global
+
+class FusionTest(unittest.TestCase):
+    def runTest(self):
+        a, b, e = Array(ocl.float), Array(ocl.float), Array(ocl.float)
+        fusion = lazy.Fusion(lazy.apply(stdlib.mul, lazy.plus(a, b), e))
+        self.assertEqual(fusion.fns, [stdlib.plus, stdlib.mul])
+        self.assertEqual([input.value for input in fusion.inputs], [a, b, e])
+        self.assertEqual(fusion.value_src, 
+                         "def fused_plus_mul_value(x0, x1, x2, f0, f1):\n"
+                         "    return f1(f0(x0, x1), x2)\n")
+        self.assertTrue("dest[gid] = value(x0[gid], x1[gid], x2[gid], f0, "
+                        "f1)" in fusion.kernel_src)
+        self.assertTrue(fusion.result_type is ocl.float)
+        
+        code = fusion.kernel_fn.compile(lazy.backend, 
+                                        *fusion.arg_types).program_item.code
+        self.assertTrue("__kernel void fused_plus_mul(__global float* x0, "
+                        "__global float* x1, __global float* x2, "
+                        "__global float* dest)" in code)
+        self.assertTrue("dest[gid] = ((x0[gid] + x1[gid]) * x2[gid]);" in code)
+        
+        # the same structure gives the same generic functions
+        other = lazy.Fusion(lazy.mul(lazy.plus(e, a), b))
+        self.assertTrue(other.kernel_fn is fusion.kernel_fn)
+        
+class SharedExpressionsTest(unittest.TestCase):
+    def runTest(self):
+        a = lazy.as_expr(Array(ocl.int))
+        c = a + 1
+        fusion = lazy.Fusion((c * a) - c)
+        # a is read once and c computed once
+        self.assertEqual(len(fusion.inputs), 2)
+        self.assertEqual(fusion.value_src,
+                         "def fused_plus_mul_minus_value(x0, x1, f0, f1, f2):\n"
+                         "    t0 = f0(x0, x1)\n"
+                         "    return f2(f1(t0, x0), t0)\n")
+        self.assertEqual(fusion.arg_types[:3], 
+                         (ocl.int.ptr_global, ocl.int, ocl.int.ptr_global))
+        
+        # expressions which have been evaluated are read from their buffers
+        c.buffer = Array(ocl.int)
+        fusion = lazy.Fusion((c * a) - c)
+        self.assertEqual(fusion.fns, [stdlib.mul, stdlib.minus])
+        self.assertTrue(fusion.inputs[0] is c)
+        self.assertTrue("value(x0[gid], x1[gid], f0, f1)" 
+                        in fusion.kernel_src)
+
+class OperatorsTest(unittest.TestCase):
+    def runTest(self):
+        a = lazy.as_expr(Array(ocl.float))
+        for expr, fn in ((a + 1, stdlib.plus), (1 - a, stdlib.minus), 
+                         (a * a, stdlib.mul), (2 / a, stdlib.div)):
+            self.assertTrue(expr.generic_fn is fn)
+        self.assertTrue((2 / a).args[1] is a)
+        self.assertEqual((1 - a).args[0].value, 1)
+        self.assertTrue(lazy.as_expr(a) is a)
+
+class VectorizedFusionTest(unittest.TestCase):
+    def runTest(self):
+        a, b = Array(ocl.float), Array(ocl.float)
+        fusion = lazy.Fusion(lazy.div(a, b) * 2)
+        code = fusion.kernel_fn.with_options(vectorize=4).compile(
+            lazy.backend, *fusion.arg_types).program_item.code
+        self.assertTrue("vstore4(((vload4(gid, x0) / vload4(gid, x1)) * x2), "
+                        "gid, dest);" in code)
+
+if __name__ == "__main__":
+    unittest.main()
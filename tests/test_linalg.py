@@ -0,0 +1,189 @@
+'''Unit tests for the tiled matrix multiplication kernels.
+
+The kernels can't be run without a device, so the generated code is checked,
+and the host functions are run with a stand-in for linalg._kernel which
+records each launch and computes its product with numpy, and with stand-ins
+for pyocl's Context and Buffer holding arrays.
+'''
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+import clq
+import clq.backends.opencl as ocl
+import clq.backends.opencl.pyocl as pyocl
+from clq.stdlib import linalg
+
+class Device(object):
+    # the attributes of a pyocl.Device that configurations depend on
+    vendor = "Vendor "
+    name = "Device"
+    driver_version = "1.0"
+    max_work_group_size = 256
+    local_mem_size = 16384
+
+def code_for(config, cl_dtype=ocl.float):
+    return linalg.gemm_tiled.compile(
+        linalg.backend, *linalg.gemm_arg_types(config, cl_dtype)
+    ).program_item.code
+
+class ConfigTest(unittest.TestCase):
+    def runTest(self):
+        config = linalg.Config(32, 4, 2)
+        self.assertEqual(config, linalg.Config(32, 4, 2))
+        self.assertNotEqual(config, linalg.Config(32, 4, 4))
+        self.assertEqual(config.local_size, (8, 32))
+        for params in ((32, 3, 1), (32, 4, 8), (20, 8, 4), (32, 32, 4)):
+            self.assertRaises(clq.Error, linalg.Config, *params)
+
+        device = Device()
+        self.assertTrue(linalg.Config(16, 2, 2).fits(device))
+        # too many work-items, and too much local memory
+        self.assertFalse(linalg.Config(64, 4, 4).fits(device))
+        self.assertFalse(linalg.Config(64, 16, 4).fits(device))
+        self.assertTrue(linalg.Config(64, 16, 4).fits(device, ocl.half))
+
+class CodeTest(unittest.TestCase):
+    def runTest(self):
+        code = code_for(linalg.Config(32, 4, 2))
+        self.assertTrue("__kernel void gemm_tiled(__global float* a, "
+                        "__global float* b, __global float* c, uint n, "
+                        "uint k, __local float* a_tile, "
+                        "__local float* b_tile)" in code)
+        self.assertTrue("float4 acc;" in code)
+        self.assertTrue("vload2(" in code and "vstore2(" in code)
+        self.assertTrue("vstore4(acc, " in code)
+        self.assertEqual(code.count("barrier(1u);"), 2)
+        # the tile sizes are bound
+        self.assertTrue("t += 32" in code)
+        self.assertFalse("tile_size" in code)
+
+        code = code_for(linalg.Config(16, 8, 8), ocl.double)
+        self.assertTrue("double8 acc;" in code)
+
+class DeviceConfigsTest(unittest.TestCase):
+    def setUp(self):
+        self.prev_configs = dict(linalg.configs)
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        linalg.configs.clear()
+        linalg.configs.update(self.prev_configs)
+        shutil.rmtree(self.path)
+
+    def runTest(self):
+        device = Device()
+        key = linalg.device_key(device)
+        self.assertEqual(key, "Vendor/Device/1.0")
+        self.assertEqual(linalg.config_for(device), linalg.default_config)
+        linalg.configs[key] = linalg.Config(32, 8, 4)
+        self.assertEqual(linalg.config_for(device), linalg.Config(32, 8, 4))
+
+        path = os.path.join(self.path, "configs.json")
+        linalg.save_configs(path)
+        linalg.configs.clear()
+        linalg.load_configs(path)
+        self.assertEqual(linalg.configs, {key: linalg.Config(32, 8, 4)})
+
+class PaddingTest(unittest.TestCase):
+    def runTest(self):
+        a = numpy.arange(6, dtype=numpy.float64).reshape(2, 3)
+        padded = linalg._padded(numpy, a, 4)
+        self.assertEqual(padded.shape, (4, 4))
+        self.assertEqual(padded.dtype, numpy.float32)
+        self.assertTrue((padded[:2, :3] == a).all())
+        self.assertEqual(padded[2:].sum() + padded[:, 3:].sum(), 0)
+
+        b = numpy.ones((4, 8), dtype=numpy.float32)
+        self.assertTrue(linalg._padded(numpy, b, 4) is b)
+
+class Buffer(object):
+    def __init__(self, context, array, cl_dtype=ocl.float):
+        self.context = context
+        self.array = array
+        self.shape = array.shape
+        self.cl_dtype = cl_dtype
+
+    def from_device(self, wait_for=None):
+        self.context.waited_for = wait_for
+        return self.array
+
+class Context(object):
+    device = Device()
+    waited_for = None
+
+    def to_device(self, array):
+        return Buffer(self, array)
+
+    def alloc(self, shape, cl_dtype):
+        return Buffer(self, numpy.zeros(shape, numpy.float32), cl_dtype)
+
+class DriverTest(unittest.TestCase):
+    def setUp(self):
+        self.launches = [ ]
+        def kernel(ctx, config, cl_dtype):
+            def launch(global_size, a, b, c, n, k, a_tile, b_tile,
+                       **kwargs):
+                self.launches.append((config, cl_dtype, global_size,
+                                      (a, b, c, n, k, a_tile, b_tile),
+                                      kwargs))
+                c.array[...] = a.array.dot(b.array)
+                return "event"
+            return launch
+        self._kernel = linalg._kernel
+        linalg._kernel = kernel
+
+    def tearDown(self):
+        linalg._kernel = self._kernel
+
+class GemmTest(DriverTest):
+    def runTest(self):
+        ctx = Context()
+        a = ctx.to_device(numpy.ones((32, 64), numpy.float32))
+        b = ctx.to_device(numpy.ones((64, 16), numpy.float32))
+        config = linalg.Config(16, 4, 2)
+        c, event = linalg.gemm(a, b, config=config, wait_for=["before"])
+        self.assertEqual((c.shape, event), ((32, 16), "event"))
+        self.assertTrue((c.array == 64).all())
+
+        launched, cl_dtype, global_size, args, kwargs = self.launches[0]
+        self.assertEqual((launched, cl_dtype), (config, ocl.float))
+        # each work-item computes four elements of a row
+        self.assertEqual(global_size, (4, 32))
+        self.assertEqual(kwargs, {'local_size': (4, 16),
+                                  'wait_for': ["before"]})
+        self.assertTrue(args[:3] == (a, b, c))
+        self.assertTrue(type(args[3]) is numpy.uint32 and args[3] == 16)
+        self.assertTrue(type(args[4]) is numpy.uint32 and args[4] == 64)
+        # a tile of local memory for each operand
+        self.assertTrue(isinstance(args[5], pyocl.LocalMemory))
+        self.assertEqual(args[5].size, 16 * 16 * 4)
+
+        # into the provided buffer, with the configuration for the device
+        linalg.gemm(a, b, c)
+        self.assertEqual(self.launches[1][0], linalg.default_config)
+        self.assertTrue(self.launches[1][3][2] is c)
+        self.assertFalse('wait_for' in self.launches[1][4])
+
+        self.assertRaises(clq.Error, linalg.gemm, a, a, config=config)
+        self.assertRaises(clq.Error, linalg.gemm, a,
+                          ctx.to_device(numpy.ones((64, 8))), config=config)
+
+class DotTest(DriverTest):
+    def runTest(self):
+        ctx = Context()
+        a = numpy.arange(6, dtype=numpy.float64).reshape(2, 3)
+        b = numpy.arange(12, dtype=numpy.float64).reshape(3, 4)
+        c = linalg.dot(ctx, a, b, linalg.Config(16, 4, 2))
+        self.assertTrue(numpy.allclose(c, a.dot(b)))
+        self.assertEqual(c.shape, (2, 4))
+        self.assertEqual(ctx.waited_for, ["event"])
+        # the padded matrices are multiplied
+        self.assertEqual(self.launches[0][2], (4, 16))
+        self.assertRaises(clq.Error, linalg.dot, ctx, a, a)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+'''Unit tests for inferring the types of local variables.'''
+import unittest
+
+import clq
+import clq.backends.opencl as ocl
+
+OpenCL = ocl.Backend()
+
+@clq.fn
+def accumulate(a, n):
+    s = 0
+    for i in (0, n):
+        s = s + a[i]
+    if n > 2:
+        s = s - 1
+    else:
+        s = 2
+    t = s
+    return t
+
+@clq.fn
+def mutual(x):
+    a = 0
+    b = a
+    a = b + x
+    return b
+
+class AccumulateTest(unittest.TestCase):
+    def runTest(self):
+        concrete_fn = accumulate.compile(OpenCL, ocl.float.ptr_global, ocl.int)
+        self.assertTrue(concrete_fn.return_type is ocl.float)
+
+class MutualTest(unittest.TestCase):
+    def runTest(self):
+        self.assertTrue(mutual.compile(OpenCL, ocl.double).return_type
+                        is ocl.double)
+        self.assertTrue(mutual.compile(OpenCL, ocl.short).return_type
+                        is ocl.int)
+
+class LongChainTest(unittest.TestCase):
+    def runTest(self):
+        n = 3000 # well past the recursion limit
+        lines = ["def long_chain(x, n):", "    s = 0"]
+        for i in xrange(n):
+            lines.append("    s = s + x")
+            lines.append("    if n == %d:" % i)
+            lines.append("        return s")
+        lines.append("    return x")
+        long_chain = clq.fn.from_source("\n".join(lines))
+        self.assertTrue(long_chain.compile(OpenCL, ocl.float, ocl.int).return_type
+                        is ocl.float)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+'''Unit tests for linking many concrete functions into a module.'''
+import unittest
+
+import clq
+import clq.backends.opencl as ocl
+
+OpenCL = ocl.Backend()
+
+# kept out of line, so its program item is shared
+helper = clq.fn.from_source('''
+def helper(x):
+    return x * 2
+''', inline=False)
+
+twice = clq.fn.from_source('''
+def twice(x, helper):
+    return helper(helper(x))
+''')
+
+plus_one = clq.fn.from_source('''
+def plus_one(x, helper):
+    return helper(x) + 1
+''')
+
+def names(module):
+    return [item.name for item in module.program_items]
+
+class SharedHelperTest(unittest.TestCase):
+    def runTest(self):
+        helper_t = helper.cl_type
+        twice_fn = twice.compile(OpenCL, ocl.int, helper_t)
+        plus_one_fn = plus_one.compile(OpenCL, ocl.int, helper_t)
+        module = clq.Module(OpenCL, (twice_fn, plus_one_fn))
+        self.assertEqual(names(module), 
+                         ["helper_int", twice_fn.name, plus_one_fn.name])
+        self.assertEqual(module.extensions, ())
+        code = module.code
+        self.assertEqual(code.count("helper_int("), 4)
+        self.assertTrue(code.index("int helper_int(") < 
+                        code.index("int %s(" % twice_fn.name))
+
+class ExtensionsTest(unittest.TestCase):
+    def runTest(self):
+        module = clq.Module(OpenCL)
+        module.add(helper.compile(OpenCL, ocl.double))
+        module.add(twice.compile(OpenCL, ocl.double, helper.cl_type))
+        self.assertEqual(module.extensions, ("cl_khr_fp64",))
+        code = module.code
+        self.assertTrue(code.startswith(
+            "#pragma OPENCL EXTENSION cl_khr_fp64 : enable\n"))
+        self.assertEqual(code.count("#pragma"), 1)
+        
+scale = clq.fn.from_source('''
+def scale(x, a):
+    return x * a
+''', inline=False)
+
+saxpy = clq.fn.from_source('''
+def saxpy(a, x, y, scale, get_global_id):
+    gid = get_global_id(0)
+    y[gid] = scale(x[gid], a) + y[gid]
+''')
+
+class SpecializationsTest(unittest.TestCase):
+    def runTest(self):
+        # as in the docstring of Module
+        scale_f = scale.compile(OpenCL, ocl.float, ocl.float)
+        scale_d = scale.compile(OpenCL, ocl.double, ocl.double)
+        saxpy_f = saxpy.compile(OpenCL, ocl.float, ocl.float.ptr_global, 
+                                ocl.float.ptr_global, scale.cl_type, 
+                                ocl.get_global_id.cl_type)
+        module = clq.Module(OpenCL, (scale_f, scale_d, saxpy_f))
+        self.assertEqual(names(module), 
+                         ["scale_float_float", "scale_double_double", 
+                          "saxpy"])
+        code = module.code
+        self.assertTrue("float scale_float_float(float x, float a)" in code)
+        self.assertTrue("double scale_double_double(double x, double a)" 
+                        in code)
+        # kernels keep their names
+        self.assertTrue("__kernel void saxpy(" in code)
+        self.assertTrue("y[gid] = (scale_float_float(x[gid], a) + y[gid]);" 
+                        in code)
+        
+class ConflictTest(unittest.TestCase):
+    def runTest(self):
+        # specializations of the same kernel share its name
+        module = clq.Module(OpenCL, (
+            saxpy.compile(OpenCL, ocl.float, ocl.float.ptr_global, 
+                          ocl.float.ptr_global, scale.cl_type, 
+                          ocl.get_global_id.cl_type),
+            saxpy.compile(OpenCL, ocl.double, ocl.double.ptr_global, 
+                          ocl.double.ptr_global, scale.cl_type, 
+                          ocl.get_global_id.cl_type)))
+        self.assertRaises(clq.LinkError, lambda: module.code)
+        
+        other = ocl.Backend()
+        self.assertRaises(clq.LinkError, module.add, 
+                          helper.compile(other, ocl.int))
+
+if __name__ == "__main__":
+    unittest.main()
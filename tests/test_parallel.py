@@ -0,0 +1,393 @@
+'''Unit tests for the parallel primitives.
+
+The kernels can't be run without a device, so besides checking the generated
+code, the drivers are run with a stand-in for parallel._kernel, which runs the
+Python source of each kernel on the host, a thread per work-item, and with
+stand-ins for pyocl's Context and Buffer holding lists.
+'''
+import ast
+import copy
+import threading
+import unittest
+
+import numpy
+
+import clq
+import clq.backends.opencl as ocl
+import clq.stdlib as stdlib
+from clq.stdlib import parallel
+
+def code_for(generic_fn, *arg_types):
+    return generic_fn.compile(parallel.backend, *arg_types).program_item.code
+
+group_builtins = parallel._builtins("get_local_id", "get_local_size",
+                                    "get_group_id", "barrier",
+                                    "CLK_LOCAL_MEM_FENCE")
+
+class BarrierTest(unittest.TestCase):
+    def runTest(self):
+        code = code_for(clq.fn.from_source('''
+def f(a, scratch, get_local_id, barrier, CLK_LOCAL_MEM_FENCE):
+    lid = get_local_id(0)
+    scratch[lid] = a[lid]
+    barrier(CLK_LOCAL_MEM_FENCE)
+    a[lid] = scratch[lid] + scratch[0]
+    barrier(CLK_LOCAL_MEM_FENCE)
+    a[lid] = a[lid] + scratch[0]
+'''), ocl.float.ptr_global, ocl.float.ptr_shared,
+     ocl.get_local_id.cl_type, ocl.barrier.cl_type, ocl.CLK_LOCAL_MEM_FENCE)
+        self.assertTrue("__local float* scratch" in code)
+        self.assertEqual(code.count("barrier(1u);"), 2)
+        # local memory is read again after each barrier
+        self.assertEqual(code.count("scratch[0]"), 2)
+        self.assertFalse(ocl.barrier.pure)
+        self.assertTrue(ocl.t("__local float*") is ocl.float.ptr_shared)
+
+class ReduceTest(unittest.TestCase):
+    def runTest(self):
+        code = code_for(parallel.reduce_groups, ocl.float.ptr_global, ocl.uint,
+                        ocl.float.ptr_global, ocl.float.ptr_shared,
+                        stdlib.plus.cl_type, *group_builtins)
+        self.assertTrue("__kernel void reduce_groups(__global float* src, "
+                        "uint n, __global float* dest, "
+                        "__local float* scratch)" in code)
+        # neighbouring elements are combined, keeping them in order
+        self.assertTrue("x = (x + src[(i + 1)]);" in code)
+        self.assertTrue("scratch[j] = (scratch[j] + scratch[(j + s)]);"
+                        in code)
+        # the barrier stays in the loop
+        loop = code[code.index("while (s < size)"):]
+        self.assertTrue("barrier(1u);" in loop)
+
+class ScanTest(unittest.TestCase):
+    def runTest(self):
+        arg_types = [ocl.int.ptr_global, ocl.uint, ocl.int.ptr_global,
+                     ocl.int.ptr_global, ocl.int, None, ocl.int.ptr_shared,
+                     stdlib.mul.cl_type] + group_builtins
+        arg_types[5] = clq.const(False)
+        exclusive = code_for(parallel.scan_groups, *arg_types)
+        arg_types[5] = clq.const(True)
+        inclusive = code_for(parallel.scan_groups, *arg_types)
+        self.assertTrue("int identity, __local int* scratch)" in exclusive)
+        self.assertTrue("scratch[bi] = (scratch[bi] * t);" in exclusive)
+        # the choice is folded away
+        self.assertFalse("inclusive" in exclusive)
+        self.assertTrue("dest[(base + j)] = scratch[j];" in exclusive)
+        self.assertTrue("(scratch[j] * src[" in inclusive)
+
+        code = code_for(parallel.add_offsets, ocl.int.ptr_global, ocl.uint,
+                        ocl.int.ptr_global, stdlib.mul.cl_type,
+                        *parallel._builtins("get_local_id", "get_local_size",
+                                            "get_group_id"))
+        self.assertTrue("dest[i] = (offset * dest[i]);" in code)
+
+class CompactTest(unittest.TestCase):
+    def runTest(self):
+        positive = clq.fn.from_source('''
+def positive(x):
+    return x > 0
+''')
+        code = code_for(parallel.flag_elements, ocl.float.ptr_global, ocl.uint,
+                        ocl.uint.ptr_global, positive.cl_type,
+                        *parallel._builtins("get_global_id"))
+        self.assertTrue("if (src[i] > 0)" in code)
+        code = code_for(parallel.scatter_flagged, ocl.float.ptr_global,
+                        ocl.uint, ocl.uint.ptr_global, ocl.uint.ptr_global,
+                        ocl.float.ptr_global,
+                        *parallel._builtins("get_global_id"))
+        self.assertTrue("dest[positions[i]] = src[i];" in code)
+
+class ReduceSegmentsTest(unittest.TestCase):
+    def runTest(self):
+        code = code_for(parallel.reduce_segment_groups, ocl.float.ptr_global,
+                        ocl.uint.ptr_global, ocl.float.ptr_global, ocl.float,
+                        ocl.float.ptr_shared, stdlib.plus.cl_type,
+                        *group_builtins)
+        self.assertTrue("end = offsets[(segment + 1)];" in code)
+        self.assertTrue("dest[segment] = identity;" in code)
+
+class RadixSortTest(unittest.TestCase):
+    def runTest(self):
+        code = code_for(parallel.flag_zero_bits, ocl.uint.ptr_global,
+                        ocl.uint, ocl.uint, ocl.uint.ptr_global,
+                        *parallel._builtins("get_global_id"))
+        self.assertTrue("flags[i] = (1 - ((keys[i] >> bit) & 1));" in code)
+
+        arg_types = [ocl.uint.ptr_global, ocl.float.ptr_global, ocl.uint,
+                     ocl.uint.ptr_global, ocl.uint.ptr_global,
+                     ocl.uint.ptr_global, ocl.float.ptr_global, None,
+                     ocl.get_global_id.cl_type]
+        arg_types[7] = clq.const(True)
+        code = code_for(parallel.split_by_bit, *arg_types)
+        self.assertTrue("dest_values[j] = values[i];" in code)
+        arg_types[7] = clq.const(False)
+        code = code_for(parallel.split_by_bit, *arg_types)
+        self.assertFalse("dest_values[j]" in code)
+
+class LocalSizeTest(unittest.TestCase):
+    def runTest(self):
+        self.assertEqual(parallel._local_size(None), parallel.local_size)
+        self.assertEqual(parallel._local_size(64), 64)
+        self.assertRaises(clq.Error, lambda: parallel._local_size(96))
+        self.assertRaises(clq.Error, lambda: parallel._local_size(0))
+
+################################################################################
+# Running kernels on the host
+################################################################################
+class RangeLoops(ast.NodeTransformer):
+    # for x in (start, stop, step) loops over a range in kernels
+    def visit_For(self, node):
+        self.generic_visit(node)
+        if isinstance(node.iter, ast.Tuple):
+            node.iter = ast.Call(ast.Name('xrange', ast.Load()),
+                                 node.iter.elts, [ ], None, None)
+        return node
+
+def host_fn(generic_fn):
+    fn_ast = RangeLoops().visit(copy.deepcopy(generic_fn.original_ast))
+    fn_ast.decorator_list = [ ]
+    module = ast.fix_missing_locations(ast.Module([fn_ast]))
+    namespace = { }
+    exec compile(module, "<%s>" % generic_fn.name, "exec") in namespace
+    return namespace[generic_fn.name]
+
+class WorkGroup(object):
+    def __init__(self, group, size):
+        self.group = group
+        self.size = size
+        self.condition = threading.Condition()
+        self.waiting = 0
+        self.generation = 0
+
+    def builtins(self, lid):
+        return {'get_local_id': lambda dim: lid,
+                'get_local_size': lambda dim: self.size,
+                'get_group_id': lambda dim: self.group,
+                'get_global_id': lambda dim: self.group * self.size + lid,
+                'barrier': self.barrier}
+
+    def barrier(self, flags):
+        with self.condition:
+            generation = self.generation
+            self.waiting += 1
+            if self.waiting == self.size:
+                self.waiting = 0
+                self.generation += 1
+                self.condition.notify_all()
+            while generation == self.generation:
+                self.condition.wait()
+
+class Local(object):
+    # stands in for the local memory each work-group gets
+    def __init__(self, n):
+        self.n = n
+
+class Kernel(object):
+    def __init__(self, generic_fn, arg_types, launches):
+        self.name = generic_fn.name
+        self.fn = host_fn(generic_fn)
+        self.arg_names = generic_fn.arg_names
+        self.arg_types = arg_types
+        self.launches = launches
+
+    def __call__(self, global_size, *args, **kwargs):
+        local_size = kwargs['local_size']
+        self.launches.append((self.name, global_size, local_size, args))
+        size = local_size[0]
+        for group in xrange(global_size[0] // size):
+            self.run_group(WorkGroup(group, size), args)
+
+    def run_group(self, work_group, args):
+        params = { }
+        args = iter(args)
+        for name, arg_type in zip(self.arg_names, self.arg_types):
+            if isinstance(arg_type, clq.ConstantType):
+                params[name] = arg_type.value
+            elif isinstance(arg_type, clq.GenericFnType):
+                params[name] = host_fn(arg_type.generic_fn)
+            elif not isinstance(arg_type, clq.VirtualType):
+                arg = next(args)
+                if isinstance(arg, Local):
+                    arg = [None] * arg.n
+                params[name] = arg
+        errors = [ ]
+        def run(lid):
+            builtins = work_group.builtins(lid)
+            kwargs = dict((name, builtins[name]) for name in self.arg_names
+                          if name in builtins)
+            try:
+                self.fn(**dict(params, **kwargs))
+            except Exception, e:
+                errors.append(e)
+        threads = [threading.Thread(target=run, args=(lid,))
+                   for lid in xrange(work_group.size)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+            if thread.is_alive():
+                raise AssertionError("%s did not complete." % self.name)
+        if errors:
+            raise errors[0]
+
+class Buffer(list):
+    def __init__(self, elements, cl_dtype, context=None):
+        list.__init__(self, elements)
+        self.cl_dtype = cl_dtype
+        self.context = context
+
+    @property
+    def cl_type(self):
+        return self.cl_dtype.ptr_global
+
+    def from_device(self):
+        return list(self)
+
+class Context(object):
+    def alloc(self, shape=None, cl_dtype=None, like=None):
+        if like is not None:
+            shape, cl_dtype = len(like), like.cl_dtype
+        return Buffer([None] * shape, cl_dtype, self)
+
+class Strings(object):
+    # an element type holding Python strings, which concatenate with plus
+    np_dtype = numpy.dtype(object)
+    ptr_global = "__global string*"
+    ptr_shared = "__local string*"
+
+class HostTest(unittest.TestCase):
+    def setUp(self):
+        self.ctx = Context()
+        self.launches = [ ]
+        self._kernel = parallel._kernel
+        self._local_memory = parallel._local_memory
+        parallel._kernel = lambda ctx, generic_fn, *arg_types: Kernel(
+            generic_fn, arg_types, self.launches)
+        parallel._local_memory = lambda ctx, n, cl_dtype: Local(n)
+
+    def tearDown(self):
+        parallel._kernel = self._kernel
+        parallel._local_memory = self._local_memory
+
+    def buffer(self, elements, cl_dtype):
+        return Buffer(elements, cl_dtype, self.ctx)
+
+class OrderTest(HostTest):
+    def runTest(self):
+        # concatenation is associative but not commutative
+        letters = "abcdefghijklmnopqrstuvwxyz"
+        for local_size in (1, 2, 4):
+            for n in (1, 2, 3, 5, 8, 9, 17, 26):
+                src = self.buffer(letters[:n], Strings)
+                self.assertEqual(parallel.reduce(stdlib.plus, src,
+                                                 local_size),
+                                 letters[:n])
+
+            offsets = self.buffer([0, 0, 1, 4, 8, 15, 26], ocl.uint)
+            dest = parallel.reduce_segments(stdlib.plus,
+                                            self.buffer(letters, Strings),
+                                            offsets, "", local_size)
+            self.assertEqual(dest, ["", "a", "bcd", "efgh", "ijklmno",
+                                    "pqrstuvwxyz"])
+
+class ReduceDriverTest(HostTest):
+    def runTest(self):
+        src = self.buffer(range(1, 11), ocl.int)
+        self.assertEqual(parallel.reduce(stdlib.plus, src, 2), 55)
+        # each pass reduces four elements per work-group
+        self.assertEqual([launch[:3] for launch in self.launches],
+                         [("reduce_groups", (6,), (2,)),
+                          ("reduce_groups", (2,), (2,))])
+        args = self.launches[0][3]
+        self.assertTrue(args[0] is src)
+        self.assertTrue(type(args[1]) is numpy.uint32 and args[1] == 10)
+        self.assertEqual(len(args[2]), 3)
+        self.assertEqual(args[3].n, 2)
+        self.assertRaises(clq.Error, parallel.reduce, stdlib.plus,
+                          self.buffer([ ], ocl.int))
+
+class ScanDriverTest(HostTest):
+    def runTest(self):
+        src = self.buffer(range(1, 11), ocl.int)
+        dest = parallel.scan(stdlib.plus, src, 0, local_size=2)
+        self.assertEqual(dest, [0, 1, 3, 6, 10, 15, 21, 28, 36, 45])
+        # the sums of the three groups are scanned and added to them
+        self.assertEqual([launch[:3] for launch in self.launches],
+                         [("scan_groups", (6,), (2,)),
+                          ("scan_groups", (2,), (2,)),
+                          ("add_offsets", (6,), (2,))])
+        args = self.launches[0][3]
+        self.assertTrue(args[0] is src and args[2] is dest)
+        self.assertTrue(type(args[4]) is numpy.int32)
+        self.assertEqual(args[5].n, 4)
+
+        dest = parallel.scan(stdlib.mul, src, 1, inclusive=True,
+                             local_size=4)
+        self.assertEqual(dest[:5], [1, 2, 6, 24, 120])
+        letters = self.buffer("abcdefghij", Strings)
+        dest = parallel.scan(stdlib.plus, letters, "", inclusive=True,
+                             local_size=2)
+        self.assertEqual(dest[-1], "abcdefghij")
+        self.assertEqual(dest[4], "abcde")
+
+class CompactDriverTest(HostTest):
+    def runTest(self):
+        positive = clq.fn.from_source('''
+def positive(x):
+    return x > 0
+''')
+        src = self.buffer([3, -1, 0, 5, -2, 7, 8], ocl.int)
+        dest, count = parallel.compact(positive, src, local_size=4)
+        self.assertEqual((dest, count), ([3, 5, 7, 8], 4))
+        self.assertEqual([launch[:3] for launch in self.launches],
+                         [("flag_elements", (8,), (4,)),
+                          ("scan_groups", (4,), (4,)),
+                          ("scatter_flagged", (8,), (4,))])
+
+        # nothing is flagged
+        dest, count = parallel.compact(positive,
+                                       self.buffer([-1, 0], ocl.int),
+                                       local_size=4)
+        self.assertEqual(count, 0)
+        self.assertEqual(len(dest), 1)
+
+class ReduceSegmentsDriverTest(HostTest):
+    def runTest(self):
+        src = self.buffer(range(10), ocl.int)
+        offsets = self.buffer([0, 3, 3, 10], ocl.uint)
+        dest = parallel.reduce_segments(stdlib.plus, src, offsets, -1,
+                                        local_size=4)
+        self.assertEqual(dest, [3, -1, 42])
+        # a work-group per segment
+        name, global_size, local_size, args = self.launches[0]
+        self.assertEqual((name, global_size, local_size),
+                         ("reduce_segment_groups", (12,), (4,)))
+        self.assertTrue(args[1] is offsets and args[2] is dest)
+        self.assertTrue(type(args[3]) is numpy.int32)
+        self.assertEqual(args[4].n, 4)
+
+class RadixSortDriverTest(HostTest):
+    def runTest(self):
+        keys = self.buffer([5, 3, 9, 0, 3, 1], ocl.uchar)
+        values = self.buffer("abcdef", Strings)
+        sorted_keys, sorted_values = parallel.radix_sort(keys, values,
+                                                         local_size=4)
+        self.assertEqual(sorted_keys, [0, 1, 3, 3, 5, 9])
+        # stable
+        self.assertEqual(sorted_values, list("dfbeac"))
+        self.assertEqual(keys, [5, 3, 9, 0, 3, 1])
+        # a pass per bit
+        self.assertEqual([launch[:3] for launch in self.launches[:3]],
+                         [("flag_zero_bits", (8,), (4,)),
+                          ("scan_groups", (4,), (4,)),
+                          ("split_by_bit", (8,), (4,))])
+        self.assertEqual(len(self.launches), 8 * 3)
+
+        self.assertEqual(parallel.radix_sort(keys, local_size=4),
+                         [0, 1, 3, 3, 5, 9])
+        self.assertRaises(clq.Error, parallel.radix_sort,
+                          self.buffer([1], ocl.int))
+
+if __name__ == "__main__":
+    unittest.main()
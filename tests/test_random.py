@@ -0,0 +1,297 @@
+'''Unit tests for the counter-based random number generators.
+
+The kernels can't be run without a device, so the generated code is checked
+and the statistical tests are run on reference implementations of the same
+algorithms, which are checked against the known answers from Random123. The
+kernels' source is also run on the host, with stand-ins for the vector types
+and builtins, and checked against the references.
+'''
+import re
+import math
+import operator
+import unittest
+
+import clq
+import clq.backends.opencl as ocl
+import clq.stdlib as stdlib
+
+from test_parallel import host_fn
+
+OpenCL = ocl.Backend()
+
+mask = 0xFFFFFFFF
+
+def philox4x32(seed, gid, counter):
+    x = [counter, gid, 0, 0]
+    k0, k1 = seed, 0
+    for r in xrange(10):
+        p0, p1 = 0xD2511F53 * x[0], 0xCD9E8D57 * x[2]
+        x = [(p1 >> 32) ^ x[1] ^ k0, p1 & mask,
+             (p0 >> 32) ^ x[3] ^ k1, p0 & mask]
+        k0, k1 = (k0 + 0x9E3779B9) & mask, (k1 + 0xBB67AE85) & mask
+    return x
+
+rotations = (10, 26, 11, 21, 13, 27, 23, 5, 6, 20, 17, 11, 25, 10, 18, 20)
+
+def rotl(v, n):
+    return ((v << n) | (v >> (32 - n))) & mask
+
+def threefry4x32(seed, gid, counter):
+    ks = [seed, 0, 0, 0, seed ^ 0x1BD11BDA]
+    x = [(counter + ks[0]) & mask, (gid + ks[1]) & mask, ks[2], ks[3]]
+    for s in xrange(1, 6):
+        for j in xrange(4):
+            i = (8 * (s - 1) + 2 * j) % 16
+            ra, rb = rotations[i], rotations[i + 1]
+            if j % 2 == 0:
+                a, b = (x[0] + x[1]) & mask, (x[2] + x[3]) & mask
+                x = [a, rotl(x[1], ra) ^ a, b, rotl(x[3], rb) ^ b]
+            else:
+                a, b = (x[0] + x[3]) & mask, (x[2] + x[1]) & mask
+                x = [a, rotl(x[1], rb) ^ b, b, rotl(x[3], ra) ^ a]
+        x = [(x[i] + ks[(s + i) % 5]) & mask for i in xrange(4)]
+        x[3] = (x[3] + s) & mask
+    return x
+
+def randf4(bits):
+    return [((b >> 8) + 0.5) * 2 ** -24 for b in bits]
+
+def randn4(bits):
+    u = randf4(bits)
+    r = [math.sqrt(-2 * math.log(v)) for v in u[:2]]
+    t = [2 * math.pi * v for v in u[2:]]
+    return [r[0] * math.cos(t[0]), r[1] * math.cos(t[1]),
+            r[0] * math.sin(t[0]), r[1] * math.sin(t[1])]
+
+def randexp4(bits):
+    return [-math.log(v) for v in randf4(bits)]
+
+def draw(rng, convert, n_items=1024, n_counters=4, seed=42):
+    values = [ ]
+    for gid in xrange(n_items):
+        for counter in xrange(n_counters):
+            values.extend(convert(rng(seed, gid, counter)))
+    return values
+
+def mean_and_variance(values):
+    n = float(len(values))
+    mean = sum(values) / n
+    return mean, sum((v - mean) ** 2 for v in values) / n
+
+class Vector(object):
+    # stands in for OpenCL's vector types when running the kernels' source
+    # on the host; uint components are masked to 32 bits when stored, which
+    # gives the same bits as the device for the +, *, ^ and >> used here
+    components = dict(zip("xyzw", range(4)))
+    components.update((c, i) for i, c in enumerate("0123456789ABCDEF"))
+
+    def __init__(self, values, is_uint):
+        if is_uint:
+            values = [v & mask for v in values]
+        self.__dict__.update(values=list(values), is_uint=is_uint)
+
+    def _indices(self, name):
+        if name.startswith("s"):
+            name = name[1:]
+        return [self.components[c] for c in name]
+
+    def __getattr__(self, name):
+        values = [self.values[i] for i in self._indices(name)]
+        if len(values) == 1:
+            return values[0]
+        return Vector(values, self.is_uint)
+
+    def __setattr__(self, name, value):
+        i, = self._indices(name)
+        self.values[i] = value & mask if self.is_uint else value
+
+    def _map(self, op, other):
+        if isinstance(other, Vector):
+            other = other.values
+        else:
+            other = [other] * len(self.values)
+        return Vector(map(op, self.values, other), self.is_uint)
+
+    def __add__(self, other): return self._map(operator.add, other)
+    def __mul__(self, other): return self._map(operator.mul, other)
+    def __xor__(self, other): return self._map(operator.xor, other)
+    def __rshift__(self, other): return self._map(operator.rshift, other)
+    __radd__, __rmul__ = __add__, __mul__
+    def __neg__(self): return Vector([-v for v in self.values], False)
+
+def constructor(is_uint):
+    def construct(*args):
+        if len(args) == 1 and not isinstance(args[0], Vector):
+            # a scalar is broadcast
+            args *= 4
+        values = [ ]
+        for arg in args:
+            values.extend(arg.values if isinstance(arg, Vector) else [arg])
+        return Vector(values, is_uint)
+    return construct
+
+def elementwise(fn):
+    def apply(*args):
+        if isinstance(args[0], Vector):
+            return Vector(map(fn, *(arg.values for arg in args)), False)
+        return fn(*args)
+    return apply
+
+emulated_builtins = {
+    'uint4': constructor(True), 'uint8': constructor(True),
+    'uint16': constructor(True), 'float4': constructor(False),
+    'mul_hi': lambda a, b: (a * b) >> 32,
+    'rotate': rotl,
+    'convert_float4': lambda v: Vector(map(float, v.values), False),
+    'log': elementwise(math.log), 'sqrt': elementwise(math.sqrt),
+    'sinpi': elementwise(lambda v: math.sin(math.pi * v)),
+    'cospi': elementwise(lambda v: math.cos(math.pi * v)),
+}
+
+def emulate(generic_fn, *args):
+    fn = host_fn(generic_fn)
+    arg_names = generic_fn.arg_names[len(args):]
+    args += tuple(emulated_builtins[name] for name in arg_names)
+    return fn(*args)
+
+class KnownAnswerTest(unittest.TestCase):
+    def runTest(self):
+        self.assertEqual(philox4x32(0, 0, 0),
+                         [0x6627e8d5, 0xe169c58d, 0xbc57ac4c, 0x9b00dbd8])
+        self.assertEqual(threefry4x32(0, 0, 0),
+                         [0x9c6ca96a, 0xe17eae66, 0xfc10ecd4, 0x5256a7d8])
+
+class GeneratedCodeTest(unittest.TestCase):
+    def runTest(self):
+        concrete_fn = stdlib.philox4x32.compile(
+            OpenCL, ocl.uint, ocl.size_t, ocl.uint, ocl.mul_hi.cl_type,
+            ocl.uint4.constructor)
+        code = concrete_fn.program_item.code
+        self.assertTrue(code.startswith("uint4 %s(uint seed, size_t gid, "
+                                        "uint counter)" % concrete_fn.name))
+        # the constants are built as uints; literals too large for an int
+        # are longs, as decimal literals are in C
+        self.assertTrue("m = (uint4)(3528531795L, 3449720151L, "
+                        "2654435769L, 3144134277L);" in code)
+        self.assertTrue("(m.y * x.z)" in code)
+        self.assertTrue("k = (k + m.zwzw);" in code)
+
+        code = stdlib.threefry4x32.compile(
+            OpenCL, ocl.uint, ocl.size_t, ocl.uint, ocl.rotate.cl_type,
+            ocl.uint4.constructor, ocl.uint8.constructor,
+            ocl.uint16.constructor).program_item.code
+        self.assertTrue("k = k.s12340567;" in code)
+        self.assertTrue("rotate(x.y, r.s0)" in code)
+
+class EmulationTest(unittest.TestCase):
+    # the kernels' source, run on the host, matches the references
+    def runTest(self):
+        randf = host_fn(stdlib.randf4)
+        for seed, gid, counter in ((0, 0, 0), (42, 7, 3),
+                                   (mask, mask, mask)):
+            for generic_fn, reference in ((stdlib.philox4x32, philox4x32),
+                                          (stdlib.threefry4x32,
+                                           threefry4x32)):
+                bits = emulate(generic_fn, seed, gid, counter)
+                self.assertEqual(bits.values,
+                                 reference(seed, gid, counter))
+
+                for generic_fn, args, reference in (
+                        (stdlib.randf4, (bits,), randf4),
+                        (stdlib.randexp4, (bits, randf), randexp4),
+                        (stdlib.randn4, (bits, randf), randn4)):
+                    values = emulate(generic_fn, *args).values
+                    for value, expected in zip(values,
+                                               reference(bits.values)):
+                        self.assertAlmostEqual(value, expected, 12)
+
+class LegacyTest(unittest.TestCase):
+    # the original generators keep their signatures
+    def runTest(self):
+        self.assertEqual(stdlib.randexp.arg_names,
+                         ("state", "randf", "log", "get_global_id"))
+        self.assertEqual(stdlib.randn.arg_names, ("state", "randf"))
+        code = stdlib.randexp.compile(
+            OpenCL, ocl.int.ptr_global, stdlib.simple_randf.cl_type,
+            ocl.log.cl_type, ocl.get_global_id.cl_type).program_item.code
+        self.assertTrue(code.startswith("float randexp_global_int_ptr_"))
+        self.assertTrue("state[gid] = x;" in code)
+        self.assertTrue("return (-log(" in code)
+
+class LiteralTest(unittest.TestCase):
+    def runTest(self):
+        @clq.fn
+        def add(a, b):
+            a[0] = a[0] + 3000000000
+            a[1] = b < 3000000000
+        code = add.compile(OpenCL, ocl.long.ptr_global,
+                           ocl.int).program_item.code
+        self.assertTrue("(a[0] + 3000000000L)" in code)
+        # compared as signed, so -1 stays less than the literal
+        self.assertTrue("a[1] = b < 3000000000L;" in code)
+
+        @clq.fn
+        def overflow(a):
+            a[0] = 18446744073709551615
+        concrete_fn = overflow.compile(OpenCL, ocl.ulong.ptr_global)
+        self.assertRaises(clq.Error, lambda: concrete_fn.program_item)
+
+class CallTest(unittest.TestCase):
+    def runTest(self):
+        fill = clq.fn.from_source('''
+def fill(seed, dest, rng, mul_hi, uint4, randn, randf, log, sqrt, sinpi,
+         cospi, convert_float4, float4, get_global_id, vstore4):
+    gid = get_global_id(0)
+    vstore4(randn(rng(seed, gid, 0, mul_hi, uint4), randf, log, sqrt, sinpi,
+                  cospi, convert_float4, float4), gid, dest)
+''')
+        concrete_fn = fill.compile(
+            OpenCL, ocl.uint, ocl.float.ptr_global, stdlib.philox4x32.cl_type,
+            ocl.mul_hi.cl_type, ocl.uint4.constructor, stdlib.randn4.cl_type,
+            stdlib.randf4.cl_type, ocl.log.cl_type, ocl.sqrt.cl_type,
+            ocl.sinpi.cl_type, ocl.cospi.cl_type, ocl.convert_float4.cl_type,
+            ocl.float4.constructor, ocl.get_global_id.cl_type,
+            ocl.vstore4.cl_type)
+        code = clq.Module(OpenCL, [concrete_fn]).code
+        # called by their own names, not those of the arguments
+        self.assertTrue(re.search(r"vstore4\(randn4_uint4_\w+\("
+                                  r"philox4x32_uint_size_t_int_\w+\("
+                                  r"seed, gid, 0\)\), gid, dest\);", code))
+        # only the kernel is one
+        self.assertEqual(code.count("__kernel"), 1)
+        self.assertTrue(re.search(r"float4 randn4_uint4_\w+\(uint4 bits\)",
+                                  code))
+
+class StatisticsTest(unittest.TestCase):
+    def runTest(self):
+        for rng in (philox4x32, threefry4x32):
+            values = draw(rng, randf4)
+            self.assertTrue(0 < min(values) and max(values) < 1)
+            mean, variance = mean_and_variance(values)
+            self.assertAlmostEqual(mean, 0.5, 2)
+            self.assertAlmostEqual(variance, 1 / 12.0, 2)
+
+            # chi-squared test of uniformity over 16 bins, with a critical
+            # value of 37.7 for p = 0.001 and 15 degrees of freedom
+            counts = [0] * 16
+            for v in values:
+                counts[int(v * 16)] += 1
+            expected = len(values) / 16.0
+            chi2 = sum((c - expected) ** 2 / expected for c in counts)
+            self.assertTrue(chi2 < 37.7)
+
+            # neighbouring work-items and counters are uncorrelated
+            n = len(values) - 4
+            mean_product = sum(values[i] * values[i + 4]
+                               for i in xrange(n)) / n
+            self.assertAlmostEqual(mean_product, 0.25, 2)
+
+            mean, variance = mean_and_variance(draw(rng, randn4))
+            self.assertAlmostEqual(mean, 0, 1)
+            self.assertAlmostEqual(variance, 1, 1)
+
+            # different seeds give different streams
+            self.assertNotEqual(rng(1, 0, 0), rng(2, 0, 0))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,252 @@
+'''Unit tests for the sparse matrix representations and kernels.
+
+The kernels can't be run without a device, so the generated code is checked
+and each representation is multiplied on the host, indexing its arrays the
+way the kernel for it does, and compared to a dense product. DeviceMatrix is
+run with stand-ins for pyocl's Context and Buffer and for sparse._kernel,
+which records each launch.
+'''
+import unittest
+
+import numpy
+
+import clq
+import clq.backends.opencl as ocl
+import clq.backends.opencl.pyocl as pyocl
+from clq.stdlib import sparse
+from cypy.np import DirectedAdjacencyMatrix
+
+def adjacency(rows):
+    matrix = DirectedAdjacencyMatrix(len(rows))
+    for row, targets in zip(matrix, rows):
+        row.extend(targets)
+    return matrix
+
+def dense(rows, values=None):
+    matrix = numpy.zeros((len(rows), len(rows)), numpy.float32)
+    edge = 0
+    for r, targets in enumerate(rows):
+        for c in targets:
+            matrix[r, c] += 1 if values is None else values[edge]
+            edge += 1
+    return matrix
+
+def value(matrix, i):
+    return 1 if matrix.values is None else matrix.values[i]
+
+def multiply_csr(csr, x):
+    return numpy.array([sum(value(csr, i) * x[csr.columns[i]]
+                            for i in xrange(csr.row_offsets[r],
+                                            csr.row_offsets[r + 1]))
+                        for r in xrange(csr.n_rows)], numpy.float32)
+
+def multiply_ell(ell, x):
+    n_rows = ell.n_rows
+    return numpy.array([sum(value(ell, j * n_rows + r) *
+                            x[ell.columns[j * n_rows + r]]
+                            for j in xrange(ell.lengths[r]))
+                        for r in xrange(n_rows)], numpy.float32)
+
+def multiply_sliced_ell(ell, x):
+    y = [ ]
+    size = ell.slice_size
+    for r in xrange(ell.n_rows):
+        base = ell.slice_offsets[r // size] + r % size
+        y.append(sum(value(ell, base + j * size) *
+                     x[ell.columns[base + j * size]]
+                     for j in xrange(ell.lengths[r])))
+    return numpy.array(y, numpy.float32)
+
+rows = [[1, 2, 3], [4, 5], [], [0, 2, 4, 5, 1], [3], [0, 1, 2, 3, 4, 5]]
+
+class PackedTest(unittest.TestCase):
+    def runTest(self):
+        csr = sparse.CSR.from_packed(
+            numpy.array([3, 7, 10, 3, 11, 22, 33, 2, 44, 55, 0]))
+        self.assertEqual(list(csr.row_offsets), [0, 3, 5, 5])
+        self.assertEqual(list(csr.columns), [11, 22, 33, 44, 55])
+        self.assertEqual(csr.values, None)
+        self.assertEqual((csr.n_rows, csr.n_edges), (3, 5))
+
+        csr = sparse.CSR.from_adjacency(adjacency(rows))
+        self.assertEqual(list(csr.lengths), [len(row) for row in rows])
+        self.assertEqual(list(csr.columns), sum(rows, [ ]))
+
+        self.assertEqual(sparse.CSR.from_packed(numpy.array([])).n_rows, 0)
+        self.assertRaises(clq.Error, sparse.CSR.from_adjacency,
+                          adjacency(rows), [1.0, 2.0])
+
+class MultiplyTest(unittest.TestCase):
+    def runTest(self):
+        values = numpy.arange(1, 18, dtype=numpy.float32)
+        x = numpy.arange(len(rows), dtype=numpy.float32) + 0.5
+        for edge_values in (None, values):
+            expected = dense(rows, edge_values).dot(x)
+            csr = sparse.CSR.from_adjacency(adjacency(rows), edge_values)
+            self.assertTrue(numpy.allclose(multiply_csr(csr, x), expected))
+            ell = sparse.ELL.from_csr(csr)
+            self.assertEqual(ell.width, 6)
+            self.assertEqual(len(ell.columns), 6 * len(rows))
+            self.assertTrue(numpy.allclose(multiply_ell(ell, x), expected))
+            for size in (1, 2, 4, 32):
+                ell = sparse.SlicedELL.from_csr(csr, size)
+                self.assertTrue(numpy.allclose(multiply_sliced_ell(ell, x),
+                                               expected))
+        # narrow slices pad less
+        self.assertEqual(list(sparse.SlicedELL.from_csr(csr, 2).slice_offsets),
+                         [0, 6, 16, 28])
+
+class TransposedTest(unittest.TestCase):
+    def runTest(self):
+        values = numpy.arange(1, 18, dtype=numpy.float32)
+        matrix = adjacency(rows)
+        transposed = sparse.CSR.from_adjacency(matrix, values).transposed()
+        self.assertTrue(numpy.allclose(
+            multiply_csr(transposed, numpy.ones(len(rows))),
+            dense(rows, values).sum(axis=0)))
+        # the rows of the transpose are those of the reversed matrix
+        reversed = sparse.CSR.from_adjacency(matrix.reversed())
+        self.assertEqual(list(transposed.row_offsets),
+                         list(reversed.row_offsets))
+        self.assertEqual(list(transposed.columns), list(reversed.columns))
+
+class CodeTest(unittest.TestCase):
+    def runTest(self):
+        uint_p, float_p = ocl.uint.ptr_global, ocl.float.ptr_global
+        gid_t = ocl.get_global_id.cl_type
+        code = sparse.csr_scalar.compile(
+            sparse.backend, uint_p, uint_p, float_p, ocl.uchar.ptr_global,
+            float_p, ocl.uint, clq.const(False), clq.const(True), gid_t
+        ).program_item.code
+        self.assertTrue("__global uchar* x, __global float* y, uint n_rows)"
+                        in code)
+        # the flags are bound, so the values are never read
+        self.assertFalse("values[" in code)
+        self.assertTrue("total = (total + x[columns[i]]);" in code)
+        self.assertTrue("y[row] = (y[row] + total);" in code)
+
+        code = sparse.csr_vector.compile(
+            sparse.backend, uint_p, uint_p, float_p, float_p, float_p,
+            ocl.uint, clq.const(True), clq.const(False), clq.const(8),
+            ocl.float.ptr_shared, ocl.get_local_id.cl_type,
+            ocl.get_local_size.cl_type, ocl.get_group_id.cl_type,
+            ocl.barrier.cl_type, ocl.CLK_LOCAL_MEM_FENCE).program_item.code
+        self.assertTrue("__local float* scratch)" in code)
+        self.assertTrue("i += 8)" in code)
+        self.assertTrue("s = 4;" in code)
+        self.assertEqual(code.count("barrier(1u);"), 2)
+
+        code = sparse.sliced_ell_scalar.compile(
+            sparse.backend, uint_p, uint_p, float_p, uint_p, float_p, float_p,
+            ocl.uint, clq.const(True), clq.const(False), clq.const(32), gid_t
+        ).program_item.code
+        self.assertTrue("(slice_offsets[(row / 32)] + (row % 32))" in code)
+        self.assertTrue("i = (base + (j * 32));" in code)
+
+cl_dtypes = {numpy.dtype(numpy.uint32): ocl.uint,
+             numpy.dtype(numpy.float32): ocl.float}
+
+class Buffer(object):
+    def __init__(self, array):
+        self.array = array
+        self.cl_dtype = cl_dtypes[array.dtype]
+        self.cl_type = self.cl_dtype.ptr_global
+
+class Context(object):
+    device = None
+
+    def __init__(self):
+        self.copied = [ ]
+
+    def to_device(self, array):
+        self.copied.append(array)
+        return Buffer(array)
+
+    def alloc(self, shape, cl_dtype):
+        return Buffer(numpy.zeros(shape, cl_dtype.np_dtype))
+
+class DeviceMatrixTest(unittest.TestCase):
+    def runTest(self):
+        ctx = Context()
+        matrix = sparse.DeviceMatrix(ctx, adjacency(rows))
+        self.assertTrue(isinstance(matrix.matrix, sparse.CSR))
+        self.assertEqual(len(ctx.copied), 2)
+        self.assertEqual(matrix.values, None)
+        self.assertEqual(matrix.n_rows, len(rows))
+
+        ell = sparse.SlicedELL.from_csr(matrix.matrix)
+        matrix = sparse.DeviceMatrix(ctx, ell)
+        self.assertEqual(len(ctx.copied), 5)
+        self.assertTrue(matrix.lengths.array is ell.lengths)
+
+        self.assertRaises(clq.Error, sparse.DeviceMatrix, ctx, ell,
+                          "vector")
+        self.assertRaises(clq.Error, sparse.DeviceMatrix, ctx,
+                          adjacency(rows), "vector", 3)
+        self.assertRaises(clq.Error, sparse.DeviceMatrix, ctx,
+                          adjacency(rows), "vector", 256, 128)
+        self.assertRaises(clq.Error, sparse.DeviceMatrix, ctx,
+                          adjacency(rows), "warp")
+
+class MultiplyDriverTest(unittest.TestCase):
+    def setUp(self):
+        self.launches = [ ]
+        def kernel(ctx, generic_fn, arg_types):
+            def launch(global_size, *args, **kwargs):
+                self.launches.append((generic_fn.name, arg_types, global_size,
+                                      args, kwargs))
+                return "event"
+            return launch
+        self._kernel = sparse._kernel
+        sparse._kernel = kernel
+
+    def tearDown(self):
+        sparse._kernel = self._kernel
+
+    def runTest(self):
+        ctx = Context()
+        x = ctx.to_device(numpy.ones(len(rows), numpy.float32))
+        matrix = sparse.DeviceMatrix(ctx, adjacency(rows), local_size=4)
+        y, event = matrix.multiply(x, wait_for=["before"])
+        self.assertEqual((len(y.array), event), (len(rows), "event"))
+        name, arg_types, global_size, args, kwargs = self.launches[-1]
+        # a work-item per row, without values
+        self.assertEqual((name, global_size), ("csr_scalar", (8,)))
+        self.assertEqual(kwargs, {'local_size': (4,),
+                                  'wait_for': ["before"]})
+        self.assertEqual(args[:2], tuple(matrix.buffers))
+        self.assertTrue(args[2] is x and args[3] is x and args[4] is y)
+        self.assertTrue(type(args[5]) is numpy.uint32 and args[5] == 6)
+        self.assertEqual(arg_types[6:8], (clq.const(False),
+                                          clq.const(False)))
+
+        # inputs are accumulated into
+        matrix = sparse.DeviceMatrix(ctx, adjacency(rows), "vector", lanes=4,
+                                     local_size=8)
+        self.assertEqual(matrix.propagate(x, y), "event")
+        name, arg_types, global_size, args, kwargs = self.launches[-1]
+        self.assertEqual((name, global_size), ("csr_vector", (24,)))
+        self.assertTrue(args[4] is y)
+        self.assertEqual(arg_types[7:9], (clq.const(True),
+                                          clq.const(4)))
+        # with a scratch element for each work-item of a group
+        self.assertTrue(isinstance(args[6], pyocl.LocalMemory))
+        self.assertEqual(args[6].size, 8 * 4)
+        self.assertEqual(kwargs, {'local_size': (8,)})
+
+        values = numpy.arange(1, 18, dtype=numpy.float32)
+        csr = sparse.CSR.from_adjacency(adjacency(rows), values)
+        matrix = sparse.DeviceMatrix(ctx, sparse.SlicedELL.from_csr(csr, 2),
+                                     local_size=4)
+        matrix.multiply(x, y)
+        name, arg_types, global_size, args, kwargs = self.launches[-1]
+        self.assertEqual((name, global_size), ("sliced_ell_scalar", (8,)))
+        self.assertEqual(args[:2], tuple(matrix.buffers))
+        self.assertTrue(args[2] is matrix.values and
+                        args[3] is matrix.lengths)
+        self.assertEqual(arg_types[-4:-1], (clq.const(True),
+                                            clq.const(False),
+                                            clq.const(2)))
+
+if __name__ == "__main__":
+    unittest.main()
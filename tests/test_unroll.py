@@ -0,0 +1,93 @@
+'''Unit tests for unrolling loops with constant bounds.'''
+import unittest
+
+import clq
+import clq.backends.opencl as ocl
+
+OpenCL = ocl.Backend()
+
+src = '''
+def f(a):
+    s = 0
+    for i in (0, 4):
+        s = s + a[i] * (i + 1)
+    for j in (0, 100, 3):
+        s = s + a[j]
+    return s + j
+'''
+
+def code_for(src, unroll, *arg_types):
+    return clq.fn.from_source(src, unroll=unroll).compile(
+        OpenCL, *arg_types).program_item.code
+
+class NotUnrolledTest(unittest.TestCase):
+    def runTest(self):
+        code = code_for(src, None, ocl.int.ptr_global)
+        self.assertTrue("for (i = 0; i < 4; i += 1) {" in code)
+        self.assertTrue("for (j = 0; j < 100; j += 3) {" in code)
+
+class FullUnrollTest(unittest.TestCase):
+    def runTest(self):
+        code = code_for(src, True, ocl.int.ptr_global)
+        self.assertFalse("for (i" in code)
+        self.assertFalse("int i;" in code)
+        self.assertTrue("s = (s + (a[0] * 1));" in code)
+        self.assertTrue("s = (s + (a[3] * 4));" in code)
+        # too many iterations
+        self.assertTrue("for (j = 0; j < 100; j += 3) {" in code)
+
+class PartialUnrollTest(unittest.TestCase):
+    def runTest(self):
+        code = code_for(src, 4, ocl.int.ptr_global)
+        self.assertFalse("for (i" in code)
+        self.assertTrue("for (j = 0; j < 96; j += 12) {" in code)
+        self.assertTrue("s = (s + a[(j + 9)]);" in code)
+        # the remaining iterations, then the final value of j
+        self.assertTrue("s = (s + a[96]);\n    s = (s + a[99]);\n    j = 102;"
+                        in code)
+
+class SkipTest(unittest.TestCase):
+    def runTest(self):
+        code = code_for('''
+def f(a, n):
+    for i in (0, 4):
+        if a[i] > 0:
+            break
+    for j in (0, n):
+        a[j] = 0
+    for k in (0, 4):
+        k = k + 1
+''', True, ocl.int.ptr_global, ocl.int)
+        self.assertTrue("for (i = 0; i < 4; i += 1) {" in code)
+        self.assertTrue("for (j = 0; j < n; j += 1) {" in code)
+        self.assertTrue("for (k = 0; k < 4; k += 1) {" in code)
+
+class ConstBoundsTest(unittest.TestCase):
+    def runTest(self):
+        code = clq.fn.from_source('''
+def f(a, n):
+    for i in (0, n):
+        a[i] = i
+''', unroll=True).compile(OpenCL, ocl.int.ptr_global,
+                          clq.const(2)).program_item.code
+        self.assertTrue("a[0] = 0;\n    a[1] = 1;" in code)
+
+class OptionsTest(unittest.TestCase):
+    def runTest(self):
+        plain = clq.fn.from_source(src)
+        unrolled = clq.fn.from_source(src, unroll=8)
+        self.assertFalse(plain is unrolled)
+        self.assertEqual(plain.options, {})
+        self.assertEqual(unrolled.options, {"unroll": 8})
+        self.assertNotEqual(plain.compile(OpenCL, ocl.int.ptr_global).cache_key,
+                            unrolled.compile(OpenCL,
+                                             ocl.int.ptr_global).cache_key)
+
+        @clq.fn(unroll=True)
+        def g(a):
+            for i in (0, 2):
+                a[i] = 0
+        self.assertEqual(g.unroll, True)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,207 @@
+'''Unit tests for vector types.'''
+import re
+import unittest
+
+import numpy
+
+import clq
+import clq.backends.opencl as ocl
+
+OpenCL = ocl.Backend()
+
+def code_for(src, *arg_types):
+    return clq.fn.from_source(src).compile(OpenCL, *arg_types).program_item.code
+
+def type_for(src, *arg_types):
+    return clq.fn.from_source(src).compile(OpenCL, *arg_types).return_type
+
+class VectorTypesTest(unittest.TestCase):
+    def runTest(self):
+        self.assertEqual(len(ocl.vector_types), 11 * len(ocl.vector_type_sizes))
+        self.assertTrue(ocl.t("float4") is ocl.float4)
+        self.assertTrue(ocl.t("__global uchar16*") is ocl.uchar16.ptr_global)
+        self.assertTrue(ocl.int.vector_types[8] is ocl.int8)
+        self.assertTrue(ocl.short2.base_type is ocl.short)
+        self.assertEqual(ocl.float4.sizeof_for(None), 16)
+        self.assertEqual(ocl.float3.sizeof_for(None), 16)
+        self.assertEqual(ocl.double3.required_extensions, (ocl.cl_khr_fp64,))
+        self.assertTrue(ocl.float4.compare_type is ocl.int4)
+        self.assertTrue(ocl.double2.compare_type is ocl.long2)
+        self.assertTrue(ocl.uchar8.compare_type is ocl.char8)
+
+class ComponentsTest(unittest.TestCase):
+    def runTest(self):
+        self.assertEqual(ocl.float4.components("x"), (0,))
+        self.assertEqual(ocl.float4.components("wzyx"), (3, 2, 1, 0))
+        self.assertEqual(ocl.float16.components("sF0"), (15, 0))
+        self.assertEqual(ocl.float8.components("odd"), (1, 3, 5, 7))
+        self.assertEqual(ocl.float3.components("hi"), (2, 3))
+        self.assertEqual(ocl.float2.components("lo"), (0,))
+        self.assertEqual(ocl.float2.components("z"), None)
+        self.assertEqual(ocl.float8.components("x"), None)
+        self.assertEqual(ocl.float8.components("s8"), None)
+
+        code = code_for('''
+def f(v):
+    w = v.wzyx
+    w.xy = v.lo
+    w.s3 += v.x
+    return w.even
+''', ocl.int4)
+        self.assertTrue("w = v.wzyx;" in code)
+        self.assertTrue("w.xy = v.lo;" in code)
+        self.assertTrue("w.s3 += v.x;" in code)
+        self.assertTrue("int2 f_int4(int4 v)" in code)
+        self.assertTrue(type_for('''
+def f(v):
+    return v.s012
+''', ocl.float8) is ocl.float3)
+
+class OperatorsTest(unittest.TestCase):
+    def runTest(self):
+        code = code_for('''
+def f(v, w, s):
+    return -(2 * v + w * s) / 3
+''', ocl.float4, ocl.float4, ocl.float)
+        self.assertTrue("float4 f_float4_float4_float(float4 v, float4 w, float s)" in code)
+        self.assertTrue("return ((-(((2 * v) + (w * s)))) / 3);" in code)
+
+        self.assertTrue(type_for('''
+def f(v, w):
+    return (v << 2) ^ ~w
+''', ocl.uint8, ocl.uint8) is ocl.uint8)
+        # no promotions, unlike scalars
+        self.assertTrue(type_for('''
+def f(v, s):
+    return v + s
+''', ocl.char2, ocl.short) is ocl.char2)
+        self.assertTrue(type_for('''
+def f(v, w):
+    return v < w
+''', ocl.float4, ocl.float4) is ocl.int4)
+        self.assertTrue(type_for('''
+def f(v):
+    return 0 == v
+''', ocl.double2) is ocl.long2)
+
+class OperatorErrorsTest(unittest.TestCase):
+    def runTest(self):
+        for src, arg_types in (
+                ('''
+def f(v, w):
+    return v + w
+''', (ocl.float4, ocl.float2)),
+                ('''
+def f(v, s):
+    return v * s
+''', (ocl.int4, ocl.float)),
+                ('''
+def f(v, s):
+    return v * s
+''', (ocl.float4, ocl.double)),
+                ('''
+def f(v):
+    return v << 1
+''', (ocl.float4,)),
+                ('''
+def f(v):
+    return ~v
+''', (ocl.float4,)),
+                ('''
+def f(v):
+    return v.q
+''', (ocl.float4,)),
+                ('''
+def f(v):
+    v.xx = v.yz
+''', (ocl.float4,)),
+                ('''
+def f(v, w):
+    v.xy = w
+''', (ocl.float4, ocl.float4))):
+            concrete_fn = clq.fn.from_source(src).compile(OpenCL, *arg_types)
+            self.assertRaises(clq.TypeResolutionError,
+                              lambda: concrete_fn.program_item)
+
+class LiteralsAndConversionsTest(unittest.TestCase):
+    def runTest(self):
+        code = code_for('''
+def f(v, w, s, float4, convert_float4, as_uint4):
+    return as_uint4(float4(s, 1, w) + convert_float4(v) + float4(s))
+''', ocl.int4, ocl.float2, ocl.float, ocl.float4.constructor,
+     ocl.convert_float4.cl_type, ocl.as_uint4.cl_type)
+        # functions passed to it are hashed into its name
+        self.assertTrue(re.search(r"uint4 f_int4_float2_float_[0-9a-f]{8}\("
+                                  r"int4 v, float2 w, float s\)", code))
+        self.assertTrue("(float4)(s, 1, w)" in code)
+        self.assertTrue("convert_float4(v)" in code)
+        self.assertTrue("(float4)(s))" in code)
+
+        fn = clq.fn.from_source('''
+def f(v, float4):
+    return float4(v.xyz)
+''')
+        concrete_fn = fn.compile(OpenCL, ocl.float4, ocl.float4.constructor)
+        self.assertRaises(clq.TypeResolutionError,
+                          lambda: concrete_fn.program_item)
+
+        fn = clq.fn.from_source('''
+def f(v, convert_int4):
+    return convert_int4(v)
+''')
+        concrete_fn = fn.compile(OpenCL, ocl.float8, ocl.convert_int4.cl_type)
+        self.assertRaises(clq.TypeResolutionError,
+                          lambda: concrete_fn.program_item)
+        self.assertTrue(ocl.convert_fn(ocl.uchar4, True, "rte") is
+                        ocl.builtins["convert_uchar4_sat_rte"])
+
+class LoadStoreTest(unittest.TestCase):
+    def runTest(self):
+        code = code_for('''
+def f(a, b, get_global_id, vload4, vstore4):
+    gid = get_global_id(0)
+    vstore4(vload4(gid, a) * 2, gid, b)
+''', ocl.float.ptr_global, ocl.float.ptr_global, ocl.get_global_id.cl_type,
+     ocl.vload4.cl_type, ocl.vstore4.cl_type)
+        self.assertTrue("vstore4((vload4(gid, a) * 2), gid, b);" in code)
+
+        fn = clq.fn.from_source('''
+def f(a, vstore4):
+    vstore4(1, 0, a)
+''')
+        concrete_fn = fn.compile(OpenCL, ocl.float.ptr_global,
+                                 ocl.vstore4.cl_type)
+        self.assertRaises(clq.TypeResolutionError,
+                          lambda: concrete_fn.program_item)
+        self.assertFalse(ocl.vload8.pure)
+
+class VectorCommonSubexpressionsTest(unittest.TestCase):
+    def runTest(self):
+        # assigning to a component changes the vector
+        code = code_for('''
+def f(v, w):
+    a = v + w
+    v.x = 1
+    b = v + w
+    return a.x + b.x
+''', ocl.int4, ocl.int4)
+        self.assertTrue("b = (v + w);" in code)
+
+class DtypeTest(unittest.TestCase):
+    def runTest(self):
+        self.assertTrue(ocl.to_cl_type[ocl.float4.np_dtype] is ocl.float4)
+        self.assertEqual(ocl.float3.np_dtype.itemsize, 16)
+        self.assertTrue(ocl.vector_type_for_dtype(numpy.dtype(
+            [('r', 'u1'), ('g', 'u1'), ('b', 'u1'), ('a', 'u1')]))
+            is ocl.uchar4)
+        self.assertTrue(ocl.vector_type_for_dtype(numpy.dtype(
+            (numpy.int32, 8))) is ocl.int8)
+        # packed, unlike float3
+        self.assertTrue(ocl.vector_type_for_dtype(numpy.dtype(
+            [('x', 'f4'), ('y', 'f4'), ('z', 'f4')])) is None)
+        self.assertTrue(ocl.vector_type_for_dtype(numpy.dtype(
+            [('x', 'f4'), ('y', 'f8')])) is None)
+        self.assertTrue(ocl.vector_type_for_dtype(numpy.dtype('f4')) is None)
+
+if __name__ == "__main__":
+    unittest.main()
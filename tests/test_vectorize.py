@@ -0,0 +1,160 @@
+'''Unit tests for the vectorization of elementwise kernels.'''
+import unittest
+
+import clq
+import clq.backends.opencl as ocl
+
+OpenCL = ocl.Backend()
+
+gid_t = ocl.get_global_id.cl_type
+float_p = ocl.float.ptr_global
+
+ew_add = clq.fn.from_source('''
+def ew_add(a, b, dest, get_global_id):
+    gid = get_global_id(0)
+    dest[gid] = a[gid] + b[gid]
+''')
+
+def compile(src, width, *arg_types):
+    return clq.fn.from_source(src, vectorize=width).compile(OpenCL, 
+                                                            *arg_types)
+
+class VectorizeTest(unittest.TestCase):
+    def runTest(self):
+        concrete_fn = ew_add.with_options(vectorize=4).compile(
+            OpenCL, float_p, float_p, float_p, gid_t)
+        code = concrete_fn.program_item.code
+        self.assertTrue("__kernel void ew_add_x4(" in code)
+        self.assertTrue("gid = get_global_id(0);" in code)
+        self.assertTrue("vstore4((vload4(gid, a) + vload4(gid, b)), gid, "
+                        "dest);" in code)
+        
+        code = compile('''
+def scale(a, dest, s, get_global_id, sqrt, fmax):
+    gid = get_global_id(0)
+    t = a[gid] * s
+    t += 1
+    dest[gid] = fmax(sqrt(t), 0)
+    dest[gid] += s
+''', 8, float_p, float_p, ocl.float, gid_t, ocl.sqrt.cl_type, 
+     ocl.fmax.cl_type).program_item.code
+        self.assertTrue("float8 t_1;" in code)
+        self.assertTrue("t_1 = (vload8(gid, a) * s);" in code)
+        self.assertTrue("t_1 += 1;" in code)
+        self.assertTrue("vstore8(fmax(sqrt(t_1), (float8)(0)), gid, dest);"
+                        in code)
+        self.assertTrue("vstore8((vload8(gid, dest) + s), gid, dest);" 
+                        in code)
+
+        # scalars are broadcast and stored values converted
+        code = compile('''
+def f(a, dest, n, get_global_id):
+    gid = get_global_id(0)
+    m = n * 2
+    dest[gid] = a[gid]
+    a[gid] = m
+''', 2, ocl.int.ptr_global, float_p, ocl.int, gid_t).program_item.code
+        self.assertTrue("m = (n * 2);" in code)
+        self.assertTrue("vstore2(convert_float2(vload2(gid, a)), gid, dest);"
+                        in code)
+        self.assertTrue("vstore2((int2)(m), gid, a);" in code)
+
+class VectorizeOptionsTest(unittest.TestCase):
+    def runTest(self):
+        vectorized = ew_add.with_options(vectorize=4)
+        self.assertEqual(vectorized.options, {"vectorize": 4})
+        self.assertTrue(vectorized is clq.fn.from_ast(ew_add.original_ast, 
+                                                      vectorize=4))
+        self.assertTrue(vectorized.with_options(vectorize=None) is 
+                        clq.fn.from_ast(ew_add.original_ast))
+        self.assertNotEqual(vectorized.cache_key, ew_add.cache_key)
+        
+        arg_types = (float_p, float_p, float_p, gid_t)
+        scalar_fn = ew_add.compile(OpenCL, *arg_types)
+        vector_fn = vectorized.compile(OpenCL, *arg_types)
+        module = clq.Module(OpenCL, (scalar_fn, vector_fn))
+        self.assertEqual(module.vectorized_kernels, 
+                         {"ew_add": ("ew_add_x4", 4)})
+        self.assertEqual(len(module.program_items), 2)
+        self.assertEqual(clq.Module(OpenCL, (scalar_fn,)).vectorized_kernels,
+                         { })
+
+class VectorizeErrorsTest(unittest.TestCase):
+    def runTest(self):
+        for src, arg_types in (
+                # no index
+                ('''
+def f(a):
+    a[0] = 1
+''', (float_p,)),
+                # comparisons of elements
+                ('''
+def f(a, get_global_id):
+    gid = get_global_id(0)
+    if a[gid] > 0:
+        a[gid] = 0
+''', (float_p, gid_t)),
+                ('''
+def f(a, dest, get_global_id):
+    gid = get_global_id(0)
+    dest[gid] = a[gid] > 0
+''', (float_p, ocl.int.ptr_global, gid_t)),
+                # the index used otherwise
+                ('''
+def f(a, get_global_id):
+    gid = get_global_id(0)
+    a[gid] = gid
+''', (float_p, gid_t)),
+                ('''
+def f(a, get_global_id):
+    gid = get_global_id(0)
+    a[gid] = a[gid + 1]
+''', (float_p, gid_t)),
+                # chars are promoted to ints
+                ('''
+def f(a, get_global_id):
+    gid = get_global_id(0)
+    a[gid] = (a[gid] + a[gid]) / 2
+''', (ocl.char.ptr_global, gid_t)),
+                # not in global memory
+                ('''
+def f(a, get_global_id):
+    gid = get_global_id(0)
+    a[gid] = 1
+''', (ocl.float.ptr_shared, gid_t)),
+                # not elementwise
+                ('''
+def f(a, dest, get_global_id, length):
+    gid = get_global_id(0)
+    dest[gid] = length(a[gid])
+''', (float_p, float_p, gid_t, ocl.length.cl_type)),
+                # other work-item functions differ between the launches
+                ('''
+def f(a, get_global_id, get_global_size):
+    gid = get_global_id(0)
+    n = get_global_size(0)
+    a[gid] = a[gid] * n
+''', (float_p, gid_t, ocl.get_global_size.cl_type)),
+                ('''
+def f(a, b, get_global_id):
+    gid = get_global_id(0)
+    i = get_global_id(0)
+    a[gid] = b[i]
+''', (float_p, float_p, gid_t)),
+                ('''
+def f(a, get_global_id, get_local_id):
+    gid = get_global_id(0)
+    a[gid] = a[gid] + get_local_id(0)
+''', (float_p, gid_t, ocl.get_local_id.cl_type)),
+                ('''
+def f(a, get_group_id, get_global_id):
+    g = get_group_id(0)
+    gid = get_global_id(0)
+    a[gid] = a[gid] * g
+''', (float_p, ocl.get_group_id.cl_type, gid_t))):
+            concrete_fn = compile(src, 4, *arg_types)
+            self.assertRaises(clq.InvalidOperationError,
+                              lambda: concrete_fn.program_item)
+
+if __name__ == "__main__":
+    unittest.main()